@@ -43,6 +43,8 @@ function test() {
     cd alf
     pip3 install -e ./nest/cnest
     export PYTHONPATH=$PYTHONPATH:`pwd`/nest/cnest
+    pip3 install -e ./experience_replayers/csegment_tree
+    export PYTHONPATH=$PYTHONPATH:`pwd`/experience_replayers/csegment_tree
     python3 -m unittest -v \
         alf.algorithms.actor_critic_algorithm_test \
         alf.algorithms.actor_critic_loss_test \
@@ -58,13 +60,17 @@ function test() {
         alf.algorithms.icm_algorithm_test \
         alf.algorithms.generator_test \
         alf.algorithms.mcts_algorithm_test \
+        alf.algorithms.mcts_kernels_test \
         alf.algorithms.memory_test \
         alf.algorithms.merlin_algorithm_test \
         alf.algorithms.mi_estimator_test \
         alf.algorithms.muzero_algorithm_test \
+        alf.algorithms.population_algorithm_test \
         alf.algorithms.ppo_algorithm_test \
         alf.algorithms.predictive_representation_learner_test \
         alf.algorithms.prior_actor_test \
+        alf.algorithms.reanalyze_workers_test \
+        alf.algorithms.replay_prefetcher_test \
         alf.algorithms.rl_algorithm_test \
         alf.algorithms.sarsa_algorithm_test \
         alf.algorithms.sac_algorithm_test \
@@ -73,6 +79,7 @@ function test() {
         alf.bin.train_play_test \
         alf.data_structures_test \
         alf.device_ctx_test \
+        alf.environments.batched_in_process_environment_test \
         alf.environments.gym_wrappers_test \
         alf.environments.parallel_environment_test \
         alf.environments.process_environment_test \
@@ -106,13 +113,17 @@ function test() {
         alf.optimizers.trusted_updater_test \
         alf.summary.summary_ops_test \
         alf.tensor_specs_test \
+        alf.trainers.policy_server_test \
         alf.trainers.policy_trainer_test \
         alf.utils.checkpoint_utils_test \
         alf.utils.common_test \
         alf.utils.data_buffer_test \
+        alf.utils.data_parallel_test \
         alf.utils.dist_utils_test \
         alf.utils.math_ops_test \
+        alf.utils.mixed_precision_test \
         alf.utils.normalizers_test \
+        alf.utils.profiler_test \
         alf.utils.tensor_utils_test \
         alf.utils.value_ops_test \
 
@@ -133,6 +133,27 @@ class ActorCriticAlgorithm(OnPolicyAlgorithm):
             info=ActorCriticInfo(
                 value=value, action_distribution=action_distribution))
 
+    def train_sequence(self, exp, state: ActorCriticState):
+        """Same as ``rollout_step()`` for each step of the sequence if both
+        networks support ``forward_sequence()`` (e.g. the RNN networks).
+        """
+        if (type(self).rollout_step is not ActorCriticAlgorithm.rollout_step
+                or not hasattr(self._actor_network, 'forward_sequence')
+                or not hasattr(self._value_network, 'forward_sequence')):
+            return None
+        value, value_state = self._value_network.forward_sequence(
+            exp.observation, state=state.value)
+        action_distribution, actor_state = (
+            self._actor_network.forward_sequence(
+                common.detach(exp.observation), state=state.actor))
+
+        action = dist_utils.sample_action_distribution(action_distribution)
+        return AlgStep(
+            output=action,
+            state=ActorCriticState(actor=actor_state, value=value_state),
+            info=ActorCriticInfo(
+                value=value, action_distribution=action_distribution))
+
     def calc_loss(self, experience, train_info: ActorCriticInfo):
         """Calculate loss."""
         return self._loss(experience, train_info)
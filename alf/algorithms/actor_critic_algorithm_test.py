@@ -20,7 +20,9 @@ import unittest
 import alf
 from alf.utils import common, dist_utils, tensor_utils
 from alf.data_structures import StepType, TimeStep
-from alf.networks import ActorDistributionNetwork, ValueNetwork
+from alf.networks import (ActorDistributionNetwork,
+                          ActorDistributionRNNNetwork, ValueNetwork,
+                          ValueRNNNetwork)
 from alf.algorithms.config import TrainerConfig
 from alf.algorithms.rl_algorithm import RLAlgorithm
 from alf.algorithms.actor_critic_algorithm import ActorCriticAlgorithm
@@ -85,6 +87,57 @@ class ActorCriticAlgorithmTest(alf.test.TestCase):
         # new_iter_num of iterations done in alg2
         self.assertTrue(alf.summary.get_global_counter() == new_iter_num)
 
+    def test_ac_algorithm_train_sequence(self):
+        obs_spec = alf.TensorSpec((2, ), dtype='float32')
+        action_spec = alf.BoundedTensorSpec(
+            shape=(), dtype='int32', minimum=0, maximum=2)
+        alg = ActorCriticAlgorithm(
+            observation_spec=obs_spec,
+            action_spec=action_spec,
+            actor_network_ctor=partial(
+                ActorDistributionRNNNetwork,
+                fc_layer_params=(8, ),
+                lstm_hidden_size=(4, ),
+                actor_fc_layer_params=(6, ),
+                discrete_projection_net_ctor=alf.networks.
+                CategoricalProjectionNetwork),
+            value_network_ctor=partial(
+                ValueRNNNetwork,
+                fc_layer_params=(8, ),
+                lstm_hidden_size=(4, ),
+                value_fc_layer_params=(6, )))
+
+        length, batch_size = 5, 3
+        observation = torch.randn(length, batch_size, 2)
+        state = alf.nest.map_structure(torch.randn_like,
+                                       alg.get_initial_train_state(batch_size))
+        alg_step = alg.train_sequence(TimeStep(observation=observation), state)
+
+        values, logits = [], []
+        for t in range(length):
+            step = alg.rollout_step(
+                TimeStep(observation=observation[t]), state)
+            values.append(step.info.value)
+            logits.append(step.info.action_distribution.logits)
+            state = step.state
+        self.assertTensorClose(
+            alg_step.info.value, torch.stack(values), epsilon=1e-5)
+        self.assertTensorClose(
+            alg_step.info.action_distribution.logits,
+            torch.stack(logits),
+            epsilon=1e-5)
+        self.assertEqual(alg_step.output.shape, (length, batch_size))
+        for s1, s2 in zip(
+                alf.nest.flatten(alg_step.state), alf.nest.flatten(state)):
+            self.assertTensorClose(s1, s2, epsilon=1e-5)
+
+        # The feed-forward networks are not supported.
+        alg = create_algorithm(MyEnv(batch_size=3))
+        self.assertIsNone(
+            alg.train_sequence(
+                TimeStep(observation=observation),
+                alg.get_initial_train_state(batch_size)))
+
 
 if __name__ == '__main__':
     alf.test.main()
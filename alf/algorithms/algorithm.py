@@ -16,7 +16,7 @@
 from absl import logging
 import copy
 from collections import OrderedDict
-from functools import wraps
+from functools import partial, wraps
 import itertools
 import json
 import os
@@ -30,18 +30,25 @@ from alf.data_structures import AlgStep, namedtuple, LossInfo, StepType
 from alf.experience_replayers.experience_replay import (
     OnetimeExperienceReplayer, SyncExperienceReplayer)
 from alf.utils.checkpoint_utils import is_checkpoint_enabled
-from alf.utils import (common, dist_utils, math_ops, spec_utils, summary_utils,
+from alf.utils import (common, data_parallel, dist_utils, math_ops,
+                       mixed_precision, profiler, spec_utils, summary_utils,
                        tensor_utils)
 from alf.utils.summary_utils import record_time
 from alf.utils.math_ops import add_ignore_empty
 from .config import TrainerConfig
 from .data_transformer import IdentityDataTransformer
+from .replay_prefetcher import ReplayPrefetcher
 
 
 def _get_optimizer_params(optimizer: torch.optim.Optimizer):
     return set(sum([g['params'] for g in optimizer.param_groups], []))
 
 
+def _has_no_params(module):
+    return isinstance(module,
+                      nn.Module) and next(module.parameters(), None) is None
+
+
 def _flatten_module(module):
     if isinstance(module, nn.ModuleList):
         return sum(map(_flatten_module, module), [])
@@ -56,6 +63,80 @@ def _flatten_module(module):
         return [module]
 
 
+class MiniBatchIterator(object):
+    """Split a batch-major experience into time-major minibatches.
+
+    Instead of permuting the whole experience and transposing each minibatch,
+    the samples of each minibatch are gathered from the experience directly
+    into a time-major buffer. The buffers are reused by later minibatches
+    with the same shapes, so a minibatch is only valid until the next one is
+    generated.
+    """
+
+    def __init__(self):
+        self._buffers = {}
+
+    def _get_buffer(self, experience, mini_batch_size):
+        flat = alf.nest.flatten(experience)
+        key = tuple(
+            (mini_batch_size, x.shape[1:], x.dtype, x.device) for x in flat)
+        buffer = self._buffers.get(key, None)
+        if buffer is None:
+            buffer = alf.nest.pack_sequence_as(experience, [
+                x.new_empty((x.shape[1], mini_batch_size) + x.shape[2:])
+                for x in flat
+            ])
+            self._buffers[key] = buffer
+        return buffer
+
+    def iterate(self, experience, batch_info, mini_batch_size, shuffle):
+        """Generate the minibatches of one pass over ``experience``.
+
+        Args:
+            experience (nested Tensor): experience with shape ``[B, T, ...]``.
+            batch_info (BatchInfo): information with shape ``[B]`` for each
+                sample. Can be None.
+            mini_batch_size (int): the number of samples in each minibatch.
+                The last minibatch may be smaller.
+            shuffle (bool): whether to randomly permute the samples.
+        Yields:
+            tuple:
+            - nested Tensor: the minibatch with shape
+              ``[T, mini_batch_size, ...]``.
+            - BatchInfo: the corresponding ``batch_info``.
+        """
+        batch_size = alf.nest.get_nest_batch_size(experience)
+        if not shuffle and mini_batch_size >= batch_size:
+            # No need to copy
+            yield (alf.nest.map_structure(lambda x: x.transpose(0, 1),
+                                          experience), batch_info)
+            return
+
+        if shuffle:
+            indices = torch.randperm(batch_size)
+        else:
+            indices = torch.arange(batch_size)
+
+        for b in range(0, batch_size, mini_batch_size):
+            idx = indices[b:b + mini_batch_size]
+            buffer = self._get_buffer(experience, idx.shape[0])
+
+            def _gather(x, buf):
+                x = x.transpose(0, 1)
+                i = idx.to(x.device)
+                if x.requires_grad:
+                    return x.index_select(1, i)
+                return torch.index_select(x, 1, i, out=buf)
+
+            batch = alf.nest.map_structure(_gather, experience, buffer)
+            if batch_info is not None:
+                binfo = alf.nest.map_structure(lambda x: x[idx.to(x.device)],
+                                               batch_info)
+            else:
+                binfo = None
+            yield batch, binfo
+
+
 class Algorithm(nn.Module):
     """Algorithm base class. ``Algorithm`` is a generic interface for supervised
     training algorithms. The key interface functions are:
@@ -154,6 +235,10 @@ class Algorithm(nn.Module):
         else:
             self._predict_state_spec = self._rollout_state_spec
 
+        # Created when ``update_with_gradient()`` is called under
+        # ``mixed_precision.autocast(torch.float16)``
+        self._loss_scaler = None
+
         self._initial_train_states = {}
         self._initial_rollout_states = {}
         self._initial_predict_states = {}
@@ -168,12 +253,22 @@ class Algorithm(nn.Module):
         else:
             self._data_transformer = IdentityDataTransformer()
         self._num_earliest_frames_ignored = self._data_transformer.stack_size - 1
+        if config and config.replay_prefetch_size > 0:
+            # The prefetch thread would update the data transformer while the
+            # main thread is using it.
+            assert not self._data_transformer.updates_in_replay, (
+                "replay_prefetch_size cannot be used with a data transformer "
+                "updating its statistics during replay. Consider using "
+                "update_mode='rollout' for the normalizers.")
         self._transform_state_spec = self._data_transformer.state_spec
 
         self._observers = []
         self._metrics = []
         self._exp_replayer = None
         self._exp_replayer_type = None
+        self._replay_prefetcher = None
+        self._prefetched_experience_spec = None
+        self._mini_batch_iterator = None
 
         self._use_rollout_state = False
         if config:
@@ -236,7 +331,8 @@ class Algorithm(nn.Module):
                          exp_replayer: str,
                          num_envs,
                          max_length: int,
-                         prioritized_sampling=False):
+                         prioritized_sampling=False,
+                         allow_multithread=False):
         """Set experience replayer.
 
         Args:
@@ -247,6 +343,9 @@ class Algorithm(nn.Module):
             max_length (int): the maximum number of steps the replay
                 buffer store for each environment.
             prioritized_sampling (bool): Use prioritized sampling if this is True.
+            allow_multithread (bool): whether the replayer can be accessed from
+                multiple threads simultaneously (e.g., when
+                ``TrainerConfig.async_unroll`` is True).
         """
         assert exp_replayer in ("one_time", "uniform"), (
             "Unsupported exp_replayer: %s" % exp_replayer)
@@ -254,6 +353,7 @@ class Algorithm(nn.Module):
         self._exp_replayer_num_envs = num_envs
         self._exp_replayer_length = max_length
         self._prioritized_sampling = prioritized_sampling
+        self._exp_replayer_allow_multithread = allow_multithread
 
     def _set_exp_replayer(self, sample_exp):
         """Initialize the experience replayer for the very first time given a
@@ -278,6 +378,7 @@ class Algorithm(nn.Module):
                 self._exp_replayer_length,
                 prioritized_sampling=self._prioritized_sampling,
                 num_earliest_frames_ignored=self._num_earliest_frames_ignored,
+                allow_multithread=self._exp_replayer_allow_multithread,
                 name="exp_replayer")
         else:
             raise ValueError("invalid experience replayer name")
@@ -348,7 +449,8 @@ class Algorithm(nn.Module):
         Returns:
             Experience: transformed experience
         """
-        return self._data_transformer.transform_experience(experience)
+        with profiler.span("transform_experience"):
+            return self._data_transformer.transform_experience(experience)
 
     def preprocess_experience(self, experience):
         """This function is called on the experiences obtained from a replay
@@ -508,7 +610,11 @@ class Algorithm(nn.Module):
             if isinstance(child, Algorithm):
                 params, child_handled = child._setup_optimizers_()
                 for m in child_handled:
-                    assert m not in handled, duplicate_error % m
+                    # A module without parameters (e.g. the data transformer
+                    # shared by the members of ``PopulationAlgorithm``) can be
+                    # shared by several sub-algorithms.
+                    assert m not in handled or _has_no_params(
+                        m), duplicate_error % m
                     handled.add(m)
             elif isinstance(child, nn.Module):
                 params = child.parameters()
@@ -1000,6 +1106,29 @@ class Algorithm(nn.Module):
         """
         return AlgStep()
 
+    def train_sequence(self, inputs, state):
+        """Perform ``train_step()`` for a whole sequence at once.
+
+        When training with sequences, it is used instead of calling
+        ``train_step()`` at each step if no sample of the mini-batch starts a
+        new episode after the first step. So ``state`` never needs to be
+        reset inside the sequence. Subclass can override it to process the
+        sequence by whole-sequence operations (e.g. the
+        ``forward_sequence()`` of ``LSTMEncodingNetwork``).
+
+        Args:
+            inputs (nested Tensor): inputs for train, with shape ``[T, B, ...]``.
+            state (nested Tensor): the state before the first step,
+                consistent with ``train_state_spec``.
+
+        Returns:
+            AlgStep|None: same as ``train_step()`` except that ``output`` and
+            ``info`` have shape ``[T, B, ...]`` and ``state`` is the state
+            after the last step. ``None`` means that the sequence needs to be
+            processed by ``train_step()`` step by step, which is the default.
+        """
+        return None
+
     # Subclass may override update_with_gradient() to allow customized training
     def update_with_gradient(self,
                              loss_info,
@@ -1009,6 +1138,8 @@ class Algorithm(nn.Module):
         """Complete one iteration of training.
 
         Update parameters using the gradient with respect to ``loss_info``.
+        Under ``mixed_precision.autocast(torch.float16)``, the loss is scaled
+        by a ``LossScaler`` and the update is skipped if the gradients overflow.
 
         Args:
             loss_info (LossInfo): loss with shape :math:`(T, B)` (except for
@@ -1056,9 +1187,18 @@ class Algorithm(nn.Module):
         for optimizer in optimizers:
             optimizer.zero_grad()
 
+        loss_scaler = None
+        if mixed_precision.get_compute_dtype() == torch.float16:
+            if self._loss_scaler is None:
+                self._loss_scaler = mixed_precision.LossScaler()
+            loss_scaler = self._loss_scaler
+
         if isinstance(loss_info.loss, torch.Tensor):
             loss = weight * loss_info.loss
-            loss.backward()
+            if loss_scaler is not None:
+                loss = loss_scaler.scale_loss(loss)
+            with profiler.span("backward"):
+                loss.backward()
 
         all_params = []
         for optimizer in optimizers:
@@ -1070,7 +1210,24 @@ class Algorithm(nn.Module):
                 "' haven't been used for learning any parameters! Please check."
             )
             all_params.extend(params)
-            optimizer.step()
+
+        with profiler.span("optimizer_step"):
+            if data_parallel.is_distributed():
+                data_parallel.all_reduce_gradients(all_params)
+
+            found_inf = False
+            if loss_scaler is not None:
+                found_inf = loss_scaler.unscale_(all_params)
+                loss_scaler.update(found_inf)
+                if found_inf:
+                    logging.warning(
+                        "%s: skip the update because of inf/nan gradients. "
+                        "Loss scale is reduced to %s" % (self.name,
+                                                         loss_scaler.scale))
+
+            if not found_inf:
+                for optimizer in optimizers:
+                    optimizer.step()
 
         all_params = [(self._param_to_name[p], p) for p in all_params]
         return loss_info, all_params
@@ -1159,12 +1316,24 @@ class Algorithm(nn.Module):
         else:
             valid_masks = None
         experience = experience._replace(rollout_info_field='rollout_info')
-        loss_info = self.calc_loss(experience, train_info)
+        with profiler.span("calc_loss"):
+            loss_info = self.calc_loss(experience, train_info)
         loss_info, params = self.update_with_gradient(loss_info, valid_masks)
         self.after_update(experience, train_info)
-        self.summarize_train(experience, train_info, loss_info, params)
+        with profiler.span("summaries"):
+            self.summarize_train(experience, train_info, loss_info, params)
         return torch.tensor(alf.nest.get_nest_shape(experience)).prod()
 
+    def finish_train(self):
+        """Release the resources used by the training.
+
+        Currently it stops the background thread preparing the replayed
+        minibatches if ``config.replay_prefetch_size`` is positive.
+        """
+        if self._replay_prefetcher is not None:
+            self._replay_prefetcher.stop()
+            self._replay_prefetcher = None
+
     @common.mark_replay
     def train_from_replay_buffer(self, update_global_counter=False):
         """This function can be called by any algorithm that has its own
@@ -1203,22 +1372,44 @@ class Algorithm(nn.Module):
         """
         config: TrainerConfig = self._config
 
-        if self._exp_replayer.total_size < config.initial_collect_steps:
+        # All the data-parallel learners need to start training together
+        # since they all-reduce the gradients at every update.
+        if (data_parallel.min_over_learners(self._exp_replayer.total_size) <
+                config.initial_collect_steps):
             # returns 0 if haven't started training yet; throughput will be 0
             return 0
 
         # TODO: If this function can be called asynchronously, and using
         # prioritized replay, then make sure replay and train below is atomic.
-        with record_time("time/replay"):
+        transformed = False
+        with record_time("time/replay"), profiler.span("get_batch"):
             mini_batch_size = config.mini_batch_size
             if mini_batch_size is None:
                 mini_batch_size = self._exp_replayer.batch_size
+            else:
+                # ``config.mini_batch_size`` is the total over all the
+                # data-parallel learners
+                mini_batch_size //= data_parallel.get_world_size()
             if config.whole_replay_buffer_training:
                 experience = self._exp_replayer.replay_all()
                 if config.clear_replay_buffer:
                     self._exp_replayer.clear()
                 num_updates = config.num_updates_per_train_iter
                 batch_info = None
+            elif config.replay_prefetch_size > 0:
+                if self._replay_prefetcher is None:
+                    self._replay_prefetcher = ReplayPrefetcher(
+                        partial(
+                            self._prefetch_experience, mini_batch_size *
+                            config.num_updates_per_train_iter,
+                            config.mini_batch_length),
+                        prefetch_size=config.replay_prefetch_size)
+                    self._replay_prefetcher.start()
+                experience, batch_info = self._replay_prefetcher.get()
+                experience = dist_utils.params_to_distributions(
+                    experience, self._prefetched_experience_spec)
+                num_updates = 1
+                transformed = True
             else:
                 experience, batch_info = self._exp_replayer.replay(
                     sample_batch_size=(
@@ -1228,15 +1419,38 @@ class Algorithm(nn.Module):
 
         with record_time("time/train"):
             return self._train_experience(
-                experience, batch_info, num_updates, mini_batch_size,
+                experience,
+                batch_info,
+                num_updates,
+                mini_batch_size,
                 config.mini_batch_length,
                 (config.update_counter_every_mini_batch
-                 and update_global_counter))
+                 and update_global_counter),
+                transformed=transformed)
+
+    @common.mark_replay
+    def _prefetch_experience(self, sample_batch_size, mini_batch_length):
+        """Sample and transform a batch of experience.
+
+        It is called by the background thread of ``ReplayPrefetcher``. The
+        distributions in the transformed experience are converted to their
+        parameters so that the result only contains tensors.
+        """
+        with profiler.span("get_batch"):
+            experience, batch_info = self._exp_replayer.replay(
+                sample_batch_size=sample_batch_size,
+                mini_batch_length=mini_batch_length)
+        experience = self._transform_replayed_experience(
+            experience, batch_info)
+        experience = self._clear_batch_info(experience)
+        if self._prefetched_experience_spec is None:
+            self._prefetched_experience_spec = dist_utils.extract_spec(
+                experience, from_dim=2)
+        return dist_utils.distributions_to_params(experience), batch_info
 
-    def _train_experience(self, experience, batch_info, num_updates,
-                          mini_batch_size, mini_batch_length,
-                          update_counter_every_mini_batch):
-        """Train using experience."""
+    def _transform_replayed_experience(self, experience, batch_info):
+        """Convert the replayed experience to the input of
+        ``preprocess_experience()``."""
         experience = dist_utils.params_to_distributions(
             experience, self.experience_spec)
         experience = self._add_batch_info(experience, batch_info)
@@ -1244,6 +1458,26 @@ class Algorithm(nn.Module):
             # The experience put in one_time replayer is already transformed
             # in unroll().
             experience = self.transform_experience(experience)
+        return experience
+
+    def _train_experience(self,
+                          experience,
+                          batch_info,
+                          num_updates,
+                          mini_batch_size,
+                          mini_batch_length,
+                          update_counter_every_mini_batch,
+                          transformed=False):
+        """Train using experience.
+
+        If ``transformed`` is True, ``experience`` has already been transformed
+        by ``transform_experience()`` (e.g., by ``_prefetch_experience()``).
+        """
+        if transformed:
+            experience = self._add_batch_info(experience, batch_info)
+        else:
+            experience = self._transform_replayed_experience(
+                experience, batch_info)
         experience = self.preprocess_experience(experience)
         experience = self._clear_batch_info(experience)
         if self._processed_experience_spec is None:
@@ -1314,42 +1548,43 @@ class Algorithm(nn.Module):
             experience)
 
         batch_size = alf.nest.get_nest_batch_size(experience)
-
-        def _make_time_major(nest):
-            """Put the time dim to axis=0."""
-            return alf.nest.map_structure(lambda x: x.transpose(0, 1), nest)
-
-        for u in range(num_updates):
-            if mini_batch_size < batch_size:
-                indices = torch.randperm(batch_size)
-                experience = alf.nest.map_structure(lambda x: x[indices],
-                                                    experience)
-                if batch_info is not None:
-                    batch_info = alf.nest.map_structure(
-                        lambda x: x[indices], batch_info)
-            for b in range(0, batch_size, mini_batch_size):
-                if update_counter_every_mini_batch:
-                    alf.summary.increment_global_counter()
-                is_last_mini_batch = (u == num_updates - 1
-                                      and b + mini_batch_size >= batch_size)
-                do_summary = (is_last_mini_batch
-                              or update_counter_every_mini_batch)
-                alf.summary.enable_summary(do_summary)
-                batch = alf.nest.map_structure(
-                    lambda x: x[b:min(batch_size, b + mini_batch_size)],
-                    experience)
-                if batch_info:
-                    binfo = alf.nest.map_structure(
-                        lambda x: x[b:min(batch_size, b + mini_batch_size)],
-                        batch_info)
-                else:
-                    binfo = None
-                batch = _make_time_major(batch)
-                exp, train_info, loss_info, params = self._update(
-                    batch,
-                    binfo,
-                    weight=alf.nest.get_nest_size(batch, 1) / mini_batch_size)
-                if do_summary:
+        if self._mini_batch_iterator is None:
+            self._mini_batch_iterator = MiniBatchIterator()
+
+        def _mini_batches():
+            for _ in range(num_updates):
+                yield from self._mini_batch_iterator.iterate(
+                    experience,
+                    batch_info or None,
+                    mini_batch_size,
+                    shuffle=mini_batch_size < batch_size)
+
+        num_mini_batches = num_updates * (
+            (batch_size + mini_batch_size - 1) // mini_batch_size)
+        # The gradients are all-reduced over the data-parallel learners at
+        # every update, so all the learners have to do the same number of
+        # updates.
+        total_mini_batches = data_parallel.min_over_learners(num_mini_batches)
+        if total_mini_batches < num_mini_batches:
+            common.warning_once(
+                "Only %s of the %s minibatches are used to match the number "
+                "of updates of the other learners" % (total_mini_batches,
+                                                      num_mini_batches))
+
+        for i, (batch, binfo) in enumerate(
+                itertools.islice(_mini_batches(), total_mini_batches)):
+            if update_counter_every_mini_batch:
+                alf.summary.increment_global_counter()
+            is_last_mini_batch = i == total_mini_batches - 1
+            do_summary = (is_last_mini_batch
+                          or update_counter_every_mini_batch)
+            alf.summary.enable_summary(do_summary)
+            exp, train_info, loss_info, params = self._update(
+                batch,
+                binfo,
+                weight=alf.nest.get_nest_size(batch, 1) / mini_batch_size)
+            if do_summary:
+                with profiler.span("summaries"):
                     self.summarize_train(exp, train_info, loss_info, params)
 
         train_steps = batch_size * mini_batch_length * num_updates
@@ -1365,29 +1600,73 @@ class Algorithm(nn.Module):
             policy_state = initial_train_state
 
         num_steps = alf.nest.get_nest_size(experience, dim=0)
-        info_list = []
+        # Split each field into steps with one operation instead of indexing
+        # all the fields at every step.
+        exp_steps = [x.unbind(0) for x in alf.nest.flatten(experience)]
+        has_distribution = any(
+            isinstance(spec, dist_utils.DistributionSpec)
+            for spec in alf.nest.flatten(self.processed_experience_spec))
+        need_reset = [False] * num_steps
+        if self._exp_contains_step_type:
+            is_first = experience.step_type == StepType.FIRST
+            # Only the steps with some FIRST step need to reset the state.
+            need_reset = is_first.any(dim=1).tolist()
+        elif policy_state != ():
+            common.warning_once(
+                "Policy state is non-empty but the experience doesn't "
+                "contain the 'step_type' field. No way to reinitialize "
+                "the state but will simply keep updating it.")
+
+        if not any(need_reset[1:]):
+            # No episode starts inside the sequence, so it can be processed
+            # as a whole if the algorithm supports it.
+            if need_reset[0]:
+                policy_state = common.reset_state_if_necessary(
+                    policy_state, initial_train_state, is_first[0])
+            exp = experience
+            if has_distribution:
+                exp = dist_utils.params_to_distributions(
+                    exp, self.processed_experience_spec)
+            policy_step = self.train_sequence(exp, policy_state)
+            if policy_step is not None:
+                if self._train_info_spec is None:
+                    self._train_info_spec = dist_utils.extract_spec(
+                        policy_step.info, from_dim=2)
+                return policy_step.info
+
+        info_steps = None
         for counter in range(num_steps):
-            exp = alf.nest.map_structure(lambda ta: ta[counter], experience)
-            exp = dist_utils.params_to_distributions(
-                exp, self.processed_experience_spec)
-            if self._exp_contains_step_type:
+            exp = alf.nest.pack_sequence_as(experience,
+                                            [x[counter] for x in exp_steps])
+            if has_distribution:
+                exp = dist_utils.params_to_distributions(
+                    exp, self.processed_experience_spec)
+            if self._exp_contains_step_type and need_reset[counter]:
                 policy_state = common.reset_state_if_necessary(
-                    policy_state, initial_train_state,
-                    exp.step_type == StepType.FIRST)
-            elif policy_state != ():
-                common.warning_once(
-                    "Policy state is non-empty but the experience doesn't "
-                    "contain the 'step_type' field. No way to reinitialize "
-                    "the state but will simply keep updating it.")
+                    policy_state, initial_train_state, is_first[counter])
             policy_step = self.train_step(exp, policy_state)
             if self._train_info_spec is None:
                 self._train_info_spec = dist_utils.extract_spec(
                     policy_step.info)
-            info_list.append(
-                dist_utils.distributions_to_params(policy_step.info))
+            info = dist_utils.distributions_to_params(policy_step.info)
+            flat_info = alf.nest.flatten(info)
+            if info_steps is None:
+                # Preallocate the outputs for the tensors not requiring grad.
+                # The tensors requiring grad are stacked after the loop since
+                # writing them into a buffer in place would chain one
+                # ``CopySlices`` backward node for each step.
+                info_structure = info
+                info_steps = [[None] * num_steps if x.requires_grad else
+                              x.new_empty((num_steps, ) + x.shape)
+                              for x in flat_info]
+            for steps, x in zip(info_steps, flat_info):
+                steps[counter] = x
             policy_state = policy_step.state
 
-        info = alf.nest.utils.stack_nests(info_list)
+        info = alf.nest.pack_sequence_as(info_structure, [
+            torch.stack(steps) if isinstance(steps, list) else steps
+            for steps in info_steps
+        ])
         info = dist_utils.params_to_distributions(info, self.train_info_spec)
         return info
 
@@ -1429,16 +1708,18 @@ class Algorithm(nn.Module):
 
     def _update(self, experience, batch_info, weight):
         length = alf.nest.get_nest_size(experience, dim=0)
-        if self._config.temporally_independent_train_step or length == 1:
-            train_info = self._collect_train_info_parallelly(experience)
-        else:
-            train_info = self._collect_train_info_sequentially(experience)
+        with profiler.span("train_step"):
+            if self._config.temporally_independent_train_step or length == 1:
+                train_info = self._collect_train_info_parallelly(experience)
+            else:
+                train_info = self._collect_train_info_sequentially(experience)
 
         experience = dist_utils.params_to_distributions(
             experience, self.processed_experience_spec)
 
         experience = self._add_batch_info(experience, batch_info)
-        loss_info = self.calc_loss(experience, train_info)
+        with profiler.span("calc_loss"):
+            loss_info = self.calc_loss(experience, train_info)
         if loss_info.priority != ():
             priority = (loss_info.priority**self._config.priority_replay_alpha
                         + self._config.priority_replay_eps)
@@ -13,14 +13,20 @@
 # limitations under the License.
 
 from absl import logging
+from collections import namedtuple
 import json
 import pprint
+import time
 import torch
+import torch.distributions as td
 import torch.nn as nn
+from unittest.mock import patch
 
 import alf
-from alf.data_structures import LossInfo
-from alf.algorithms.algorithm import Algorithm
+from alf.data_structures import AlgStep, LossInfo, StepType
+from alf.tensor_specs import TensorSpec
+from alf.utils import common, dist_utils
+from alf.algorithms.algorithm import Algorithm, MiniBatchIterator
 
 
 class MyAlg(Algorithm):
@@ -39,6 +45,70 @@ class MyAlg(Algorithm):
         return ['ignored_param']
 
 
+Exp = namedtuple('Exp', ['step_type', 'observation'])
+
+
+class RecurrentAlg(Algorithm):
+    def __init__(self, hidden_size=8):
+        super().__init__(
+            train_state_spec=(TensorSpec((hidden_size, )),
+                              TensorSpec((hidden_size, ))),
+            name="RecurrentAlg")
+        self._cell = nn.LSTMCell(3, hidden_size)
+
+    def train_step(self, exp, state):
+        h, c = self._cell(exp.observation, state)
+        return AlgStep(
+            output=h,
+            state=(h, c),
+            info=dict(
+                dist=td.Normal(loc=h, scale=torch.ones_like(h)),
+                step_type=exp.step_type))
+
+
+class SequenceRecurrentAlg(RecurrentAlg):
+    """``RecurrentAlg`` which unrolls its LSTM cell over a whole sequence."""
+
+    def train_sequence(self, exp, state):
+        cell = self._cell
+        h, c = state
+        h_seq, h, c = torch.lstm(
+            exp.observation, (h.unsqueeze(0), c.unsqueeze(0)),
+            [cell.weight_ih, cell.weight_hh, cell.bias_ih, cell.bias_hh],
+            has_biases=True,
+            num_layers=1,
+            dropout=0.,
+            train=self.training,
+            bidirectional=False,
+            batch_first=False)
+        return AlgStep(
+            output=h_seq,
+            state=(h.squeeze(0), c.squeeze(0)),
+            info=dict(
+                dist=td.Normal(loc=h_seq, scale=torch.ones_like(h_seq)),
+                step_type=exp.step_type))
+
+
+def _collect_train_info_by_loop(alg, experience):
+    """The straightforward implementation of
+    ``Algorithm._collect_train_info_sequentially()``."""
+    batch_size = alf.nest.get_nest_size(experience, dim=1)
+    initial_train_state = alg.get_initial_train_state(batch_size)
+    policy_state = initial_train_state
+    info_list = []
+    for counter in range(alf.nest.get_nest_size(experience, dim=0)):
+        exp = alf.nest.map_structure(lambda ta: ta[counter], experience)
+        exp = dist_utils.params_to_distributions(exp,
+                                                 alg.processed_experience_spec)
+        policy_state = common.reset_state_if_necessary(
+            policy_state, initial_train_state, exp.step_type == StepType.FIRST)
+        policy_step = alg.train_step(exp, policy_state)
+        info_list.append(dist_utils.distributions_to_params(policy_step.info))
+        policy_state = policy_step.state
+    info = alf.nest.utils.stack_nests(info_list)
+    return dist_utils.params_to_distributions(info, alg.train_info_spec)
+
+
 class AlgorithmTest(alf.test.TestCase):
     def test_flatten_module(self):
         a = nn.Module()
@@ -168,6 +238,159 @@ class AlgorithmTest(alf.test.TestCase):
             self.assertTrue(torch.all(param.grad == 1.0))
         self.assertEqual(loss_info.loss, 3.)
 
+    def test_collect_train_info_sequentially(self):
+        length, batch_size = 50, 16
+        step_type = torch.full((length, batch_size), int(StepType.MID))
+        step_type[0] = int(StepType.FIRST)
+        step_type[20, :3] = int(StepType.FIRST)
+        experience = Exp(
+            step_type=step_type,
+            observation=torch.randn(length, batch_size, 3))
+        alg = RecurrentAlg()
+        alg._processed_experience_spec = dist_utils.extract_spec(
+            experience, from_dim=2)
+        alg._exp_contains_step_type = True
+
+        infos = []
+        for func in [
+                alg._collect_train_info_sequentially, lambda exp:
+                _collect_train_info_by_loop(alg, exp)
+        ]:
+            alg.zero_grad()
+            info = func(experience)
+            info['dist'].mean.sum().backward()
+            infos.append((info, [p.grad.clone() for p in alg.parameters()]))
+            func(experience)
+            t0 = time.time()
+            for _ in range(10):
+                func(experience)
+            logging.info(
+                "%s: %.3f ms" %
+                (func.__name__ if hasattr(func, '__self__') else "loop",
+                 (time.time() - t0) * 100))
+
+        (info1, grads1), (info2, grads2) = infos
+        self.assertEqual(info1['step_type'], step_type)
+        self.assertTensorClose(info1['dist'].mean, info2['dist'].mean)
+        for g1, g2 in zip(grads1, grads2):
+            self.assertTensorClose(g1, g2, epsilon=1e-5)
+
+    def test_collect_train_info_by_sequence(self):
+        length, batch_size = 10, 4
+        alg = SequenceRecurrentAlg()
+        alg._exp_contains_step_type = True
+        step_type = torch.full((length, batch_size), int(StepType.MID))
+        step_type[0, :2] = int(StepType.FIRST)
+        for first_inside in [False, True]:
+            if first_inside:
+                step_type[5, 1] = int(StepType.FIRST)
+            experience = Exp(
+                step_type=step_type,
+                observation=torch.randn(length, batch_size, 3))
+            alg._processed_experience_spec = dist_utils.extract_spec(
+                experience, from_dim=2)
+            with patch.object(
+                    alg, 'train_sequence',
+                    wraps=alg.train_sequence) as train_sequence:
+                info1 = alg._collect_train_info_sequentially(experience)
+            # The whole sequence is used only if no episode starts after the
+            # first step.
+            self.assertEqual(train_sequence.call_count, int(not first_inside))
+            info2 = _collect_train_info_by_loop(alg, experience)
+            self.assertEqual(info1['step_type'], step_type)
+            self.assertTensorClose(
+                info1['dist'].mean, info2['dist'].mean, epsilon=1e-6)
+
+
+class MiniBatchIteratorTest(alf.test.TestCase):
+    def test_mini_batch_iterator(self):
+        batch_size, length = 10, 3
+        experience = dict(
+            i=torch.arange(batch_size).unsqueeze(1).expand(-1, length),
+            t=torch.arange(length).unsqueeze(0).expand(batch_size,
+                                                       -1).to(torch.float32))
+        batch_info = torch.arange(batch_size)
+        iterator = MiniBatchIterator()
+        for shuffle in [False, True]:
+            indices = []
+            sizes = []
+            for batch, binfo in iterator.iterate(experience, batch_info, 4,
+                                                 shuffle):
+                sizes.append(batch['i'].shape[1])
+                # time major
+                self.assertEqual(batch['i'].shape[0], length)
+                self.assertEqual(batch['t'],
+                                 experience['t'][:sizes[-1]].transpose(0, 1))
+                self.assertEqual(batch['i'][0], binfo)
+                indices.append(binfo)
+            self.assertEqual(sizes, [4, 4, 2])
+            indices = torch.cat(indices)
+            self.assertEqual(indices.sort()[0], torch.arange(batch_size))
+            if not shuffle:
+                self.assertEqual(indices, torch.arange(batch_size))
+
+        # Whole batch is not copied
+        batches = list(
+            iterator.iterate(experience, batch_info, batch_size, False))
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(batches[0][0]['i'].data_ptr(),
+                         experience['i'].data_ptr())
+
+    def test_mini_batch_iterator_benchmark(self):
+        batch_size, length, mini_batch_size = 256, 4, 32
+        experience = dict(
+            observation=torch.randint(
+                256, (batch_size, length, 4, 84, 84), dtype=torch.uint8),
+            reward=torch.randn(batch_size, length))
+        nbytes = sum(
+            x.numel() * x.element_size() for x in alf.nest.flatten(experience))
+        copied = [0]
+
+        def _count(x, y):
+            """Count the bytes of ``y`` if it is not a view of ``x``."""
+            # The memory range spanned by ``x``
+            begin = x.data_ptr()
+            end = begin + x.element_size() * (1 + sum(
+                (n - 1) * s for n, s in zip(x.shape, x.stride())))
+            if not begin <= y.data_ptr() < end:
+                copied[0] += y.numel() * y.element_size()
+            return y
+
+        def _old():
+            indices = torch.randperm(batch_size)
+            exp = alf.nest.map_structure(lambda x: _count(x, x[indices]),
+                                         experience)
+            for b in range(0, batch_size, mini_batch_size):
+                batch = alf.nest.map_structure(
+                    lambda x: _count(x, x[b:b + mini_batch_size].transpose(
+                        0, 1)), exp)
+                # Consumers usually need contiguous time-major tensors
+                alf.nest.map_structure(lambda x: _count(x, x.contiguous()),
+                                       batch)
+
+        iterator = MiniBatchIterator()
+
+        def _new():
+            for batch, _ in iterator.iterate(experience, None, mini_batch_size,
+                                             True):
+                batch = alf.nest.map_structure(_count, experience, batch)
+                alf.nest.map_structure(lambda x: _count(x, x.contiguous()),
+                                       batch)
+
+        result = {}
+        for name, func in [("permute+transpose", _old), ("gather", _new)]:
+            func()
+            copied[0] = 0
+            t0 = time.time()
+            for _ in range(10):
+                func()
+            result[name] = copied[0] // 10
+            logging.info("%s: %.3f ms per pass, %.1f MB copied per pass" %
+                         (name,
+                          (time.time() - t0) * 100, result[name] / 2**20))
+        self.assertEqual(result["permute+transpose"], 2 * nbytes)
+        self.assertEqual(result["gather"], nbytes)
+
 
 if __name__ == '__main__':
     logging.use_absl_handler()
@@ -0,0 +1,245 @@
+# Copyright (c) 2020 Horizon Robotics and ALF Contributors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unroll an RLAlgorithm in a background thread."""
+
+from absl import logging
+import contextlib
+import itertools
+import queue
+import threading
+import time
+import torch
+
+import alf
+
+
+class AsyncUnroller(object):
+    """Repeatedly unroll a copy of an algorithm in a background thread.
+
+    The unroll thread calls ``rollout_algorithm.unroll()``, which steps the
+    environments and stores the experiences into the replay buffer (through
+    ``observe_for_replay()``) while the training thread is updating the
+    parameters of ``algorithm``. ``rollout_algorithm`` should be a copy of
+    ``algorithm`` sharing the same environment and replay buffer with it. It
+    is kept in eval mode and its parameters and buffers are synced from
+    ``algorithm`` at each ``get()``, so the unroll thread never sees the
+    parameters in the middle of an update. Because the sync overwrites all the
+    buffers of ``rollout_algorithm``, the statistics updated by it during
+    unroll (e.g., a normalizer with ``update_mode="rollout"``) are discarded.
+
+    The unrolled experiences are handed to the training thread through
+    ``get()``, which is expected to be called once every training iteration.
+    The time steps observed by the unroll are also passed to
+    ``algorithm.observe_for_metrics()`` by ``get()`` so that the metrics are
+    only updated by the training thread.
+
+    The number of unrolls that the unroll thread can be ahead of the training
+    is bounded by ``max_policy_lag``. Since ``get()`` is called once for each
+    training iteration, the experience returned by ``get()`` is collected by
+    a policy at most ``max_policy_lag`` training iterations old.
+
+    Note that the execution mode (``common.is_rollout()`` etc.) and the summary
+    states are kept per thread. So ``unroll()`` in the background thread
+    does not write summaries. The unroll related summaries should be written by
+    the training thread using the experience returned by ``get()``.
+    """
+
+    def __init__(self,
+                 algorithm,
+                 rollout_algorithm,
+                 unroll_length,
+                 max_policy_lag=1):
+        """
+        Args:
+            algorithm (RLAlgorithm): the algorithm being trained.
+            rollout_algorithm (RLAlgorithm): a copy of ``algorithm`` to be
+                unrolled.
+            unroll_length (int): number of steps for each ``unroll()``.
+            max_policy_lag (int): the maximal number of unrolls the unroll
+                thread can be ahead of the consumer calling ``get()``.
+        """
+        assert max_policy_lag >= 1, (
+            "max_policy_lag should be at least 1. Got %s" % max_policy_lag)
+        assert rollout_algorithm is not algorithm, (
+            "rollout_algorithm should be a copy of algorithm")
+        self._algorithm = algorithm
+        self._rollout_algorithm = rollout_algorithm
+        self._unroll_length = unroll_length
+        self._slots = threading.Semaphore(max_policy_lag)
+        self._queue = queue.Queue()
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._pause_lock = threading.Lock()
+        self._num_gets = 0
+        self._synced_gets = 0
+        self._loaded_gets = 0
+        self._busy_time = 0.
+        self._wait_time = 0.
+        self._error = None
+
+        rollout_tensors = dict(
+            itertools.chain(rollout_algorithm.named_parameters(),
+                            rollout_algorithm.named_buffers()))
+        self._tensors = []
+        for name, t in itertools.chain(algorithm.named_parameters(),
+                                       algorithm.named_buffers()):
+            assert name in rollout_tensors, (
+                "%s is not found in rollout_algorithm" % name)
+            if rollout_tensors[name] is not t:
+                self._tensors.append((t, rollout_tensors[name]))
+        self._staging = [t.detach().clone() for t, _ in self._tensors]
+
+        self._time_steps = []
+        rollout_algorithm.observe_for_metrics = self._observe_for_metrics
+        self._thread = threading.Thread(
+            target=self._run, name="AsyncUnroller", daemon=True)
+
+    def start(self):
+        """Start the unroll thread."""
+        self._thread.start()
+
+    def stop(self):
+        """Stop the unroll thread and wait for it to finish."""
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    @property
+    def is_running(self):
+        """Whether the unroll thread is running."""
+        return self._thread.is_alive()
+
+    @contextlib.contextmanager
+    def paused(self):
+        """A context within which the unroll thread is not unrolling.
+
+        Entering it waits for the current unroll to finish. It can be used to
+        access the objects shared with the unroll thread (e.g. the replay
+        buffer and the environments), such as when saving a checkpoint.
+        """
+        with self._pause_lock:
+            yield
+
+    def _acquire(self, lock):
+        while not lock.acquire(timeout=0.1):
+            if self._stop_event.is_set():
+                return False
+        return True
+
+    def _observe_for_metrics(self, time_step):
+        # The observation is not needed by the metrics
+        self._time_steps.append(
+            alf.nest.map_structure(torch.clone,
+                                   time_step._replace(observation=())))
+
+    def _load_parameters(self):
+        """Load the parameters staged by ``get()`` into the rollout algorithm.
+
+        Returns:
+            int: the number of calls to ``get()`` when the parameters were
+            staged.
+        """
+        with self._sync_lock:
+            if self._loaded_gets != self._synced_gets:
+                for (_, r), s in zip(self._tensors, self._staging):
+                    r.data.copy_(s)
+                self._loaded_gets = self._synced_gets
+            return self._loaded_gets
+
+    def _run(self):
+        try:
+            self._rollout_algorithm.eval()
+            while not self._stop_event.is_set():
+                t0 = time.time()
+                if not self._acquire(self._slots):
+                    return
+                if not self._acquire(self._pause_lock):
+                    return
+                try:
+                    t1 = time.time()
+                    start_gets = self._load_parameters()
+                    with torch.no_grad():
+                        experience = self._rollout_algorithm.unroll(
+                            self._unroll_length)
+                    time_steps = list(self._time_steps)
+                    self._time_steps.clear()
+                finally:
+                    self._pause_lock.release()
+                t2 = time.time()
+                self._queue.put((experience, start_gets, time_steps))
+                with self._lock:
+                    self._wait_time += t1 - t0
+                    self._busy_time += t2 - t1
+        except Exception as e:
+            logging.exception("Exception in the unroll thread")
+            self._error = e
+            self._queue.put(None)
+
+    def _stage_parameters(self):
+        """Copy the current parameters of ``algorithm`` for the unroll thread."""
+        with self._sync_lock:
+            with torch.no_grad():
+                for (t, _), s in zip(self._tensors, self._staging):
+                    s.copy_(t)
+            self._synced_gets = self._num_gets
+
+    def get(self):
+        """Get the experience of the next unroll.
+
+        It blocks until the experience is available. The time steps observed
+        by the unroll are passed to ``algorithm.observe_for_metrics()``, and
+        the current parameters of ``algorithm`` are staged to be used by the
+        unrolls started after this call.
+
+        Returns:
+            tuple:
+            - Experience: the experience returned by ``unroll()``
+            - int: the number of training iterations (i.e., the number of calls
+              to ``get()``, including this one) since the parameters used by
+              the unroll were staged.
+        """
+        while True:
+            if self._error is not None:
+                raise RuntimeError("The unroll thread failed") from self._error
+            try:
+                item = self._queue.get(timeout=0.1)
+                break
+            except queue.Empty:
+                if not self._thread.is_alive():
+                    raise RuntimeError("The unroll thread is not running")
+        if item is None:
+            raise RuntimeError("The unroll thread failed") from self._error
+        experience, start_gets, time_steps = item
+        for time_step in time_steps:
+            self._algorithm.observe_for_metrics(time_step)
+        self._num_gets += 1
+        self._stage_parameters()
+        self._slots.release()
+        return experience, self._num_gets - start_gets
+
+    def pop_utilization(self):
+        """Get the utilization of the unroll thread.
+
+        Returns:
+            float: the fraction of time the unroll thread spent on unrolling
+            since the last call of this function. It is ``None`` if no unroll
+            is finished since the last call.
+        """
+        with self._lock:
+            total = self._busy_time + self._wait_time
+            utilization = self._busy_time / total if total > 0 else None
+            self._busy_time = 0.
+            self._wait_time = 0.
+        return utilization
@@ -29,9 +29,13 @@ class TrainerConfig(object):
                  num_env_steps=0,
                  unroll_length=8,
                  unroll_with_grad=False,
+                 async_unroll=False,
+                 async_max_policy_lag=1,
                  use_rollout_state=False,
                  temporally_independent_train_step=None,
                  num_checkpoints=10,
+                 async_checkpoint=False,
+                 incremental_replay_buffer_checkpoint=False,
                  confirm_checkpoint_upon_crash=True,
                  load_checkpoint_strict=True,
                  evaluate=False,
@@ -43,9 +47,13 @@ class TrainerConfig(object):
                  update_counter_every_mini_batch=False,
                  summaries_flush_secs=1,
                  summary_max_queue=10,
+                 deferred_summary=False,
                  metric_min_buffer_size=10,
                  debug_summaries=False,
                  profiling=False,
+                 timeline_profiling=False,
+                 timeline_profiling_interval=100,
+                 mixed_precision=False,
                  summarize_grads_and_vars=False,
                  summarize_action_distributions=False,
                  summarize_output=False,
@@ -55,12 +63,14 @@ class TrainerConfig(object):
                  mini_batch_size=None,
                  whole_replay_buffer_training=True,
                  replay_buffer_length=1024,
+                 replay_prefetch_size=0,
                  priority_replay=False,
                  priority_replay_alpha=0.7,
                  priority_replay_beta=0.4,
                  priority_replay_eps=1e-6,
                  clear_replay_buffer=True,
-                 num_envs=1):
+                 num_envs=1,
+                 num_learners=1):
         """
         Args:
             root_dir (str): directory for saving summary and checkpoints
@@ -93,6 +103,24 @@ class TrainerConfig(object):
                 is an on-policy sub-algorithm, we can enable this flag for its
                 training. ``OnPolicyAlgorithm`` always unrolls with grads and this
                 flag doesn't apply to it.
+            async_unroll (bool): If True, ``unroll()`` is performed by a
+                background thread which keeps stepping the environments and
+                storing experiences into the replay buffer while the training
+                is going on. Only used by ``OffPolicyAlgorithm`` with a replay
+                buffer which is not cleared after each training iteration (i.e.,
+                not both ``whole_replay_buffer_training`` and
+                ``clear_replay_buffer``), and ``unroll_with_grad`` must be False.
+                The unroll thread uses a copy of the algorithm in eval mode,
+                whose parameters and buffers are synced from the trained
+                algorithm at every training iteration. So the statistics updated
+                during unroll (e.g. by a normalizer with
+                ``update_mode="rollout"``) are not kept.
+            async_max_policy_lag (int): the maximal number of unrolls the
+                background unroll thread can be ahead of the training iterations
+                when ``async_unroll`` is True. The unroll thread waits when
+                it is this many unrolls ahead, and training waits when there is
+                no new unroll. So the experience of each unroll is collected
+                by a policy at most so many training iterations old.
             use_rollout_state (bool): If True, when off-policy training, the RNN
                 states will be taken from the replay buffer; otherwise they will
                 be set to 0. In the case of True, the ``train_state_spec`` of an
@@ -107,6 +135,16 @@ class TrainerConfig(object):
                 ``None``, its value is inferred based on whether the algorithm
                 has RNN state (``True`` if there is RNN state, ``False`` if not).
             num_checkpoints (int): how many checkpoints to save for the training
+            async_checkpoint (bool): If True, the checkpoint files are written
+                by a background thread so that the training can continue while
+                they are being written. The states are copied to CPU memory
+                first, which needs as much memory as the checkpoint.
+            incremental_replay_buffer_checkpoint (bool): If True, each checkpoint
+                only saves the replay buffer entries changed since the previous
+                checkpoint of the same run. Restoring such a checkpoint needs
+                all the previous checkpoints of the run back to the first one
+                (or the one it was resumed from), which saves the whole replay
+                buffer.
             confirm_checkpoint_upon_crash (bool): whether to prompt for whether
                 do checkpointing after crash.
             load_checkpoint_strict (bool): whether to strictly enforce that the keys
@@ -131,11 +169,33 @@ class TrainerConfig(object):
                 debugging. Only used by ``OffPolicyAlgorithm``.
             summaries_flush_secs (int): flush summary to disk every so many seconds
             summary_max_queue (int): flush to disk every so mary summaries
+            deferred_summary (bool): If True, the tensors of the summaries
+                are copied to CPU in one batch per summary step and the events
+                are written by a background thread (see
+                ``alf.summary.DeferredSummaryWriter``), so that recording
+                summaries does not synchronize with the GPU. The summaries
+                appear in the event file one summary step later.
             metric_min_buffer_size (int): a minimal size of the buffer used to
                 construct some average episodic metrics used in ``RLAlgorithm``.
             debug_summaries (bool): A bool to gather debug summaries.
             profiling (bool): If True, use cProfile to profile the training. The
                 profile result will be written to ``root_dir``/py_train.INFO.
+            timeline_profiling (bool): If True, record the time of the phases
+                (e.g. ``unroll``, ``env_step``, ``train_step``, ``backward``) of
+                the sampled training iterations with
+                ``alf.utils.profiler.TimelineProfiler``. When the training
+                finishes, a Chrome trace ``timeline.json`` (viewable in
+                ``chrome://tracing`` or Perfetto) and a per-phase table
+                ``timeline_summary.txt`` are written to ``root_dir/train``.
+            timeline_profiling_interval (int): record one training iteration out
+                of every so many iterations for ``timeline_profiling``.
+            mixed_precision (bool): If True, the matrix multiplications and
+                convolutions of the layers in ``alf.layers`` are computed in
+                ``torch.bfloat16`` on CPU or ``torch.float16`` on CUDA (see
+                ``alf.utils.mixed_precision``). The parameters and the other
+                computations stay in ``torch.float32``. For ``torch.float16``,
+                the losses are scaled dynamically to avoid the underflow of
+                the gradients.
             summarize_grads_and_vars (bool): If True, gradient and network variable
                 summaries will be written during training.
             summarize_output (bool): If True, summarize output of certain networks.
@@ -158,6 +218,21 @@ class TrainerConfig(object):
             replay_buffer_length (int): the maximum number of steps the replay
                 buffer store for each environment. Only used by
                 ``OffPolicyAlgorithm``.
+            replay_prefetch_size (int): if positive, the minibatches are
+                sampled from the replay buffer and transformed by
+                ``transform_experience()`` in a background thread, which keeps
+                so many minibatches ready ahead of the training. Not used if
+                ``whole_replay_buffer_training`` is True. Note that a
+                minibatch may be sampled up to ``replay_prefetch_size``
+                updates before it is used for training. So its priorities and
+                importance weights may be outdated, and some of its samples may
+                have been overwritten in the replay buffer by then, whose
+                priorities will not be updated (see
+                ``ReplayBuffer.update_priority()``). It cannot be used with a
+                data transformer updating its statistics during replay (e.g.
+                ``ObservationNormalizer`` with ``update_mode="replay"``),
+                since the statistics would be updated by the background
+                thread.
             priority_replay (bool): Use prioritized sampling if this is True.
             priority_replay_alpha (float): The priority from LossInfo is powered
                 to this as an argument for ``ReplayBuffer.update_priority()``.
@@ -172,6 +247,18 @@ class TrainerConfig(object):
                 ``ReplayBuffer``.
             priority_replay_eps (float): minimum priority for priority replay.
             num_envs (int): the number of environments to run asynchronously.
+            num_learners (int): the number of data-parallel learner processes.
+                If greater than 1, ``alf.bin.train`` spawns so many processes,
+                each of which runs its own environments, replay buffer and
+                algorithm. Each learner uses ``mini_batch_size / num_learners``
+                samples for each update and the gradients are averaged over
+                all the learners before every optimizer step (see
+                ``alf.utils.data_parallel``). Only the learner with rank 0
+                writes summaries, evaluates and saves checkpoints. So when
+                resuming from a checkpoint, only the learner with rank 0
+                restores its replay buffer and metrics. The other learners
+                start with the experiences collected by the iteration run
+                before loading the checkpoint.
         """
         assert priority_replay_beta >= 0.0, ("importance_weight_beta should "
                                              "be non-negative be")
@@ -186,9 +273,14 @@ class TrainerConfig(object):
             num_env_steps=num_env_steps,
             unroll_length=unroll_length,
             unroll_with_grad=unroll_with_grad,
+            async_unroll=async_unroll,
+            async_max_policy_lag=async_max_policy_lag,
             use_rollout_state=use_rollout_state,
             temporally_independent_train_step=temporally_independent_train_step,
             num_checkpoints=num_checkpoints,
+            async_checkpoint=async_checkpoint,
+            incremental_replay_buffer_checkpoint=(
+                incremental_replay_buffer_checkpoint),
             confirm_checkpoint_upon_crash=confirm_checkpoint_upon_crash,
             load_checkpoint_strict=load_checkpoint_strict,
             evaluate=evaluate,
@@ -200,9 +292,13 @@ class TrainerConfig(object):
             update_counter_every_mini_batch=update_counter_every_mini_batch,
             summaries_flush_secs=summaries_flush_secs,
             summary_max_queue=summary_max_queue,
+            deferred_summary=deferred_summary,
             metric_min_buffer_size=metric_min_buffer_size,
             debug_summaries=debug_summaries,
             profiling=profiling,
+            timeline_profiling=timeline_profiling,
+            timeline_profiling_interval=timeline_profiling_interval,
+            mixed_precision=mixed_precision,
             summarize_grads_and_vars=summarize_grads_and_vars,
             summarize_action_distributions=summarize_action_distributions,
             summarize_output=summarize_output,
@@ -213,10 +309,12 @@ class TrainerConfig(object):
             whole_replay_buffer_training=whole_replay_buffer_training,
             clear_replay_buffer=clear_replay_buffer,
             replay_buffer_length=replay_buffer_length,
+            replay_prefetch_size=replay_prefetch_size,
             priority_replay=priority_replay,
             priority_replay_alpha=priority_replay_alpha,
             priority_replay_beta=priority_replay_beta,
             priority_replay_eps=priority_replay_eps,
-            num_envs=num_envs)
+            num_envs=num_envs,
+            num_learners=num_learners)
         for k, v in parameters.items():
             self.__setattr__(k, v)
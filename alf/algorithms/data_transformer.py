@@ -73,6 +73,13 @@ class DataTransformer(nn.Module):
         """Get the state spec of this transformer."""
         return self._state_spec
 
+    @property
+    def updates_in_replay(self):
+        """Whether ``transform_experience()`` updates the parameters or buffers
+        of this transformer (e.g. the statistics of a normalizer) during
+        replay."""
+        return False
+
     def transform_timestep(self, timestep: TimeStep, state):
         """Transform a TimeStep structure.
 
@@ -145,6 +152,10 @@ class SequentialDataTransformer(DataTransformer):
     def stack_size(self):
         return self._stack_size
 
+    @property
+    def updates_in_replay(self):
+        return any(t.updates_in_replay for t in self._data_transformers)
+
     def transform_timestep(self, timestep: TimeStep, state):
         new_state = []
         for trans, state in zip(self._data_transformers, state):
@@ -528,6 +539,10 @@ class ObservationNormalizer(SimpleDataTransformer):
         else:
             raise ValueError("Unsupported mode: " + mode)
 
+    @property
+    def updates_in_replay(self):
+        return self._update_mode == "replay"
+
     def _transform(self, timestep_or_exp):
         """Normalize a given observation. If during unroll, then first update
         the normalizer. The normalizer won't be updated in other circumstances.
@@ -599,6 +614,10 @@ class RewardNormalizer(SimpleDataTransformer):
         self._clip_value = clip_value
         self._update_mode = update_mode
 
+    @property
+    def updates_in_replay(self):
+        return self._update_mode == "replay"
+
     def _transform(self, timestep_or_exp):
         norm = self._normalizer
         if ((self._update_mode == "replay" and common.is_replay())
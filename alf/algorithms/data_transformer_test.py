@@ -27,8 +27,8 @@ DataItem = namedtuple(
 
 
 class FrameStackerTest(parameterized.TestCase, alf.test.TestCase):
-    @parameterized.parameters(-1, 0)
-    def test_frame_stacker(self, stack_axis=0):
+    @parameterized.parameters((-1, None), (0, None), (0, "zlib"))
+    def test_frame_stacker(self, stack_axis=0, compression=None):
         data_spec = DataItem(
             step_type=alf.TensorSpec((), dtype=torch.int32),
             observation=dict(
@@ -40,7 +40,9 @@ class FrameStackerTest(parameterized.TestCase, alf.test.TestCase):
             data_spec=data_spec,
             num_environments=2,
             max_length=1024,
-            num_earliest_frames_ignored=2)
+            num_earliest_frames_ignored=2,
+            compressed_fields=['observation'] if compression else None,
+            compression=compression)
         frame_stacker = FrameStacker(
             data_spec.observation,
             stack_size=3,
@@ -26,14 +26,20 @@ from alf.algorithms.off_policy_algorithm import OffPolicyAlgorithm
 from alf.utils import dist_utils
 from alf import nest
 from alf.trainers.policy_trainer import Trainer
-from alf.utils import common, tensor_utils
+from alf.utils import common, spec_utils, tensor_utils
+from . import mcts_kernels
 from .mcts_models import MCTSModel, ModelOutput
 
 MAXIMUM_FLOAT_VALUE = float('inf')
 
 
 class _MCTSTree(object):
-    def __init__(self, num_expansions, model_output, known_value_bounds):
+    def __init__(self,
+                 num_expansions,
+                 model_output,
+                 known_value_bounds,
+                 use_jit=False):
+        self.use_jit = use_jit
         batch_size, branch_factor = model_output.action_probs.shape
         action_spec = dist_utils.extract_spec(model_output.actions, from_dim=2)
         state_spec = dist_utils.extract_spec(model_output.state, from_dim=1)
@@ -101,13 +107,21 @@ class _MCTSTree(object):
 
         Only valid values are used to update the stats.
         We maintain separate stats for each tree.
-        The shapes of ``nodes`` and ``valid`` are [T, B].
-        The invalid entries in ``values`` will be modified.
+        The shapes of ``nodes`` and ``valid`` are [T, N], where N is a multiple
+        of the batch size B and the n-th column is for the ``n % B``-th tree.
         """
         if self.fixed_bounds:
             return
-        values = self.calc_value(nodes)
-        invalid = ~valid
+        if self.use_jit:
+            (self.minimum, self.maximum, self.normalize_scale,
+             self.normalize_base) = mcts_kernels.update_value_stats(
+                 self.visit_count, self.value_sum, nodes[0], nodes[1], valid,
+                 self.minimum, self.maximum, self.normalize_scale,
+                 self.normalize_base)
+            return
+        batch_size = self.B.shape[0]
+        values = self.calc_value(nodes).reshape(-1, batch_size)
+        invalid = ~valid.reshape(-1, batch_size)
         values[invalid] = -MAXIMUM_FLOAT_VALUE
         self.maximum = torch.max(self.maximum, values.max(dim=0)[0])
         values[invalid] = MAXIMUM_FLOAT_VALUE
@@ -130,10 +144,23 @@ class _MCTSTree(object):
 
 
 def _nest_slice(nested, i):
-    return nest.map_structure(lambda x: x[i], nested)
-
-
-MCTSState = namedtuple("MCTSState", ["steps"])
+    return nest.map_structure(lambda x: x[i] if x is not None else None,
+                              nested)
+
+
+# The subtree under the chosen action kept for the next search. The nodes are
+# re-indexed so that the root of the subtree is 0 and a node is always after
+# its parent. Unused nodes have zero ``visit_count``. A subtree is invalid if
+# the ``visit_count`` of its root is 0 (e.g. the state is reset). ``game_over``
+# is uint8 because ``torch.where()`` does not support bool for resetting states.
+MCTSSubtree = namedtuple(
+    "MCTSSubtree", [
+        "visit_count", "value_sum", "to_play", "prior", "children_index",
+        "model_state", "reward", "action", "game_over"
+    ],
+    default_value=())
+
+MCTSState = namedtuple("MCTSState", ["steps", "subtree"], default_value=())
 MCTSInfo = namedtuple(
     "MCTSInfo", ["candidate_actions", "value", "candidate_action_policy"])
 
@@ -194,6 +221,9 @@ class MCTSAlgorithm(OffPolicyAlgorithm):
             act_with_exploration_policy=False,
             search_with_exploration_policy=False,
             learn_with_exploration_policy=False,
+            num_parallel_sims=1,
+            max_reused_nodes=0,
+            use_jit=False,
             debug_summaries=False,
     ):
         r"""
@@ -243,6 +273,28 @@ class MCTSAlgorithm(OffPolicyAlgorithm):
                 using reverse KL divergence will be used for tree search.
             learn_with_exploration_policy (bool): If True, a policy calculated
                 using reverse KL divergence will be used for learning.
+            num_parallel_sims (int): the number of simulations performed
+                together for each tree. In each iteration, ``num_parallel_sims``
+                leaves are selected one after another for each tree. A virtual
+                loss is added to the nodes of each selected path so that the
+                following selections tend to explore different paths. Then all
+                the leaves of all the trees are evaluated by one call of
+                ``recurrent_inference()`` and backed up together. This reduces
+                the number of iterations (and model calls) of a search by
+                ``num_parallel_sims`` times at the cost of slightly weaker
+                search with the same ``num_simulations``.
+            max_reused_nodes (int): If positive, the subtree under the chosen
+                action is kept in ``MCTSState.subtree`` and the next search
+                starts from it instead of a new tree, so that the statistics of
+                the previous search are reused. At most so many nodes (those
+                expanded earliest) of the subtree are kept. Note that
+                ``MCTSState`` becomes large, and the subtree is only valid if
+                the next ``time_step`` is the result of the chosen action, which
+                is the case for self-play.
+            use_jit (bool): If True, the tree search, the UCB scores, the
+                backup and the value stats are computed by the TorchScript
+                kernels in ``mcts_kernels``, which give the same results with
+                less python overhead.
         """
         assert not nest.is_nested(
             action_spec), "nested action_spec is not supported"
@@ -264,6 +316,12 @@ class MCTSAlgorithm(OffPolicyAlgorithm):
         self._act_with_exploration_policy = act_with_exploration_policy
         self._search_with_exploration_policy = search_with_exploration_policy
         self._learn_with_exploration_policy = learn_with_exploration_policy
+        assert num_parallel_sims >= 1
+        self._num_parallel_sims = num_parallel_sims
+        self._max_reused_nodes = max_reused_nodes
+        self._use_jit = use_jit
+        self._unexpanded_mode, self._unexpanded_value = (
+            mcts_kernels.unexpanded_value_mode(unexpanded_value_score))
 
         super().__init__(
             observation_spec,
@@ -273,8 +331,51 @@ class MCTSAlgorithm(OffPolicyAlgorithm):
             debug_summaries=debug_summaries)
 
     def set_model(self, model: MCTSModel):
-        """Set the model used by the algorithm."""
+        """Set the model used by the algorithm.
+
+        If ``max_reused_nodes`` is positive, the state specs are updated for
+        the first model to include the spec of ``MCTSState.subtree``.
+        """
         self._model = model
+        if self._max_reused_nodes > 0 and self._train_state_spec.subtree == ():
+            state_spec = self._train_state_spec._replace(
+                subtree=self._get_subtree_spec(model))
+            self._train_state_spec = state_spec
+            self._rollout_state_spec = state_spec
+            self._predict_state_spec = state_spec
+
+    def _get_subtree_spec(self, model: MCTSModel):
+        """Get the spec of ``MCTSSubtree`` from the output of ``model``."""
+        training = model.training
+        model.eval()
+        with torch.no_grad():
+            model_output = model.initial_inference(
+                spec_utils.zeros_from_spec(self._observation_spec, 2))
+        model.train(training)
+        S = self._max_reused_nodes
+        branch_factor = model_output.action_probs.shape[1]
+
+        def _spec(x, from_dim, dtype=None):
+            spec = dist_utils.extract_spec(x, from_dim=from_dim)
+            return TensorSpec((S, ) + spec.shape, dtype or spec.dtype)
+
+        def _optional_spec(x, from_dim):
+            if isinstance(x, torch.Tensor):
+                return _spec(x, from_dim)
+            return ()
+
+        return MCTSSubtree(
+            visit_count=TensorSpec((S, ), torch.int32),
+            value_sum=TensorSpec((S, )),
+            to_play=TensorSpec((S, ), torch.int64),
+            prior=TensorSpec((S, branch_factor)),
+            children_index=TensorSpec((S, branch_factor), torch.int64),
+            model_state=nest.map_structure(lambda x: _spec(x, 1),
+                                           model_output.state),
+            reward=_optional_spec(model_output.reward, 1),
+            action=_optional_spec(model_output.actions, 1),
+            game_over=TensorSpec((S, ), torch.uint8) if isinstance(
+                model_output.game_over, torch.Tensor) else ())
 
     @property
     def discount(self):
@@ -314,8 +415,26 @@ class MCTSAlgorithm(OffPolicyAlgorithm):
                 action_probs=model_output.action_probs *
                 valid_action_mask.to(torch.float32))
 
-        trees = _MCTSTree(self._num_simulations + 1, model_output,
-                          self._known_value_bounds)
+        subtree = ()
+        if self._max_reused_nodes > 0:
+            subtree = state.subtree
+        if subtree != () and isinstance(model_output.actions, torch.Tensor):
+            # The children of the reused root are for its original candidate
+            # actions.
+            valid = subtree.visit_count[:, 0] > 0
+            model_output = model_output._replace(
+                actions=torch.where(
+                    valid.reshape(-1, *([1] * (subtree.action.ndim - 2))),
+                    subtree.action[:, 0], model_output.actions),
+                action_probs=torch.where(
+                    valid.unsqueeze(-1), subtree.prior[:, 0],
+                    model_output.action_probs))
+
+        # The first ``offset + 1`` nodes are for the reused subtree. The new
+        # node of the i-th simulation is ``offset + i``.
+        offset = max(self._max_reused_nodes - 1, 0)
+        trees = _MCTSTree(offset + self._num_simulations + 1, model_output,
+                          self._known_value_bounds, self._use_jit)
         if self._is_two_player_game and to_plays is None:
             # We may need the environment to pass to_play and pass to_play to
             # model because players may not always alternate in some game.
@@ -335,9 +454,20 @@ class MCTSAlgorithm(OffPolicyAlgorithm):
         # will be based on none-zero ucb_scores
         trees.visit_count[roots] = 1
         trees.value_sum[roots] = model_output.value
+        if subtree != ():
+            self._restore_subtree(trees, subtree)
         self._update_best_child(trees, roots)
 
-        for sim in range(1, self._num_simulations + 1):
+        if self._num_parallel_sims > 1:
+            for sim in range(1, self._num_simulations + 1,
+                             self._num_parallel_sims):
+                self._parallel_simulations(
+                    trees, to_plays, offset + sim,
+                    min(self._num_parallel_sims,
+                        self._num_simulations + 1 - sim))
+            return self._make_step(trees, state, steps)
+
+        for sim in range(offset + 1, offset + self._num_simulations + 1):
             search_paths, path_lengths, last_to_plays = self._search(
                 trees, to_plays)
             prev_nodes = search_paths[path_lengths - 2, trees.B]
@@ -363,9 +493,129 @@ class MCTSAlgorithm(OffPolicyAlgorithm):
                 path_lengths=path_lengths,
                 values=model_output.value)
 
-        action, info = self._select_action(trees, steps)
-        return AlgStep(
-            output=action, state=MCTSState(steps=state.steps + 1), info=info)
+        return self._make_step(trees, state, steps)
+
+    def _make_step(self, trees: _MCTSTree, state: MCTSState, steps):
+        action, action_id, info = self._select_action(trees, steps)
+        new_state = MCTSState(steps=state.steps + 1)
+        if self._max_reused_nodes > 0:
+            new_state = new_state._replace(
+                subtree=self._extract_subtree(trees, action_id))
+        return AlgStep(output=action, state=new_state, info=info)
+
+    def _extract_subtree(self, trees: _MCTSTree, action_id):
+        """Extract the subtree under the chosen child of each root.
+
+        If the subtree has more than ``max_reused_nodes`` nodes, only the
+        earliest expanded nodes are kept. Since a node is always expanded after
+        its parent, the kept nodes still form a tree.
+        """
+        B = trees.B
+        S = self._max_reused_nodes
+        N = trees.visit_count.shape[1]
+        new_roots = trees.children_index[B, trees.root_indices, action_id]
+        valid = new_roots != 0
+        if trees.game_over is not None:
+            valid = valid & ~trees.game_over[B, new_roots]
+
+        in_subtree = torch.zeros_like(trees.visit_count, dtype=torch.bool)
+        in_subtree[B, new_roots] = valid
+        frontier = in_subtree
+        while torch.any(frontier):
+            b, n = torch.nonzero(frontier, as_tuple=True)
+            children = trees.children_index[b, n]
+            expanded = children != 0
+            frontier = torch.zeros_like(in_subtree)
+            frontier[b.unsqueeze(-1).
+                     expand_as(children)[expanded], children[expanded]] = True
+            in_subtree = in_subtree | frontier
+
+        # new index of each node in the subtree
+        new_index = in_subtree.cumsum(dim=1) - 1
+        keep = in_subtree & (new_index < S)
+        new_index = torch.where(keep, new_index, torch.zeros_like(new_index))
+        # [B, S], the old indices of the kept nodes in ascending order
+        slots = torch.arange(N).unsqueeze(0)
+        nodes = torch.where(keep, slots, slots + N).argsort(dim=1)[:, :S]
+        used = torch.arange(S).unsqueeze(0) < keep.sum(dim=1, keepdim=True)
+        nodes = (B.unsqueeze(-1), nodes)
+
+        def _gather(x):
+            x = x[nodes]
+            x[~used] = 0
+            return x
+
+        children_index = _gather(trees.children_index)
+        children_index = new_index[B.reshape(-1, 1, 1), children_index]
+        visit_count = _gather(trees.visit_count)
+        value_sum = _gather(trees.value_sum)
+        # Children may be dropped. Make the visit count of the root consistent
+        # with its children so that the policy calculated from the visit counts
+        # of the children of the root is still normalized.
+        children_visit_count = visit_count[B.
+                                           unsqueeze(-1), children_index[:, 0]]
+        children_visit_count[children_index[:, 0] == 0] = 0
+        root_visit_count = children_visit_count.sum(dim=1) + 1
+        value_sum[:, 0] = value_sum[:, 0] * root_visit_count / (
+            visit_count[:, 0] + 1e-30)
+        visit_count[:, 0] = root_visit_count.to(torch.int32) * valid
+
+        def _optional(x):
+            return _gather(x) if x is not None else ()
+
+        game_over = ()
+        if trees.game_over is not None:
+            game_over = _gather(trees.game_over).to(torch.uint8)
+
+        return MCTSSubtree(
+            visit_count=visit_count,
+            value_sum=value_sum,
+            to_play=_gather(trees.to_play),
+            prior=_gather(trees.prior),
+            children_index=children_index,
+            model_state=nest.map_structure(_gather, trees.model_state),
+            reward=_optional(trees.reward),
+            action=_optional(trees.action),
+            game_over=game_over)
+
+    def _restore_subtree(self, trees: _MCTSTree, subtree: MCTSSubtree):
+        """Put the nodes of ``subtree`` into the first nodes of ``trees``.
+
+        The root (node 0) has been expanded from the current observation. Only
+        its visit count, value and children are taken from ``subtree``.
+        """
+        valid = subtree.visit_count[:, 0] > 0
+        b = trees.B[valid]
+        S = self._max_reused_nodes
+
+        def _restore(x, y):
+            x[b, 1:S] = y[valid, 1:]
+
+        _restore(trees.visit_count, subtree.visit_count)
+        _restore(trees.value_sum, subtree.value_sum)
+        _restore(trees.to_play, subtree.to_play)
+        _restore(trees.prior, subtree.prior)
+        _restore(trees.children_index, subtree.children_index)
+        nest.map_structure(_restore, trees.model_state, subtree.model_state)
+        if trees.reward is not None:
+            _restore(trees.reward, subtree.reward)
+        if trees.action is not None:
+            _restore(trees.action, subtree.action)
+        if trees.game_over is not None:
+            _restore(trees.game_over, subtree.game_over.to(torch.bool))
+        trees.visit_count[b, 0] = subtree.visit_count[valid, 0]
+        trees.value_sum[b, 0] = subtree.value_sum[valid, 0]
+        trees.children_index[b, 0] = subtree.children_index[valid, 0]
+
+        # [S, B]
+        nodes = torch.arange(S).unsqueeze(-1).expand(-1, trees.B.shape[0])
+        expanded = (trees.visit_count[:, :S] > 0).t() & valid.unsqueeze(0)
+        trees.update_value_stats((trees.B.unsqueeze(0), nodes), expanded)
+        # The root is updated by the caller.
+        expanded[0] = False
+        if torch.any(expanded):
+            self._update_best_child(trees, (trees.B.unsqueeze(0).expand(
+                S, -1)[expanded], nodes[expanded]))
 
     def _print_tree(self, trees: _MCTSTree, b):
         """Helper function to visualize the b-th search tree."""
@@ -378,8 +628,119 @@ class MCTSAlgorithm(OffPolicyAlgorithm):
             children = trees.children_index[node]
             nodes.extend([(b, int(c)) for c in list(children) if c != 0])
 
-    def _search(self, trees, to_plays):
+    def _parallel_simulations(self, trees: _MCTSTree, to_plays, first_sim,
+                              num_sims):
+        """Perform ``num_sims`` simulations together for each tree.
+
+        The leaves are selected one after another with virtual loss, evaluated
+        by one ``recurrent_inference()`` and backed up together. The new node
+        of the ``l``-th simulation is stored at ``first_sim + l``.
+        """
+        B = trees.B
+        batch_size = B.shape[0]
+        visit_count = trees.visit_count.clone()
+        value_sum = trees.value_sum.clone()
+        # The allocated nodes which have not been expanded yet.
+        pending = torch.zeros_like(trees.visit_count, dtype=torch.bool)
+        all_search_paths = []
+        all_path_lengths = []
+        all_to_plays = []
+        all_best_child_index = []
+        for l in range(num_sims):
+            sim = first_sim + l
+            search_paths, path_lengths, last_to_plays = self._search(
+                trees, to_plays, pending)
+            prev_nodes = search_paths[path_lengths - 2, B]
+            best_child_index = trees.best_child_index[B, prev_nodes]
+            leaves = search_paths[path_lengths - 1, B]
+            new = (leaves == 0) & (path_lengths > 1)
+            leaves[new] = sim
+            search_paths[path_lengths - 1, B] = leaves
+            trees.children_index[B[new], prev_nodes[new],
+                                 best_child_index[new]] = sim
+            pending[B[new], sim] = True
+            self._add_virtual_loss(trees, search_paths, path_lengths)
+            all_search_paths.append(search_paths)
+            all_path_lengths.append(path_lengths)
+            all_to_plays.append(last_to_plays)
+            all_best_child_index.append(best_child_index)
+
+        # Remove the virtual losses. Only ``best_child_index`` and ``ucb_score``
+        # of the nodes on the paths are changed besides ``visit_count`` and
+        # ``value_sum``. They will be recalculated by ``_backup()``.
+        trees.visit_count = visit_count
+        trees.value_sum = value_sum
+
+        T = max(p.shape[0] for p in all_search_paths)
+        # [T, num_sims * B]
+        search_paths = torch.cat([
+            torch.cat([p, p[-1:].expand(T - p.shape[0], -1)])
+            for p in all_search_paths
+        ],
+                                 dim=1)
+        path_lengths = torch.cat(all_path_lengths)
+        batch_index = B.repeat(num_sims)
+        prev_nodes = search_paths[path_lengths - 2,
+                                  torch.arange(num_sims * batch_size)]
+        # ``best_child_index`` has been changed by the virtual losses.
+        best_child_index = torch.cat(all_best_child_index)
+        model_state = nest.map_structure(lambda x: x[batch_index, prev_nodes],
+                                         trees.model_state)
+        if trees.action is None:
+            action = best_child_index
+        else:
+            action = trees.action[batch_index, prev_nodes, best_child_index]
+        model_output = self._model.recurrent_inference(model_state, action)
+        # Only keep the fields needed by ``_expand_node()`` for slicing.
+        model_output = model_output._replace(
+            action_distribution=(), game_over_logit=())
+        for l in range(num_sims):
+            self._expand_node(
+                trees,
+                first_sim + l,
+                to_plays=all_to_plays[l],
+                model_output=_nest_slice(
+                    model_output, slice(l * batch_size, (l + 1) * batch_size)))
+        self._backup(
+            trees,
+            search_paths=search_paths,
+            path_lengths=path_lengths,
+            values=model_output.value,
+            batch_index=batch_index)
+
+    def _add_virtual_loss(self, trees: _MCTSTree, search_paths, path_lengths):
+        """Add one virtual visit with the worst value to each node on the paths.
+
+        The worst value of a node is the worst value for the player of its
+        parent, so the parent tends to choose other children in the following
+        selections. If the value bounds are not known yet, the current value of
+        the parent is used.
+        """
+        B = trees.B.unsqueeze(0)
+        T = search_paths.shape[0]
+        depth = torch.arange(T).unsqueeze(-1)
+        valid = depth < path_lengths
+        parents = torch.cat([search_paths[:1], search_paths[:-1]])
+        worst_value = trees.minimum.unsqueeze(0).expand(T, -1)
+        if self._is_two_player_game:
+            worst_value = torch.where(trees.to_play[B, parents] == 0,
+                                      worst_value, trees.maximum.unsqueeze(0))
+        worst_value = torch.where(worst_value.abs() < MAXIMUM_FLOAT_VALUE,
+                                  worst_value, trees.calc_value((B, parents)))
+        nodes = (B.expand(T, -1)[valid], search_paths[valid])
+        trees.visit_count[nodes] += 1
+        trees.value_sum[nodes] += worst_value[valid]
+        # The leaves are not expanded yet. So only their ancestors need update.
+        ancestors = depth < path_lengths - 1
+        self._update_best_child(
+            trees, (B.expand(T, -1)[ancestors], search_paths[ancestors]))
+
+    def _search(self, trees, to_plays, pending=None):
         """
+        Args:
+            pending (Tensor|None): bool Tensor of shape ``[B, num_expansions]``.
+                If provided, the search also stops at the nodes whose value is
+                True.
         Returns:
             tuple:
             - search_paths: [T, B] int64 matrix, where T is the max length of the
@@ -388,6 +749,17 @@ class MCTSAlgorithm(OffPolicyAlgorithm):
             - path_lengths: [B] vector, length of each search path
             - last_to_plays: to_play for the last node of each path
         """
+        if self._use_jit:
+            # ``to_plays`` is not used for one player game and can be None.
+            search_paths, path_lengths, last_to_plays = mcts_kernels.search(
+                trees.children_index, trees.best_child_index, trees.game_over,
+                pending, trees.root_indices,
+                trees.root_indices if to_plays is None else to_plays,
+                self._is_two_player_game)
+            if to_plays is None:
+                last_to_plays = None
+            return search_paths, path_lengths, last_to_plays
+
         children_index = trees.children_index
         best_child_index = trees.best_child_index
         game_over = trees.game_over
@@ -413,6 +785,8 @@ class MCTSAlgorithm(OffPolicyAlgorithm):
             done = nodes == 0
             if game_over is not None:
                 done = game_over[B, nodes] | done
+            if pending is not None:
+                done = pending[B, nodes] | done
 
         search_paths = torch.stack(search_paths)
         return search_paths, path_lengths, to_plays
@@ -453,7 +827,7 @@ class MCTSAlgorithm(OffPolicyAlgorithm):
             value=trees.calc_value(roots),
             candidate_action_policy=policy,
         )
-        return action, info
+        return action, action_id, info
 
     def _update_best_child(self, trees: _MCTSTree, parents):
         if self._search_with_exploration_policy:
@@ -463,6 +837,16 @@ class MCTSAlgorithm(OffPolicyAlgorithm):
 
     def _ucb_child(self, trees: _MCTSTree, parents):
         """Get child using UCB score."""
+        if self._use_jit:
+            mcts_kernels.ucb_child(
+                parents[0], parents[1], trees.visit_count, trees.value_sum,
+                trees.prior, trees.children_index, trees.to_play, trees.reward,
+                trees.normalize_scale,
+                trees.normalize_base, trees.ucb_score, trees.best_child_index,
+                float(self._discount), float(self._pb_c_init),
+                float(self._pb_c_base), self._is_two_player_game,
+                self._unexpanded_mode, self._unexpanded_value)
+            return
         ucb_scores = self._ucb_score(trees, parents)
         trees.ucb_score[parents] = ucb_scores
 
@@ -548,17 +932,43 @@ class MCTSAlgorithm(OffPolicyAlgorithm):
         action = torch.multinomial(policy, 1).squeeze(1)
         trees.best_child_index[parents] = action
 
-    def _backup(self, trees: _MCTSTree, search_paths, path_lengths, values):
-        B = trees.B.unsqueeze(0)
+    def _backup(self,
+                trees: _MCTSTree,
+                search_paths,
+                path_lengths,
+                values,
+                batch_index=None):
+        """Backup the values along the search paths.
+
+        Args:
+            search_paths (Tensor): [T, N] int64 matrix
+            path_lengths (Tensor): [N] int64 vector
+            values (Tensor): [N] the values of the last nodes of the paths
+            batch_index (Tensor|None): [N] int64 vector, the trees of the paths.
+                If None, it is ``trees.B``. Several paths can be for the same
+                tree.
+        """
+        if batch_index is None:
+            batch_index = trees.B
+        if self._use_jit:
+            nodes_b, nodes_n, valid = mcts_kernels.backup(
+                trees.visit_count, trees.value_sum, trees.reward, search_paths,
+                path_lengths, values, batch_index, float(self._discount))
+            trees.update_value_stats((batch_index.unsqueeze(0), search_paths),
+                                     valid)
+            self._update_best_child(trees, (nodes_b, nodes_n))
+            return
+        B = batch_index.unsqueeze(0)
+        N = batch_index.shape[0]
         T = search_paths.shape[0]
         depth = torch.arange(T).unsqueeze(-1)
 
         if trees.reward is not None:
             reward = trees.reward[B, search_paths]
             reward[depth > path_lengths] = 0.
-            # [T+1, batch_size]
+            # [T+1, N]
             reward = tensor_utils.tensor_extend_zero(reward)
-            reward[path_lengths, B] = values
+            reward[path_lengths, torch.arange(N)] = values
             discounts = (self._discount**torch.arange(
                 T + 1, dtype=torch.float32)).unsqueeze(-1)
 
@@ -577,12 +987,15 @@ class MCTSAlgorithm(OffPolicyAlgorithm):
             discounts = self._discount**(path_lengths.unsqueeze(0) - steps)
             discounted_return = values.unsqueeze(0) * discounts
 
-        value_sum = trees.value_sum[B, search_paths] + discounted_return
-
         valid = depth < path_lengths
         nodes = (B.expand(T, -1)[valid], search_paths[valid])
-        trees.visit_count[nodes] += 1
-        trees.value_sum[nodes] = value_sum[valid]
+        # Use accumulate because a node can be on several paths.
+        trees.visit_count.index_put_(
+            nodes,
+            torch.ones_like(nodes[1], dtype=torch.int32),
+            accumulate=True)
+        trees.value_sum.index_put_(
+            nodes, discounted_return[valid], accumulate=True)
         trees.update_value_stats((B, search_paths), valid)
         self._update_best_child(trees, nodes)
 
@@ -22,6 +22,7 @@ from alf.algorithms.mcts_algorithm import (MCTSModel, MCTSState, ModelOutput,
                                            MCTSAlgorithm,
                                            VisitSoftmaxTemperatureByMoves)
 from alf.algorithms.mcts_algorithm import calculate_exploration_policy
+from alf.algorithms.mcts_models import SimpleMCTSModel
 from alf.data_structures import StepType, TimeStep
 
 
@@ -194,7 +195,11 @@ class MCTSAlgorithmTest(alf.test.TestCase):
         ]
         # yapf: enable
 
-        def _create_mcts(observation_spec, action_spec, num_simulations):
+        def _create_mcts(observation_spec,
+                         action_spec,
+                         num_simulations,
+                         num_parallel_sims=1,
+                         max_reused_nodes=0):
             return MCTSAlgorithm(
                 observation_spec,
                 action_spec,
@@ -207,7 +212,9 @@ class MCTSAlgorithmTest(alf.test.TestCase):
                 visit_softmax_temperature_fn=VisitSoftmaxTemperatureByMoves(
                     [(0, 1.0), (10, 0.0001)]),
                 known_value_bounds=(-1, 1),
-                is_two_player_game=True)
+                is_two_player_game=True,
+                num_parallel_sims=num_parallel_sims,
+                max_reused_nodes=max_reused_nodes)
 
         # test case serially
         for observation, action in cases:
@@ -231,18 +238,110 @@ class MCTSAlgorithmTest(alf.test.TestCase):
         observation = torch.tensor([case[0] for case in cases],
                                    dtype=torch.float32)
         state = MCTSState(steps=(observation != 0).sum(dim=(1, 2)))
-        mcts = _create_mcts(
-            observation_spec, action_spec, num_simulations=2000)
+        for num_parallel_sims in [1, 4]:
+            mcts = _create_mcts(
+                observation_spec,
+                action_spec,
+                num_simulations=2000,
+                num_parallel_sims=num_parallel_sims)
+            mcts.set_model(model)
+            t0 = time.time()
+            alg_step = mcts.predict_step(
+                time_step._replace(
+                    step_type=torch.tensor([StepType.MID] * len(cases)),
+                    observation=observation), state)
+            logging.info("num_parallel_sims=%s time=%s" % (num_parallel_sims,
+                                                           time.time() - t0))
+            for i, (_, action) in enumerate(cases):
+                if type(action) == tuple:
+                    self.assertTrue(alg_step.output[i] in action)
+                else:
+                    self.assertEqual(alg_step.output[i], action)
+            # The visit counts of the children of the root sum to
+            # num_simulations.
+            self.assertTensorClose(
+                alg_step.info.candidate_action_policy.sum(dim=1),
+                torch.ones(len(cases)),
+                epsilon=1e-5)
+
+        # test subtree reuse
+        observation = torch.tensor([[[0, 0, 0], [0, -1, -1], [0, 1, 0]]],
+                                   dtype=torch.float32)
+        num_simulations = 200
+        for num_parallel_sims in [1, 4]:
+            mcts = _create_mcts(
+                observation_spec,
+                action_spec,
+                num_simulations=num_simulations,
+                num_parallel_sims=num_parallel_sims,
+                max_reused_nodes=num_simulations)
+            mcts.set_model(model)
+            self.assertEqual(
+                mcts.predict_state_spec.subtree.children_index.shape,
+                (num_simulations, 9))
+            state = mcts.get_initial_predict_state(1)
+            state = state._replace(steps=torch.tensor([3]))
+            self.assertEqual(int(state.subtree.visit_count[0, 0]), 0)
+            alg_step = mcts.predict_step(
+                time_step._replace(observation=observation), state)
+            action = alg_step.output[0]
+            subtree = alg_step.state.subtree
+            self.assertGreater(int(subtree.visit_count[0, 0]), 0)
+            # The root of the subtree is the chosen child
+            self.assertEqual(
+                int(subtree.visit_count[0, 0]),
+                round(
+                    float(alg_step.info.candidate_action_policy[0, action] *
+                          num_simulations)))
+            children = subtree.children_index[0, 0]
+            carried_visit_count = subtree.visit_count[0, children] * (children
+                                                                      != 0)
+
+            # Play the chosen move and search from the reused subtree
+            observation = observation.clone()
+            observation.view(-1)[action] = 1.
+            alg_step = mcts.predict_step(
+                time_step._replace(observation=observation), alg_step.state)
+            visit_count = alg_step.info.candidate_action_policy[0] * (
+                carried_visit_count.sum() + num_simulations)
+            self.assertTensorClose(
+                visit_count, visit_count.round(), epsilon=1e-3)
+            self.assertTrue(
+                torch.all(visit_count.round() >= carried_visit_count))
+            self.assertGreater(visit_count.sum(), num_simulations)
+
+    def test_parallel_sims_with_simple_mcts_model(self):
+        observation_spec = alf.TensorSpec((4, ))
+        action_spec = alf.BoundedTensorSpec((),
+                                            dtype=torch.int64,
+                                            minimum=0,
+                                            maximum=2)
+        model = SimpleMCTSModel(observation_spec, action_spec)
+        batch_size = 3
+        num_simulations = 16
+        mcts = MCTSAlgorithm(
+            observation_spec,
+            action_spec,
+            discount=0.99,
+            root_dirichlet_alpha=0.5,
+            root_exploration_fraction=0.25,
+            num_simulations=num_simulations,
+            pb_c_init=1.25,
+            pb_c_base=19652,
+            visit_softmax_temperature_fn=VisitSoftmaxTemperatureByMoves(),
+            is_two_player_game=False,
+            num_parallel_sims=4)
         mcts.set_model(model)
-        alg_step = mcts.predict_step(
-            time_step._replace(
-                step_type=torch.tensor([StepType.MID] * len(cases)),
-                observation=observation), state)
-        for i, (observation, action) in enumerate(cases):
-            if type(action) == tuple:
-                self.assertTrue(alg_step.output[i] in action)
-            else:
-                self.assertEqual(alg_step.output[i], action)
+        time_step = TimeStep(
+            step_type=torch.tensor([StepType.MID] * batch_size),
+            observation=torch.randn(batch_size, 4))
+        state = mcts.get_initial_predict_state(batch_size)
+        alg_step = mcts.predict_step(time_step, state)
+        self.assertEqual(alg_step.output.shape, (batch_size, ))
+        self.assertTensorClose(
+            alg_step.info.candidate_action_policy.sum(dim=1),
+            torch.ones(batch_size),
+            epsilon=1e-5)
 
 
 class CalculateExplorationPolicyTest(alf.test.TestCase):
@@ -0,0 +1,274 @@
+# Copyright (c) 2020 Horizon Robotics and ALF Contributors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""TorchScript kernels for the tree operations of ``MCTSAlgorithm``.
+
+These are the compiled versions of ``MCTSAlgorithm._search()``,
+``MCTSAlgorithm._ucb_child()``, ``MCTSAlgorithm._backup()`` and
+``_MCTSTree.update_value_stats()``. They work on the tensors of ``_MCTSTree``
+directly and compute exactly the same results as the python versions. They are
+used by ``MCTSAlgorithm`` if ``use_jit`` is True, which saves the python
+overhead of the many small tensor operations of each simulation. The tree
+tensors are accessed with ``take()`` and ``put_()`` using the flattened indices
+``b * num_expansions + n``, which is cheaper than advanced indexing for the
+small tensors of the trees.
+"""
+
+import torch
+from typing import Optional, Tuple
+
+# The modes of ``unexpanded_value_score`` for ``ucb_child()``. TorchScript
+# cannot use global constants, so they are hard-coded in ``value_score()``.
+UNEXPANDED_VALUE_CONSTANT = 0
+UNEXPANDED_VALUE_MAX = 1
+UNEXPANDED_VALUE_MIN = 2
+UNEXPANDED_VALUE_MEAN = 3
+
+
+def unexpanded_value_mode(unexpanded_value_score):
+    """Get the mode of ``unexpanded_value_score`` for ``ucb_child()``.
+
+    Args:
+        unexpanded_value_score (float|str): see ``MCTSAlgorithm``
+    Returns:
+        tuple:
+        - mode (int): one of ``UNEXPANDED_VALUE_XXX``
+        - value (float): the value score for ``UNEXPANDED_VALUE_CONSTANT``
+    """
+    if not isinstance(unexpanded_value_score, str):
+        return UNEXPANDED_VALUE_CONSTANT, float(unexpanded_value_score)
+    mode = {
+        'max': UNEXPANDED_VALUE_MAX,
+        'min': UNEXPANDED_VALUE_MIN,
+        'none': UNEXPANDED_VALUE_MIN,
+        'mean': UNEXPANDED_VALUE_MEAN
+    }[unexpanded_value_score]
+    return mode, 0.
+
+
+@torch.jit.script
+def search(children_index: torch.Tensor, best_child_index: torch.Tensor,
+           game_over: Optional[torch.Tensor], pending: Optional[torch.Tensor],
+           root_indices: torch.Tensor, to_plays: torch.Tensor,
+           is_two_player_game: int
+           ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """Follow ``best_child_index`` from the roots until an unexpanded node.
+
+    Args:
+        children_index (Tensor): ``_MCTSTree.children_index``
+        best_child_index (Tensor): ``_MCTSTree.best_child_index``
+        game_over (Tensor|None): ``_MCTSTree.game_over``
+        pending (Tensor|None): bool Tensor of shape ``[B, num_expansions]``.
+            If provided, the search also stops at the nodes whose value is
+            True.
+        root_indices (Tensor): ``_MCTSTree.root_indices``
+        to_plays (Tensor): the players of the roots. Not used if
+            ``is_two_player_game`` is 0.
+        is_two_player_game (int): 1 for two player game, 0 otherwise
+    Returns:
+        tuple: ``search_paths``, ``path_lengths`` and ``last_to_plays`` as
+        ``MCTSAlgorithm._search()``
+    """
+    num_expansions = best_child_index.shape[1]
+    branch_factor = children_index.shape[2]
+    # The offsets of the trees in the flattened tensors
+    base = torch.arange(root_indices.shape[0]) * num_expansions
+    nodes = root_indices
+    path_lengths = torch.ones_like(nodes)
+    search_paths = [nodes]
+    if game_over is not None:
+        done = game_over.take(base + nodes)
+    else:
+        done = nodes < 0
+    while not bool(done.all()):
+        flat = base + nodes
+        children = children_index.take(flat * branch_factor +
+                                       best_child_index.take(flat))
+        nodes = torch.where(done, nodes, children)
+        path_lengths = path_lengths + (~done).to(torch.int64)
+        search_paths.append(nodes)
+        if is_two_player_game != 0:
+            to_plays = torch.where(done, to_plays,
+                                   is_two_player_game - to_plays)
+        # nodes == 0 means unexpanded child
+        done = nodes == 0
+        if game_over is not None:
+            done = game_over.take(base + nodes) | done
+        if pending is not None:
+            done = pending.take(base + nodes) | done
+    return torch.stack(search_paths), path_lengths, to_plays
+
+
+@torch.jit.script
+def value_score(parents_b: torch.Tensor, parents_n: torch.Tensor,
+                visit_count: torch.Tensor, value_sum: torch.Tensor,
+                children_index: torch.Tensor, to_play: torch.Tensor,
+                reward: Optional[torch.Tensor], normalize_scale: torch.Tensor,
+                normalize_base: torch.Tensor, discount: float,
+                is_two_player_game: int, unexpanded_mode: int,
+                unexpanded_value: float) -> Tuple[torch.Tensor, torch.Tensor]:
+    """The value scores of the children of ``parents``.
+
+    Returns:
+        tuple: ``value_score`` and ``child_visit_count`` as
+        ``MCTSAlgorithm._value_score()``
+    """
+    num_expansions = visit_count.shape[1]
+    branch_factor = children_index.shape[2]
+    parents = parents_b * num_expansions + parents_n
+    children = children_index.take(
+        parents.unsqueeze(-1) * branch_factor + torch.arange(branch_factor))
+    b = parents_b.unsqueeze(-1)
+    flat_children = b * num_expansions + children
+    child_visit_count = visit_count.take(flat_children)
+    unexpanded = children == 0
+    score = discount * (value_sum.take(flat_children) / child_visit_count)
+    child_visit_count = child_visit_count.masked_fill(unexpanded, 0)
+    if reward is not None:
+        score = score + reward.take(flat_children)
+    score = normalize_scale.take(b) * (score - normalize_base.take(b))
+    if unexpanded_mode == 0:  # UNEXPANDED_VALUE_CONSTANT
+        score = score.masked_fill(unexpanded, unexpanded_value)
+    if is_two_player_game != 0:
+        score = score * ((to_play.take(parents) == 0) * 2 - 1).unsqueeze(-1)
+
+    inf = float('inf')
+    if unexpanded_mode == 1:  # UNEXPANDED_VALUE_MAX
+        score = score.masked_fill(unexpanded, -inf)
+        max_score = score.max(dim=1, keepdim=True)[0]
+        max_score = max_score.masked_fill(max_score == -inf, 0.)
+        score = torch.where(unexpanded, max_score, score)
+    elif unexpanded_mode == 2:  # UNEXPANDED_VALUE_MIN
+        score = score.masked_fill(unexpanded, inf)
+        min_score = score.min(dim=1, keepdim=True)[0]
+        min_score = min_score.masked_fill(min_score == inf, 0.)
+        score = torch.where(unexpanded, min_score, score)
+    elif unexpanded_mode == 3:  # UNEXPANDED_VALUE_MEAN
+        score = score.masked_fill(unexpanded, 0.)
+        n = (~unexpanded).sum(dim=1, keepdim=True) + 1e-30
+        mean_score = score.sum(dim=1, keepdim=True) / n
+        score = torch.where(unexpanded, mean_score, score)
+    return score, child_visit_count
+
+
+@torch.jit.script
+def ucb_child(parents_b: torch.Tensor, parents_n: torch.Tensor,
+              visit_count: torch.Tensor, value_sum: torch.Tensor,
+              prior: torch.Tensor, children_index: torch.Tensor,
+              to_play: torch.Tensor, reward: Optional[torch.Tensor],
+              normalize_scale: torch.Tensor, normalize_base: torch.Tensor,
+              ucb_score: torch.Tensor, best_child_index: torch.Tensor,
+              discount: float, pb_c_init: float, pb_c_base: float,
+              is_two_player_game: int, unexpanded_mode: int,
+              unexpanded_value: float):
+    """Update ``ucb_score`` and ``best_child_index`` of ``parents`` in place.
+
+    Same as ``MCTSAlgorithm._ucb_child()``.
+    """
+    score, child_visit_count = value_score(
+        parents_b, parents_n, visit_count, value_sum, children_index, to_play,
+        reward, normalize_scale, normalize_base, discount, is_two_player_game,
+        unexpanded_mode, unexpanded_value)
+    branch_factor = prior.shape[2]
+    parents = parents_b * visit_count.shape[1] + parents_n
+    flat_children = (
+        parents.unsqueeze(-1) * branch_factor + torch.arange(branch_factor))
+    p = prior.take(flat_children)
+    score = score.masked_fill(p == 0, -float('inf'))
+    parent_visit_count = visit_count.take(parents).unsqueeze(-1)
+    pb_c = torch.log(
+        (parent_visit_count + pb_c_base + 1.) / pb_c_base) + pb_c_init
+    pb_c = pb_c * torch.sqrt(parent_visit_count.to(
+        torch.float32)) / (child_visit_count + 1.)
+    scores = pb_c * p + score
+    # A parent may appear several times with the same scores.
+    ucb_score.put_(flat_children, scores)
+    best_child_index.put_(parents, scores.argmax(dim=1))
+
+
+@torch.jit.script
+def backup(visit_count: torch.Tensor, value_sum: torch.Tensor,
+           reward: Optional[torch.Tensor], search_paths: torch.Tensor,
+           path_lengths: torch.Tensor, values: torch.Tensor,
+           batch_index: torch.Tensor,
+           discount: float) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """Add the returns to the nodes on the search paths in place.
+
+    Same as the accumulation of ``MCTSAlgorithm._backup()``.
+
+    Returns:
+        tuple:
+        - nodes_b (Tensor): the trees of the visited nodes
+        - nodes_n (Tensor): the visited nodes
+        - valid (Tensor): bool Tensor of shape ``[T, N]`` indicating the valid
+          steps of ``search_paths``
+    """
+    B = batch_index.unsqueeze(0)
+    N = batch_index.shape[0]
+    T = search_paths.shape[0]
+    depth = torch.arange(T).unsqueeze(-1)
+    flat = B * visit_count.shape[1] + search_paths
+
+    if reward is not None:
+        r = reward.take(flat)
+        r = r.masked_fill(depth > path_lengths, 0.)
+        # [T+1, N]
+        r = torch.cat([r, torch.zeros_like(r[:1])])
+        r[path_lengths, torch.arange(N)] = values
+        discounts = torch.pow(discount, torch.arange(
+            T + 1, dtype=torch.float32)).unsqueeze(-1)
+        discounted_return = r.flip(0).cumsum(dim=0).flip(0)
+        discounted_return = discounted_return / discounts
+        discounted_return = discounted_return[1:]
+    else:
+        steps = torch.arange(1, T + 1, dtype=torch.float32).unsqueeze(-1)
+        discounts = torch.pow(discount, path_lengths.unsqueeze(0) - steps)
+        discounted_return = values.unsqueeze(0) * discounts
+
+    valid = depth < path_lengths
+    nodes = flat[valid]
+    # Use accumulate because a node can be on several paths.
+    visit_count.put_(
+        nodes, torch.ones_like(nodes).to(torch.int32), accumulate=True)
+    value_sum.put_(nodes, discounted_return[valid], accumulate=True)
+    return B.expand(T, -1)[valid], search_paths[valid], valid
+
+
+@torch.jit.script
+def update_value_stats(
+        visit_count: torch.Tensor, value_sum: torch.Tensor,
+        batch_index: torch.Tensor, nodes: torch.Tensor, valid: torch.Tensor,
+        minimum: torch.Tensor, maximum: torch.Tensor,
+        normalize_scale: torch.Tensor, normalize_base: torch.Tensor
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+    """Same as ``_MCTSTree.update_value_stats((batch_index, nodes), valid)``.
+
+    Returns:
+        tuple: the new ``minimum``, ``maximum``, ``normalize_scale`` and
+        ``normalize_base``
+    """
+    batch_size = minimum.shape[0]
+    flat = batch_index * visit_count.shape[1] + nodes
+    values = (value_sum.take(flat) / visit_count.take(flat)).reshape(
+        -1, batch_size)
+    invalid = ~valid.reshape(-1, batch_size)
+    inf = float('inf')
+    maximum = torch.max(maximum,
+                        values.masked_fill(invalid, -inf).max(dim=0)[0])
+    minimum = torch.min(minimum,
+                        values.masked_fill(invalid, inf).min(dim=0)[0])
+    normalize = maximum > minimum
+    normalize_scale = torch.where(normalize, 1 / (maximum - minimum + 1e-30),
+                                  normalize_scale)
+    normalize_base = torch.where(normalize, minimum, normalize_base)
+    return minimum, maximum, normalize_scale, normalize_base
@@ -0,0 +1,148 @@
+# Copyright (c) 2020 Horizon Robotics and ALF Contributors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from absl import logging
+from absl.testing import parameterized
+import time
+import torch
+
+import alf
+from alf.algorithms.mcts_algorithm import (MCTSAlgorithm, MCTSState,
+                                           VisitSoftmaxTemperatureByMoves)
+from alf.algorithms.mcts_algorithm_test import TicTacToeModel
+from alf.data_structures import StepType, TimeStep
+
+
+class NoRewardTicTacToeModel(TicTacToeModel):
+    """TicTacToeModel without reward, whose value is not always zero."""
+
+    def initial_inference(self, observation):
+        output = super().initial_inference(observation)
+        return output._replace(
+            value=output.reward + 0.1 * observation.sum(dim=(1, 2)), reward=())
+
+    def recurrent_inference(self, state, action):
+        output = super().recurrent_inference(state, action)
+        return output._replace(
+            value=output.reward + 0.1 * output.state.sum(dim=(1, 2)),
+            reward=())
+
+
+def _create_mcts(num_simulations, use_jit, **kwargs):
+    return MCTSAlgorithm(
+        alf.TensorSpec((3, 3)),
+        alf.BoundedTensorSpec((), dtype=torch.int64, minimum=0, maximum=8),
+        discount=0.9,
+        root_dirichlet_alpha=0.5,
+        root_exploration_fraction=0.25,
+        num_simulations=num_simulations,
+        pb_c_init=1.25,
+        pb_c_base=19652,
+        visit_softmax_temperature_fn=VisitSoftmaxTemperatureByMoves(
+            [(0, 1.0), (10, 0.0001)]),
+        is_two_player_game=True,
+        use_jit=use_jit,
+        **kwargs)
+
+
+def _random_boards(batch_size):
+    """Random boards with at most one move of each player.
+
+    So that no game is over after one more move.
+    """
+    boards = torch.zeros(batch_size, 9)
+    for b in range(batch_size):
+        n = int(torch.randint(2, ()))
+        cells = torch.randperm(9)[:2 * n]
+        boards[b, cells[0::2]] = -1.
+        boards[b, cells[1::2]] = 1.
+    return boards.reshape(batch_size, 3, 3)
+
+
+def _predict(mcts, observation, state):
+    batch_size = observation.shape[0]
+    time_step = TimeStep(
+        step_type=torch.full((batch_size, ), StepType.MID, dtype=torch.int32),
+        observation=observation)
+    return mcts.predict_step(time_step, state)
+
+
+class MCTSKernelsTest(parameterized.TestCase, alf.test.TestCase):
+    @parameterized.parameters(
+        (0.5, (-1, 1)),
+        ('max', None),
+        ('min', None, 4),
+        ('mean', (-1, 1), 1, 20),
+        ('none', None, 1, 0, NoRewardTicTacToeModel),
+        (0., None, 4, 20, NoRewardTicTacToeModel),
+    )
+    def test_same_as_python(self,
+                            unexpanded_value_score,
+                            known_value_bounds,
+                            num_parallel_sims=1,
+                            max_reused_nodes=0,
+                            model_cls=TicTacToeModel):
+        model = model_cls()
+        batch_size = 16
+        observation = _random_boards(batch_size)
+        steps = (observation != 0).sum(dim=(1, 2))
+        steps_list = []
+        for use_jit in [False, True]:
+            mcts = _create_mcts(
+                num_simulations=30,
+                use_jit=use_jit,
+                unexpanded_value_score=unexpanded_value_score,
+                known_value_bounds=known_value_bounds,
+                num_parallel_sims=num_parallel_sims,
+                max_reused_nodes=max_reused_nodes)
+            mcts.set_model(model)
+            state = mcts.get_initial_predict_state(batch_size)
+            state = state._replace(steps=steps)
+            torch.manual_seed(0)
+            alg_steps = []
+            obs = observation
+            for _ in range(2):
+                alg_step = _predict(mcts, obs, state)
+                alg_steps.append(alg_step)
+                state = alg_step.state
+                obs = obs.clone()
+                obs.reshape(batch_size,
+                            9)[torch.arange(batch_size), alg_step.output] = 1.
+            steps_list.append(alg_steps)
+        for py_step, jit_step in zip(*steps_list):
+            self.assertTensorEqual(py_step.output, jit_step.output)
+            alf.nest.map_structure(self.assertTensorEqual, py_step.info,
+                                   jit_step.info)
+            alf.nest.map_structure(self.assertTensorEqual, py_step.state,
+                                   jit_step.state)
+
+    def test_benchmark(self):
+        # Sizes of muzero_tic_tac_toe.gin: 9 actions and 20 simulations
+        model = TicTacToeModel()
+        for batch_size in [32, 256]:
+            observation = _random_boards(batch_size)
+            state = MCTSState(steps=(observation != 0).sum(dim=(1, 2)))
+            for use_jit in [False, True]:
+                mcts = _create_mcts(num_simulations=20, use_jit=use_jit)
+                mcts.set_model(model)
+                _predict(mcts, observation, state)
+                t0 = time.time()
+                for _ in range(5):
+                    _predict(mcts, observation, state)
+                logging.info("batch_size=%s use_jit=%s time=%s" %
+                             (batch_size, use_jit, (time.time() - t0) / 5))
+
+
+if __name__ == '__main__':
+    alf.test.main()
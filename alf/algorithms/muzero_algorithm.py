@@ -15,6 +15,7 @@
 
 from functools import partial
 import gin
+import threading
 import torch
 
 import alf
@@ -24,6 +25,7 @@ from alf.data_structures import AlgStep, Experience, LossInfo, namedtuple, TimeS
 from alf.experience_replayers.replay_buffer import BatchInfo, ReplayBuffer
 from alf.algorithms.mcts_algorithm import MCTSAlgorithm
 from alf.algorithms.mcts_models import MCTSModel, ModelOutput, ModelTarget
+from alf.algorithms.reanalyze_workers import ReanalyzeTable, ReanalyzeWorkerPool
 from alf.nest.utils import convert_device
 from alf.utils import common, dist_utils
 from alf.utils.normalizers import ScalarAdaptiveNormalizer
@@ -54,6 +56,22 @@ def _is_empty(x):
     return isinstance(x, tuple) and x == ()
 
 
+def _create_reanalyze_table(replay_buffer, candidate_actions,
+                            candidate_action_policy):
+    """Create a ``ReanalyzeTable`` for the slots of ``replay_buffer``.
+
+    The specs are extracted from ``candidate_actions`` and
+    ``candidate_action_policy`` of shape ``[B, T, ...]``.
+    """
+    action_spec = None
+    if not _is_empty(candidate_actions):
+        action_spec = dist_utils.extract_spec(candidate_actions, from_dim=2)
+    return ReanalyzeTable(
+        replay_buffer.num_environments, replay_buffer.max_length,
+        dist_utils.extract_spec(candidate_action_policy, from_dim=2),
+        action_spec)
+
+
 @gin.configurable
 class MuzeroAlgorithm(OffPolicyAlgorithm):
     """MuZero algorithm.
@@ -79,6 +97,10 @@ class MuzeroAlgorithm(OffPolicyAlgorithm):
                  reanalyze_ratio=0.,
                  reanalyze_td_steps=5,
                  reanalyze_batch_size=None,
+                 num_reanalyze_workers=0,
+                 reanalyze_max_staleness=1,
+                 reanalyze_sync_period=None,
+                 reanalyze_cache_max_age=None,
                  data_transformer_ctor=None,
                  target_update_tau=1.,
                  target_update_period=1000,
@@ -116,7 +138,44 @@ class MuzeroAlgorithm(OffPolicyAlgorithm):
             reanalyze_batch_size (int|None): the memory usage may be too much for
                 reanalyzing all the data for one training iteration. If so, provide
                 a number for this so that it will analyzing the data in several
-                batches.
+                batches. It is also the number of positions reanalyzed together
+                by each reanalyze worker (32 if None).
+            num_reanalyze_workers (int): If positive, so many background
+                processes keep reanalyzing randomly sampled positions of the
+                replay buffer with a copy of the target model and store the
+                results in a ``ReanalyzeTable``. The samples chosen for
+                reanalyzing (by ``reanalyze_ratio``) use the results from the
+                table if they are available for all the unrolled positions and
+                not stale. The other samples are reanalyzed inline. Only
+                supported for CPU training and replay buffers without
+                ``mmap_dir`` or ``compressed_fields`` since the workers are
+                forked and read the replay buffer from shared memory. For the
+                same reason, the workers are only forked when no thread other
+                than the main thread is alive, so it cannot be used with
+                ``TrainerConfig.async_unroll``,
+                ``TrainerConfig.replay_prefetch_size``,
+                ``TrainerConfig.deferred_summary`` or
+                ``TrainerConfig.async_checkpoint``, whose background threads
+                make forking unsafe. The workers are forked when the
+                first batch is preprocessed, so the state of
+                ``data_transformer_ctor`` (e.g. the statistics of an observation
+                normalizer) used by them is frozen at that time.
+            reanalyze_max_staleness (int): the results of the workers are
+                stale if the model copy used for them is older than the
+                current one by more than so many syncs.
+            reanalyze_sync_period (int|None): the target model is copied to the
+                reanalyze workers every so many training updates. If None,
+                ``target_update_period`` is used.
+            reanalyze_cache_max_age (int|None): If not None, the reanalyzed
+                targets of each position are cached in a ``ReanalyzeTable``
+                with the slots of the replay buffer together with the number
+                of target model updates when they were computed, and reused if
+                the target model has been updated at most so many times since
+                then. The entries of a slot become invalid once it is
+                overwritten by a new position. Larger values trade the
+                freshness of the targets for less reanalyzing. The fraction of
+                the reanalyzed samples served by the cache is reported as the
+                summary ``reanalyze/cache_hit_ratio``.
             data_transformer_ctor (Callable|list[Callable]): should be same as
                 ``TrainerConfig.data_transformer_ctor``.
             target_update_tau (float): Factor for soft update of the target
@@ -156,6 +215,17 @@ class MuzeroAlgorithm(OffPolicyAlgorithm):
         self._reanalyze_ratio = reanalyze_ratio
         self._reanalyze_td_steps = reanalyze_td_steps
         self._reanalyze_batch_size = reanalyze_batch_size
+        self._num_reanalyze_workers = num_reanalyze_workers
+        self._reanalyze_max_staleness = reanalyze_max_staleness
+        self._reanalyze_sync_period = (reanalyze_sync_period
+                                       or target_update_period)
+        self._reanalyze_workers = None
+        self._reanalyze_table = None
+        self._reanalyze_cache_max_age = reanalyze_cache_max_age
+        self._reanalyze_cache = None
+        self._target_update_period = target_update_period
+        self._num_updates = 0
+        self._num_target_updates = 0
         self._data_transformer = None
         self._data_transformer_ctor = data_transformer_ctor
 
@@ -168,6 +238,11 @@ class MuzeroAlgorithm(OffPolicyAlgorithm):
                 target_models=[self._target_model],
                 tau=target_update_tau,
                 period=target_update_period)
+        if num_reanalyze_workers > 0:
+            assert reanalyze_ratio > 0, (
+                "num_reanalyze_workers requires positive reanalyze_ratio")
+            assert self._device == "cpu", (
+                "num_reanalyze_workers is only supported for CPU training")
 
     def _trainable_attributes_to_ignore(self):
         return ['_target_model']
@@ -244,8 +319,19 @@ class MuzeroAlgorithm(OffPolicyAlgorithm):
                 mcts_state_field = 'state' + info_path[len('rollout_info'):]
                 r = torch.rand(
                     experience.step_type.shape[0]) < self._reanalyze_ratio
-                r_candidate_actions, r_candidate_action_policy, r_values = self._reanalyze(
-                    replay_buffer, env_ids[r], positions[r], mcts_state_field)
+                if self._num_reanalyze_workers > 0:
+                    if self._reanalyze_workers is None:
+                        self._start_reanalyze_workers(
+                            experience, replay_buffer, mcts_state_field,
+                            candidate_actions_field,
+                            candidate_action_policy_field)
+                    r_candidate_actions, r_candidate_action_policy, r_values = self._read_reanalyzed(
+                        replay_buffer, env_ids[r], positions[r],
+                        mcts_state_field)
+                else:
+                    r_candidate_actions, r_candidate_action_policy, r_values = self._reanalyze(
+                        replay_buffer, env_ids[r], positions[r],
+                        mcts_state_field)
 
             # [B]
             steps_to_episode_end = replay_buffer.steps_to_episode_end(
@@ -404,8 +490,136 @@ class MuzeroAlgorithm(OffPolicyAlgorithm):
                 reward.cuda(), self._reward_clip_value).cpu()
         return reward
 
+    def _start_reanalyze_workers(self, experience, replay_buffer,
+                                 mcts_state_field, candidate_actions_field,
+                                 candidate_action_policy_field):
+        """Fork the reanalyze workers.
+
+        Each worker gets a copy of this algorithm as it is now. In particular,
+        the state of ``self._data_transformer`` used by the workers is frozen
+        at this moment (or created by each worker if it has not been created
+        yet) and is not updated by the training afterwards.
+        """
+        # Forking while another thread is running can deadlock the workers if
+        # that thread holds a lock (e.g. the lock of the replay buffer or of
+        # the logging module) at that moment.
+        other_threads = [
+            t.name for t in threading.enumerate()
+            if t is not threading.main_thread()
+        ]
+        assert not other_threads, (
+            "The reanalyze workers cannot be forked while other threads %s "
+            "are running. num_reanalyze_workers cannot be used with "
+            "TrainerConfig.async_unroll, replay_prefetch_size, "
+            "deferred_summary or async_checkpoint" % other_threads)
+        self._reanalyze_table = _create_reanalyze_table(
+            replay_buffer,
+            alf.nest.get_field(experience, candidate_actions_field),
+            alf.nest.get_field(experience, candidate_action_policy_field))
+        self._reanalyze_workers = ReanalyzeWorkerPool(
+            partial(self._reanalyze_in_worker, replay_buffer,
+                    mcts_state_field),
+            self._target_model,
+            replay_buffer,
+            self._reanalyze_table,
+            num_workers=self._num_reanalyze_workers,
+            batch_size=self._reanalyze_batch_size or 32)
+        self._reanalyze_workers.start()
+
+    def _reanalyze_in_worker(self, replay_buffer, mcts_state_field, model,
+                             env_ids, positions):
+        """Reanalyze in a worker process.
+
+        The targets of each of the ``1 + num_unroll_steps`` positions starting
+        from ``positions`` are returned for ``ReanalyzeTable.write()``.
+        """
+        candidate_actions, candidate_action_policy, values = self._reanalyze1(
+            replay_buffer, env_ids, positions, mcts_state_field, model)
+        env_ids, positions = self._next_n_positions(
+            replay_buffer, env_ids, positions, self._num_unroll_steps)
+        return (env_ids, positions, candidate_actions, candidate_action_policy,
+                values)
+
+    def _read_reanalyzed(self, replay_buffer: ReplayBuffer, env_ids, positions,
+                         mcts_state_field):
+        """Get the reanalyzed targets from the reanalyze workers.
+
+        The samples whose targets are not all available from the workers are
+        reanalyzed inline.
+        """
+        if not self._reanalyze_workers.is_alive():
+            raise RuntimeError("The reanalyze workers are not running")
+        env_ids1, positions1 = self._next_n_positions(
+            replay_buffer, env_ids, positions, self._num_unroll_steps)
+        found, candidate_actions, candidate_action_policy, values = (
+            self._reanalyze_table.read(
+                env_ids1, positions1, self._reanalyze_workers.version -
+                self._reanalyze_max_staleness))
+        found = found.all(dim=1)
+        alf.summary.scalar("reanalyze/worker_result_ratio",
+                           found.to(torch.float32).mean())
+        missed = ~found
+        if torch.any(missed):
+            r_candidate_actions, r_candidate_action_policy, r_values = self._reanalyze(
+                replay_buffer, env_ids[missed], positions[missed],
+                mcts_state_field)
+            if not _is_empty(candidate_actions):
+                candidate_actions[missed] = r_candidate_actions
+            candidate_action_policy[missed] = r_candidate_action_policy
+            values[missed] = r_values
+        return convert_device((candidate_actions, candidate_action_policy,
+                               values))
+
     def _reanalyze(self, replay_buffer: ReplayBuffer, env_ids, positions,
                    mcts_state_field):
+        """Reanalyze the samples starting from ``positions``.
+
+        If ``reanalyze_cache_max_age`` is not None, only the samples whose
+        targets are not all in the cache are reanalyzed.
+        """
+        if self._reanalyze_cache_max_age is None:
+            return self._reanalyze_in_batches(replay_buffer, env_ids,
+                                              positions, mcts_state_field)
+
+        version = self._num_target_updates
+        env_ids1, positions1 = self._next_n_positions(
+            replay_buffer, env_ids, positions, self._num_unroll_steps)
+        if self._reanalyze_cache is None:
+            hit = torch.zeros(env_ids.shape, dtype=torch.bool)
+        else:
+            found, candidate_actions, candidate_action_policy, values = (
+                self._reanalyze_cache.read(
+                    env_ids1, positions1,
+                    version - self._reanalyze_cache_max_age))
+            hit = found.all(dim=1)
+        alf.summary.scalar("reanalyze/cache_hit_ratio",
+                           hit.to(torch.float32).mean())
+        miss = ~hit
+        if torch.any(miss):
+            result = self._reanalyze_in_batches(replay_buffer, env_ids[miss],
+                                                positions[miss],
+                                                mcts_state_field)
+            result = convert_device(result, replay_buffer.device)
+            r_candidate_actions, r_candidate_action_policy, r_values = result
+            if self._reanalyze_cache is None:
+                with alf.device(replay_buffer.device):
+                    self._reanalyze_cache = _create_reanalyze_table(
+                        replay_buffer, r_candidate_actions,
+                        r_candidate_action_policy)
+                candidate_actions, candidate_action_policy, values = result
+            else:
+                if not _is_empty(candidate_actions):
+                    candidate_actions[miss] = r_candidate_actions
+                candidate_action_policy[miss] = r_candidate_action_policy
+                values[miss] = r_values
+            self._reanalyze_cache.write(
+                env_ids1[miss], positions1[miss], r_candidate_actions,
+                r_candidate_action_policy, r_values, version)
+        return convert_device((candidate_actions, candidate_action_policy,
+                               values))
+
+    def _reanalyze_in_batches(self, replay_buffer: ReplayBuffer, env_ids,
+                              positions, mcts_state_field):
         batch_size = env_ids.shape[0]
         mini_batch_size = batch_size
         if self._reanalyze_batch_size is not None:
@@ -471,8 +685,12 @@ class MuzeroAlgorithm(OffPolicyAlgorithm):
 
         return exp1, exp2
 
-    def _reanalyze1(self, replay_buffer: ReplayBuffer, env_ids, positions,
-                    mcts_state_field):
+    def _reanalyze1(self,
+                    replay_buffer: ReplayBuffer,
+                    env_ids,
+                    positions,
+                    mcts_state_field,
+                    target_model=None):
         """Reanalyze one batch.
 
         This means:
@@ -485,7 +703,11 @@ class MuzeroAlgorithm(OffPolicyAlgorithm):
 
         In order to do 1 and 2, we need to get the observations for n1 + n2 steps
         and processs them using data_transformer.
+
+        ``target_model`` is used instead of ``self._target_model`` if provided.
         """
+        if target_model is None:
+            target_model = self._target_model
         batch_size = env_ids.shape[0]
         n1 = self._num_unroll_steps + 1
         n2 = self._reanalyze_td_steps
@@ -520,9 +742,12 @@ class MuzeroAlgorithm(OffPolicyAlgorithm):
             game_overs = convert_device(game_overs)
 
             # 1. Reanalyze the first n1 steps to get both the updated value and policy
-            self._mcts.set_model(self._target_model)
-            mcts_step = self._mcts.predict_step(
-                exp1, alf.nest.get_field(exp1, mcts_state_field))
+            self._mcts.set_model(target_model)
+            mcts_state = alf.nest.get_field(exp1, mcts_state_field)
+            # The subtrees reused during rollout were searched with the old
+            # model, so the reanalysis always starts from new trees.
+            mcts_state = mcts_state._replace(subtree=())
+            mcts_step = self._mcts.predict_step(exp1, mcts_state)
             self._mcts.set_model(self._model)
             candidate_actions = ()
             if not _is_empty(mcts_step.info.candidate_actions):
@@ -536,8 +761,7 @@ class MuzeroAlgorithm(OffPolicyAlgorithm):
 
             # 2. Calulate the value of the next n2 steps so that n2-step return
             # can be computed.
-            model_output = self._target_model.initial_inference(
-                exp2.observation)
+            model_output = target_model.initial_inference(exp2.observation)
             values2 = model_output.value.reshape(batch_size, n2)
 
             # 3. Calculate n2-step return
@@ -597,3 +821,16 @@ class MuzeroAlgorithm(OffPolicyAlgorithm):
     def after_update(self, experience, train_info):
         if self._update_target is not None:
             self._update_target()
+            self._num_updates += 1
+            if self._num_updates % self._target_update_period == 0:
+                self._num_target_updates += 1
+        if (self._reanalyze_workers is not None
+                and self._num_updates % self._reanalyze_sync_period == 0):
+            self._reanalyze_workers.sync_model(self._target_model)
+
+    def finish_train(self):
+        """Stop the reanalyze workers besides ``OffPolicyAlgorithm.finish_train()``."""
+        if self._reanalyze_workers is not None:
+            self._reanalyze_workers.stop()
+            self._reanalyze_workers = None
+        super().finish_train()
@@ -13,10 +13,13 @@
 # limitations under the License.
 
 from functools import partial
+import time
+from unittest.mock import patch
 import torch
 from torch import nn
 
 import alf
+from alf.algorithms.config import TrainerConfig
 from alf.algorithms.data_transformer import FrameStacker
 from alf.algorithms.muzero_algorithm import MuzeroAlgorithm, MuzeroInfo, OffPolicyAlgorithm
 from alf.algorithms.mcts_algorithm import MCTSInfo, MCTSState
@@ -95,8 +98,13 @@ class MockMCTSAlgorithm(OffPolicyAlgorithm):
 
 
 class MuzeroAlgorithmTest(alf.test.TestCase):
-    def _test_preprocess_experience(self, train_reward_function, td_steps,
-                                    reanalyze_ratio, expected):
+    def _test_preprocess_experience(self,
+                                    train_reward_function,
+                                    td_steps,
+                                    reanalyze_ratio,
+                                    expected,
+                                    num_reanalyze_workers=0,
+                                    reanalyze_cache_max_age=None):
         """
         The following summarizes how the data is generated:
 
@@ -145,6 +153,8 @@ class MuzeroAlgorithmTest(alf.test.TestCase):
             train_reward_function=train_reward_function,
             reanalyze_ratio=reanalyze_ratio,
             reanalyze_td_steps=reanalyze_td_steps,
+            num_reanalyze_workers=num_reanalyze_workers,
+            reanalyze_cache_max_age=reanalyze_cache_max_age,
             data_transformer_ctor=partial(FrameStacker, stack_size=2))
 
         data_transformer = FrameStacker(observation_spec, stack_size=2)
@@ -166,6 +176,9 @@ class MuzeroAlgorithmTest(alf.test.TestCase):
             num_environments=batch_size,
             max_length=16,
             keep_episodic_info=True)
+        if num_reanalyze_workers > 0:
+            muzero.set_exp_replayer(
+                "uniform", batch_size, 16, allow_multithread=True)
 
         #             01234567890123
         step_type0 = 'FMMMLFMMLFMMMM'
@@ -197,6 +210,8 @@ class MuzeroAlgorithmTest(alf.test.TestCase):
             alg_step = muzero.rollout_step(transformed_time_step, state)
             experience = ds.make_experience(time_step, alg_step, state)
             replay_buffer.add_batch(experience)
+            if num_reanalyze_workers > 0:
+                muzero.observe_for_replay(experience)
             state = alg_step.state
 
         env_ids = torch.tensor([0] * 14 + [1] * 14, dtype=torch.int64)
@@ -209,7 +224,60 @@ class MuzeroAlgorithmTest(alf.test.TestCase):
             replay_buffer=replay_buffer,
             batch_info=BatchInfo(env_ids=env_ids, positions=positions),
             rollout_info_field='rollout_info')
+        if num_reanalyze_workers > 0:
+            # The workers cannot be forked while the thread started for
+            # ``replay_prefetch_size`` is sampling the replay buffer, even
+            # though the batch is preprocessed by the main thread.
+            muzero._config = TrainerConfig(
+                root_dir="dummy",
+                mini_batch_size=4,
+                mini_batch_length=1,
+                num_updates_per_train_iter=1,
+                whole_replay_buffer_training=False,
+                replay_prefetch_size=1)
+            # The experience is transformed by the parent algorithm in practice.
+            with patch.object(muzero, 'transform_experience', lambda e: e):
+                with self.assertRaisesRegex(AssertionError,
+                                            "ReplayPrefetcher"):
+                    muzero.train_from_replay_buffer()
+            muzero.finish_train()
+            self.assertIsNone(muzero._reanalyze_workers)
         processed_experience = muzero.preprocess_experience(experience)
+        if num_reanalyze_workers > 0:
+            # The first call reanalyzes inline and starts the workers. Wait
+            # for the workers to reanalyze all the positions and check that
+            # their results are used.
+            env_ids1, positions1 = muzero._next_n_positions(
+                replay_buffer, env_ids, positions, num_unroll_steps)
+            t0 = time.time()
+            while not muzero._reanalyze_table.read(env_ids1, positions1,
+                                                   0)[0].all():
+                self.assertLess(time.time() - t0, 60)
+                time.sleep(0.1)
+            muzero._reanalyze = lambda *args: self.fail(
+                "Should not reanalyze inline")
+            processed_experience = muzero.preprocess_experience(experience)
+            muzero.finish_train()
+        if reanalyze_cache_max_age is not None:
+            # All the samples are in the cache now.
+            reanalyze1 = muzero._reanalyze1
+            muzero._reanalyze1 = lambda *args: self.fail("Cache miss")
+            processed_experience = muzero.preprocess_experience(experience)
+            alf.nest.map_structure(lambda x, y: self.assertEqual(x, y),
+                                   processed_experience.rollout_info, expected)
+            # The cache becomes stale after so many target updates.
+            for _ in range(reanalyze_cache_max_age + 1):
+                for _ in range(muzero._target_update_period):
+                    muzero.after_update(None, None)
+            num_calls = [0]
+
+            def _reanalyze1_with_count(*args):
+                num_calls[0] += 1
+                return reanalyze1(*args)
+
+            muzero._reanalyze1 = _reanalyze1_with_count
+            processed_experience = muzero.preprocess_experience(experience)
+            self.assertGreater(num_calls[0], 0)
         import pprint
         pprint.pprint(processed_experience.rollout_info)
         alf.nest.map_structure(lambda x, y: self.assertEqual(x, y),
@@ -743,6 +811,18 @@ class MuzeroAlgorithmTest(alf.test.TestCase):
             reanalyze_ratio=1.,
             expected=expected)
         # yapf: enable
+        self._test_preprocess_experience(
+            train_reward_function=False,
+            td_steps=-1,
+            reanalyze_ratio=1.,
+            expected=expected,
+            num_reanalyze_workers=1)
+        self._test_preprocess_experience(
+            train_reward_function=False,
+            td_steps=-1,
+            reanalyze_ratio=1.,
+            expected=expected,
+            reanalyze_cache_max_age=1)
 
 
 if __name__ == '__main__':
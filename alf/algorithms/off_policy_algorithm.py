@@ -13,11 +13,16 @@
 # limitations under the License.
 """Base class for off policy algorithms."""
 
+import copy
+import time
 import torch
 
 import alf
+from alf.algorithms.algorithm import Algorithm
+from alf.algorithms.async_unroller import AsyncUnroller
 from alf.algorithms.config import TrainerConfig
 from alf.algorithms.rl_algorithm import RLAlgorithm
+from alf.utils import profiler
 from alf.utils.summary_utils import record_time
 
 
@@ -51,6 +56,12 @@ class OffPolicyAlgorithm(RLAlgorithm):
                 add policy_step.info to batched_train_info
             loss = calc_loss(experiences, batched_train_info)
             update_with_gradient(loss)
+
+    If ``TrainerConfig.async_unroll`` is True, the collect stage is performed
+    by a background thread (see ``AsyncUnroller``) so that the environments
+    keep running while the train stage is going on. The background thread
+    unrolls a separate copy of the algorithm in eval mode, whose parameters are
+    synced from the trained algorithm once every training iteration.
     """
 
     def is_on_policy(self):
@@ -63,12 +74,16 @@ class OffPolicyAlgorithm(RLAlgorithm):
         if not config.update_counter_every_mini_batch:
             alf.summary.increment_global_counter()
 
-        with torch.set_grad_enabled(config.unroll_with_grad):
-            with record_time("time/unroll"):
-                self.eval()
-                experience = self.unroll(config.unroll_length)
-                self.summarize_rollout(experience)
-                self.summarize_metrics()
+        if config.async_unroll:
+            experience = self._async_unroll()
+        else:
+            with torch.set_grad_enabled(config.unroll_with_grad):
+                with record_time("time/unroll"):
+                    self.eval()
+                    experience = self.unroll(config.unroll_length)
+                    with profiler.span("summaries"):
+                        self.summarize_rollout(experience)
+                        self.summarize_metrics()
 
         self.train()
         steps = self.train_from_replay_buffer(update_global_counter=True)
@@ -83,3 +98,84 @@ class OffPolicyAlgorithm(RLAlgorithm):
 
         # For now, we only return the steps of the primary algorithm's training
         return steps
+
+    def _async_unroll(self):
+        """Get the experience unrolled by the background unroll thread.
+
+        The unroll thread is started at the first call.
+        """
+        with record_time("time/unroll"):
+            if self._async_unroller is None:
+                experience = self._start_async_unroll()
+                policy_lag = 0
+            else:
+                t0 = time.time()
+                with profiler.span("wait_unroll"):
+                    experience, policy_lag = self._async_unroller.get()
+                self._learner_wait_time += time.time() - t0
+            with profiler.span("summaries"):
+                self.summarize_rollout(experience)
+                self.summarize_metrics()
+
+        if alf.summary.should_record_summaries():
+            t = time.time()
+            alf.summary.scalar(
+                "time/learner_utilization",
+                1. - self._learner_wait_time / (t - self._learner_start_time))
+            self._learner_wait_time = 0.
+            self._learner_start_time = t
+            actor_utilization = self._async_unroller.pop_utilization()
+            if actor_utilization is not None:
+                alf.summary.scalar("time/actor_utilization", actor_utilization)
+            alf.summary.scalar("async_unroll/policy_lag", policy_lag)
+        return experience
+
+    def _start_async_unroll(self):
+        """Start the background unroll thread.
+
+        The first unroll is performed by the calling thread so that the objects
+        created lazily by ``unroll()`` (e.g. the replay buffer) exist before
+        making the rollout copy, which then shares them with this algorithm.
+
+        Returns:
+            Experience: the experience of the first unroll.
+        """
+        config: TrainerConfig = self._config
+        assert not config.unroll_with_grad, (
+            "async_unroll does not support unroll_with_grad")
+        assert self._exp_replayer_type == "uniform", (
+            "async_unroll requires a replay buffer which is not cleared "
+            "after each training iteration")
+        self.eval()
+        with torch.no_grad():
+            experience = self.unroll(config.unroll_length)
+        self._async_unroller = AsyncUnroller(self, self._make_rollout_copy(),
+                                             config.unroll_length,
+                                             config.async_max_policy_lag)
+        self._async_unroller.start()
+        self._learner_wait_time = 0.
+        self._learner_start_time = time.time()
+        return experience
+
+    def _make_rollout_copy(self):
+        """Make a copy of this algorithm for the background unroll thread.
+
+        The copy has its own modules (and hence its own parameters and
+        buffers), but shares the environment, the replay buffer, the metrics,
+        the optimizers and the config with this algorithm.
+
+        Returns:
+            OffPolicyAlgorithm: the copy
+        """
+        memo = {}
+        for alg in self.modules():
+            if not isinstance(alg, Algorithm):
+                continue
+            shared = [
+                getattr(alg, name, None)
+                for name in ('_env', '_config', '_proc', '_exp_replayer',
+                             '_replay_prefetcher', '_mini_batch_iterator')
+            ]
+            for obj in shared + alg._optimizers + alg._metrics:
+                memo[id(obj)] = obj
+        return copy.deepcopy(self, memo)
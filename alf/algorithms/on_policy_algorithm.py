@@ -18,6 +18,7 @@ import torch
 import alf
 from alf.algorithms.off_policy_algorithm import OffPolicyAlgorithm
 from alf.data_structures import Experience, TimeStep, StepType
+from alf.utils import profiler
 from alf.utils.summary_utils import record_time
 
 
@@ -69,7 +70,8 @@ class OnPolicyAlgorithm(OffPolicyAlgorithm):
 
         with record_time("time/unroll"):
             experience = self.unroll(self._config.unroll_length)
-            self.summarize_metrics()
+            with profiler.span("summaries"):
+                self.summarize_metrics()
 
         with record_time("time/train"):
             train_info = experience.rollout_info
@@ -0,0 +1,492 @@
+# Copyright (c) 2020 Horizon Robotics and ALF Contributors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Train a population of independent agents in one process."""
+
+import gin
+import torch
+import torch.distributions as td
+
+import alf
+from alf.algorithms.config import TrainerConfig
+from alf.algorithms.off_policy_algorithm import OffPolicyAlgorithm
+from alf.algorithms.on_policy_algorithm import OnPolicyAlgorithm
+from alf.algorithms.rl_algorithm import RLAlgorithm
+from alf.data_structures import Experience, TimeStep
+from alf.networks import PopulationNetwork
+from alf.networks.network import population_members, population_networks
+from alf.utils import dist_utils, profiler
+from alf.utils.summary_utils import record_time
+
+
+class _EnvSlice(object):
+    """A view of the environments ``[begin, end)`` of a batched environment.
+
+    It only provides the information needed for constructing an algorithm
+    (e.g. the specs and the batch size). It cannot be stepped.
+    """
+
+    def __init__(self, env, begin, end, time_step):
+        self._env = env
+        self._begin = begin
+        self._end = end
+        self._time_step = alf.nest.map_structure(lambda x: x[begin:end],
+                                                 time_step)
+        self._time_step = self._time_step._replace(
+            env_id=self._time_step.env_id - begin)
+
+    @property
+    def batched(self):
+        return True
+
+    @property
+    def batch_size(self):
+        return self._end - self._begin
+
+    @property
+    def num_envs_per_step(self):
+        return self.batch_size
+
+    def env_info_spec(self):
+        return self._env.env_info_spec()
+
+    def observation_spec(self):
+        return self._env.observation_spec()
+
+    def action_spec(self):
+        return self._env.action_spec()
+
+    def reward_spec(self):
+        return self._env.reward_spec()
+
+    def time_step_spec(self):
+        return self._env.time_step_spec()
+
+    def current_time_step(self):
+        return self._time_step
+
+    def reset(self):
+        return self._time_step
+
+
+@gin.configurable
+class PopulationAlgorithm(RLAlgorithm):
+    """Train a population of independent agents in one process.
+
+    The environments of the batched environment are evenly divided among the
+    members of the population. Member ``k`` acts in the environments
+    ``[k * B / K, (k + 1) * B / K)``, where ``B`` is the batch size of the
+    environment and ``K`` is the size of the population. Each member is an
+    instance of an ``RLAlgorithm`` with its own parameters, optimizers,
+    replay buffer and metrics, so the members are trained in the same way as
+    being trained separately with ``B / K`` environments. For example, the
+    following trains 4 SAC agents with different random initializations:
+
+    .. code-block:: python
+
+        TrainerConfig.algorithm_ctor=@PopulationAlgorithm
+        PopulationAlgorithm.algorithm_ctor=@SacAlgorithm
+        PopulationAlgorithm.population_size=4
+
+    and the following trains SAC agents with different learning rates:
+
+    .. code-block:: python
+
+        PopulationAlgorithm.algorithm_ctor=[@lr1/SacAlgorithm, @lr2/SacAlgorithm]
+        lr1/Adam.lr=1e-3
+        lr2/Adam.lr=3e-4
+
+    Compared to running the agents in separate processes, the environments of
+    all the members are stepped together and the members share one process.
+    The options of ``TrainerConfig`` (e.g. ``mini_batch_size`` and
+    ``initial_collect_steps``) apply to each member. The metrics of member
+    ``k`` are summarized under ``member{k}/``, and the metrics of the whole
+    population are summarized as usual.
+
+    All the members should have the same state specs and the same structure of
+    the rollout info. The members are run one after another on their own
+    slices of the batch. ``TrainerConfig.async_unroll`` and
+    ``TrainerConfig.unroll_with_grad`` are not supported.
+
+    If ``stack_members`` is True, the members are stacked into one algorithm
+    instead, whose networks are ``PopulationNetwork`` (see
+    ``population_networks()``). Each sample of a batch is computed by the
+    parameters of the member acting in its environment, and the members are
+    computed together by the parallel networks (e.g. ``ParallelFC``), which
+    is much faster than running small members one after another. In this mode:
+
+    * The parameters and states not belonging to a network (e.g. the entropy
+      coefficient of SAC and the observation normalizer) are shared by the
+      members.
+    * The members are trained with one optimizer, so gradient clipping is
+      applied to the gradients of all the members together.
+    * The experiences of all the members are stored in one replay buffer and
+      ``TrainerConfig.mini_batch_size`` is the size of the mini-batch of the
+      whole population. The number of samples of each member in a
+      mini-batch varies, and the loss of each member is averaged over its own
+      samples (see ``calc_loss()``).
+    """
+
+    def __init__(self,
+                 observation_spec,
+                 action_spec,
+                 algorithm_ctor,
+                 population_size=None,
+                 stack_members=False,
+                 env=None,
+                 config: TrainerConfig = None,
+                 debug_summaries=False,
+                 name="PopulationAlgorithm"):
+        """
+        Args:
+            observation_spec (nested TensorSpec): representing the observations.
+            action_spec (nested BoundedTensorSpec): representing the actions.
+            algorithm_ctor (Callable|list[Callable]): the constructor(s) of the
+                members, which will be called as ``algorithm_ctor(
+                observation_spec=?, action_spec=?, env=?, config=?,
+                debug_summaries=?)``. If a list, each member is created by one of
+                them.
+            population_size (int): the number of members. Only needed if
+                ``algorithm_ctor`` is not a list.
+            stack_members (bool): If True, the members are stacked into one
+                algorithm created as ``algorithm_ctor(observation_spec=?,
+                action_spec=?, debug_summaries=?)`` within
+                ``population_networks(population_size)``. ``algorithm_ctor``
+                cannot be a list in this case.
+            env (Environment): The environment to interact with. Its batch size
+                should be a multiple of the size of the population.
+            config (TrainerConfig): config for training
+            debug_summaries (bool): If True, debug summaries will be created.
+            name (str): Name of this algorithm.
+        """
+        if isinstance(algorithm_ctor, (list, tuple)):
+            assert not stack_members, (
+                "stack_members does not support a list of algorithm_ctor")
+            assert population_size in (None, len(algorithm_ctor)), (
+                "population_size does not match the number of algorithm_ctor")
+            ctors = list(algorithm_ctor)
+        else:
+            assert population_size is not None, (
+                "population_size should be provided")
+            ctors = [algorithm_ctor] * population_size
+        population_size = len(ctors)
+        assert env is not None and config is not None, (
+            "PopulationAlgorithm should be the root algorithm")
+        assert env.batch_size % population_size == 0, (
+            "The batch size of the environment (%d) should be a multiple of "
+            "population_size (%d)" % (env.batch_size, population_size))
+        assert getattr(env, 'num_envs_per_step',
+                       env.batch_size) == env.batch_size, (
+                           "PopulationAlgorithm does not support environments "
+                           "which only return a subset of environments")
+        assert not config.async_unroll, (
+            "PopulationAlgorithm does not support async_unroll")
+        assert not config.unroll_with_grad, (
+            "PopulationAlgorithm does not support unroll_with_grad")
+
+        member_batch_size = env.batch_size // population_size
+        time_step = env.reset()
+        env_slices = [
+            _EnvSlice(env, k * member_batch_size, (k + 1) * member_batch_size,
+                      time_step) for k in range(population_size)
+        ]
+        if stack_members:
+            with population_networks(population_size):
+                algorithm = algorithm_ctor(
+                    observation_spec=observation_spec,
+                    action_spec=action_spec,
+                    debug_summaries=debug_summaries)
+            assert any(
+                isinstance(m, PopulationNetwork) for m in algorithm.modules()
+            ), ("The algorithm created by algorithm_ctor does not have any "
+                "network to be stacked")
+            members = [algorithm]
+        else:
+            members = [
+                ctor(
+                    observation_spec=observation_spec,
+                    action_spec=action_spec,
+                    env=env_slice,
+                    config=config,
+                    debug_summaries=debug_summaries)
+                for ctor, env_slice in zip(ctors, env_slices)
+            ]
+        member = members[0]
+        for m in members[1:]:
+            assert m.is_on_policy() == member.is_on_policy(), (
+                "All the members should be either on-policy or off-policy")
+            for spec_name in ('train_state_spec', 'rollout_state_spec',
+                              'predict_state_spec'):
+                alf.nest.assert_same_structure(
+                    getattr(m, spec_name), getattr(member, spec_name))
+        self._on_policy = member.is_on_policy()
+
+        super().__init__(
+            observation_spec=observation_spec,
+            action_spec=action_spec,
+            train_state_spec=member.train_state_spec,
+            rollout_state_spec=member.rollout_state_spec,
+            predict_state_spec=member.predict_state_spec,
+            env=env,
+            config=config,
+            debug_summaries=debug_summaries,
+            name=name)
+
+        self._population_size = population_size
+        self._member_batch_size = member_batch_size
+        self._stack_members = stack_members
+        if stack_members:
+            self._algorithm = algorithm
+            self._members = None
+            self._member_metrics = [
+                self._create_metrics(env_slice) for env_slice in env_slices
+            ]
+            # Set ``use_rollout_state`` of the stacked algorithm
+            self.use_rollout_state = self.use_rollout_state
+        else:
+            self._algorithm = None
+            self._members = torch.nn.ModuleList(members)
+
+    @property
+    def members(self):
+        """The members of the population if ``stack_members`` is False."""
+        assert not self._stack_members, (
+            "The members are stacked. Use stacked_algorithm instead")
+        return list(self._members)
+
+    @property
+    def stacked_algorithm(self):
+        """The algorithm of the stacked members if ``stack_members`` is True."""
+        assert self._stack_members, "The members are not stacked"
+        return self._algorithm
+
+    def get_member_metrics(self, k):
+        """Get the metrics of member ``k``.
+
+        Returns:
+            list[StepMetric]: the first two are ``NumberOfEpisodes`` and
+            ``EnvironmentSteps``.
+        """
+        if self._stack_members:
+            return self._member_metrics[k]
+        return self._members[k].get_metrics()
+
+    def is_on_policy(self):
+        return self._on_policy
+
+    def _member_slice(self, nest, k, dim=0):
+        """Get the part of ``nest`` for member ``k``.
+
+        The ``env_id`` of ``TimeStep`` and ``Experience`` are converted to the
+        ids in the environments of the member.
+        """
+        begin = k * self._member_batch_size
+        end = begin + self._member_batch_size
+        index = (slice(None), ) * dim + (slice(begin, end), )
+
+        def _slice(x):
+            if isinstance(x, torch.Tensor):
+                return x[index]
+            elif isinstance(x, td.Distribution):
+                spec = dist_utils.extract_spec(x, from_dim=dim + 1)
+                params = alf.nest.map_structure(
+                    lambda p: p[index], dist_utils.distributions_to_params(x))
+                return dist_utils.params_to_distributions(params, spec)
+            else:
+                return x
+
+        nest = alf.nest.map_structure(_slice, nest)
+        return self._remap_env_id(nest, begin)
+
+    def _remap_env_id(self, nest, offset):
+        if isinstance(nest, (TimeStep, Experience)) and isinstance(
+                nest.env_id, torch.Tensor):
+            nest = nest._replace(env_id=nest.env_id - offset)
+        if isinstance(nest, TimeStep) and isinstance(nest.untransformed,
+                                                     TimeStep):
+            nest = nest._replace(
+                untransformed=self._remap_env_id(nest.untransformed, offset))
+        return nest
+
+    def _concat(self, nests):
+        """Concatenate the outputs of the members along the batch dimension."""
+        spec = dist_utils.extract_spec(nests[0], from_dim=1)
+        nests = [dist_utils.distributions_to_params(n) for n in nests]
+        nest = alf.nest.map_structure(lambda *xs: torch.cat(xs), *nests)
+        return dist_utils.params_to_distributions(nest, spec)
+
+    def _member_ids(self, env_id):
+        return env_id.to(torch.int64) // self._member_batch_size
+
+    def _run_members(self, func, inputs, state):
+        if self._stack_members:
+            with population_members(self._member_ids(inputs.env_id)):
+                return func(self._algorithm, inputs, state)
+        steps = [
+            func(m, self._member_slice(inputs, k), self._member_slice(
+                state, k)) for k, m in enumerate(self._members)
+        ]
+        return self._concat(steps)
+
+    def predict_step(self, time_step: TimeStep, state, epsilon_greedy):
+        return self._run_members(
+            lambda m, ts, s: m.predict_step(ts, s, epsilon_greedy), time_step,
+            state)
+
+    def rollout_step(self, time_step: TimeStep, state):
+        return self._run_members(lambda m, ts, s: m.rollout_step(ts, s),
+                                 time_step, state)
+
+    def train_step(self, exp: Experience, state):
+        return self._run_members(lambda m, e, s: m.train_step(e, s), exp,
+                                 state)
+
+    def calc_loss(self, experience, train_info):
+        """Calculate the losses of the members for on-policy training.
+
+        The losses are concatenated along the batch dimension and ``loss`` is
+        multiplied by the size of the population, so that the gradient for
+        each member is the same as that of its own loss averaged over its own
+        batch in ``update_with_gradient()``.
+
+        If the members are stacked, a mini-batch sampled from the shared replay
+        buffer does not have the same number of samples for every member. So
+        the ``loss`` of each sample is multiplied by ``B / n_k`` instead, where
+        ``B`` is the batch size and ``n_k`` is the number of samples of its
+        member.
+        """
+        if self._stack_members:
+            member_ids = self._member_ids(experience.env_id)
+            with population_members(member_ids):
+                loss_info = self._algorithm.calc_loss(experience, train_info)
+            loss = loss_info.loss
+            assert loss.ndim >= 2, (
+                "The stacked members need the loss of each sample, got a loss "
+                "with shape %s" % (loss.shape, ))
+            # ``env_id`` is the same for all the steps of a sample
+            member_ids = member_ids[0]
+            counts = torch.bincount(
+                member_ids, minlength=self._population_size)
+            weight = member_ids.shape[0] / counts[member_ids].to(loss.dtype)
+            return loss_info._replace(loss=loss * weight)
+
+        loss_infos = [
+            m.calc_loss(
+                self._member_slice(experience, k, dim=1),
+                self._member_slice(train_info, k, dim=1))
+            for k, m in enumerate(self._members)
+        ]
+
+        def _merge(*xs):
+            if xs[0].ndim >= 2:
+                return torch.cat(xs, dim=1)
+            return torch.stack(xs).mean(dim=0)
+
+        loss_info = alf.nest.map_structure(_merge, *loss_infos)
+        return loss_info._replace(loss=loss_info.loss * len(self._members))
+
+    def preprocess_experience(self, experience):
+        if self._stack_members:
+            with population_members(self._member_ids(experience.env_id)):
+                return self._algorithm.preprocess_experience(experience)
+        return experience
+
+    def after_update(self, experience, train_info):
+        if self._stack_members:
+            with population_members(self._member_ids(experience.env_id)):
+                self._algorithm.after_update(experience, train_info)
+            return
+        for k, m in enumerate(self._members):
+            m.after_update(
+                self._member_slice(experience, k, dim=1),
+                self._member_slice(train_info, k, dim=1))
+
+    def after_train_iter(self, experience, train_info=None):
+        if self._stack_members:
+            with population_members(self._member_ids(experience.env_id)):
+                self._algorithm.after_train_iter(experience, train_info)
+            return
+        for k, m in enumerate(self._members):
+            m.after_train_iter(
+                self._member_slice(experience, k, dim=1),
+                None if train_info is None else self._member_slice(
+                    train_info, k, dim=1))
+
+    def observe_for_replay(self, exp):
+        if self._stack_members:
+            super().observe_for_replay(exp)
+            return
+        for k, m in enumerate(self._members):
+            m.observe_for_replay(self._member_slice(exp, k))
+
+    def observe_for_metrics(self, time_step):
+        super().observe_for_metrics(time_step)
+        for k in range(self._population_size):
+            member_time_step = self._member_slice(time_step, k)
+            if self._stack_members:
+                for metric in self._member_metrics[k]:
+                    metric(member_time_step)
+            else:
+                self._members[k].observe_for_metrics(member_time_step)
+
+    def summarize_metrics(self):
+        super().summarize_metrics()
+        if not alf.summary.should_record_summaries():
+            return
+        for k in range(self._population_size):
+            metrics = self.get_member_metrics(k)
+            with alf.summary.scope("member%d" % k):
+                for metric in metrics:
+                    metric.gen_summaries(
+                        train_step=alf.summary.get_global_counter(),
+                        step_metrics=metrics[:2])
+
+    def finish_train(self):
+        for m in self._members or [self._algorithm]:
+            m.finish_train()
+        super().finish_train()
+
+    # The losses of all the members are calculated by ``calc_loss()`` and
+    # backpropagated together.
+    _train_iter_on_policy = OnPolicyAlgorithm._train_iter_on_policy
+
+    def _train_iter_off_policy(self):
+        if self._stack_members:
+            # The stacked members are trained from the replay buffer of
+            # ``self``.
+            return OffPolicyAlgorithm._train_iter_off_policy(self)
+
+        config: TrainerConfig = self._config
+        if not config.update_counter_every_mini_batch:
+            alf.summary.increment_global_counter()
+
+        with torch.no_grad():
+            with record_time("time/unroll"):
+                self.eval()
+                experience = self.unroll(config.unroll_length)
+                with profiler.span("summaries"):
+                    self.summarize_rollout(experience)
+                    self.summarize_metrics()
+
+        self.train()
+        steps = 0
+        for k, m in enumerate(self._members):
+            with alf.summary.scope("member%d" % k):
+                steps += m.train_from_replay_buffer(
+                    update_global_counter=(k == 0))
+
+        with record_time("time/after_train_iter"):
+            experience = experience._replace(rollout_info=())
+            self.after_train_iter(experience)
+
+        return steps
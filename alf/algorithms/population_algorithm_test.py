@@ -0,0 +1,233 @@
+# Copyright (c) 2020 Horizon Robotics and ALF Contributors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from absl.testing import parameterized
+from functools import partial
+import tempfile
+import torch
+import torch.distributions as td
+from unittest.mock import patch
+
+import alf
+from alf.algorithms.population_algorithm import PopulationAlgorithm
+from alf.algorithms.rl_algorithm_test import MyAlg, MyEnv
+from alf.data_structures import AlgStep, Experience, LossInfo, TimeStep
+from alf.networks import EncodingNetwork, PopulationNetwork
+from alf.networks.encoding_networks import ParallelEncodingNetwork
+from alf.trainers.policy_trainer import RLTrainer, TrainerConfig
+from alf.utils import common, math_ops
+
+
+class MyRLTrainer(RLTrainer):
+    def _create_environment(self,
+                            nonparallel=False,
+                            random_seed=None,
+                            register=True):
+        env = MyEnv(6)
+        if register:
+            self._register_env(env)
+        return env
+
+
+class MyStackableAlg(MyAlg):
+    """``MyAlg`` computing the logits with an ``EncodingNetwork``, which has an
+    optimized ``make_parallel()``."""
+
+    def __init__(self, observation_spec, action_spec, **kwargs):
+        super().__init__(observation_spec, action_spec, **kwargs)
+        self._logits_net = EncodingNetwork(
+            observation_spec,
+            fc_layer_params=(),
+            last_layer_size=3,
+            last_activation=math_ops.identity)
+
+    def _dist(self, observation):
+        logits, _ = self._logits_net(observation)
+        return td.Categorical(logits=logits)
+
+    def predict_step(self, time_step: TimeStep, state, epsilon_greedy):
+        dist = self._dist(time_step.observation)
+        return AlgStep(output=dist.sample(), state=(), info=())
+
+    def rollout_step(self, time_step: TimeStep, state):
+        dist = self._dist(time_step.observation)
+        return AlgStep(
+            output=dist.sample(), state=time_step.observation, info=dist)
+
+    def train_step(self, exp: Experience, state):
+        dist = self._dist(exp.observation)
+        return AlgStep(output=dist.sample(), state=exp.observation, info=dist)
+
+
+class PopulationAlgorithmTest(parameterized.TestCase, alf.test.TestCase):
+    @parameterized.parameters((True, ), (False, ))
+    def test_population_algorithm(self, on_policy):
+        with tempfile.TemporaryDirectory() as root_dir:
+            conf = TrainerConfig(
+                algorithm_ctor=partial(
+                    PopulationAlgorithm,
+                    algorithm_ctor=partial(MyAlg, on_policy=on_policy),
+                    population_size=3),
+                root_dir=root_dir,
+                unroll_length=5,
+                mini_batch_length=5,
+                mini_batch_size=2,
+                num_updates_per_train_iter=1,
+                use_rollout_state=True,
+                whole_replay_buffer_training=True,
+                num_iterations=100,
+                confirm_checkpoint_upon_crash=False)
+            trainer = MyRLTrainer(conf)
+            trainer.train()
+
+            alg = trainer._algorithm
+            members = alg.members
+            self.assertEqual(len(members), 3)
+            for m in members:
+                self.assertEqual(m._env.batch_size, 2)
+            # Each member has its own parameters and optimizer
+            for p0, p1 in zip(members[0].parameters(),
+                              members[1].parameters()):
+                self.assertIsNot(p0, p1)
+            self.assertFalse(
+                all(
+                    torch.all(p0 == p1) for p0, p1 in zip(
+                        members[0].parameters(), members[1].parameters())))
+            self.assertEqual(
+                len(set(id(m.optimizers()[0]) for m in members)), 3)
+
+            env = common.get_env()
+            time_step = common.get_initial_time_step(env)
+            state = alg.get_initial_predict_state(env.batch_size)
+            policy_step = alg.predict_step(time_step, state, 0.)
+            self.assertEqual(policy_step.output.shape, (6, ))
+            policy_step = alg.rollout_step(time_step, state)
+            logits = policy_step.info.log_prob(torch.arange(3).reshape(3, 1))
+            self.assertTrue(torch.all(logits[1, :] > logits[0, :]))
+            self.assertTrue(torch.all(logits[1, :] > logits[2, :]))
+
+            # The members observe their own environments
+            num_episodes = [int(m.get_metrics()[0].result()) for m in members]
+            self.assertEqual(
+                sum(num_episodes), int(alg.get_metrics()[0].result()))
+            env_steps = [int(m.get_metrics()[1].result()) for m in members]
+            self.assertEqual(
+                sum(env_steps), int(alg.get_metrics()[1].result()))
+            if not on_policy:
+                # Each member has its own replay buffer
+                self.assertIsNone(alg._exp_replayer)
+                for m in members:
+                    self.assertIsNotNone(m._exp_replayer)
+
+    @parameterized.parameters((True, ), (False, ))
+    def test_stacked_population_algorithm(self, on_policy):
+        with tempfile.TemporaryDirectory() as root_dir:
+            conf = TrainerConfig(
+                algorithm_ctor=partial(
+                    PopulationAlgorithm,
+                    algorithm_ctor=partial(
+                        MyStackableAlg, on_policy=on_policy),
+                    population_size=3,
+                    stack_members=True),
+                root_dir=root_dir,
+                unroll_length=5,
+                mini_batch_length=5,
+                mini_batch_size=6,
+                num_updates_per_train_iter=1,
+                use_rollout_state=True,
+                whole_replay_buffer_training=True,
+                num_iterations=100,
+                confirm_checkpoint_upon_crash=False)
+            trainer = MyRLTrainer(conf)
+            trainer.train()
+
+            alg = trainer._algorithm
+            net = alg.stacked_algorithm._logits_net
+            self.assertIsInstance(net, PopulationNetwork)
+            self.assertIsInstance(net._parallel_network,
+                                  ParallelEncodingNetwork)
+            # Each member has its own parameters
+            for p in net.parameters():
+                self.assertEqual(p.shape[0], 3)
+                self.assertFalse(torch.all(p[0] == p[1]))
+
+            env = common.get_env()
+            time_step = common.get_initial_time_step(env)
+            state = alg.get_initial_predict_state(env.batch_size)
+            policy_step = alg.predict_step(time_step, state, 0.)
+            self.assertEqual(policy_step.output.shape, (6, ))
+            policy_step = alg.rollout_step(time_step, state)
+            logits = policy_step.info.log_prob(torch.arange(3).reshape(3, 1))
+            self.assertTrue(torch.all(logits[1, :] > logits[0, :]))
+            self.assertTrue(torch.all(logits[1, :] > logits[2, :]))
+
+            # Each member has its own metrics
+            num_episodes = [
+                int(alg.get_member_metrics(k)[0].result()) for k in range(3)
+            ]
+            self.assertEqual(
+                sum(num_episodes), int(alg.get_metrics()[0].result()))
+            self.assertTrue(all(n > 0 for n in num_episodes))
+
+    def test_stacked_calc_loss(self):
+        config = TrainerConfig(root_dir="dummy", unroll_length=5)
+        env = MyEnv(6)
+        alg = PopulationAlgorithm(
+            observation_spec=env.observation_spec(),
+            action_spec=env.action_spec(),
+            algorithm_ctor=MyStackableAlg,
+            population_size=3,
+            stack_members=True,
+            env=env,
+            config=config)
+        # The members of the samples are 0, 1, 1, 1, 2, 2
+        env_id = torch.tensor([0, 2, 3, 2, 4, 5]).expand(4, 6)
+        member_ids = env_id[0] // 2
+        loss = torch.rand(4, 6)
+        with patch.object(
+                alg.stacked_algorithm,
+                'calc_loss',
+                return_value=LossInfo(loss=loss)):
+            loss_info = alg.calc_loss(Experience(env_id=env_id), None)
+        self.assertTensorClose(loss_info.loss,
+                               loss * torch.tensor([6., 2, 2, 2, 3, 3]))
+        # The mean loss is the sum of the mean losses over each member's own
+        # samples.
+        self.assertAlmostEqual(
+            float(loss_info.loss.mean()),
+            sum(float(loss[:, member_ids == k].mean()) for k in range(3)),
+            places=5)
+
+    def test_algorithm_ctor_list(self):
+        config = TrainerConfig(root_dir="dummy", unroll_length=5)
+        env = MyEnv(4)
+        alg = PopulationAlgorithm(
+            observation_spec=env.observation_spec(),
+            action_spec=env.action_spec(),
+            algorithm_ctor=[MyAlg, MyAlg],
+            env=env,
+            config=config)
+        self.assertEqual(len(alg.members), 2)
+        with self.assertRaises(AssertionError):
+            PopulationAlgorithm(
+                observation_spec=env.observation_spec(),
+                action_spec=env.action_spec(),
+                algorithm_ctor=MyAlg,
+                population_size=3,
+                env=env,
+                config=config)
+
+
+if __name__ == '__main__':
+    alf.test.main()
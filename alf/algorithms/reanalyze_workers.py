@@ -0,0 +1,276 @@
+# Copyright (c) 2020 Horizon Robotics and ALF Contributors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Reanalyze the experiences of a replay buffer in background processes."""
+
+from absl import logging
+import copy
+import time
+import torch
+import torch.multiprocessing as mp
+
+import alf
+
+
+class ReanalyzeTable(object):
+    """The reanalyzed targets of the positions of a replay buffer.
+
+    The targets of position ``pos`` of environment ``env_id`` are stored at
+    ``[env_id, pos % max_length]`` together with ``pos`` and the version of
+    the model used for computing them, so an entry becomes invalid once its
+    slot is used by a later position. It is used both for the results of the
+    reanalyze workers and as the cache of the reanalyzed targets of the
+    learner. The tensors are in shared memory so that they can be written by
+    the worker processes and read by the learner.
+    """
+
+    def __init__(self,
+                 num_environments,
+                 max_length,
+                 policy_spec,
+                 action_spec=None):
+        """
+        Args:
+            num_environments (int): the number of environments of the replay
+                buffer
+            max_length (int): ``max_length`` of the replay buffer
+            policy_spec (TensorSpec): spec of ``candidate_action_policy`` of
+                one position
+            action_spec (TensorSpec|None): spec of ``candidate_actions`` of one
+                position. None if the candidate actions are not used.
+        """
+        shape = (num_environments, max_length)
+        self._max_length = max_length
+        self._position = torch.full(shape, -1, dtype=torch.int64)
+        self._version = torch.zeros(shape, dtype=torch.int64)
+        self._value = torch.zeros(shape)
+        self._policy = policy_spec.zeros(shape)
+        self._actions = None
+        if action_spec is not None:
+            self._actions = action_spec.zeros(shape)
+        for x in (self._position, self._version, self._value, self._policy,
+                  self._actions):
+            if x is not None:
+                x.share_memory_()
+        self._lock = mp.get_context("fork").Lock()
+
+    def write(self, env_ids, positions, actions, policy, values, version):
+        """Write the targets of ``positions`` of ``env_ids``.
+
+        Args:
+            env_ids (Tensor): int64 Tensor broadcastable to ``positions``
+            positions (Tensor): int64 Tensor of any shape ``S``
+            actions (Tensor|()): candidate actions of shape ``S + action_spec.shape``
+            policy (Tensor): candidate action policy of shape ``S + policy_spec.shape``
+            values (Tensor): value targets of shape ``S``
+            version (int): the version of the model used
+        """
+        env_ids = env_ids.expand_as(positions).reshape(-1)
+        positions = positions.reshape(-1)
+        indices = (env_ids, positions % self._max_length)
+        with self._lock:
+            self._position[indices] = positions
+            self._version[indices] = version
+            self._value[indices] = values.reshape(-1)
+            self._policy[indices] = policy.reshape(-1, *self._policy.shape[2:])
+            if self._actions is not None:
+                self._actions[indices] = actions.reshape(
+                    -1, *self._actions.shape[2:])
+
+    def read(self, env_ids, positions, min_version):
+        """Read the targets of ``positions`` of ``env_ids``.
+
+        Args:
+            env_ids (Tensor): int64 Tensor broadcastable to ``positions``
+            positions (Tensor): int64 Tensor of any shape ``S``
+            min_version (int): the entries computed by models with smaller
+                versions are regarded as stale.
+        Returns:
+            tuple:
+            - found (Tensor): bool Tensor of shape ``S`` indicating whether the
+              targets of the position are in the table and not stale.
+            - actions (Tensor|()): candidate actions
+            - policy (Tensor): candidate action policy
+            - values (Tensor): value targets
+        """
+        env_ids = env_ids.expand_as(positions)
+        indices = (env_ids, positions % self._max_length)
+        with self._lock:
+            found = ((self._position[indices] == positions)
+                     & (self._version[indices] >= min_version))
+            values = self._value[indices]
+            policy = self._policy[indices]
+            actions = ()
+            if self._actions is not None:
+                actions = self._actions[indices]
+        return found, actions, policy, values
+
+
+class ReanalyzeWorkerPool(object):
+    """Reanalyze randomly sampled positions of a replay buffer in background.
+
+    Each worker is a forked process which repeatedly samples ``batch_size``
+    positions from ``replay_buffer`` uniformly, reanalyzes them with its copy
+    of ``model`` by ``reanalyze_fn`` and writes the results to ``table``.
+    ``replay_buffer`` is moved to shared memory by ``start()`` so that the
+    workers can see the new experiences. The learner updates the model of the
+    workers by ``sync_model()``, which increases ``version``.
+
+    Since the workers read ``replay_buffer`` without locking, the results of
+    the positions overwritten during the reanalysis are discarded.
+    """
+
+    def __init__(self,
+                 reanalyze_fn,
+                 model,
+                 replay_buffer,
+                 table: ReanalyzeTable,
+                 num_workers,
+                 batch_size,
+                 name="ReanalyzeWorker"):
+        """
+        Args:
+            reanalyze_fn (Callable): called as ``reanalyze_fn(model, env_ids,
+                positions)`` by the workers, where ``env_ids`` and
+                ``positions`` are 1-D int64 Tensors of the sampled positions.
+                It should return ``(env_ids, positions, actions, policy,
+                values)`` for ``ReanalyzeTable.write()``.
+            model (nn.Module): the model for reanalyzing. The workers use a
+                copy of it.
+            replay_buffer (ReplayBuffer): the replay buffer to be reanalyzed.
+                It should not use ``mmap_dir`` or ``compressed_fields``.
+            table (ReanalyzeTable): the table for the results
+            num_workers (int): the number of worker processes
+            batch_size (int): the number of positions reanalyzed together
+            name (str): name of the worker processes
+        """
+        assert num_workers > 0
+        self._reanalyze_fn = reanalyze_fn
+        self._replay_buffer = replay_buffer
+        self._table = table
+        self._num_workers = num_workers
+        self._batch_size = batch_size
+        self._name = name
+        ctx = mp.get_context("fork")
+        self._model = copy.deepcopy(model).share_memory()
+        self._model_lock = ctx.Lock()
+        self._version = torch.zeros((), dtype=torch.int64).share_memory_()
+        self._stop_event = ctx.Event()
+        self._processes = [
+            ctx.Process(
+                target=self._run,
+                args=(i, ),
+                name="%s%d" % (name, i),
+                daemon=True) for i in range(num_workers)
+        ]
+
+    @property
+    def version(self):
+        """The version of the model of the workers."""
+        return int(self._version)
+
+    def start(self):
+        """Start the worker processes."""
+        self._replay_buffer.share_memory()
+        for p in self._processes:
+            p.start()
+
+    def stop(self):
+        """Stop the worker processes and wait for them to finish."""
+        self._stop_event.set()
+        for p in self._processes:
+            p.join(timeout=10)
+            if p.is_alive():
+                p.terminate()
+
+    def is_alive(self):
+        """Whether any worker process is running."""
+        return any(p.is_alive() for p in self._processes)
+
+    @torch.no_grad()
+    def sync_model(self, model):
+        """Copy the parameters and buffers of ``model`` to the workers.
+
+        Args:
+            model (nn.Module): a module with the same structure as the model
+                given to the constructor
+        """
+        with self._model_lock:
+            for x, y in zip(self._model.state_dict().values(),
+                            model.state_dict().values()):
+                x.copy_(y)
+            self._version += 1
+
+    def _sample(self):
+        replay_buffer = self._replay_buffer
+        env_ids = torch.randint(replay_buffer.num_environments,
+                                (self._batch_size, ))
+        end = replay_buffer.get_current_position(env_ids)
+        begin = replay_buffer.get_earliest_position(env_ids)
+        valid = end > begin
+        env_ids, begin, end = env_ids[valid], begin[valid], end[valid]
+        positions = begin + (torch.rand(env_ids.shape) *
+                             (end - begin).to(torch.float32)).to(torch.int64)
+        positions = torch.min(positions, end - 1)
+        return env_ids, positions
+
+    @torch.no_grad()
+    def _sync_local_model(self, model, version):
+        with self._model_lock:
+            if int(self._version) != version:
+                version = int(self._version)
+                model.load_state_dict(self._model.state_dict())
+        return version
+
+    def _run(self, worker_id):
+        torch.set_num_threads(1)
+        # The summary writer of the parent process is not usable here
+        alf.summary.disable_summary()
+        torch.manual_seed((torch.initial_seed() + worker_id + 1) % 2**63)
+        model = copy.deepcopy(self._model)
+        version = int(self._version)
+        try:
+            while not self._stop_event.is_set():
+                version = self._sync_local_model(model, version)
+                env_ids, positions = self._sample()
+                if env_ids.shape[0] == 0:
+                    time.sleep(0.1)
+                    continue
+                try:
+                    with torch.no_grad():
+                        result = self._reanalyze_fn(model, env_ids, positions)
+                except AssertionError:
+                    # ``ReplayBuffer.get_field()`` asserts that the positions
+                    # are in the buffer.
+                    if self._overwritten(env_ids, positions).any():
+                        continue
+                    raise
+                env_ids, positions, actions, policy, values = result
+                valid = ~self._overwritten(
+                    env_ids.reshape(-1),
+                    positions.min(dim=-1)[0])
+                if not valid.all():
+                    env_ids, positions, values, policy = (env_ids[valid],
+                                                          positions[valid],
+                                                          values[valid],
+                                                          policy[valid])
+                    if isinstance(actions, torch.Tensor):
+                        actions = actions[valid]
+                self._table.write(env_ids, positions, actions, policy, values,
+                                  version)
+        except Exception:
+            logging.exception("Exception in %s%d" % (self._name, worker_id))
+            raise
+
+    def _overwritten(self, env_ids, positions):
+        return positions < self._replay_buffer.get_earliest_position(env_ids)
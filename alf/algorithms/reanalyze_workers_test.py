@@ -0,0 +1,56 @@
+# Copyright (c) 2020 Horizon Robotics and ALF Contributors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import torch
+
+import alf
+from alf.algorithms.reanalyze_workers import ReanalyzeTable
+
+
+class ReanalyzeTableTest(alf.test.TestCase):
+    def test_read_write(self):
+        table = ReanalyzeTable(
+            num_environments=2,
+            max_length=4,
+            policy_spec=alf.TensorSpec((3, )),
+            action_spec=alf.TensorSpec((3, ), dtype=torch.int64))
+        env_ids = torch.tensor([[0], [1]])
+        positions = torch.tensor([[0, 1], [2, 3]])
+        values = positions.to(torch.float32)
+        policy = values.unsqueeze(-1).expand(2, 2, 3)
+        actions = positions.unsqueeze(-1).expand(2, 2, 3)
+        table.write(env_ids, positions, actions, policy, values, version=1)
+
+        found, a, p, v = table.read(env_ids, positions, min_version=1)
+        self.assertTrue(found.all())
+        self.assertTensorEqual(a, actions)
+        self.assertTensorEqual(p, policy)
+        self.assertTensorEqual(v, values)
+
+        # stale
+        found = table.read(env_ids, positions, min_version=2)[0]
+        self.assertFalse(found.any())
+
+        # never written or overwritten by a later position
+        table.write(
+            torch.tensor([0]), torch.tensor([4]), actions[0, :1],
+            policy[0, :1], values[0, :1], 2)
+        found = table.read(
+            torch.tensor([[0], [1]]), torch.tensor([[0, 1], [0, 1]]), 1)[0]
+        self.assertTensorEqual(found,
+                               torch.tensor([[False, True], [False, False]]))
+
+
+if __name__ == '__main__':
+    alf.test.main()
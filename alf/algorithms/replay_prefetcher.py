@@ -0,0 +1,161 @@
+# Copyright (c) 2020 Horizon Robotics and ALF Contributors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Prepare replayed batches in a background thread."""
+
+from absl import logging
+import contextlib
+import queue
+import threading
+import torch
+
+import alf
+
+
+class ReplayPrefetcher(object):
+    """Repeatedly call ``fetch_fn()`` in a background thread.
+
+    ``fetch_fn()`` is expected to sample a batch from a replay buffer and
+    prepare it for training (e.g., ``transform_experience()``). Up to
+    ``prefetch_size`` results are prepared ahead of the consumer calling
+    ``get()``.
+
+    If the default device is "cuda", ``fetch_fn()`` runs on a separate CUDA
+    stream so that copying the batch to the GPU and transforming it can overlap
+    with the training on the default stream. ``get()`` makes the current
+    stream wait for the work of the batch.
+
+    Note that a batch can be sampled up to ``prefetch_size`` training updates
+    before it is used. The experiences in the batch may have been overwritten
+    in the replay buffer by then, and the priorities and importance weights in
+    the batch may be outdated.
+
+    The states accessed by ``fetch_fn()`` (e.g. the replay buffer) can be
+    safely accessed by other threads within ``paused()``.
+    """
+
+    def __init__(self, fetch_fn, prefetch_size=1):
+        """
+        Args:
+            fetch_fn (Callable): a function without argument which returns the
+                next batch.
+            prefetch_size (int): the maximal number of batches prepared ahead.
+        """
+        assert prefetch_size >= 1, (
+            "prefetch_size should be at least 1. Got %s" % prefetch_size)
+        self._fetch_fn = fetch_fn
+        self._queue = queue.Queue(maxsize=prefetch_size)
+        self._stop_event = threading.Event()
+        self._error = None
+        # ``fetch_fn()`` is called while holding this lock.
+        self._fetch_lock = threading.Lock()
+        # The batches fetched before the latest ``paused(discard=True)`` have
+        # an older generation and are discarded by ``get()``.
+        self._generation = 0
+        self._use_stream = alf.get_default_device() == "cuda"
+        self._thread = threading.Thread(
+            target=self._run, name="ReplayPrefetcher", daemon=True)
+
+    def start(self):
+        """Start the prefetch thread."""
+        self._thread.start()
+
+    def stop(self):
+        """Stop the prefetch thread and wait for it to finish."""
+        self._stop_event.set()
+        # Unblock the thread if it is waiting for a free slot.
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        if self._thread.is_alive():
+            self._thread.join()
+
+    @contextlib.contextmanager
+    def paused(self, discard=False):
+        """A context within which ``fetch_fn()`` is not running.
+
+        Args:
+            discard (bool): If True, the batches fetched before entering the
+                context are discarded. It should be used if the states used by
+                ``fetch_fn()`` are changed in the context (e.g. the replay
+                buffer is loaded from a checkpoint).
+        """
+        with self._fetch_lock:
+            if discard:
+                self._generation += 1
+            yield
+
+    def _put(self, item):
+        while not self._stop_event.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _run(self):
+        stream = torch.cuda.Stream() if self._use_stream else None
+        try:
+            while not self._stop_event.is_set():
+                with torch.no_grad(), self._fetch_lock:
+                    generation = self._generation
+                    if stream is None:
+                        batch = self._fetch_fn()
+                        event = None
+                    else:
+                        with torch.cuda.stream(stream):
+                            batch = self._fetch_fn()
+                            event = torch.cuda.Event()
+                            event.record(stream)
+                self._put((generation, batch, event))
+        except Exception as e:
+            logging.exception("Exception in the prefetch thread")
+            self._error = e
+            self._put(None)
+
+    def get(self):
+        """Get the next batch.
+
+        It blocks until the batch is available.
+
+        Returns:
+            the result of ``fetch_fn()``
+        """
+        while True:
+            if self._error is not None:
+                raise RuntimeError(
+                    "The prefetch thread failed") from self._error
+            try:
+                item = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                if not self._thread.is_alive():
+                    raise RuntimeError("The prefetch thread is not running")
+                continue
+            if item is None:
+                raise RuntimeError(
+                    "The prefetch thread failed") from self._error
+            if item[0] == self._generation:
+                break
+        _, batch, event = item
+        if event is not None:
+            current_stream = torch.cuda.current_stream()
+            current_stream.wait_event(event)
+
+            def _record_stream(x):
+                if isinstance(x, torch.Tensor) and x.is_cuda:
+                    x.record_stream(current_stream)
+
+            alf.nest.map_structure(_record_stream, batch)
+        return batch
@@ -0,0 +1,89 @@
+# Copyright (c) 2020 Horizon Robotics and ALF Contributors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+import torch
+
+import alf
+from alf.algorithms.replay_prefetcher import ReplayPrefetcher
+
+
+class ReplayPrefetcherTest(alf.test.TestCase):
+    def test_prefetch_order(self):
+        counter = [0]
+
+        def _fetch():
+            counter[0] += 1
+            return dict(x=torch.tensor(counter[0]))
+
+        prefetcher = ReplayPrefetcher(_fetch, prefetch_size=3)
+        prefetcher.start()
+        for i in range(10):
+            self.assertEqual(prefetcher.get()['x'], i + 1)
+        prefetcher.stop()
+
+    def test_prefetch_size(self):
+        num_calls = [0]
+        lock = threading.Lock()
+
+        def _fetch():
+            with lock:
+                num_calls[0] += 1
+            return torch.zeros(())
+
+        prefetcher = ReplayPrefetcher(_fetch, prefetch_size=2)
+        prefetcher.start()
+        time.sleep(0.5)
+        # At most ``prefetch_size`` results are queued and one more is
+        # waiting for a free slot.
+        self.assertLessEqual(num_calls[0], 3)
+        prefetcher.get()
+        prefetcher.stop()
+        self.assertFalse(prefetcher._thread.is_alive())
+
+    def test_paused(self):
+        source = dict(value=1, num_calls=0)
+
+        def _fetch():
+            source['num_calls'] += 1
+            return torch.tensor(source['value'])
+
+        prefetcher = ReplayPrefetcher(_fetch, prefetch_size=2)
+        prefetcher.start()
+        self.assertEqual(prefetcher.get(), 1)
+        with prefetcher.paused(discard=True):
+            num_calls = source['num_calls']
+            time.sleep(0.2)
+            # ``fetch_fn()`` is not called within ``paused()``
+            self.assertEqual(source['num_calls'], num_calls)
+            source['value'] = 2
+        # The batches fetched before ``paused()`` are discarded
+        for _ in range(3):
+            self.assertEqual(prefetcher.get(), 2)
+        prefetcher.stop()
+
+    def test_error(self):
+        def _fetch():
+            raise ValueError("fetch error")
+
+        prefetcher = ReplayPrefetcher(_fetch)
+        prefetcher.start()
+        with self.assertRaises(RuntimeError):
+            prefetcher.get()
+        prefetcher.stop()
+
+
+if __name__ == '__main__':
+    alf.test.main()
@@ -14,6 +14,7 @@
 """Base class for RL algorithms."""
 
 from abc import abstractmethod
+import contextlib
 import os
 import psutil
 import time
@@ -25,10 +26,22 @@ import gin
 import alf
 from alf.algorithms.algorithm import Algorithm
 from alf.data_structures import AlgStep, Experience, make_experience, TimeStep
-from alf.utils import common, dist_utils, summary_utils, math_ops
+from alf.utils import common, dist_utils, summary_utils, math_ops, profiler
 from .config import TrainerConfig
 
 
+def _gather_state(state, env_ids):
+    """Select the states of environments ``env_ids``."""
+    return alf.nest.map_structure(lambda s: s[env_ids], state)
+
+
+def _scatter_state(all_state, state, env_ids):
+    """Return a copy of ``all_state`` with the states of environments
+    ``env_ids`` replaced by ``state``."""
+    return alf.nest.map_structure(lambda a, s: a.index_put((env_ids, ), s),
+                                  all_state, state)
+
+
 @gin.configurable
 class RLAlgorithm(Algorithm):
     """Abstract base class for RL Algorithms.
@@ -126,38 +139,61 @@ class RLAlgorithm(Algorithm):
         self._current_time_step = None
         self._current_policy_state = None
         self._current_transform_state = None
+        self._async_unroller = None
+        self._unroll_buffer = None
+        self._unroll_buffer_key = None
 
         if self._env is not None and not self.is_on_policy():
             if config.whole_replay_buffer_training and config.clear_replay_buffer:
                 replayer = "one_time"
             else:
                 replayer = "uniform"
-            self.set_exp_replayer(replayer, self._env.batch_size,
-                                  config.replay_buffer_length,
-                                  config.priority_replay)
-
-        env = self._env
-        if env is not None:
-            metric_buf_size = max(self._config.metric_min_buffer_size,
-                                  self._env.batch_size)
-            self._metrics = [
-                alf.metrics.NumberOfEpisodes(),
-                alf.metrics.EnvironmentSteps(),
-                alf.metrics.AverageReturnMetric(
-                    batch_size=env.batch_size,
-                    buffer_size=metric_buf_size,
-                    reward_shape=env.reward_spec().shape),
-                alf.metrics.AverageEpisodeLengthMetric(
-                    batch_size=env.batch_size, buffer_size=metric_buf_size),
-                alf.metrics.AverageEnvInfoMetric(
-                    example_env_info=env.reset().env_info,
-                    batch_size=env.batch_size,
-                    buffer_size=metric_buf_size)
-            ]
+            assert (
+                replayer == "uniform" or getattr(
+                    env, 'num_envs_per_step', env.batch_size) == env.batch_size
+            ), ("The environment only returns a subset of its environments "
+                "at each step, which is only supported by the 'uniform' "
+                "replayer")
+            self.set_exp_replayer(
+                replayer,
+                self._env.batch_size,
+                config.replay_buffer_length,
+                config.priority_replay,
+                allow_multithread=(config.async_unroll
+                                   or config.replay_prefetch_size > 0))
+
+        if self._env is not None:
+            self._metrics = self._create_metrics(self._env)
 
         self._original_rollout_step = self.rollout_step
         self.rollout_step = self._rollout_step
 
+    def _create_metrics(self, env):
+        """Create the metrics for the environment ``env``.
+
+        Args:
+            env (AlfEnvironment): a batched environment
+        Returns:
+            list[StepMetric]: the metrics. The first two are
+            ``NumberOfEpisodes`` and ``EnvironmentSteps``.
+        """
+        metric_buf_size = max(self._config.metric_min_buffer_size,
+                              env.batch_size)
+        return [
+            alf.metrics.NumberOfEpisodes(),
+            alf.metrics.EnvironmentSteps(),
+            alf.metrics.AverageReturnMetric(
+                batch_size=env.batch_size,
+                buffer_size=metric_buf_size,
+                reward_shape=env.reward_spec().shape),
+            alf.metrics.AverageEpisodeLengthMetric(
+                batch_size=env.batch_size, buffer_size=metric_buf_size),
+            alf.metrics.AverageEnvInfoMetric(
+                example_env_info=env.reset().env_info,
+                batch_size=env.batch_size,
+                buffer_size=metric_buf_size)
+        ]
+
     def is_rl(self):
         """Always return True for RLAlgorithm."""
         return True
@@ -393,11 +429,27 @@ class RLAlgorithm(Algorithm):
         pass
 
     @common.mark_rollout
+    @profiler.span("unroll")
     def unroll(self, unroll_length):
         r"""Unroll ``unroll_length`` steps using the current policy.
 
         Because the ``self._env`` is a batched environment. The total number of
-        environment steps is ``self._env.batch_size * unroll_length``.
+        environment steps is ``self._env.num_envs_per_step * unroll_length``.
+
+        If ``self._env.num_envs_per_step`` is smaller than
+        ``self._env.batch_size`` (i.e., each step only returns the time steps
+        of a subset of the environments), the policy states and transform
+        states are kept for all the environments and the states for the
+        environments of each step are selected according to
+        ``TimeStep.env_id``. In this case, the experiences of different steps
+        may be from different environments, so the returned experience should
+        only be used for summary and not for on-policy training.
+
+        The experience of each step is directly written into a preallocated
+        buffer (see ``_get_unroll_buffer()``). If the unroll is performed
+        without gradient and not by ``AsyncUnroller``, the buffer is reused by
+        the next ``unroll()``. So the returned experience should not be kept
+        beyond the current training iteration.
 
         Args:
             unroll_length (int): number of steps to unroll.
@@ -418,13 +470,25 @@ class RLAlgorithm(Algorithm):
         policy_state = self._current_policy_state
         trans_state = self._current_transform_state
 
-        experience_list = []
-        original_reward_list = []
-        initial_state = self.get_initial_rollout_state(self._env.batch_size)
+        exp_buffer = None
+        num_envs_per_step = getattr(self._env, 'num_envs_per_step',
+                                    self._env.batch_size)
+        subset_envs = num_envs_per_step < self._env.batch_size
+        if subset_envs:
+            assert not self.is_on_policy(), (
+                "On-policy training does not support environments which only "
+                "return a subset of environments at each step")
+            all_policy_state = policy_state
+            all_trans_state = trans_state
+        initial_state = self.get_initial_rollout_state(num_envs_per_step)
 
         env_step_time = 0.
         store_exp_time = 0.
-        for _ in range(unroll_length):
+        for t in range(unroll_length):
+            if subset_envs:
+                env_ids = time_step.env_id.long()
+                policy_state = _gather_state(all_policy_state, env_ids)
+                trans_state = _gather_state(all_trans_state, env_ids)
             policy_state = common.reset_state_if_necessary(
                 policy_state, initial_state, time_step.is_first())
             transformed_time_step, trans_state = self.transform_timestep(
@@ -433,8 +497,9 @@ class RLAlgorithm(Algorithm):
             # to store it in replay buffers
             transformed_time_step = transformed_time_step._replace(
                 untransformed=time_step)
-            policy_step = self.rollout_step(transformed_time_step,
-                                            policy_state)
+            with profiler.span("rollout_step"):
+                policy_step = self.rollout_step(transformed_time_step,
+                                                policy_state)
             # release the reference to ``time_step``
             transformed_time_step = transformed_time_step._replace(
                 untransformed=())
@@ -442,7 +507,8 @@ class RLAlgorithm(Algorithm):
             action = common.detach(policy_step.output)
 
             t0 = time.time()
-            next_time_step = self._env.step(action)
+            with profiler.span("env_step"):
+                next_time_step = self._env.step(action)
             env_step_time += time.time() - t0
 
             self.observe_for_metrics(time_step.cpu())
@@ -455,7 +521,8 @@ class RLAlgorithm(Algorithm):
                                       policy_state)
 
             t0 = time.time()
-            self.observe_for_replay(exp)
+            with profiler.span("observe_for_replay"):
+                self.observe_for_replay(exp)
             store_exp_time += time.time() - t0
 
             exp_for_training = Experience(
@@ -470,18 +537,27 @@ class RLAlgorithm(Algorithm):
                     policy_step.info),
                 env_id=transformed_time_step.env_id)
 
-            experience_list.append(exp_for_training)
-            original_reward_list.append(time_step.reward)
+            if exp_buffer is None:
+                exp_buffer = self._get_unroll_buffer(
+                    unroll_length, (exp_for_training, time_step.reward))
+            alf.nest.map_structure(lambda b, x: b[t].copy_(x), exp_buffer,
+                                   (exp_for_training, time_step.reward))
             time_step = next_time_step
             policy_state = policy_step.state
+            if subset_envs:
+                all_policy_state = _scatter_state(all_policy_state,
+                                                  policy_state, env_ids)
+                all_trans_state = _scatter_state(all_trans_state, trans_state,
+                                                 env_ids)
+                policy_state = all_policy_state
+                trans_state = all_trans_state
 
         alf.summary.scalar("time/unroll_env_step", env_step_time)
         alf.summary.scalar("time/unroll_store_exp", store_exp_time)
-        original_reward = alf.nest.utils.stack_nests(original_reward_list)
+        experience, original_reward = exp_buffer
         self.summarize_reward("rollout_reward/original_reward",
                               original_reward)
 
-        experience = alf.nest.utils.stack_nests(experience_list)
         experience = experience._replace(
             rollout_info=dist_utils.params_to_distributions(
                 experience.rollout_info, self._rollout_info_spec))
@@ -495,6 +571,33 @@ class RLAlgorithm(Algorithm):
 
         return experience
 
+    def _get_unroll_buffer(self, unroll_length, step_exp):
+        """Get a buffer for storing ``unroll_length`` steps of ``step_exp``.
+
+        The buffer is reused across unrolls if there is no need of gradient
+        and the experience is consumed before the next unroll (i.e.,
+        ``config.async_unroll`` is False). Otherwise, a new buffer is
+        allocated for each unroll.
+
+        Args:
+            unroll_length (int): the number of steps
+            step_exp (nested Tensor): the experience of one step
+        Returns:
+            nested Tensor: the buffer with the same structure as ``step_exp``
+            and shape ``[unroll_length, ...]`` for each of its tensors.
+        """
+        reuse = not torch.is_grad_enabled() and not self._config.async_unroll
+        key = [(unroll_length, x.shape, x.dtype, x.device)
+               for x in alf.nest.flatten(step_exp)]
+        if reuse and self._unroll_buffer_key == key:
+            return self._unroll_buffer
+        buffer = alf.nest.map_structure(
+            lambda x: x.new_empty((unroll_length, ) + x.shape), step_exp)
+        if reuse:
+            self._unroll_buffer = buffer
+            self._unroll_buffer_key = key
+        return buffer
+
     def train_iter(self):
         """Perform one iteration of training.
 
@@ -509,6 +612,44 @@ class RLAlgorithm(Algorithm):
         else:
             return self._train_iter_off_policy()
 
+    def finish_train(self):
+        """Release the resources used by ``train_iter()``.
+
+        It is called by the trainer after the training is finished. Besides
+        what is done by ``Algorithm.finish_train()``, it stops the background
+        unroll thread if ``config.async_unroll`` is True.
+        """
+        if self._async_unroller is not None:
+            self._async_unroller.stop()
+            self._async_unroller = None
+        super().finish_train()
+
+    @contextlib.contextmanager
+    def pause_unroll(self, discard_prefetched=False):
+        """A context within which the background unroll thread and the replay
+        prefetch threads of this algorithm and its sub-algorithms (if any) are
+        paused.
+
+        It should be used when accessing the objects shared with these threads
+        (e.g. the replay buffer and the data transformer) for purposes other
+        than training, such as saving or loading checkpoints.
+
+        Args:
+            discard_prefetched (bool): If True, the minibatches prefetched
+                before entering the context are discarded. It should be True if
+                the replay buffer is changed in the context (e.g. loaded from a
+                checkpoint).
+        """
+        with contextlib.ExitStack() as stack:
+            if self._async_unroller is not None:
+                stack.enter_context(self._async_unroller.paused())
+            for alg in self.modules():
+                if (isinstance(alg, Algorithm)
+                        and alg._replay_prefetcher is not None):
+                    stack.enter_context(
+                        alg._replay_prefetcher.paused(discard_prefetched))
+            yield
+
     def _train_iter_on_policy(self):
         """Implemented in ``OnPolicyAlgorithm``."""
         raise NotImplementedError()
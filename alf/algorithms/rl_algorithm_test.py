@@ -22,6 +22,7 @@ from alf.utils import common, dist_utils, tensor_utils
 from alf.data_structures import AlgStep, Experience, LossInfo, StepType, TimeStep
 from alf.algorithms.on_policy_algorithm import OnPolicyAlgorithm
 from alf.algorithms.config import TrainerConfig
+from alf.algorithms.data_transformer import ObservationNormalizer
 
 
 class MyAlg(OnPolicyAlgorithm):
@@ -150,6 +151,59 @@ class MyEnv(object):
         return self._current_time_step
 
 
+class MySubsetEnv(object):
+    """An environment with ``batch_size`` independent ``MyEnv`` which only
+    returns the time steps of ``num_envs_per_step`` randomly chosen
+    environments at each step."""
+
+    def __init__(self, batch_size, num_envs_per_step):
+        self._envs = [MyEnv(batch_size=1) for _ in range(batch_size)]
+        self._batch_size = batch_size
+        self._num_envs_per_step = num_envs_per_step
+        self.reset()
+
+    def observation_spec(self):
+        return self._envs[0].observation_spec()
+
+    def action_spec(self):
+        return self._envs[0].action_spec()
+
+    def reward_spec(self):
+        return self._envs[0].reward_spec()
+
+    @property
+    def batch_size(self):
+        return self._batch_size
+
+    @property
+    def num_envs_per_step(self):
+        return self._num_envs_per_step
+
+    def close(self):
+        pass
+
+    def _make_time_step(self, time_steps):
+        self._env_ids = torch.randperm(
+            self._batch_size)[:self._num_envs_per_step]
+        time_step = alf.nest.map_structure(
+            lambda *x: torch.cat(x)[self._env_ids], *time_steps)
+        self._current_time_step = time_step._replace(
+            env_id=self._env_ids.to(torch.int32))
+        return self._current_time_step
+
+    def reset(self):
+        return self._make_time_step([env.reset() for env in self._envs])
+
+    def step(self, action):
+        for i, a in zip(self._env_ids.tolist(), action):
+            self._envs[i].step(a.reshape(1))
+        return self._make_time_step(
+            [env.current_time_step() for env in self._envs])
+
+    def current_time_step(self):
+        return self._current_time_step
+
+
 class RLAlgorithmTest(unittest.TestCase):
     def test_on_policy_algorithm(self):
         # root_dir is not used. We have to give it a value because
@@ -214,6 +268,184 @@ class RLAlgorithmTest(unittest.TestCase):
         self.assertTrue(torch.all(logits[1, :] > logits[0, :]))
         self.assertTrue(torch.all(logits[1, :] > logits[2, :]))
 
+    def test_async_off_policy_algorithm(self):
+        with tempfile.TemporaryDirectory() as root_dir:
+            common.run_under_record_context(
+                lambda: self._test_async_off_policy_algorithm(root_dir),
+                summary_dir=root_dir,
+                summary_interval=1,
+                flush_secs=1)
+
+    def _test_async_off_policy_algorithm(self, root_dir):
+        alf.summary.enable_summary()
+        config = TrainerConfig(
+            root_dir=root_dir,
+            unroll_length=5,
+            num_envs=1,
+            num_updates_per_train_iter=1,
+            mini_batch_length=2,
+            mini_batch_size=12,
+            replay_buffer_length=10,
+            async_unroll=True,
+            async_max_policy_lag=2,
+            whole_replay_buffer_training=False,
+            clear_replay_buffer=False)
+        env = MyEnv(batch_size=3)
+        alg = MyAlg(
+            observation_spec=env.observation_spec(),
+            action_spec=env.action_spec(),
+            env=env,
+            on_policy=False,
+            config=config)
+        for _ in range(200):
+            alg.train_iter()
+
+        # The unroll thread uses a separate copy of the algorithm in eval mode
+        rollout_alg = alg._async_unroller._rollout_algorithm
+        self.assertFalse(rollout_alg.training)
+        self.assertIs(rollout_alg._env, alg._env)
+        self.assertIs(rollout_alg._exp_replayer, alg._exp_replayer)
+        with alg.pause_unroll():
+            for p, q in zip(alg.parameters(), rollout_alg.parameters()):
+                self.assertIsNot(p, q)
+        # The metrics are updated by the training thread
+        self.assertGreater(alg.get_metrics()[1].result(), 100 * 5)
+        alg.finish_train()
+
+        time_step = common.get_initial_time_step(env)
+        state = alg.get_initial_predict_state(env.batch_size)
+        policy_step = alg.rollout_step(time_step, state)
+        logits = policy_step.info.log_prob(torch.arange(3).reshape(3, 1))
+        print("logits: ", logits)
+        self.assertTrue(torch.all(logits[1, :] > logits[0, :]))
+        self.assertTrue(torch.all(logits[1, :] > logits[2, :]))
+
+    def test_unroll_buffer(self):
+        config = TrainerConfig(
+            root_dir='/tmp/rl_algorithm_test', unroll_length=5, num_envs=1)
+        env = MyEnv(batch_size=3)
+        alg = MyAlg(
+            observation_spec=env.observation_spec(),
+            action_spec=env.action_spec(),
+            env=env,
+            config=config,
+            on_policy=False)
+        with torch.no_grad():
+            exp1 = alg.unroll(5)
+            exp2 = alg.unroll(5)
+        # The buffer is reused when there is no gradient.
+        self.assertEqual(exp1.reward.data_ptr(), exp2.reward.data_ptr())
+        self.assertEqual(exp2.observation.shape, (5, 3, 2))
+        self.assertEqual(exp2.rollout_info.logits.shape, (5, 3, 3))
+        # The reward of MyEnv is determined by the previous action.
+        self.assertTrue(
+            torch.all(exp2.reward[1:] == env._rewards[exp2.action[:-1]]))
+
+        # A new buffer is allocated for each unroll with gradient.
+        exp3 = alg.unroll(5)
+        exp4 = alg.unroll(5)
+        self.assertNotEqual(exp3.reward.data_ptr(), exp4.reward.data_ptr())
+        self.assertTrue(exp4.rollout_info.logits.requires_grad)
+
+    def test_off_policy_algorithm_with_replay_prefetch(self):
+        config = TrainerConfig(
+            root_dir='/tmp/rl_algorithm_test',
+            unroll_length=5,
+            num_envs=1,
+            num_updates_per_train_iter=1,
+            mini_batch_length=2,
+            mini_batch_size=12,
+            replay_buffer_length=10,
+            replay_prefetch_size=2,
+            whole_replay_buffer_training=False,
+            clear_replay_buffer=False)
+        env = MyEnv(batch_size=3)
+        alg = MyAlg(
+            observation_spec=env.observation_spec(),
+            action_spec=env.action_spec(),
+            env=env,
+            on_policy=False,
+            config=config)
+        for _ in range(200):
+            alg.train_iter()
+        prefetcher = alg._replay_prefetcher
+        with alg.pause_unroll(discard_prefetched=True):
+            # The prefetch thread is not sampling the replay buffer
+            self.assertTrue(prefetcher._fetch_lock.locked())
+            self.assertEqual(prefetcher._generation, 1)
+        alg.train_iter()
+        alg.finish_train()
+        self.assertIsNone(alg._replay_prefetcher)
+
+        time_step = common.get_initial_time_step(env)
+        state = alg.get_initial_predict_state(env.batch_size)
+        policy_step = alg.rollout_step(time_step, state)
+        logits = policy_step.info.log_prob(torch.arange(3).reshape(3, 1))
+        print("logits: ", logits)
+        self.assertTrue(torch.all(logits[1, :] > logits[0, :]))
+        self.assertTrue(torch.all(logits[1, :] > logits[2, :]))
+
+    def test_replay_prefetch_with_stateful_data_transformer(self):
+        env = MyEnv(batch_size=3)
+        config = TrainerConfig(
+            root_dir='/tmp/rl_algorithm_test', replay_prefetch_size=2)
+        config.data_transformer = ObservationNormalizer(env.observation_spec())
+        with self.assertRaises(AssertionError):
+            MyAlg(
+                observation_spec=env.observation_spec(),
+                action_spec=env.action_spec(),
+                env=env,
+                on_policy=False,
+                config=config)
+        config.data_transformer = ObservationNormalizer(
+            env.observation_spec(), update_mode="rollout")
+        MyAlg(
+            observation_spec=env.observation_spec(),
+            action_spec=env.action_spec(),
+            env=env,
+            on_policy=False,
+            config=config)
+
+    def test_off_policy_algorithm_with_env_subsets(self):
+        config = TrainerConfig(
+            root_dir='/tmp/rl_algorithm_test',
+            unroll_length=5,
+            num_envs=1,
+            num_updates_per_train_iter=1,
+            mini_batch_length=4,
+            mini_batch_size=8,
+            initial_collect_steps=40,
+            use_rollout_state=True,
+            whole_replay_buffer_training=False,
+            clear_replay_buffer=False)
+        env = MySubsetEnv(batch_size=4, num_envs_per_step=2)
+        alg = MyAlg(
+            observation_spec=env.observation_spec(),
+            action_spec=env.action_spec(),
+            env=env,
+            on_policy=False,
+            config=config)
+        for _ in range(20):
+            alg.train_iter()
+
+        # The rollout state of each environment is the observation of its
+        # last step, which should be kept while the environment is not
+        # returned by the steps of other environments.
+        all_state = alg._current_policy_state
+        self.assertEqual((4, 2), all_state.shape)
+        time_step = env.current_time_step()
+        env_ids = time_step.env_id.to(torch.int64)
+        exp = alg.unroll(1)
+        self.assertTrue(torch.all(exp.env_id[0] == time_step.env_id))
+        expected_state = torch.where(time_step.is_first().unsqueeze(-1),
+                                     torch.zeros(2, 2), all_state[env_ids])
+        self.assertTrue(torch.all(exp.state[0] == expected_state))
+        new_state = alg._current_policy_state
+        self.assertTrue(torch.all(new_state[env_ids] == time_step.observation))
+        mask = torch.ones(4, dtype=torch.bool)
+        mask[env_ids] = False
+        self.assertTrue(torch.all(new_state[mask] == all_state[mask]))
+
 
 if __name__ == '__main__':
     unittest.main()
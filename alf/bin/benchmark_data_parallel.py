@@ -0,0 +1,62 @@
+# Copyright (c) 2020 Horizon Robotics and ALF Contributors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+r"""Measure how the training throughput scales with the number of learners.
+
+The same global batch is split evenly among the learners, which train a small
+MLP with their gradients all-reduced after every update.
+
+Run:
+```bash
+python3 -m alf.bin.benchmark_data_parallel \
+  --num_learners=1,2,4,8 \
+  --alsologtostderr
+```
+"""
+
+from absl import app
+from absl import flags
+from absl import logging
+import os
+import tempfile
+import torch
+
+from alf.utils import data_parallel
+from alf.utils.data_parallel_test import _train
+
+flags.DEFINE_list('num_learners', ['1', '2', '4', '8'],
+                  'The numbers of learners to benchmark.')
+flags.DEFINE_integer('global_batch_size', 4096,
+                     'The batch size summed over all the learners.')
+flags.DEFINE_integer('num_updates', 20, 'The number of updates to time.')
+
+FLAGS = flags.FLAGS
+
+
+def main(_):
+    with tempfile.TemporaryDirectory() as root_dir:
+        result_file = os.path.join(root_dir, "result")
+        for world_size in map(int, FLAGS.num_learners):
+            data_parallel.spawn_learners(
+                _train,
+                world_size,
+                args=(FLAGS.global_batch_size, FLAGS.num_updates, result_file))
+            t = torch.load(result_file)[1]
+            logging.info(
+                "num_learners=%d: %.1f samples/s" %
+                (world_size, FLAGS.global_batch_size * FLAGS.num_updates / t))
+
+
+if __name__ == '__main__':
+    logging.set_verbosity(logging.INFO)
+    app.run(main)
@@ -0,0 +1,121 @@
+# Copyright (c) 2020 Horizon Robotics and ALF Contributors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+r"""Serve a trained model to the environments in other processes.
+
+The server follows the latest checkpoint under ``root_dir``, so it can be used
+to evaluate a model concurrently with its training:
+
+```bash
+cd ${PROJECT}/alf/examples;
+python -m alf.bin.serve_policy \
+  --root_dir=~/tmp/cart_pole \
+  --gin_file=ac_cart_pole.gin \
+  --address=/tmp/cart_pole_policy \
+  --reload_interval=60 \
+  --alsologtostderr
+```
+
+The environments connect to the server with
+``alf.trainers.policy_server.PolicyClient("/tmp/cart_pole_policy")``.
+"""
+
+from absl import app
+from absl import flags
+from absl import logging
+import gin
+import os
+
+import torch
+
+import alf
+from alf.algorithms.data_transformer import create_data_transformer
+from alf.environments.utils import create_environment
+from alf.trainers import policy_trainer
+from alf.trainers.policy_server import PolicyServer
+from alf.utils import common
+from alf.utils.checkpoint_utils import Checkpointer
+import alf.utils.external_configurables
+
+flags.DEFINE_string('root_dir', os.getenv('TEST_UNDECLARED_OUTPUTS_DIR'),
+                    'Root directory for writing logs/summaries/checkpoints.')
+flags.DEFINE_string(
+    'address', None, "Unix domain socket path or 'host:port' to listen on. "
+    "If not provided, a free Unix domain socket is used.")
+flags.DEFINE_float('epsilon_greedy', 0.1, "probability of sampling action.")
+flags.DEFINE_integer('max_batch_size', 256,
+                     "max total batch size of the batched requests")
+flags.DEFINE_float('max_wait_ms', 1.,
+                   "max milliseconds to wait for more requests to batch")
+flags.DEFINE_bool('jit', False,
+                  "whether to trace predict_step() by TorchScript")
+flags.DEFINE_float(
+    'reload_interval', None,
+    "If provided, check for new checkpoints every so many seconds.")
+flags.DEFINE_multi_string('gin_file', None, 'Paths to the gin-config files.')
+flags.DEFINE_multi_string('gin_param', None, 'Gin binding parameters.')
+
+FLAGS = flags.FLAGS
+
+
+def _parse_address(address):
+    if address is None or ':' not in address:
+        return address
+    host, port = address.rsplit(':', 1)
+    return (host, int(port))
+
+
+def main(_):
+    gin_file = common.get_gin_file()
+    gin.parse_config_files_and_bindings(gin_file, FLAGS.gin_param)
+    algorithm_ctor = gin.query_parameter(
+        'TrainerConfig.algorithm_ctor').scoped_configurable_fn
+    # The environment is only created for the specs.
+    env = create_environment(nonparallel=True)
+    common.set_global_env(env)
+    config = policy_trainer.TrainerConfig(root_dir="")
+    data_transformer = create_data_transformer(config.data_transformer_ctor,
+                                               env.observation_spec())
+    config.data_transformer = data_transformer
+    observation_spec = data_transformer.transformed_observation_spec
+    common.set_transformed_observation_spec(observation_spec)
+    algorithm = algorithm_ctor(
+        observation_spec=observation_spec,
+        action_spec=env.action_spec(),
+        config=config)
+    env.close()
+    checkpointer = Checkpointer(
+        ckpt_dir=os.path.join(FLAGS.root_dir, 'train', 'algorithm'),
+        algorithm=algorithm)
+    server = PolicyServer(
+        algorithm,
+        address=_parse_address(FLAGS.address),
+        epsilon_greedy=FLAGS.epsilon_greedy,
+        max_batch_size=FLAGS.max_batch_size,
+        max_wait_time=FLAGS.max_wait_ms * 1e-3,
+        use_jit=FLAGS.jit,
+        checkpointer=checkpointer,
+        reload_interval=FLAGS.reload_interval)
+    logging.info("Serving the policy at %s" % (server.address, ))
+    try:
+        server.serve()
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    logging.set_verbosity(logging.INFO)
+    flags.mark_flag_as_required('root_dir')
+    if torch.cuda.is_available():
+        alf.set_default_device("cuda")
+    app.run(main)
@@ -31,6 +31,10 @@ command in a different terminal:
 
     tensorboard --logdir=~/tmp/cart_pole
 
+To train with multiple data-parallel learner processes (see
+``alf.utils.data_parallel``), add
+``--gin_param='TrainerConfig.num_learners=4'`` to the command.
+
 You can visualize playing of the trained model by running:
 
 .. code-block:: bash
@@ -47,9 +51,11 @@ from absl import flags
 from absl import logging
 import gin
 import os
+import sys
 import torch
 
 from alf.utils import common
+from alf.utils import data_parallel
 import alf.utils.external_configurables
 from alf.trainers import policy_trainer
 
@@ -71,6 +77,10 @@ def train_eval(ml_type, root_dir):
         root_dir (str): directory for saving summary and checkpoints
     """
     trainer_conf = policy_trainer.TrainerConfig(root_dir=root_dir)
+    if trainer_conf.num_learners > 1 and not data_parallel.is_distributed():
+        data_parallel.spawn_learners(
+            _train_learner, trainer_conf.num_learners, args=(sys.argv, ))
+        return
     if ml_type == 'rl':
         trainer = policy_trainer.RLTrainer(trainer_conf)
     elif ml_type == 'sl':
@@ -81,6 +91,19 @@ def train_eval(ml_type, root_dir):
     trainer.train()
 
 
+def _train_learner(argv):
+    """Run ``train_eval()`` in a spawned learner process.
+
+    Args:
+        argv (list[str]): command line arguments of the main process
+    """
+    FLAGS(argv)
+    logging.set_verbosity(logging.INFO)
+    if torch.cuda.is_available():
+        alf.set_default_device("cuda")
+    main(argv)
+
+
 def main(_):
     gin_file = common.get_gin_file()
     FLAGS.alsologtostderr = True
@@ -104,6 +104,23 @@ class AlfEnvironment(object):
                 'batch_size property' % type(self))
         return 1
 
+    @property
+    def num_envs_per_step(self):
+        """The batch size of the time steps returned by ``step()`` and ``reset()``.
+
+        It is same as ``batch_size`` unless the environment only returns the
+        time steps of a subset of its ``batch_size`` environments at each step
+        (e.g. ``ParallelAlfEnvironment`` with ``num_envs_per_step``). In that
+        case, ``TimeStep.env_id`` tells which environments the time steps are
+        from, and the action passed to ``step()`` should be for the
+        environments of the time step returned by the previous ``step()``
+        or ``reset()``.
+
+        Returns:
+            int:
+        """
+        return self.batch_size
+
     @abc.abstractmethod
     def env_info_spec(self):
         """Defines the env_info provided by the environment."""
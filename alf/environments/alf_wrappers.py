@@ -62,6 +62,10 @@ class AlfEnvironmentBaseWrapper(AlfEnvironment):
     def batch_size(self):
         return getattr(self._env, 'batch_size', None)
 
+    @property
+    def num_envs_per_step(self):
+        return self._env.num_envs_per_step
+
     def _reset(self):
         return self._env.reset()
 
@@ -0,0 +1,170 @@
+# Copyright (c) 2020 Horizon Robotics and ALF Contributors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Runs multiple environments in the current process and steps them in batch."""
+
+from multiprocessing import dummy as mp_threads
+import gin
+import numpy as np
+import torch
+
+import alf
+from alf.environments import alf_environment
+import alf.nest as nest
+
+
+@gin.configurable
+class BatchedInProcessEnvironment(alf_environment.AlfEnvironment):
+    """Batch together environments and simulate them in the current process.
+
+    Unlike ``ParallelAlfEnvironment``, there is no inter-process communication
+    for each step. So it is more efficient for cheap environments (e.g.
+    ``CartPole``) whose step time is much smaller than the communication
+    overhead. The environments are stepped one after another, or in a thread
+    pool if ``num_threads`` is positive.
+
+    Similar to ``ParallelAlfEnvironment``, each environment is created by
+    calling the corresponding constructor with its ``env_id`` and should reset
+    itself automatically at the end of an episode (e.g. ``AlfGymWrapper`` with
+    ``auto_reset=True``). The specs and the batched time steps are the same as
+    those of ``ParallelAlfEnvironment`` created from the same constructors.
+    """
+
+    def __init__(self, env_constructors, num_threads=0):
+        """
+        Args:
+            env_constructors (list[Callable]): a list of callable environment
+                creators. Each of them is called as ``env_constructor(env_id)``.
+            num_threads (int): if positive, step the environments using a
+                thread pool with so many threads. Note that some environments
+                require ``step()`` and ``reset()`` to be called in the thread
+                where they are created, in which case ``num_threads`` should
+                be 0.
+
+        Raises:
+            ValueError: If the action or observation specs don't match.
+        """
+        super(BatchedInProcessEnvironment, self).__init__()
+        self._envs = [
+            ctor(env_id) for env_id, ctor in enumerate(env_constructors)
+        ]
+        self._num_envs = len(self._envs)
+        self._pool = mp_threads.Pool(num_threads) if num_threads > 0 else None
+        self._action_spec = self._envs[0].action_spec()
+        self._observation_spec = self._envs[0].observation_spec()
+        self._reward_spec = self._envs[0].reward_spec()
+        self._time_step_spec = self._envs[0].time_step_spec()
+        self._env_info_spec = self._envs[0].env_info_spec()
+        if any(env.action_spec() != self._action_spec for env in self._envs):
+            raise ValueError(
+                'All environments must have the same action spec.')
+        if any(env.time_step_spec() != self._time_step_spec
+               for env in self._envs):
+            raise ValueError(
+                'All environments must have the same time_step_spec.')
+
+    @property
+    def envs(self):
+        """The list of individual environment."""
+        return self._envs
+
+    @property
+    def batched(self):
+        return True
+
+    @property
+    def batch_size(self):
+        return self._num_envs
+
+    def env_info_spec(self):
+        return self._env_info_spec
+
+    def observation_spec(self):
+        return self._observation_spec
+
+    def action_spec(self):
+        return self._action_spec
+
+    def reward_spec(self):
+        return self._reward_spec
+
+    def time_step_spec(self):
+        return self._time_step_spec
+
+    def _map(self, func, *args):
+        if self._pool is None:
+            return list(map(func, *args))
+        else:
+            return self._pool.starmap(func, zip(*args))
+
+    def _reset(self):
+        """Reset all environments and combine the resulting observation.
+
+        Returns:
+            Time step with batch dimension.
+        """
+        time_steps = self._map(lambda env: env.reset(), self._envs)
+        return self._stack_time_steps(time_steps)
+
+    def _step(self, actions):
+        """Apply a batch of actions to the environments.
+
+        Args:
+            actions: Batched action, possibly nested, to apply to the environment.
+
+        Returns:
+            Batch of observations, rewards, and done flags.
+        """
+        time_steps = self._map(lambda env, action: env.step(action),
+                               self._envs, self._unstack_actions(actions))
+        return self._stack_time_steps(time_steps)
+
+    def close(self):
+        """Close all environments."""
+        for env in self._envs:
+            env.close()
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+
+    def render(self, mode='rgb_array'):
+        """Render the first environment."""
+        return self._envs[0].render(mode)
+
+    def _stack_time_steps(self, time_steps):
+        """Given a list of TimeStep, combine to one with a batch dimension."""
+        stacked = nest.fast_map_structure(
+            lambda *arrays: torch.as_tensor(np.stack(arrays)), *time_steps)
+        if alf.get_default_device() == "cuda":
+            cpu = stacked
+            stacked = nest.map_structure(lambda x: x.cuda(), cpu)
+            stacked._cpu = cpu
+        return stacked
+
+    def _unstack_actions(self, batched_actions):
+        """Returns a list of actions from potentially nested batch of actions."""
+        batched_actions = nest.map_structure(lambda x: x.cpu().numpy(),
+                                             batched_actions)
+        flattened_actions = nest.flatten(batched_actions)
+        return [
+            nest.pack_sequence_as(batched_actions, actions)
+            for actions in zip(*flattened_actions)
+        ]
+
+    def seed(self, seeds):
+        """Seeds the environments."""
+        if len(seeds) != len(self._envs):
+            raise ValueError(
+                'Number of seeds should match the number of environments.')
+        for seed, env in zip(seeds, self._envs):
+            env.seed(seed)
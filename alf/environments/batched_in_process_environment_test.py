@@ -0,0 +1,108 @@
+# Copyright (c) 2020 Horizon Robotics and ALF Contributors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the batched_in_process_environment."""
+
+from absl.testing import parameterized
+import functools
+import torch
+
+import alf
+import alf.data_structures as ds
+from alf.environments import suite_gym
+from alf.environments.batched_in_process_environment import BatchedInProcessEnvironment
+from alf.environments.parallel_environment import ParallelAlfEnvironment
+from alf.environments.random_alf_environment import RandomAlfEnvironment
+from alf.environments.utils import create_environment
+import alf.tensor_specs as ts
+
+
+class BatchedInProcessEnvironmentTest(parameterized.TestCase,
+                                      alf.test.TestCase):
+    def _set_default_specs(self):
+        self.observation_spec = ts.TensorSpec((3, 3), torch.float32)
+        self.action_spec = ts.BoundedTensorSpec([7],
+                                                dtype=torch.float32,
+                                                minimum=-1.0,
+                                                maximum=1.0)
+        self.time_step_spec = ds.time_step_spec(self.observation_spec,
+                                                self.action_spec,
+                                                ts.TensorSpec(()))
+
+    def _make_environment(self, num_envs=2, num_threads=0):
+        self._set_default_specs()
+        constructor = functools.partial(
+            RandomAlfEnvironment, self.observation_spec, self.action_spec)
+        return BatchedInProcessEnvironment(
+            [constructor] * num_envs, num_threads=num_threads)
+
+    def test_get_specs(self):
+        env = self._make_environment()
+        self.assertEqual(self.observation_spec, env.observation_spec())
+        self.assertEqual(self.time_step_spec, env.time_step_spec())
+        self.assertEqual(self.action_spec, env.action_spec())
+        env.close()
+
+    @parameterized.parameters(0, 2)
+    def test_step(self, num_threads):
+        num_envs = 3
+        env = self._make_environment(num_envs, num_threads)
+        action_spec = env.action_spec()
+        observation_spec = env.observation_spec()
+        action = torch.stack([action_spec.sample() for _ in range(num_envs)])
+        time_step = env.reset()
+        self.assertEqual(num_envs, time_step.observation.shape[0])
+        self.assertTensorEqual(time_step.env_id, torch.arange(num_envs))
+
+        time_step = env.step(action)
+        self.assertEqual(num_envs, time_step.observation.shape[0])
+        self.assertEqual(observation_spec.shape,
+                         time_step.observation.shape[1:])
+        self.assertEqual(observation_spec.dtype, time_step.observation.dtype)
+        env.close()
+
+    def _assert_same(self, x, y):
+        self.assertEqual(x.dtype, y.dtype)
+        self.assertTensorEqual(x, y)
+
+    def test_same_as_parallel_environment(self):
+        num_envs = 4
+        seeds = list(range(num_envs))
+        ctor = functools.partial(suite_gym.load, 'CartPole-v0')
+        env = BatchedInProcessEnvironment([ctor] * num_envs)
+        penv = ParallelAlfEnvironment([ctor] * num_envs)
+        self.assertEqual(penv.time_step_spec(), env.time_step_spec())
+        self.assertEqual(penv.action_spec(), env.action_spec())
+        self.assertEqual(penv.env_info_spec(), env.env_info_spec())
+        env.seed(seeds)
+        penv.seed(seeds)
+        time_step = env.reset()
+        ptime_step = penv.reset()
+        for _ in range(30):
+            alf.nest.map_structure(self._assert_same, time_step, ptime_step)
+            action = torch.randint(2, (num_envs, ))
+            time_step = env.step(action)
+            ptime_step = penv.step(action)
+        env.close()
+        penv.close()
+
+    def test_create_environment(self):
+        env = create_environment(
+            'CartPole-v0', num_parallel_environments=2, batch_in_process=True)
+        self.assertIsInstance(env, BatchedInProcessEnvironment)
+        self.assertEqual(2, env.batch_size)
+        env.close()
+
+
+if __name__ == '__main__':
+    alf.test.main()
@@ -19,6 +19,7 @@ Adapted from TF-Agents Environment API as seen in:
 
 from absl import logging
 import gin
+from multiprocessing import connection as mp_connection
 import torch
 
 import alf
@@ -43,7 +44,9 @@ class ParallelAlfEnvironment(alf_environment.AlfEnvironment):
                  env_constructors,
                  start_serially=True,
                  blocking=False,
-                 flatten=True):
+                 flatten=True,
+                 shared_memory=False,
+                 num_envs_per_step=None):
         """
         Args:
             env_constructors (list[Callable]): a list of callable environment creators.
@@ -51,6 +54,27 @@ class ParallelAlfEnvironment(alf_environment.AlfEnvironment):
             blocking (bool): whether to step environments one after another.
             flatten (bool): whether to use flatten action and time_steps during
                 communication to reduce overhead.
+            shared_memory (bool): whether to use shared memory to transfer the
+                time steps from the environment processes. If True, a batched
+                buffer in shared memory is preallocated for each field of the
+                time step (including ``env_info``). Each environment process
+                writes its time step into its own slot of the buffers in place
+                so that no pickling of the time steps through the pipes and no
+                stacking of the individual time steps are needed. The batched
+                buffers are copied once before being returned because the next
+                step will overwrite them. Only supported when ``flatten`` is
+                True.
+            num_envs_per_step (int): if provided and smaller than the number of
+                environments, ``reset()`` and ``step()`` return the time steps
+                of the first ``num_envs_per_step`` environments which are ready
+                instead of waiting for all the environments. The remaining
+                environments keep running in the background. ``TimeStep.env_id``
+                tells which environments the returned time steps are from.
+                The actions given to ``step()`` are for the environments of the
+                time step returned by the previous ``step()`` or ``reset()``.
+                If more environments are ready than needed, the ones which have
+                been waiting longest are returned first. ``blocking`` must be
+                False for this mode.
 
         Raises:
             ValueError: If the action or observation specs don't match.
@@ -63,6 +87,23 @@ class ParallelAlfEnvironment(alf_environment.AlfEnvironment):
             self._envs.append(env)
             self._env_ids.append(env_id)
         self._num_envs = len(env_constructors)
+        self._num_envs_per_step = num_envs_per_step or self._num_envs
+        assert 0 < self._num_envs_per_step <= self._num_envs, (
+            "num_envs_per_step should be in [1, %d]. Got %d" %
+            (self._num_envs, self._num_envs_per_step))
+        self._first_ready = self._num_envs_per_step < self._num_envs
+        assert not (self._first_ready and blocking), (
+            "num_envs_per_step < number of environments requires "
+            "blocking=False")
+        # ``_promises[i]`` is the promise for the outstanding request of
+        # environment ``i``. ``_pending_env_ids`` is the list of environments
+        # with outstanding requests in the order of the requests.
+        # ``_received[i]`` is the received but not yet returned result of
+        # environment ``i``.
+        self._promises = {}
+        self._received = {}
+        self._pending_env_ids = []
+        self._current_env_ids = list(range(self._num_envs))
         self._blocking = blocking
         self._start_serially = start_serially
         self.start()
@@ -82,6 +123,15 @@ class ParallelAlfEnvironment(alf_environment.AlfEnvironment):
             raise ValueError(
                 'All environments must have the same time_step_spec.')
         self._flatten = flatten
+        self._shared_time_step = None
+        if shared_memory:
+            assert flatten, "shared_memory requires flatten=True"
+            self._shared_time_step = [
+                spec.zeros((self._num_envs, )).share_memory_()
+                for spec in nest.flatten(self._time_step_with_env_info_spec)
+            ]
+            for i, env in enumerate(self._envs):
+                env.set_shared_buffer([b[i] for b in self._shared_time_step])
 
     @property
     def envs(self):
@@ -106,6 +156,10 @@ class ParallelAlfEnvironment(alf_environment.AlfEnvironment):
     def batch_size(self):
         return self._num_envs
 
+    @property
+    def num_envs_per_step(self):
+        return self._num_envs_per_step
+
     def env_info_spec(self):
         return self._env_info_spec
 
@@ -127,6 +181,14 @@ class ParallelAlfEnvironment(alf_environment.AlfEnvironment):
         Returns:
             Time step with batch dimension.
         """
+        if self._first_ready:
+            self._receive_all_pending()
+            self._received = {}
+            self._pending_env_ids = []
+            for env_id, env in enumerate(self._envs):
+                self._promises[env_id] = env.reset(blocking=False)
+                self._pending_env_ids.append(env_id)
+            return self._receive_first_ready()
         time_steps = [env.reset(self._blocking) for env in self._envs]
         if not self._blocking:
             time_steps = [promise() for promise in time_steps]
@@ -144,6 +206,13 @@ class ParallelAlfEnvironment(alf_environment.AlfEnvironment):
         Returns:
             Batch of observations, rewards, and done flags.
         """
+        if self._first_ready:
+            for env_id, action in zip(self._current_env_ids,
+                                      self._unstack_actions(actions)):
+                self._promises[env_id] = self._envs[env_id].step(
+                    action, blocking=False)
+                self._pending_env_ids.append(env_id)
+            return self._receive_first_ready()
         time_steps = [
             env.step(action, self._blocking)
             for env, action in zip(self._envs, self._unstack_actions(actions))
@@ -153,6 +222,38 @@ class ParallelAlfEnvironment(alf_environment.AlfEnvironment):
             time_steps = [promise() for promise in time_steps]
         return self._stack_time_steps(time_steps)
 
+    def _receive_first_ready(self):
+        """Receive the time steps of the first ``num_envs_per_step`` ready
+        environments and combine them to one with a batch dimension."""
+        # The results which have already been received (see ``seed()``) are
+        # returned first.
+        ready = [i for i in self._pending_env_ids
+                 if i in self._received][:self._num_envs_per_step]
+        while len(ready) < self._num_envs_per_step:
+            waiting = [i for i in self._pending_env_ids if i not in ready]
+            conns = mp_connection.wait(
+                [self._envs[i].connection for i in waiting])
+            # Keep the order of the requests so that the environments which
+            # have been waiting longest are returned first.
+            ready.extend([
+                i for i in waiting if self._envs[i].connection in conns
+            ][:self._num_envs_per_step - len(ready)])
+        time_steps = [
+            self._received.pop(i)
+            if i in self._received else self._promises.pop(i)() for i in ready
+        ]
+        self._pending_env_ids = [
+            i for i in self._pending_env_ids if i not in ready
+        ]
+        self._current_env_ids = ready
+        return self._stack_time_steps(time_steps, ready)
+
+    def _receive_all_pending(self):
+        """Wait for all the outstanding requests and keep their results."""
+        for env_id, promise in self._promises.items():
+            self._received[env_id] = promise()
+        self._promises = {}
+
     def close(self):
         """Close all external process."""
         logging.info('Closing all processes.')
@@ -160,9 +261,26 @@ class ParallelAlfEnvironment(alf_environment.AlfEnvironment):
             env.close()
         logging.info('All processes closed.')
 
-    def _stack_time_steps(self, time_steps):
-        """Given a list of TimeStep, combine to one with a batch dimension."""
-        if self._flatten:
+    def _stack_time_steps(self, time_steps, env_ids=None):
+        """Given a list of TimeStep, combine to one with a batch dimension.
+
+        If ``shared_memory`` is used, ``time_steps`` is ignored and the
+        batched time step is taken from the shared buffers.
+
+        Args:
+            time_steps (list[TimeStep]): time steps from the environments
+            env_ids (list[int]): the environments of ``time_steps``. ``None``
+                means all the environments.
+        """
+        if self._shared_time_step is not None:
+            if env_ids is None:
+                batch = [b.clone() for b in self._shared_time_step]
+            else:
+                env_ids = torch.as_tensor(env_ids)
+                batch = [b[env_ids] for b in self._shared_time_step]
+            stacked = nest.pack_sequence_as(self._time_step_with_env_info_spec,
+                                            batch)
+        elif self._flatten:
             stacked = nest.fast_map_structure_flatten(
                 lambda *arrays: torch.stack(arrays),
                 self._time_step_with_env_info_spec, *time_steps)
@@ -194,6 +312,9 @@ class ParallelAlfEnvironment(alf_environment.AlfEnvironment):
         if len(seeds) != len(self._envs):
             raise ValueError(
                 'Number of seeds should match the number of parallel_envs.')
+        # Make sure that the result of the ``seed`` call is not mixed up with
+        # the outstanding requests.
+        self._receive_all_pending()
 
         promises = [
             env.call('seed', seed) for seed, env in zip(seeds, self._envs)
@@ -36,6 +36,14 @@ class SlowStartingEnvironment(RandomAlfEnvironment):
         super(SlowStartingEnvironment, self).__init__(*args, **kwargs)
 
 
+class SlowSteppingEnvironment(RandomAlfEnvironment):
+    """Environment 0 is much slower than other environments."""
+
+    def _step(self, action):
+        time.sleep(0.2 if self._env_id == 0 else 0.01)
+        return super()._step(action)
+
+
 class ParallelAlfEnvironmentTest(alf.test.TestCase):
     def setUp(self):
         parallel_environment.multiprocessing = dummy_multiprocessing
@@ -55,7 +63,9 @@ class ParallelAlfEnvironmentTest(alf.test.TestCase):
                                    num_envs=2,
                                    flatten=True,
                                    start_serially=True,
-                                   blocking=True):
+                                   blocking=True,
+                                   shared_memory=False,
+                                   num_envs_per_step=None):
         self._set_default_specs()
         constructor = constructor or functools.partial(
             RandomAlfEnvironment, self.observation_spec, self.action_spec)
@@ -63,7 +73,9 @@ class ParallelAlfEnvironmentTest(alf.test.TestCase):
             env_constructors=[constructor] * num_envs,
             blocking=blocking,
             flatten=flatten,
-            start_serially=start_serially)
+            start_serially=start_serially,
+            shared_memory=shared_memory,
+            num_envs_per_step=num_envs_per_step)
 
     def test_close_no_hang_after_init(self):
         env = self._make_parallel_environment()
@@ -100,6 +112,69 @@ class ParallelAlfEnvironmentTest(alf.test.TestCase):
                          time_step2.observation.shape)
         env.close()
 
+    def test_step_shared_memory(self):
+        num_envs = 3
+        env = self._make_parallel_environment(
+            num_envs=num_envs, blocking=False, shared_memory=True)
+
+        action_spec = env.action_spec()
+        observation_spec = env.observation_spec()
+        action = torch.stack([action_spec.sample() for _ in range(num_envs)])
+        time_step0 = env.reset()
+        self.assertEqual(num_envs, time_step0.observation.shape[0])
+
+        time_step = env.step(action)
+        self.assertEqual(num_envs, time_step.observation.shape[0])
+        self.assertEqual(observation_spec.shape,
+                         time_step.observation.shape[1:])
+        self.assertEqual(observation_spec.dtype, time_step.observation.dtype)
+        observation = time_step.observation.clone()
+
+        # The returned time step should not be overwritten by the next step.
+        time_step2 = env.step(action)
+        self.assertEqual(time_step.observation.shape,
+                         time_step2.observation.shape)
+        self.assertTensorEqual(observation, time_step.observation)
+        self.assertTensorNotClose(time_step.observation,
+                                  time_step2.observation)
+        env.close()
+
+    def test_step_first_ready(self):
+        for shared_memory in [False, True]:
+            self._set_default_specs()
+            constructor = functools.partial(
+                SlowSteppingEnvironment,
+                self.observation_spec,
+                self.action_spec,
+                episode_end_probability=0.)
+            env = self._make_parallel_environment(
+                constructor=constructor,
+                num_envs=4,
+                blocking=False,
+                shared_memory=shared_memory,
+                num_envs_per_step=2)
+            self.assertEqual(4, env.batch_size)
+            self.assertEqual(2, env.num_envs_per_step)
+            action_spec = env.action_spec()
+            time_step = env.reset()
+            self.assertEqual(2, time_step.observation.shape[0])
+            counts = np.zeros(4)
+            for _ in range(20):
+                action = torch.stack([action_spec.sample() for _ in range(2)])
+                time_step = env.step(action)
+                env_ids = time_step.env_id.tolist()
+                self.assertEqual(2, len(set(env_ids)))
+                self.assertEqual(self.observation_spec.shape,
+                                 time_step.observation.shape[1:])
+                counts[env_ids] += 1
+            # The slow environment should be stepped less often than the
+            # others.
+            self.assertLess(counts[0], counts[1:].min())
+            env.seed([0, 1, 2, 3])
+            time_step = env.step(action)
+            self.assertEqual(2, len(set(time_step.env_id.tolist())))
+            env.close()
+
     def test_non_blocking_start_processes_in_parallel(self):
         self._set_default_specs()
         constructor = functools.partial(
@@ -58,6 +58,7 @@ class ProcessEnvironment(object):
     _RESULT = 4
     _EXCEPTION = 5
     _CLOSE = 6
+    _SHARED_BUFFER = 7
 
     def __init__(self, env_constructor, env_id=None, flatten=False):
         """Step environment in a separate process for lock free paralellism.
@@ -167,6 +168,33 @@ class ProcessEnvironment(object):
         self._conn.send((self._CALL, payload))
         return self._receive
 
+    @property
+    def connection(self):
+        """The connection to the worker process.
+
+        It can be used with ``multiprocessing.connection.wait()`` to wait for
+        the results of multiple environments.
+        """
+        return self._conn
+
+    def set_shared_buffer(self, buffer):
+        """Let the worker process write the time steps into ``buffer``.
+
+        After this is called, the time steps returned by ``step()`` and
+        ``reset()`` are written in place into ``buffer`` by the worker process
+        instead of being sent through the pipe, and ``step()`` and ``reset()``
+        return ``None`` (or a promise returning ``None``). The content of
+        ``buffer`` is valid once the call (or the promise) returns. Only
+        supported when ``flatten`` is True.
+
+        Args:
+            buffer (list[Tensor]): the flattened time step (including
+                ``env_info``) in shared memory (see ``Tensor.share_memory_()``).
+        """
+        assert self._flatten, "Shared buffer is only supported with flatten"
+        self._conn.send((self._SHARED_BUFFER, buffer))
+        self._receive()
+
     def close(self):
         """Send a close message to the external process and join it."""
         try:
@@ -248,6 +276,7 @@ class ProcessEnvironment(object):
             alf.set_default_device("cpu")
             env = env_constructor(env_id)
             action_spec = env.action_spec()
+            shared_buffer = None
             conn.send(self._READY)  # Ready.
             while True:
                 try:
@@ -272,8 +301,16 @@ class ProcessEnvironment(object):
                         assert all([
                             not isinstance(x, torch.Tensor) for x in result
                         ]), ("Tensor result is not allowed: %s" % name)
+                        if shared_buffer is not None:
+                            for buf, x in zip(shared_buffer, result):
+                                buf.copy_(torch.as_tensor(x))
+                            result = None
                     conn.send((self._RESULT, result))
                     continue
+                if message == self._SHARED_BUFFER:
+                    shared_buffer = payload
+                    conn.send((self._RESULT, None))
+                    continue
                 if message == self._CLOSE:
                     assert payload is None
                     env.close()
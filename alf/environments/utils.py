@@ -19,6 +19,7 @@ import random
 
 from alf.environments import suite_gym
 from alf.environments import thread_environment, parallel_environment
+from alf.environments import batched_in_process_environment
 from alf.environments import alf_wrappers
 
 
@@ -61,6 +62,7 @@ def create_environment(env_name='CartPole-v0',
                        env_load_fn=suite_gym.load,
                        num_parallel_environments=30,
                        nonparallel=False,
+                       batch_in_process=False,
                        seed=None):
     """Create a batched environment.
 
@@ -74,6 +76,13 @@ def create_environment(env_name='CartPole-v0',
         num_parallel_environments (int): num of parallel environments
         nonparallel (bool): force to create a single env in the current
             process. Used for correctly exposing game gin confs to tensorboard.
+        batch_in_process (bool): if True, create a
+            ``BatchedInProcessEnvironment``, which steps all the environments
+            in the current process, instead of a ``ParallelAlfEnvironment``.
+            This avoids the inter-process communication overhead for cheap
+            environments such as ``CartPole``.
+        seed (None|int): random seed for the environments. The i-th
+            environment is seeded with ``seed + i``.
 
     Returns:
         AlfEnvironment:
@@ -98,12 +107,16 @@ def create_environment(env_name='CartPole-v0',
         else:
             alf_env.seed(seed)
     else:
-        # flatten=True will use flattened action and time_step in
-        #   process environments to reduce communication overhead.
-        alf_env = parallel_environment.ParallelAlfEnvironment(
-            [functools.partial(env_load_fn, env_name)] *
-            num_parallel_environments,
-            flatten=True)
+        env_constructors = [functools.partial(env_load_fn, env_name)
+                            ] * num_parallel_environments
+        if batch_in_process:
+            alf_env = batched_in_process_environment.BatchedInProcessEnvironment(
+                env_constructors)
+        else:
+            # flatten=True will use flattened action and time_step in
+            #   process environments to reduce communication overhead.
+            alf_env = parallel_environment.ParallelAlfEnvironment(
+                env_constructors, flatten=True)
 
         if seed is None:
             alf_env.seed([
@@ -0,0 +1,268 @@
+// Copyright (c) 2020 Horizon Robotics and ALF Contributors. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//      http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+#include <pybind11/numpy.h>
+#include <pybind11/pybind11.h>
+
+#include <algorithm>
+#include <cstdint>
+#include <exception>
+#include <string>
+
+namespace py = pybind11;
+
+// The layout of the tree is the same as ``SegmentTree`` in segment_tree.py:
+// ``values[1]`` is the root, ``values[capacity:2*capacity]`` are the leaves and
+// the children of node ``i`` are ``2*i`` and ``2*i+1``. Leaf index ``idx`` is
+// stored at ``values[idx + leftmost_leaf]`` (wrapped back by ``capacity`` if it
+// is beyond ``2*capacity``).
+
+template <typename T>
+using Array = py::array_t<T, py::array::c_style>;
+
+struct Add {
+  template <typename T>
+  static T Apply(T a, T b) {
+    return a + b;
+  }
+};
+
+struct Max {
+  template <typename T>
+  static T Apply(T a, T b) {
+    return std::max(a, b);
+  }
+};
+
+struct Min {
+  template <typename T>
+  static T Apply(T a, T b) {
+    return std::min(a, b);
+  }
+};
+
+inline int64_t IndexToLeaf(int64_t idx,
+                           int64_t capacity,
+                           int64_t leftmost_leaf) {
+  int64_t leaf = idx + leftmost_leaf;
+  return leaf >= 2 * capacity ? leaf - capacity : leaf;
+}
+
+inline int64_t LeafToIndex(int64_t leaf,
+                           int64_t capacity,
+                           int64_t leftmost_leaf) {
+  int64_t idx = leaf - leftmost_leaf;
+  return idx < 0 ? idx + capacity : idx;
+}
+
+template <typename T>
+T* MutableData(Array<T>& tree, int64_t capacity) {
+  if (tree.ndim() != 1 || tree.shape(0) != 2 * capacity) {
+    throw std::runtime_error("The shape of the tree should be [2*capacity]");
+  }
+  return tree.mutable_data();
+}
+
+template <typename T>
+void CheckIndicesAndValues(const Array<int64_t>& indices,
+                           const Array<T>& values,
+                           int64_t capacity) {
+  if (indices.ndim() != 1 || values.ndim() != 1 ||
+      indices.shape(0) != values.shape(0)) {
+    throw std::runtime_error(
+        "indices and values should be 1-D arrays with the same length");
+  }
+  const int64_t* idx = indices.data();
+  for (py::ssize_t i = 0; i < indices.shape(0); ++i) {
+    if (idx[i] < 0 || idx[i] >= capacity) {
+      throw std::runtime_error("indices should be in range [0, capacity)");
+    }
+  }
+}
+
+// Set ``tree[leaf]`` to ``value`` and update all its ancestors.
+template <typename Op, typename T>
+inline void UpdateLeaf(T* tree, int64_t leaf, T value) {
+  tree[leaf] = value;
+  for (int64_t i = leaf / 2; i >= 1; i /= 2) {
+    tree[i] = Op::Apply(tree[2 * i], tree[2 * i + 1]);
+  }
+}
+
+template <typename Op, typename T>
+void Update(Array<T> tree,
+            int64_t capacity,
+            int64_t leftmost_leaf,
+            const Array<int64_t>& indices,
+            const Array<T>& values) {
+  T* t = MutableData(tree, capacity);
+  CheckIndicesAndValues(indices, values, capacity);
+  const int64_t* idx = indices.data();
+  const T* val = values.data();
+  py::ssize_t n = indices.shape(0);
+  py::gil_scoped_release release;
+  for (py::ssize_t i = 0; i < n; ++i) {
+    UpdateLeaf<Op>(t, IndexToLeaf(idx[i], capacity, leftmost_leaf), val[i]);
+  }
+}
+
+// Update a sum tree and a max tree with the same values in one pass. Returns
+// the change of the number of non-zero values in the sum tree.
+template <typename T>
+int64_t SumMaxUpdate(Array<T> sum_tree,
+                     Array<T> max_tree,
+                     int64_t capacity,
+                     int64_t leftmost_leaf,
+                     const Array<int64_t>& indices,
+                     const Array<T>& values) {
+  T* s = MutableData(sum_tree, capacity);
+  T* m = MutableData(max_tree, capacity);
+  CheckIndicesAndValues(indices, values, capacity);
+  const int64_t* idx = indices.data();
+  const T* val = values.data();
+  py::ssize_t n = indices.shape(0);
+  int64_t nnz_change = 0;
+  py::gil_scoped_release release;
+  for (py::ssize_t i = 0; i < n; ++i) {
+    int64_t leaf = IndexToLeaf(idx[i], capacity, leftmost_leaf);
+    nnz_change += (val[i] != 0) - (s[leaf] != 0);
+    UpdateLeaf<Add>(s, leaf, val[i]);
+    UpdateLeaf<Max>(m, leaf, val[i]);
+  }
+  return nnz_change;
+}
+
+// Same as ``Update<Add>`` but also returns the change of the number of non-zero
+// values.
+template <typename T>
+int64_t SumUpdate(Array<T> tree,
+                  int64_t capacity,
+                  int64_t leftmost_leaf,
+                  const Array<int64_t>& indices,
+                  const Array<T>& values) {
+  T* t = MutableData(tree, capacity);
+  CheckIndicesAndValues(indices, values, capacity);
+  const int64_t* idx = indices.data();
+  const T* val = values.data();
+  py::ssize_t n = indices.shape(0);
+  int64_t nnz_change = 0;
+  py::gil_scoped_release release;
+  for (py::ssize_t i = 0; i < n; ++i) {
+    int64_t leaf = IndexToLeaf(idx[i], capacity, leftmost_leaf);
+    nnz_change += (val[i] != 0) - (t[leaf] != 0);
+    UpdateLeaf<Add>(t, leaf, val[i]);
+  }
+  return nnz_change;
+}
+
+template <typename T>
+Array<int64_t> FindSumBound(Array<T> tree,
+                            int64_t capacity,
+                            int64_t leftmost_leaf,
+                            const Array<T>& thresholds) {
+  const T* t = MutableData(tree, capacity);
+  if (thresholds.ndim() != 1) {
+    throw std::runtime_error("thresholds should be a 1-D array");
+  }
+  py::ssize_t n = thresholds.shape(0);
+  Array<int64_t> result(n);
+  int64_t* r = result.mutable_data();
+  const T* th = thresholds.data();
+  py::gil_scoped_release release;
+  for (py::ssize_t i = 0; i < n; ++i) {
+    T threshold = th[i];
+    int64_t node = 1;
+    while (node < capacity) {
+      node *= 2;
+      T left = t[node];
+      // The condition (threshold >= left) && (right == 0) is only possible if
+      // the original threshold == root. We want to make sure we still get an
+      // index corresponding to a non-zero value.
+      if (threshold >= left && t[node + 1] > 0) {
+        threshold -= left;
+        node += 1;
+      }
+    }
+    r[i] = LeafToIndex(node, capacity, leftmost_leaf);
+  }
+  return result;
+}
+
+template <typename T>
+void DefineFunctions(py::module& m) {
+  m.def("sum_update",
+        &SumUpdate<T>,
+        R"pbdoc(
+            Set the leaves of a sum tree and update the internal nodes.
+            Returns the change of the number of non-zero leaves.
+          )pbdoc",
+        py::arg("tree").noconvert(),
+        py::arg("capacity"),
+        py::arg("leftmost_leaf"),
+        py::arg("indices"),
+        py::arg("values"));
+  m.def("max_update",
+        &Update<Max, T>,
+        R"pbdoc(
+            Set the leaves of a max tree and update the internal nodes.
+          )pbdoc",
+        py::arg("tree").noconvert(),
+        py::arg("capacity"),
+        py::arg("leftmost_leaf"),
+        py::arg("indices"),
+        py::arg("values"));
+  m.def("min_update",
+        &Update<Min, T>,
+        R"pbdoc(
+            Set the leaves of a min tree and update the internal nodes.
+          )pbdoc",
+        py::arg("tree").noconvert(),
+        py::arg("capacity"),
+        py::arg("leftmost_leaf"),
+        py::arg("indices"),
+        py::arg("values"));
+  m.def("sum_max_update",
+        &SumMaxUpdate<T>,
+        R"pbdoc(
+            Set the leaves of a sum tree and a max tree to the same values and
+            update their internal nodes in one pass. Returns the change of the
+            number of non-zero leaves.
+          )pbdoc",
+        py::arg("sum_tree").noconvert(),
+        py::arg("max_tree").noconvert(),
+        py::arg("capacity"),
+        py::arg("leftmost_leaf"),
+        py::arg("indices"),
+        py::arg("values"));
+  m.def("find_sum_bound",
+        &FindSumBound<T>,
+        R"pbdoc(
+            For each threshold, find the minimal index such that the prefix
+            sum of the leaves up to it is greater than the threshold.
+          )pbdoc",
+        py::arg("tree").noconvert(),
+        py::arg("capacity"),
+        py::arg("leftmost_leaf"),
+        py::arg("thresholds"));
+}
+
+PYBIND11_MODULE(csegment_tree, m) {
+  m.doc() = R"pbdoc(
+            C++ implementation of the batched update and prefix sum search of
+            segment trees used by prioritized replay.
+        )pbdoc";
+
+  DefineFunctions<float>(m);
+  DefineFunctions<double>(m);
+}
@@ -186,6 +186,7 @@ class SyncExperienceReplayer(ExperienceReplayer):
                  max_length,
                  num_earliest_frames_ignored=0,
                  prioritized_sampling=False,
+                 allow_multithread=False,
                  name="SyncExperienceReplayer"):
         """Create a ReplayBuffer.
 
@@ -199,6 +200,8 @@ class SyncExperienceReplayer(ExperienceReplayer):
                 when sample from the buffer. This is typically required when
                 FrameStack is used.
             prioritized_sampling (bool): Use prioritized sampling if this is True.
+            allow_multithread (bool): whether the replayer can be used from
+                multiple threads simultaneously.
         """
         super().__init__()
         self._experience_spec = experience_spec
@@ -208,6 +211,7 @@ class SyncExperienceReplayer(ExperienceReplayer):
             max_length=max_length,
             prioritized_sampling=prioritized_sampling,
             num_earliest_frames_ignored=num_earliest_frames_ignored,
+            allow_multithread=allow_multithread,
             name=name)
         self._data_iter = None
 
@@ -29,6 +29,7 @@ from alf.utils.data_buffer import atomic, RingBuffer
 from alf.utils import checkpoint_utils
 
 from .segment_tree import SumSegmentTree, MaxSegmentTree, MinSegmentTree
+from .segment_tree import update_sum_max
 
 BatchInfo = namedtuple(
     "BatchInfo", ["env_ids", "positions", "importance_weights"],
@@ -60,10 +61,15 @@ class ReplayBuffer(RingBuffer):
                  with_replacement=False,
                  device="cpu",
                  allow_multiprocess=False,
+                 allow_multithread=False,
                  keep_episodic_info=None,
                  step_type_field="step_type",
                  postprocess_exp_fn=None,
                  enable_checkpoint=False,
+                 mmap_dir=None,
+                 compressed_fields=None,
+                 compression="zlib",
+                 compression_level=None,
                  name="ReplayBuffer"):
         """
         Args:
@@ -90,6 +96,8 @@ class ReplayBuffer(RingBuffer):
                 duplicated samples.
             device (string): "cpu" or "cuda" where tensors are created.
             allow_multiprocess (bool): whether multiprocessing is supported.
+            allow_multithread (bool): whether reading and writing from multiple
+                threads is supported.
             keep_episodic_info (bool): index episode start and ending positions.
                 If None, its value will be set to True if ``num_earliest_frames_ignored``>0
             step_type_field (string): path to the step_type field in exp nest.
@@ -105,6 +113,21 @@ class ReplayBuffer(RingBuffer):
                 Returns:
                     updated ``(batch, batch_info)``.
             enable_checkpoint (bool): whether checkpointing this replay buffer.
+            mmap_dir (str): if provided, store the experiences in
+                memory-mapped files in this directory instead of in memory.
+                Checkpointing the replay buffer then only flushes the files
+                and saves the indexing tensors. See ``RingBuffer`` for
+                details.
+            compressed_fields (list[str]): paths of the fields (e.g.
+                "observation") stored with each step compressed separately.
+                Together with ``FrameStacker``, which only stores one frame
+                per step and rebuilds the stacks from the replay buffer, this
+                can greatly reduce the memory for image observations. See
+                ``RingBuffer`` for details.
+            compression (str): compression method for ``compressed_fields``,
+                one of "zlib", "lz4" and "png".
+            compression_level (int): compression level for
+                ``compressed_fields``. If None, a fast level is used.
             name (string): name of the replay buffer object.
         """
         super().__init__(
@@ -113,6 +136,11 @@ class ReplayBuffer(RingBuffer):
             max_length=max_length,
             device=device,
             allow_multiprocess=allow_multiprocess,
+            allow_multithread=allow_multithread,
+            mmap_dir=mmap_dir,
+            compressed_fields=compressed_fields,
+            compression=compression,
+            compression_level=compression_level,
             name=name)
         self._num_earliest_frames_ignored = num_earliest_frames_ignored
         if num_earliest_frames_ignored > 0:
@@ -185,8 +213,7 @@ class ReplayBuffer(RingBuffer):
         self._update_segment_tree(indices, values)
 
     def _update_segment_tree(self, indices, values):
-        self._sum_tree[indices] = values
-        self._max_tree[indices] = values
+        update_sum_max(self._sum_tree, self._max_tree, indices, values)
 
     def _env_id_idx_to_index(self, env_ids, idx):
         """Convert env_id, idx in batched buffer to indices in SegmentTree."""
@@ -217,6 +244,7 @@ class ReplayBuffer(RingBuffer):
                 self._update_segment_tree(indices, values)
         self._mini_batch_length = mini_batch_length
 
+    @atomic
     @torch.no_grad()
     def update_priority(self, env_ids, positions, priorities):
         """Update the priorities for the given experiences.
@@ -225,7 +253,9 @@ class ReplayBuffer(RingBuffer):
             env_ids (Tensor): 1-D int64 Tensor.
             positions (Tensor): 1-D int64 Tensor with same shape as ``env_ids``.
                 These positions should be obtained from the BatchInfo returned
-                by ``get_batch()``.
+                by ``get_batch()``. The batch may have been obtained several
+                updates ago (e.g. when it is prefetched). The positions which
+                have been overwritten since then are ignored.
             priorities (Tensor): 1-D float Tensor with same shape as ``env_ids``.
                 The elements are the new priorities corresponds to experiences
                 indicated by ``(env_ids, positions)``
@@ -370,6 +400,9 @@ class ReplayBuffer(RingBuffer):
                 alf.summary.scalar(
                     "replayer/" + self._name + ".original_reward_mean",
                     torch.mean(result.reward[:-1]))
+                alf.summary.scalar(
+                    "replayer/" + self._name + ".bytes_per_transition",
+                    self.bytes_per_transition)
 
             if self._postprocess_exp_fn:
                 result, info = self._postprocess_exp_fn(self, result, info)
@@ -594,7 +627,7 @@ class ReplayBuffer(RingBuffer):
         # buffer whose data can start from the middle, so this is limited
         # to the case where clear() is the only way to remove data from
         # the buffer.
-        if size == self._max_length:
+        if size == self._max_length and not self._compressed_stores:
             result = self._buffer
         else:
             # Assumes that non-full buffer always stores data starting from 0
@@ -407,6 +407,65 @@ class ReplayBufferTest(RingBufferTest):
         replay_buffer.clear()
         self.assertEqual(replay_buffer.total_size, 0)
 
+    @parameterized.parameters("zlib", "png")
+    def test_compressed_fields(self, compression):
+        data_spec = DataItem(
+            env_id=alf.TensorSpec(shape=(), dtype=torch.int64),
+            x=alf.TensorSpec(shape=(2, 8, 8), dtype=torch.uint8),
+            t=alf.TensorSpec(shape=(), dtype=torch.int32),
+            o=dict({
+                "a": alf.TensorSpec(shape=(), dtype=torch.float32),
+                "g": alf.TensorSpec(shape=(), dtype=torch.float32)
+            }),
+            reward=alf.TensorSpec(shape=(), dtype=torch.float32))
+
+        def _create_replay_buffer(compressed_fields):
+            return ReplayBuffer(
+                data_spec=data_spec,
+                num_environments=self.num_envs,
+                max_length=self.max_length,
+                step_type_field="",
+                compressed_fields=compressed_fields,
+                compression=compression)
+
+        replay_buffer = _create_replay_buffer(None)
+        compressed_replay_buffer = _create_replay_buffer(['x'])
+        self.assertEqual(replay_buffer.bytes_per_transition, 128 + 24)
+        for t in range(6):
+            batch = get_batch(range(self.num_envs), self.dim, t=t, x=0.3)
+            # Images with large flat areas like Atari frames
+            x = torch.zeros(self.num_envs, 2, 8, 8, dtype=torch.uint8)
+            x[:, :, t:, :t] = torch.arange(self.num_envs).reshape(
+                -1, 1, 1, 1).to(torch.uint8)
+            batch = batch._replace(x=x)
+            replay_buffer.add_batch(batch)
+            compressed_replay_buffer.add_batch(batch)
+        self.assertLess(compressed_replay_buffer.bytes_per_transition,
+                        replay_buffer.bytes_per_transition)
+
+        torch.manual_seed(0)
+        batch, info = replay_buffer.get_batch(16, 3)
+        torch.manual_seed(0)
+        compressed_batch, compressed_info = compressed_replay_buffer.get_batch(
+            16, 3)
+        alf.nest.map_structure(self.assertEqual, batch, compressed_batch)
+        alf.nest.map_structure(self.assertEqual, info, compressed_info)
+
+        env_ids = torch.tensor([[0], [3]])
+        positions = torch.tensor([[2, 3, 5], [4, 4, 5]])
+        self.assertEqual(
+            replay_buffer.get_field('x', env_ids, positions),
+            compressed_replay_buffer.get_field('x', env_ids, positions))
+        self.assertEqual(replay_buffer.gather_all().x,
+                         compressed_replay_buffer.gather_all().x)
+
+        # The compressed data is restored from the state dict.
+        state_dict = compressed_replay_buffer.state_dict()
+        new_replay_buffer = _create_replay_buffer(['x'])
+        new_replay_buffer.load_state_dict(state_dict)
+        self.assertEqual(replay_buffer.gather_all().x,
+                         new_replay_buffer.gather_all().x)
+
     def test_recent_data_and_without_replacement(self):
         num_envs = 4
         max_length = 100
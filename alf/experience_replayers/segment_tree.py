@@ -20,6 +20,11 @@ import torch.nn as nn
 import alf
 from alf.nest.utils import convert_device
 
+try:
+    import csegment_tree
+except ImportError:
+    csegment_tree = None
+
 
 class SegmentTree(nn.Module):
     """
@@ -32,14 +37,36 @@ class SegmentTree(nn.Module):
     and ``values[2*i+1]``. And ``values[i]`` is set to ``op(values[2*i], values[2*i+1])``.
     Each leaf represent a value set through ``__setitem__``. All the nodes of
     tree are initialized to be zeros.
+
+    If the C++ extension ``csegment_tree`` is installed, it is used for the
+    batched updates and searches of the trees on CPU with dtype ``torch.float32``
+    or ``torch.float64``, which avoids the level-by-level tensor operations of
+    the Python implementation.
     """
 
+    # The name of the function in ``csegment_tree`` for updating the tree
+    _native_update = None
+
     def __init__(self,
                  capacity,
                  op,
                  dtype=torch.float32,
                  device="cpu",
+                 native=True,
                  name="SegmentTree"):
+        """
+        Args:
+            capacity (int): number of leaves
+            op (Callable): the binary operation for calculating the value of
+                an internal node from its children.
+            dtype (torch.dtype): dtype of the values
+            device (str): device where the values are stored
+            native (bool): whether to use the C++ implementation if it is
+                available. It is only available if ``csegment_tree`` is
+                installed, ``device`` is "cpu" and ``dtype`` is
+                ``torch.float32`` or ``torch.float64``.
+            name (str): name of the tree
+        """
         super().__init__()
         self._name = name
         self._device = device
@@ -54,6 +81,21 @@ class SegmentTree(nn.Module):
             self._leftmost_leaf *= 2
             if self._leftmost_leaf < capacity:
                 self._depth += 1
+        self._native = (native and csegment_tree is not None
+                        and self._native_update is not None and device == "cpu"
+                        and dtype in (torch.float32, torch.float64))
+
+    @property
+    def native(self):
+        """Whether the C++ implementation is used."""
+        return self._native
+
+    def _native_args(self, indices, values):
+        """Get the arguments of the ``csegment_tree`` functions."""
+        indices = indices.cpu().to(torch.int64).contiguous().numpy()
+        values = values.cpu().to(self._values.dtype).contiguous().numpy()
+        return (self._values.numpy(), self._capacity, self._leftmost_leaf,
+                indices, values)
 
     def __setitem__(self, indices, values):
         """Set the value of leaves and update the internal nodes.
@@ -63,6 +105,10 @@ class SegmentTree(nn.Module):
                 [0, capacity).
             values (Tensor): 1-D Tensor with the same shape as ``indices``
         """
+        if self._native:
+            getattr(csegment_tree,
+                    self._native_update)(*self._native_args(indices, values))
+            return
 
         def _step(indices):
             """
@@ -146,17 +192,29 @@ class SegmentTree(nn.Module):
 class SumSegmentTree(SegmentTree):
     """SegmentTree with sum operation."""
 
+    _native_update = "sum_update"
+
     def __init__(self,
                  capacity,
                  dtype=torch.float32,
                  device="cpu",
+                 native=True,
                  name="SumSegmentTree"):
         super().__init__(
-            capacity, torch.add, dtype=dtype, device=device, name=name)
+            capacity,
+            torch.add,
+            dtype=dtype,
+            device=device,
+            native=native,
+            name=name)
         self._nnz = 0
 
     def __setitem__(self, indices, values):
         assert values.min() >= 0
+        if self._native:
+            self._nnz += csegment_tree.sum_update(
+                *self._native_args(indices, values))
+            return
         leaves = self._index_to_leaf(indices)
         nnz = (values != 0).sum() - (self._values[leaves] != 0).sum()
         self._nnz += int(nnz.cpu().numpy())
@@ -210,6 +268,13 @@ class SumSegmentTree(SegmentTree):
                 raise ValueError("thresholds cannot "
                                  "be greater than summary(): got %s vs. %s" %
                                  (thresholds.max(), self.summary()))
+            if self._native:
+                thresholds = thresholds.cpu().to(
+                    self._values.dtype).contiguous().numpy()
+                indices = csegment_tree.find_sum_bound(
+                    self._values.numpy(), self._capacity, self._leftmost_leaf,
+                    thresholds)
+                return convert_device(torch.from_numpy(indices))
             thresholds = convert_device(thresholds)
             indices = torch.ones_like(thresholds, dtype=torch.int64)
             for _ in range(self._depth):
@@ -230,20 +295,65 @@ class SumSegmentTree(SegmentTree):
 class MinSegmentTree(SegmentTree):
     """SegmentTree with min operation."""
 
+    _native_update = "min_update"
+
     def __init__(self,
                  capacity,
                  dtype=torch.float32,
                  device="cpu",
+                 native=True,
                  name="MinSegmentTree"):
-        super().__init__(capacity, torch.min, dtype, device=device, name=name)
+        super().__init__(
+            capacity,
+            torch.min,
+            dtype,
+            device=device,
+            native=native,
+            name=name)
 
 
 class MaxSegmentTree(SegmentTree):
     """SegmentTree with max operation."""
 
+    _native_update = "max_update"
+
     def __init__(self,
                  capacity,
                  dtype=torch.float32,
                  device="cpu",
+                 native=True,
                  name="MaxSegmentTree"):
-        super().__init__(capacity, torch.max, dtype, device=device, name=name)
+        super().__init__(
+            capacity,
+            torch.max,
+            dtype,
+            device=device,
+            native=native,
+            name=name)
+
+
+def update_sum_max(sum_tree, max_tree, indices, values):
+    """Set the same values to a sum tree and a max tree.
+
+    If both trees use the C++ implementation, they are updated in one pass.
+
+    Args:
+        sum_tree (SumSegmentTree): the sum tree to be updated
+        max_tree (MaxSegmentTree): the max tree to be updated
+        indices (Tensor): 1-D int64 Tensor. Its values should be in range
+            [0, capacity).
+        values (Tensor): 1-D Tensor with the same shape as ``indices``
+    """
+    if (sum_tree.native and max_tree.native
+            and sum_tree._capacity == max_tree._capacity
+            and sum_tree._values.dtype == max_tree._values.dtype):
+        assert values.min() >= 0
+        sum_values, capacity, leftmost_leaf, indices, values = (
+            sum_tree._native_args(indices, values))
+        sum_tree._nnz += csegment_tree.sum_max_update(sum_values,
+                                                      max_tree._values.numpy(),
+                                                      capacity, leftmost_leaf,
+                                                      indices, values)
+    else:
+        sum_tree[indices] = values
+        max_tree[indices] = values
@@ -12,17 +12,29 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from absl import logging
+from absl.testing import parameterized
 import random
+import time
 import torch
+import unittest
 
 import alf
+from alf.experience_replayers import segment_tree
 from alf.experience_replayers.segment_tree import SumSegmentTree, MaxSegmentTree
 
 
-class SegmentTreeTest(alf.test.TestCase):
-    def test_max_tree(self):
+class SegmentTreeTest(parameterized.TestCase, alf.test.TestCase):
+    def _check_native(self, native):
+        if native and segment_tree.csegment_tree is None:
+            self.skipTest("csegment_tree is not installed")
+
+    @parameterized.parameters(False, True)
+    def test_max_tree(self, native):
+        self._check_native(native)
         for size in [1, 2, 3, 4, 7, 8, 9, 15, 16, 128]:
-            tree = MaxSegmentTree(size)
+            tree = MaxSegmentTree(size, native=native)
+            self.assertEqual(tree.native, native)
             vals = torch.zeros(size, dtype=torch.float32)
             for _ in range(100):
                 n = random.randint(1, size)
@@ -37,9 +49,12 @@ class SegmentTreeTest(alf.test.TestCase):
             i = torch.arange(size, dtype=torch.int64)
             self.assertEqual(tree[i], vals)
 
-    def test_sum_tree(self):
+    @parameterized.parameters(False, True)
+    def test_sum_tree(self, native):
+        self._check_native(native)
         for size in [3, 1, 2, 3, 4, 7, 8, 9, 15, 16, 128]:
-            tree = SumSegmentTree(size)
+            tree = SumSegmentTree(size, native=native)
+            self.assertEqual(tree.native, native)
             vals = torch.zeros(size, dtype=torch.float32)
             for _ in range(100):
                 n = random.randint(1, size)
@@ -51,6 +66,7 @@ class SegmentTreeTest(alf.test.TestCase):
                 vals[i] = v
                 tree[i] = v
                 self.assertEqual(tree.summary(), vals.sum())
+                self.assertEqual(tree.nnz, int((vals != 0).sum()))
 
             s = torch.cumsum(vals, 0)
             s = torch.cat([torch.tensor([0.]), s[:-1]])
@@ -67,14 +83,67 @@ class SegmentTreeTest(alf.test.TestCase):
             self.assertEqual(tree.find_sum_bound(thresh), size - 1)
             self.assertRaises(ValueError, tree.find_sum_bound, thresh + 1)
 
-    def test_boundary(self):
-        tree = SumSegmentTree(10)
+    @parameterized.parameters(False, True)
+    def test_boundary(self, native):
+        self._check_native(native)
+        tree = SumSegmentTree(10, native=native)
         v = torch.tensor([0.1] * 9 + [0.0])
         i = torch.arange(10)
         tree[i] = v
         thresh = tree.summary().reshape(1)
         self.assertEqual(tree.find_sum_bound(thresh), 8)
 
+    @unittest.skipIf(segment_tree.csegment_tree is None,
+                     "csegment_tree is not installed")
+    def test_native_same_as_python(self):
+        for size in [1, 5, 16, 1000]:
+            sum_trees = [SumSegmentTree(size, native=n) for n in (False, True)]
+            max_trees = [MaxSegmentTree(size, native=n) for n in (False, True)]
+            for _ in range(20):
+                n = random.randint(1, size)
+                i = alf.math.shuffle(torch.arange(size))[:n]
+                v = torch.rand(n) * (torch.rand(n) < 0.8).to(torch.float32)
+                sum_trees[0][i] = v
+                max_trees[0][i] = v
+                segment_tree.update_sum_max(sum_trees[1], max_trees[1], i, v)
+                self.assertTensorClose(sum_trees[0]._values[1:],
+                                       sum_trees[1]._values[1:])
+                self.assertTensorEqual(max_trees[0]._values[1:],
+                                       max_trees[1]._values[1:])
+                self.assertEqual(sum_trees[0].nnz, sum_trees[1].nnz)
+                thresholds = torch.rand(100) * sum_trees[1].summary()
+                self.assertTensorEqual(sum_trees[0].find_sum_bound(thresholds),
+                                       sum_trees[1].find_sum_bound(thresholds))
+
+    @unittest.skipIf(segment_tree.csegment_tree is None,
+                     "csegment_tree is not installed")
+    def test_benchmark(self):
+        """Compare the speed of the C++ and Python implementations with the
+        access pattern of prioritized replay."""
+        capacity = 1000000
+        batch_size = 256
+        for native in [False, True]:
+            sum_tree = SumSegmentTree(capacity, native=native)
+            max_tree = MaxSegmentTree(capacity, native=native)
+            segment_tree.update_sum_max(sum_tree, max_tree,
+                                        torch.arange(capacity),
+                                        torch.rand(capacity))
+            t_update = 0.
+            t_search = 0.
+            for _ in range(100):
+                t0 = time.time()
+                r = torch.rand(batch_size) * sum_tree.summary()
+                indices = sum_tree.find_sum_bound(r)
+                t1 = time.time()
+                segment_tree.update_sum_max(sum_tree, max_tree, indices,
+                                            torch.rand(batch_size))
+                t2 = time.time()
+                t_search += t1 - t0
+                t_update += t2 - t1
+            logging.info(
+                "native=%s find_sum_bound: %.3fms update_sum_max: %.3fms" %
+                (native, t_search * 10, t_update * 10))
+
 
 if __name__ == '__main__':
     alf.test.main()
@@ -23,7 +23,7 @@ import torch.nn as nn
 from alf.initializers import variance_scaling_init
 from alf.nest.utils import get_outer_rank
 from alf.tensor_specs import TensorSpec
-from alf.utils import common
+from alf.utils import common, mixed_precision
 from alf.utils.math_ops import identity
 
 
@@ -322,7 +322,11 @@ class FC(nn.Module):
             self._bn.reset_parameters()
 
     def forward(self, inputs):
-        if inputs.dim() == 2 and self._use_bias:
+        compute_dtype = mixed_precision.get_compute_dtype()
+        if compute_dtype is not None:
+            y = mixed_precision.linear(inputs, self._weight, self._bias,
+                                       compute_dtype)
+        elif inputs.dim() == 2 and self._use_bias:
             y = torch.addmm(self._bias, inputs, self._weight.t())
         else:
             y = inputs.matmul(self._weight.t())
@@ -438,7 +442,11 @@ class ParallelFC(nn.Module):
         else:
             raise ValueError("Wrong inputs.ndim=%d" % inputs.ndim)
 
-        if self.bias is not None:
+        compute_dtype = mixed_precision.get_compute_dtype()
+        if compute_dtype is not None:
+            y = mixed_precision.parallel_linear(inputs, self._weight,
+                                                self._bias, compute_dtype)
+        elif self.bias is not None:
             y = torch.baddbmm(
                 self._bias.unsqueeze(1), inputs,
                 self.weight.transpose(1, 2))  # [n, B, k]
@@ -546,7 +554,11 @@ class Conv2D(nn.Module):
             self._bn = None
 
     def forward(self, img):
-        y = self._conv2d(img)
+        compute_dtype = mixed_precision.get_compute_dtype()
+        if compute_dtype is not None:
+            y = mixed_precision.conv2d(img, self._conv2d, compute_dtype)
+        else:
+            y = self._conv2d(img)
         if self._bn is not None:
             y = self._bn(y)
         return self._activation(y)
@@ -694,7 +706,11 @@ class ParallelConv2D(nn.Module):
         img = img.reshape(img.shape[0], img.shape[1] * img.shape[2],
                           *img.shape[3:])
 
-        res = self._conv2d(img)
+        compute_dtype = mixed_precision.get_compute_dtype()
+        if compute_dtype is not None:
+            res = mixed_precision.conv2d(img, self._conv2d, compute_dtype)
+        else:
+            res = self._conv2d(img)
 
         if self._bn is not None:
             res = self._bn(res)
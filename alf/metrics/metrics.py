@@ -186,6 +186,11 @@ class AverageEpisodicSumMetric(metric.StepMetric):
         subclasses' ``_extract_metric_values()``. It will ignore the values of
         first time steps.
 
+        If the batch size of ``time_step`` is smaller than ``batch_size`` (e.g.,
+        the environment returns the time steps of a subset of its environments
+        at each step), ``time_step.env_id`` is used to find the accumulators of
+        the corresponding environments.
+
         Args:
             time_step (alf.data_structures.TimeStep): batched tensor
         Returns:
@@ -193,11 +198,16 @@ class AverageEpisodicSumMetric(metric.StepMetric):
         """
 
         values = self._extract_metric_values(time_step)
+        batch_size = time_step.step_type.shape[0]
+        if batch_size == self._batch_size:
+            env_ids = slice(None)
+        else:
+            env_ids = time_step.env_id.cpu().long()
 
         assert all(
             alf.nest.flatten(
                 alf.nest.map_structure(
-                    lambda val: list(val.shape) == [self._batch_size],
+                    lambda val: list(val.shape) == [batch_size],
                     values))), ("Value shape is not correct "
                                 "(only scalar values are supported).")
 
@@ -208,8 +218,9 @@ class AverageEpisodicSumMetric(metric.StepMetric):
             # Zero out batch indices where a new episode is starting.
             # Update with new values; Ignores first step whose reward comes from
             # the boundary transition of the last step from the previous episode.
-            acc[:] = torch.where(is_first, torch.zeros_like(acc),
-                                 acc + val.to(self._dtype))
+            acc[env_ids] = torch.where(
+                is_first, torch.zeros_like(val, dtype=self._dtype),
+                acc[env_ids] + val.to(self._dtype))
 
         alf.nest.map_structure(_update_accumulator_, self._accumulator, values)
 
@@ -217,6 +228,8 @@ class AverageEpisodicSumMetric(metric.StepMetric):
         last_episode_indices = torch.where(time_step.is_last())[0]
 
         if len(last_episode_indices) > 0:
+            if batch_size != self._batch_size:
+                last_episode_indices = env_ids[last_episode_indices]
             alf.nest.map_structure(
                 lambda buf, acc: buf.append(acc[last_episode_indices]),
                 self._buffer, self._accumulator)
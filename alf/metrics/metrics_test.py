@@ -95,6 +95,20 @@ class THMetricsTest(parameterized.TestCase, unittest.TestCase):
         else:
             self.assertEqual(0.0, metric.result())
 
+    def testAverageReturnWithEnvSubsets(self):
+        # Each time step only contains 2 of the 3 environments.
+        F, M, L = StepType.FIRST, StepType.MID, StepType.LAST
+        trajectories = [
+            _create_timestep([0, 0], [0, 1], [F, F], ()),
+            _create_timestep([0, 1], [2, 0], [F, M], ()),
+            _create_timestep([2, 3], [0, 2], [L, L], ()),
+            _create_timestep([5, 0], [1, 0], [L, F], ()),
+        ]
+        metric = AverageReturnMetric(batch_size=3)
+        for ts in trajectories:
+            metric(ts)
+        self.assertAlmostEqual(11. / 3, float(metric.result()), places=5)
+
 
 if __name__ == "__main__":
     unittest.main()
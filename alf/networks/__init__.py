@@ -18,7 +18,7 @@ from .critic_networks import *
 from .dynamics_networks import *
 from .encoding_networks import *
 from .mdq_critic_networks import *
-from .network import Network, NaiveParallelNetwork, SequentialNetwork
+from .network import Network, NaiveParallelNetwork, PopulationNetwork, SequentialNetwork
 from .ou_process import OUProcess
 from .preprocessor_networks import PreprocessorNetwork
 from .projection_networks import *
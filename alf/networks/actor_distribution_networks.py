@@ -24,6 +24,7 @@ from .projection_networks import NormalProjectionNetwork, CategoricalProjectionN
 from .preprocessor_networks import PreprocessorNetwork
 from alf.tensor_specs import BoundedTensorSpec, TensorSpec
 from alf.networks.network import Network
+from alf.utils import dist_utils
 
 
 @gin.configurable
@@ -225,6 +226,35 @@ class ActorDistributionRNNNetwork(ActorDistributionNetwork):
         self._create_projection_net(discrete_projection_net_ctor,
                                     continuous_projection_net_ctor)
 
+    def forward_sequence(self, observation, state):
+        """Computes the action distributions for a whole sequence.
+
+        It is equivalent to calling ``forward()`` for each step of the
+        sequence, which should not contain any episode boundary after its
+        first step.
+
+        Args:
+            observation (nested torch.Tensor): its shape is ``[T, B, ...]``
+            state (nest[tuple]): the states before the first step
+
+        Returns:
+            act_dist (nested torch.distributions): action distributions with
+                batch shape ``[T, B]``
+            new_state (nest[tuple]): the states after the last step
+        """
+        length, batch_size = nest.get_nest_shape(observation)[:2]
+        encoding, state = self._encoding_net.forward_sequence(
+            observation, state)
+        encoding = encoding.reshape(length * batch_size, -1)
+        act_dist = nest.map_structure(lambda proj: proj(encoding)[0],
+                                      self._projection_net)
+        act_dist_spec = dist_utils.extract_spec(act_dist)
+        act_dist = nest.map_structure(
+            lambda x: x.reshape(length, batch_size, *x.shape[1:]),
+            dist_utils.distributions_to_params(act_dist))
+        act_dist = dist_utils.params_to_distributions(act_dist, act_dist_spec)
+        return act_dist, state
+
     @property
     def state_spec(self):
         return self._encoding_net.state_spec
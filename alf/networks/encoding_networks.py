@@ -1059,6 +1059,54 @@ class LSTMEncodingNetwork(Network):
         output, _ = self._post_encoding_net(h_state)
         return output, new_state
 
+    def forward_sequence(self, inputs, state):
+        """Compute the outputs for a whole sequence.
+
+        It is equivalent to calling ``forward()`` for each step of the
+        sequence, so the sequence should not contain any episode boundary
+        after its first step. The LSTM cells are unrolled over the sequence
+        with ``torch.lstm`` (the op behind ``nn.LSTM``) using the weights of
+        the cells, instead of calling the cells once per step.
+
+        Args:
+            inputs (nested torch.Tensor): its shape is ``[T, B, ...]``
+            state (list[tuple]): the states before the first step, a list of
+                tuples, where each tuple is a pair of ``h_state`` and
+                ``c_state``.
+
+        Returns:
+            tuple:
+            - output (torch.Tensor): its shape is ``[T, B, ...]``
+            - new_state (list[tuple]): the states after the last step
+        """
+        assert len(self._cells) == len(state)
+        length, batch_size = alf.nest.get_nest_shape(inputs)[:2]
+        inputs = alf.nest.map_structure(lambda x: x.reshape(-1, *x.shape[2:]),
+                                        inputs)
+        h_state, _ = self._pre_encoding_net(inputs)
+        h_state = h_state.reshape(length, batch_size, -1)
+
+        new_state = []
+        lstm_outputs = []
+        for cell, (h, c) in zip(self._cells, state):
+            h_state, h, c = torch.lstm(
+                h_state, (h.unsqueeze(0), c.unsqueeze(0)),
+                [cell.weight_ih, cell.weight_hh, cell.bias_ih, cell.bias_hh],
+                has_biases=True,
+                num_layers=1,
+                dropout=0.,
+                train=self.training,
+                bidirectional=False,
+                batch_first=False)
+            new_state.append((h.squeeze(0), c.squeeze(0)))
+            lstm_outputs.append(h_state)
+
+        h_state = torch.cat(
+            [lstm_outputs[l] for l in self._lstm_output_layers], -1)
+        output, _ = self._post_encoding_net(
+            h_state.reshape(length * batch_size, -1))
+        return output.reshape(length, batch_size, *output.shape[1:]), new_state
+
     @property
     def state_spec(self):
         return self._state_spec
@@ -227,6 +227,30 @@ class EncodingNetworkTest(parameterized.TestCase, alf.test.TestCase):
             self.assertEqual(network.output_spec, TensorSpec((500, )))
             self.assertEqual(output.size()[-1], 500)
 
+    @parameterized.parameters((-1, ), (None, ))
+    def test_lstm_encoding_network_forward_sequence(self, lstm_output_layers):
+        length, batch_size = 7, 3
+        network = LSTMEncodingNetwork(
+            input_tensor_spec=TensorSpec((5, )),
+            pre_fc_layer_params=(8, ),
+            hidden_size=(6, 4),
+            lstm_output_layers=lstm_output_layers,
+            post_fc_layer_params=(9, ))
+        inputs = torch.randn(length, batch_size, 5)
+        state = [(torch.randn(batch_size, h), torch.randn(batch_size, h))
+                 for h in (6, 4)]
+
+        output, new_state = network.forward_sequence(inputs, state)
+        outputs = []
+        step_state = state
+        for t in range(length):
+            out, step_state = network(inputs[t], step_state)
+            outputs.append(out)
+        self.assertTensorClose(output, torch.stack(outputs), epsilon=1e-5)
+        for s1, s2 in zip(
+                alf.nest.flatten(new_state), alf.nest.flatten(step_state)):
+            self.assertTensorClose(s1, s2, epsilon=1e-5)
+
     @parameterized.parameters(
         None,
         TensorSpec((), torch.float32),
@@ -16,11 +16,13 @@
 """
 
 import abc
+import contextlib
 import copy
 import functools
 import gin
 import inspect
 import six
+import threading
 import torch
 
 import torch.nn as nn
@@ -30,7 +32,7 @@ from alf.tensor_specs import TensorSpec
 from alf.nest.utils import get_outer_rank
 from alf.utils.dist_utils import DistributionSpec, extract_spec
 import alf.utils.math_ops as math_ops
-from alf.utils import common
+from alf.utils import common, dist_utils
 
 
 class _NetworkMeta(abc.ABCMeta):
@@ -90,6 +92,59 @@ class _NetworkMeta(abc.ABCMeta):
         attrs["__init__"] = functools.update_wrapper(_capture_init, init)
         return abc.ABCMeta.__new__(mcs, classname, baseclasses, attrs)
 
+    def __call__(cls, *args, **kwargs):
+        """Wrap the network in ``PopulationNetwork`` if needed."""
+        population_size = getattr(_population, 'size', None)
+        if population_size is None or cls is PopulationNetwork:
+            return super().__call__(*args, **kwargs)
+        with _population_networks(None):
+            return PopulationNetwork(super().__call__(*args, **kwargs),
+                                     population_size)
+
+
+# The thread local states for ``PopulationNetwork``
+_population = threading.local()
+
+
+@contextlib.contextmanager
+def _population_networks(population_size):
+    old_size = getattr(_population, 'size', None)
+    _population.size = population_size
+    try:
+        yield
+    finally:
+        _population.size = old_size
+
+
+def population_networks(population_size):
+    """A context within which the created networks are stacked for a population.
+
+    Each ``Network`` created directly within this context is replaced by a
+    ``PopulationNetwork`` stacking ``population_size`` copies of it. The
+    networks created by ``PopulationNetwork`` themselves are not replaced.
+
+    Args:
+        population_size (int): the number of members of the population
+    """
+    assert population_size > 0
+    return _population_networks(population_size)
+
+
+@contextlib.contextmanager
+def population_members(member_ids):
+    """A context for calling ``PopulationNetwork``.
+
+    Args:
+        member_ids (Tensor): int64 Tensor of shape ``[B]``, the member of the
+            population each sample of the input batch belongs to.
+    """
+    old_ids = getattr(_population, 'member_ids', None)
+    _population.member_ids = member_ids
+    try:
+        yield
+    finally:
+        _population.member_ids = old_ids
+
 
 @six.add_metaclass(_NetworkMeta)
 class Network(nn.Module):
@@ -303,6 +358,101 @@ class NaiveParallelNetwork(Network):
         return self._state_spec
 
 
+class PopulationNetwork(Network):
+    """The networks of the members of a population stacked together.
+
+    It holds ``network.make_parallel(population_size)``, so each member has
+    its own independently initialized parameters while the members are
+    computed together. The computation is batched over the members if
+    ``network`` has an optimized ``make_parallel()`` (e.g. ``EncodingNetwork``
+    with only FC layers, which uses ``ParallelFC``). Otherwise
+    ``NaiveParallelNetwork`` computes the members one after another.
+
+    The input, the state and the output have the same shapes as those of
+    ``network``. Each sample of the batch is computed by the member given by
+    ``population_members()``, which ``forward()`` should be called within.
+    """
+
+    def __init__(self, network, population_size, name=None):
+        """
+        Args:
+            network (Network): the network of one member
+            population_size (int): the number of members
+            name (str): If ``None``, ``population_`` followed by
+                ``network.name`` will be used.
+        """
+        super().__init__(network.input_tensor_spec,
+                         name if name else 'population_%s' % network.name)
+        with _population_networks(None):
+            self._output_spec = network.output_spec
+            self._parallel_network = network.make_parallel(population_size)
+        self._population_size = population_size
+        self._state_spec = network.state_spec
+
+    @property
+    def population_size(self):
+        return self._population_size
+
+    @property
+    def state_spec(self):
+        return self._state_spec
+
+    def make_parallel(self, n):
+        with _population_networks(None):
+            return super().make_parallel(n)
+
+    def forward(self, inputs, state=()):
+        """Compute the output and the next state.
+
+        Args:
+            inputs (nested torch.Tensor): its shape is ``[B, ...]``
+            state (nested torch.Tensor): its shape is ``[B, ...]``
+        Returns:
+            output (nested torch.Tensor): its shape is ``[B, ...]``
+            next_state (nested torch.Tensor): its shape is ``[B, ...]``
+        """
+        member_ids = getattr(_population, 'member_ids', None)
+        assert member_ids is not None, (
+            "PopulationNetwork should be called within population_members()")
+        n = self._population_size
+        batch_size = member_ids.shape[0]
+        counts = torch.bincount(member_ids, minlength=n)
+        m = int(counts.max())
+        if m * n == batch_size and bool(
+                torch.all(member_ids[1:] >= member_ids[:-1])):
+            # The samples of each member are together in the batch.
+            def _stack(x):
+                return x.reshape(n, m, *x.shape[1:]).transpose(0, 1)
+
+            def _unstack(x):
+                return x.transpose(0, 1).reshape(batch_size, *x.shape[2:])
+        else:
+            # The index of each sample among the samples of its member
+            order = torch.argsort(member_ids * batch_size +
+                                  torch.arange(batch_size))
+            slots = torch.empty_like(member_ids)
+            slots[order] = torch.arange(batch_size) - (
+                torch.cumsum(counts, 0) - counts)[member_ids[order]]
+
+            def _stack(x):
+                y = x.new_zeros((m, n) + x.shape[1:])
+                y[slots, member_ids] = x
+                return y
+
+            def _unstack(x):
+                return x[slots, member_ids]
+
+        inputs = alf.nest.map_structure(_stack, inputs)
+        state = alf.nest.map_structure(_stack, state)
+        output, state = self._parallel_network(inputs, state)
+        output_spec = extract_spec(output, from_dim=2)
+        output = alf.nest.map_structure(
+            _unstack, dist_utils.distributions_to_params(output))
+        output = dist_utils.params_to_distributions(output, output_spec)
+        state = alf.nest.map_structure(_unstack, state)
+        return output, state
+
+
 @gin.configurable
 class SequentialNetwork(Network):
     """Network composed of a sequence of torch layers."""
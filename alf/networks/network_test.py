@@ -23,7 +23,9 @@ from alf.tensor_specs import TensorSpec
 from alf.initializers import _numerical_calculate_gain
 from alf.initializers import _calculate_gain
 from alf.networks import EncodingNetwork, LSTMEncodingNetwork
-from alf.networks.network import NaiveParallelNetwork
+from alf.networks.encoding_networks import ParallelEncodingNetwork
+from alf.networks.network import NaiveParallelNetwork, PopulationNetwork
+from alf.networks.network import population_members, population_networks
 
 
 class BaseNetwork(alf.networks.Network):
@@ -137,5 +139,41 @@ class NaiveParallelNetworkTest(alf.test.TestCase):
              (TensorSpec((4, 40)), TensorSpec((4, 40)))])
 
 
+class PopulationNetworkTest(alf.test.TestCase):
+    def test_population_network(self):
+        spec = TensorSpec((4, ))
+        with population_networks(3):
+            net = EncodingNetwork(spec, fc_layer_params=(8, ))
+        self.assertIsInstance(net, PopulationNetwork)
+        self.assertIsInstance(net._parallel_network, ParallelEncodingNetwork)
+        self.assertEqual(net.output_spec, TensorSpec((8, )))
+        # A network created outside of population_networks() is not stacked
+        self.assertNotIsInstance(
+            EncodingNetwork(spec, fc_layer_params=(8, )), PopulationNetwork)
+
+        x = torch.randn(6, 4)
+        member_ids = torch.tensor([0, 0, 1, 1, 2, 2])
+        with population_members(member_ids):
+            y, _ = net(x)
+        self.assertEqual(y.shape, (6, 8))
+
+        # The output does not depend on the order and the number of the
+        # samples of each member
+        perm = torch.tensor([3, 0, 5, 1, 4])
+        with population_members(member_ids[perm]):
+            y1, _ = net(x[perm])
+        self.assertTensorClose(y1, y[perm], epsilon=1e-6)
+
+        # Each member has its own parameters
+        with population_members(torch.zeros(6, dtype=torch.int64)):
+            y2, _ = net(x)
+        self.assertTensorClose(y2[:2], y[:2], epsilon=1e-6)
+        self.assertFalse(torch.allclose(y2[2:], y[2:]))
+
+        copy = net.copy()
+        self.assertIsInstance(copy, PopulationNetwork)
+        self.assertEqual(copy.population_size, 3)
+
+
 if __name__ == '__main__':
     alf.test.main()
@@ -19,6 +19,7 @@ import functools
 import torch
 import torch.nn as nn
 
+import alf
 from .encoding_networks import EncodingNetwork, LSTMEncodingNetwork
 from .preprocessor_networks import PreprocessorNetwork
 from alf.tensor_specs import TensorSpec
@@ -211,6 +212,31 @@ class ValueRNNNetwork(PreprocessorNetwork):
         value = value.reshape(value.shape[0], *self._output_spec.shape)
         return value, state
 
+    def forward_sequence(self, observation, state):
+        """Computes the values for a whole sequence.
+
+        It is equivalent to calling ``forward()`` for each step of the
+        sequence, which should not contain any episode boundary after its
+        first step.
+
+        Args:
+            observation (torch.Tensor): its shape is ``[T, B, ...]``
+            state (nest[tuple]): the states before the first step
+
+        Returns:
+            value (torch.Tensor): its shape is ``[T, B]``
+            new_state (nest[tuple]): the states after the last step
+        """
+        length, batch_size = alf.nest.get_nest_shape(observation)[:2]
+        observation = alf.nest.map_structure(
+            lambda x: x.reshape(-1, *x.shape[2:]), observation)
+        observation, state = super().forward(observation, state)
+        observation = observation.reshape(length, batch_size,
+                                          *observation.shape[1:])
+        value, state = self._encoding_net.forward_sequence(observation, state)
+        value = value.reshape(length, batch_size, *self._output_spec.shape)
+        return value, state
+
     @property
     def state_spec(self):
         return self._encoding_net.state_spec
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from contextlib import contextmanager
 import copy
 import gin
 import torch
@@ -38,6 +39,7 @@ def wrap_optimizer(cls):
     def __init__(self,
                  gradient_clipping=None,
                  clip_by_global_norm=False,
+                 flat_params=False,
                  name=None,
                  **kwargs):
         """
@@ -46,6 +48,17 @@ def wrap_optimizer(cls):
             clip_by_global_norm (bool): If True, use `tensor_utils.clip_by_global_norm`
                 to clip gradient. If False, use `tensor_utils.clip_by_norms` for
                 each grad.
+            flat_params (bool): If True, the data and gradients of the parameters
+                of each param group are moved into two flat buffers (see
+                ``tensor_utils.flatten_parameters()``) at the first ``step()``.
+                The underline optimizer then updates each param group as one
+                tensor, and global norm clipping is done on the flat gradients.
+                This reduces the number of small kernels for models with many
+                small parameters. Note that the gradients of all parameters are
+                always defined in this mode, so a parameter not used in the loss
+                is updated with zero gradient instead of being skipped. The
+                optimizer state can only be loaded into an optimizer with the
+                same ``flat_params`` and param groups.
             name (str): the name displayed when summarizing the gradient norm. If
                 None, then a global name in the format of "class_name_i" will be
                 created, where "i" is the global optimizer id.
@@ -65,6 +78,9 @@ def wrap_optimizer(cls):
         super(NewCls, self).__init__([{'params': []}], **kwargs)
         self._gradient_clipping = gradient_clipping
         self._clip_by_global_norm = clip_by_global_norm
+        self._flat_params = flat_params
+        # The flat parameter of each param group if ``flat_params``
+        self._flat_param_list = []
         self.name = name
         if name is None:
             self.name = NewClsName + str(NewCls.counter)
@@ -79,10 +95,14 @@ def wrap_optimizer(cls):
             lr = float(self._lr_scheduler())
             for param_group in self.param_groups:
                 param_group['lr'] = lr
+        if self._flat_params:
+            self._flatten_param_groups()
         if self._gradient_clipping is not None:
             params = []
             for param_group in self.param_groups:
                 params.extend(param_group["params"])
+            if self._flat_params and self._clip_by_global_norm:
+                params = self._flat_param_list
             grads = alf.nest.map_structure(lambda p: p.grad, params)
             if self._clip_by_global_norm:
                 _, global_norm = tensor_utils.clip_by_global_norm(
@@ -93,7 +113,88 @@ def wrap_optimizer(cls):
             else:
                 tensor_utils.clip_by_norms(
                     grads, self._gradient_clipping, in_place=True)
-        super(NewCls, self).step(closure=closure)
+        if self._flat_params:
+            with self._use_flat_param_groups():
+                super(NewCls, self).step(closure=closure)
+        else:
+            super(NewCls, self).step(closure=closure)
+
+    @common.add_method(NewCls)
+    def zero_grad(self, set_to_none=False):
+        """Zero the gradients of all parameters.
+
+        For the flattened param groups, the flat gradient is always zeroed in
+        place (even if ``set_to_none`` is True) so that the gradients of the
+        parameters remain its views.
+
+        Args:
+            set_to_none (bool): if True, set the gradients to None instead of
+                zeroing them.
+        """
+        if not self._flat_params and not set_to_none:
+            return super(NewCls, self).zero_grad()
+        for i, param_group in enumerate(self.param_groups):
+            if i < len(self._flat_param_list):
+                self._flat_param_list[i].grad.zero_()
+                continue
+            for p in param_group['params']:
+                if p.grad is None:
+                    continue
+                if set_to_none:
+                    p.grad = None
+                else:
+                    p.grad.detach_()
+                    p.grad.zero_()
+
+    @common.add_method(NewCls)
+    def _flatten_param_groups(self):
+        """Flatten the param groups added since the last call."""
+        for param_group in self.param_groups[len(self._flat_param_list):]:
+            if param_group['params']:
+                data, grad = tensor_utils.flatten_parameters(
+                    param_group['params'])
+            else:
+                data = torch.zeros(0)
+                grad = torch.zeros(0)
+            flat_param = torch.nn.Parameter(data)
+            flat_param.grad = grad
+            self._flat_param_list.append(flat_param)
+
+    @common.add_method(NewCls)
+    @contextmanager
+    def _use_flat_param_groups(self):
+        """Temporarily replace the parameters of each param group with its
+        flat parameter."""
+        self._flatten_param_groups()
+        param_groups = self.param_groups
+        self.param_groups = [
+            dict(param_group,
+                 params=[flat_param]) for param_group, flat_param in zip(
+                     param_groups, self._flat_param_list)
+        ]
+        try:
+            yield
+        finally:
+            # Hyper-parameters may be changed (e.g. by ``load_state_dict()``)
+            for param_group, flat_group in zip(param_groups,
+                                               self.param_groups):
+                param_group.update(
+                    (k, v) for k, v in flat_group.items() if k != 'params')
+            self.param_groups = param_groups
+
+    @common.add_method(NewCls)
+    def state_dict(self):
+        if not self._flat_params:
+            return super(NewCls, self).state_dict()
+        with self._use_flat_param_groups():
+            return super(NewCls, self).state_dict()
+
+    @common.add_method(NewCls)
+    def load_state_dict(self, state_dict):
+        if not self._flat_params:
+            return super(NewCls, self).load_state_dict(state_dict)
+        with self._use_flat_param_groups():
+            super(NewCls, self).load_state_dict(state_dict)
 
     return NewCls
 
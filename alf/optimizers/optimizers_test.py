@@ -55,6 +55,63 @@ class OptimizersTest(alf.test.TestCase):
         opt.step()
         self.assertTensorClose(_grad_norm(params), torch.as_tensor(clip_norm))
 
+    def test_flat_params(self):
+        def _make(flat_params):
+            torch.manual_seed(0)
+            model = torch.nn.Sequential(
+                torch.nn.Linear(5, 3), torch.nn.Linear(3, 1))
+            opt = Adam(
+                lr=0.1,
+                gradient_clipping=0.5,
+                clip_by_global_norm=True,
+                flat_params=flat_params)
+            opt.add_param_group({'params': model[0].parameters()})
+            opt.add_param_group({'params': model[1].parameters(), 'lr': 0.2})
+            return model, opt
+
+        models, opts = zip(_make(False), _make(True))
+        x = torch.randn(2, 5)
+        for _ in range(3):
+            for model, opt in zip(models, opts):
+                opt.zero_grad()
+                model(x).sum().backward()
+                opt.step()
+        for p1, p2 in zip(models[0].parameters(), models[1].parameters()):
+            self.assertTensorClose(p1, p2, epsilon=1e-6)
+            self.assertTensorClose(p1.grad, p2.grad, epsilon=1e-6)
+        self.assertIsNotNone(
+            tensor_utils.get_flat_view(list(models[1][0].parameters())))
+
+        # The optimizer state can be restored
+        model, opt = _make(True)
+        model.load_state_dict(models[1].state_dict())
+        opt.load_state_dict(opts[1].state_dict())
+        for m, o in [(model, opt), (models[1], opts[1])]:
+            o.zero_grad()
+            m(x).sum().backward()
+            o.step()
+        for p1, p2 in zip(model.parameters(), models[1].parameters()):
+            self.assertTensorClose(p1, p2, epsilon=1e-6)
+
+    def test_zero_grad_set_to_none(self):
+        for flat_params in [False, True]:
+            model = torch.nn.Linear(5, 3)
+            opt = Adam(lr=0.1, flat_params=flat_params)
+            opt.add_param_group({'params': model.parameters()})
+            model(torch.randn(2, 5)).sum().backward()
+            opt.step()
+            opt.zero_grad(set_to_none=True)
+            if flat_params:
+                # The flat gradient is zeroed in place and still aliased
+                for p in model.parameters():
+                    self.assertTensorEqual(p.grad, torch.zeros_like(p))
+                self.assertIsNotNone(
+                    tensor_utils.get_flat_view(
+                        [p.grad for p in model.parameters()]))
+            else:
+                for p in model.parameters():
+                    self.assertIsNone(p.grad)
+
 
 if __name__ == "__main__":
     alf.test.main()
@@ -13,13 +13,31 @@
 # limitations under the License.
 """Summary related functions."""
 
+from absl import logging
 import functools
 import numpy as np
+import queue
+import threading
+import time
 import torch
 from torch.utils.tensorboard import SummaryWriter
 from typing import Callable
 
-_summary_enabled = False
+
+class _ThreadState(threading.local):
+    """Summary states that are kept separately for each thread.
+
+    A thread other than the one enabling summary (e.g. the unroll thread used
+    by ``TrainerConfig.async_unroll``) does not write summaries and does not
+    change the name scope of the summaries written by other threads.
+    """
+
+    def __init__(self):
+        self.summary_enabled = False
+        self.scope_stack = ['']
+
+
+_thread_state = _ThreadState()
 
 _summarize_output = False
 
@@ -27,8 +45,6 @@ _default_writer: SummaryWriter = None
 
 _global_counter = np.array(0, dtype=np.int64)
 
-_scope_stack = ['']
-
 _record_if_stack = [
     lambda: True,
 ]
@@ -66,12 +82,12 @@ class scope(object):
         return self._name
 
     def __enter__(self):
-        scope_name = _scope_stack[-1] + self._name + '/'
-        _scope_stack.append(scope_name)
+        scope_name = _thread_state.scope_stack[-1] + self._name + '/'
+        _thread_state.scope_stack.append(scope_name)
         return scope_name
 
     def __exit__(self, type, value, traceback):
-        _scope_stack.pop()
+        _thread_state.scope_stack.pop()
 
 
 def _summary_wrapper(summary_func):
@@ -85,7 +101,7 @@ def _summary_wrapper(summary_func):
         if should_record_summaries():
             if step is None:
                 step = _global_counter
-            name = _scope_stack[-1] + name
+            name = _thread_state.scope_stack[-1] + name
             summary_func(name, data, step, **kwargs)
 
     return wrapper
@@ -203,7 +219,192 @@ class record_if(object):
         _record_if_stack.pop()
 
 
-def create_summary_writer(summary_dir, flush_secs=10, max_queue=10):
+def _copy_to_host(tensors):
+    """Copy ``tensors`` to CPU without blocking the caller.
+
+    The CUDA tensors with the same dtype are concatenated and copied to pinned
+    memory with one asynchronous copy.
+
+    Returns:
+        tuple:
+        - list[Tensor]: the CPU tensors. Their content is only valid after the
+          returned event is completed.
+        - Event|None: the CUDA event to wait for before reading the tensors.
+    """
+    results = list(tensors)
+    groups = {}
+    for i, t in enumerate(tensors):
+        if t.is_cuda:
+            groups.setdefault((t.device, t.dtype), []).append(i)
+    for (_, dtype), indices in groups.items():
+        flat = torch.cat([tensors[i].reshape(-1) for i in indices])
+        host = torch.empty(flat.shape, dtype=dtype, pin_memory=True)
+        host.copy_(flat, non_blocking=True)
+        sizes = [tensors[i].numel() for i in indices]
+        for i, h in zip(indices, host.split(sizes)):
+            results[i] = h.reshape(tensors[i].shape)
+    event = None
+    if groups:
+        event = torch.cuda.Event()
+        event.record()
+    return results, event
+
+
+class DeferredSummaryWriter(object):
+    """A summary writer which does not block the caller.
+
+    ``SummaryWriter`` converts the tensor of each scalar or histogram to numpy
+    when it is added, which forces a device synchronization for CUDA tensors,
+    and then serializes and queues the event. ``DeferredSummaryWriter`` instead
+    keeps a copy of the tensors on their devices. All the tensors added at
+    one step are copied to CPU together by one asynchronous copy when the
+    summaries of a new step are added (i.e. once per summary interval), or when
+    ``flush()`` or ``close()`` is called. The events are made and written by a
+    background thread after the copy completes.
+
+    Note that the summaries of the last step only appear in the event file after
+    the next summary step or ``flush()``.
+    """
+
+    def __init__(self, writer):
+        """
+        Args:
+            writer (SummaryWriter): the writer used by the background thread to
+                write the events.
+        """
+        self._writer = writer
+        self._pending_step = None
+        # list of (tag, step, walltime, Tensor)
+        self._pending_scalars = []
+        # list of (tag, step, walltime, Tensor, dict of histogram args)
+        self._pending_histograms = []
+        self._queue = queue.Queue()
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._run, name="DeferredSummaryWriter", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if self._error is None:
+                    func, args, kwargs = item
+                    func(*args, **kwargs)
+            except Exception as e:
+                logging.exception("Exception in the summary writing thread")
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _put(self, func, *args, **kwargs):
+        if self._error is not None:
+            raise RuntimeError(
+                "The summary writing thread failed") from self._error
+        self._queue.put((func, args, kwargs))
+
+    def _defer(self, step):
+        if self._pending_step is not None and step != self._pending_step:
+            self._transfer()
+        self._pending_step = step
+
+    def _transfer(self):
+        """Start copying the pending tensors to CPU and let the background
+        thread write them."""
+        scalars, self._pending_scalars = self._pending_scalars, []
+        histograms, self._pending_histograms = self._pending_histograms, []
+        self._pending_step = None
+        if not scalars and not histograms:
+            return
+        tensors = [x[3] for x in scalars] + [x[3] for x in histograms]
+        tensors, event = _copy_to_host(tensors)
+        self._put(self._write_pending, scalars, histograms, tensors, event)
+
+    def _write_pending(self, scalars, histograms, tensors, event):
+        if event is not None:
+            event.synchronize()
+        for (tag, step, walltime, _), value in zip(scalars, tensors):
+            self._writer.add_scalar(tag, value.item(), step, walltime=walltime)
+        for (tag, step, walltime, _, kwargs), value in zip(
+                histograms, tensors[len(scalars):]):
+            self._writer.add_histogram(
+                tag, value, step, walltime=walltime, **kwargs)
+
+    def add_scalar(self, tag, scalar_value, global_step=None, walltime=None):
+        """Same as ``SummaryWriter.add_scalar()``."""
+        step = None if global_step is None else int(global_step)
+        walltime = time.time() if walltime is None else walltime
+        if isinstance(scalar_value, torch.Tensor):
+            self._defer(step)
+            self._pending_scalars.append((tag, step, walltime,
+                                          scalar_value.detach().clone()))
+        else:
+            self._put(
+                self._writer.add_scalar,
+                tag,
+                scalar_value,
+                step,
+                walltime=walltime)
+
+    def add_histogram(self,
+                      tag,
+                      values,
+                      global_step=None,
+                      bins='tensorflow',
+                      walltime=None,
+                      max_bins=None):
+        """Same as ``SummaryWriter.add_histogram()``."""
+        step = None if global_step is None else int(global_step)
+        walltime = time.time() if walltime is None else walltime
+        kwargs = dict(bins=bins, max_bins=max_bins)
+        if isinstance(values, torch.Tensor):
+            self._defer(step)
+            self._pending_histograms.append((tag, step, walltime,
+                                             values.detach().clone(), kwargs))
+        else:
+            if isinstance(values, np.ndarray):
+                values = values.copy()
+            self._put(
+                self._writer.add_histogram,
+                tag,
+                values,
+                step,
+                walltime=walltime,
+                **kwargs)
+
+    def add_text(self, tag, text_string, global_step=None, walltime=None):
+        """Same as ``SummaryWriter.add_text()``."""
+        step = None if global_step is None else int(global_step)
+        walltime = time.time() if walltime is None else walltime
+        self._put(
+            self._writer.add_text, tag, text_string, step, walltime=walltime)
+
+    def flush(self):
+        """Write all the added summaries to the event file."""
+        self._transfer()
+        self._queue.join()
+        self._put(self._writer.flush)
+        self._queue.join()
+        if self._error is not None:
+            raise RuntimeError(
+                "The summary writing thread failed") from self._error
+
+    def close(self):
+        """Write all the added summaries and close the event file."""
+        try:
+            self.flush()
+        finally:
+            self._queue.put(None)
+            self._thread.join()
+            self._writer.close()
+
+
+def create_summary_writer(summary_dir,
+                          flush_secs=10,
+                          max_queue=10,
+                          deferred=False):
     """Ceates a SummaryWriter that will write out events to the event file.
 
     Args:
@@ -213,11 +414,17 @@ def create_summary_writer(summary_dir, flush_secs=10, max_queue=10):
             Default is ten items.
         flush_secs (int) – How often, in seconds, to flush the pending events
             and summaries to disk. Default is every 10 seconds.
+        deferred (bool): If True, return a ``DeferredSummaryWriter``, which
+            copies the tensors to CPU in one batch per summary step and writes
+            the events in a background thread.
     Returns:
-        SummaryWriter
+        SummaryWriter|DeferredSummaryWriter
     """
-    return SummaryWriter(
+    writer = SummaryWriter(
         log_dir=summary_dir, flush_secs=flush_secs, max_queue=max_queue)
+    if deferred:
+        writer = DeferredSummaryWriter(writer)
+    return writer
 
 
 def set_default_writer(writer):
@@ -231,19 +438,17 @@ def enable_summary(flag=True):
     Args:
         flag (bool): True to enable, False to disable
     """
-    global _summary_enabled
-    _summary_enabled = flag
+    _thread_state.summary_enabled = flag
 
 
 def disable_summary():
     """Disable summary."""
-    global _summary_enabled
-    _summary_enabled = False
+    _thread_state.summary_enabled = False
 
 
 def is_summary_enabled():
     """Return whether summary is enabled."""
-    return _summary_enabled
+    return _thread_state.summary_enabled
 
 
 def should_summarize_output(flag=None):
@@ -0,0 +1,422 @@
+# Copyright (c) 2020 Horizon Robotics and ALF Contributors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Serve ``predict_step()`` of an algorithm to environments in other processes.
+
+A ``PolicyServer`` listens on a local socket. Each ``PolicyClient`` sends the
+time steps of its (batched) environment and receives the actions. The requests
+from different clients arriving within a short time window are batched
+together for one ``predict_step()``. The policy states and the transform
+states of each client are kept by the server, so the clients only need to
+exchange time steps and actions.
+
+Together with ``Checkpointer``, the server can follow the checkpoints of a
+running training (see ``alf.bin.serve_policy``), so that the evaluation can run
+in separate processes concurrently with the training.
+"""
+
+from absl import logging
+import multiprocessing.connection as mp_connection
+import threading
+import time
+import torch
+
+import alf
+from alf.utils import common
+
+
+def _to_numpy(nest):
+    return alf.nest.map_structure(
+        lambda x: x.cpu().numpy() if isinstance(x, torch.Tensor) else x, nest)
+
+
+def _to_tensor(nest):
+    device = alf.get_default_device()
+    return alf.nest.map_structure(lambda x: torch.as_tensor(x, device=device),
+                                  nest)
+
+
+def _concat(nests):
+    if len(nests) == 1:
+        return nests[0]
+    return alf.nest.map_structure(lambda *xs: torch.cat(xs), *nests)
+
+
+def _slice(nest, begin, end):
+    return alf.nest.map_structure(lambda x: x[begin:end], nest)
+
+
+class _ClientState(object):
+    """The states of a connected client."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.batch_size = None
+        self.policy_state = None
+        self.trans_state = None
+
+
+class PolicyServer(object):
+    """Serve ``algorithm.predict_step()`` with dynamic batching.
+
+    The server waits for the first request, and then keeps collecting requests
+    from the other clients until the total batch size reaches
+    ``max_batch_size`` or ``max_wait_time`` has passed. ``max_wait_time``
+    trades the latency of each request for larger batches.
+
+    Each client should always use the same batch size.
+
+    Example:
+
+    .. code-block:: python
+
+        server = PolicyServer(algorithm, epsilon_greedy=0.)
+        server.start()
+        # In another process:
+        client = PolicyClient(server.address)
+        action = client.predict(time_step)
+    """
+
+    def __init__(self,
+                 algorithm,
+                 address=None,
+                 authkey=None,
+                 epsilon_greedy=0.1,
+                 max_batch_size=256,
+                 max_wait_time=1e-3,
+                 use_jit=False,
+                 checkpointer=None,
+                 reload_interval=None):
+        """
+        Args:
+            algorithm (RLAlgorithm): the algorithm whose ``predict_step()`` is
+                served.
+            address (str|tuple|None): the address to listen on. It can be a path
+                for a Unix domain socket or a tuple ``(host, port)`` for a TCP
+                socket. If None, a free Unix domain socket address is chosen,
+                which is available as ``address``.
+            authkey (bytes|None): if provided, the clients need to use the same
+                key to connect.
+            epsilon_greedy (float): passed to ``predict_step()``.
+            max_batch_size (int): stop waiting for more requests once the
+                total batch size of the collected requests reaches this.
+            max_wait_time (float): the longest time in seconds to wait for more
+                requests after the first one.
+            use_jit (bool): If True, ``predict_step()`` is traced by
+                ``torch.jit.trace()`` for each batch size. Only supported
+                for algorithms without predict state and transform state.
+                Note that the branches in ``predict_step()`` depending on the
+                values of the tensors are fixed by tracing.
+            checkpointer (Checkpointer|None): if provided, the latest checkpoint
+                is loaded at the beginning and then every ``reload_interval``
+                seconds if there is a new one.
+            reload_interval (float|None): how often to check for new
+                checkpoints. If None, the checkpoint is only loaded once.
+        """
+        self._algorithm = algorithm
+        self._epsilon_greedy = epsilon_greedy
+        self._max_batch_size = max_batch_size
+        self._max_wait_time = max_wait_time
+        self._checkpointer = checkpointer
+        self._reload_interval = reload_interval
+        self._checkpoint_step = None
+        self._last_reload_time = None
+        self._use_jit = use_jit
+        # traced predict functions keyed by batch size
+        self._traced = {}
+        self._listener = mp_connection.Listener(address, authkey=authkey)
+        self._authkey = authkey
+        self._clients = {}
+        self._new_conns = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._serve_thread = None
+        self._accept_thread = threading.Thread(
+            target=self._accept, name="PolicyServerAccept", daemon=True)
+        self._accept_thread.start()
+        self._num_requests = 0
+        self._num_batches = 0
+        self._num_samples = 0
+        algorithm.eval()
+        self._maybe_reload()
+
+    @property
+    def address(self):
+        """The address the server is listening on."""
+        return self._listener.address
+
+    @property
+    def checkpoint_step(self):
+        """The step of the loaded checkpoint. None if not loaded."""
+        return self._checkpoint_step
+
+    def get_stats(self):
+        """Get the statistics of the served requests.
+
+        Returns:
+            dict: with keys "requests", "batches" and "samples".
+        """
+        return dict(
+            requests=self._num_requests,
+            batches=self._num_batches,
+            samples=self._num_samples)
+
+    def _accept(self):
+        while not self._stop_event.is_set():
+            try:
+                conn = self._listener.accept()
+            except (OSError, EOFError, mp_connection.AuthenticationError):
+                if self._stop_event.is_set():
+                    return
+                logging.exception("Failed to accept a connection")
+                continue
+            with self._lock:
+                self._new_conns.append(conn)
+
+    def _maybe_reload(self):
+        if self._checkpointer is None:
+            return
+        now = time.time()
+        if self._last_reload_time is not None and (
+                self._reload_interval is None
+                or now - self._last_reload_time < self._reload_interval):
+            return
+        self._last_reload_time = now
+        step = self._checkpointer.get_latest_checkpoint_step()
+        if step is None or step == self._checkpoint_step:
+            return
+        self._checkpointer.load(
+            step, including_optimizer=False, including_replay_buffer=False)
+        self._checkpoint_step = step
+        # The traced functions may hold the old parameters.
+        self._traced = {}
+        logging.info("PolicyServer: loaded checkpoint %s" % step)
+
+    def _receive(self, conns, requests):
+        """Receive one request from each of ``conns``."""
+        for conn in conns:
+            client = self._clients[conn]
+            try:
+                time_step = conn.recv()
+            except (EOFError, OSError):
+                del self._clients[conn]
+                conn.close()
+                continue
+            requests.append((client, _to_tensor(time_step)))
+
+    def serve(self):
+        """Serve the requests in the current thread until ``stop()``."""
+        while not self._stop_event.is_set():
+            self._maybe_reload()
+            with self._lock:
+                for conn in self._new_conns:
+                    self._clients[conn] = _ClientState(conn)
+                self._new_conns = []
+            if not self._clients:
+                time.sleep(0.01)
+                continue
+            ready = mp_connection.wait(list(self._clients.keys()), timeout=0.1)
+            requests = []
+            self._receive(ready, requests)
+            if not requests:
+                continue
+            deadline = time.time() + self._max_wait_time
+            batch_size = sum(
+                alf.nest.get_nest_batch_size(ts) for _, ts in requests)
+            while batch_size < self._max_batch_size:
+                remaining = deadline - time.time()
+                requested = set(c.conn for c, _ in requests)
+                waiting = [c for c in self._clients if c not in requested]
+                if remaining <= 0 or not waiting:
+                    break
+                ready = mp_connection.wait(waiting, timeout=remaining)
+                if not ready:
+                    break
+                n = len(requests)
+                self._receive(ready, requests)
+                batch_size += sum(
+                    alf.nest.get_nest_batch_size(ts) for _, ts in requests[n:])
+            self._serve_requests(requests)
+
+    def _serve_requests(self, requests):
+        try:
+            actions = self._predict(requests)
+            replies = [('ok', _to_numpy(a)) for a in actions]
+        except Exception as e:
+            logging.exception("PolicyServer: failed to predict")
+            replies = [('error', repr(e))] * len(requests)
+        for (client, _), reply in zip(requests, replies):
+            try:
+                client.conn.send(reply)
+            except (EOFError, OSError):
+                self._clients.pop(client.conn, None)
+        self._num_requests += len(requests)
+        self._num_batches += 1
+
+    @torch.no_grad()
+    def _predict(self, requests):
+        algorithm = self._algorithm
+        sizes = []
+        for client, time_step in requests:
+            batch_size = alf.nest.get_nest_batch_size(time_step)
+            if client.batch_size is None:
+                client.batch_size = batch_size
+                client.policy_state = algorithm.get_initial_predict_state(
+                    batch_size)
+                client.trans_state = algorithm.get_initial_transform_state(
+                    batch_size)
+            assert batch_size == client.batch_size, (
+                "The batch size of a client should not change")
+            sizes.append(batch_size)
+        batch_size = sum(sizes)
+        time_step = _concat([ts for _, ts in requests])
+        policy_state = _concat([c.policy_state for c, _ in requests])
+        trans_state = _concat([c.trans_state for c, _ in requests])
+        policy_state = common.reset_state_if_necessary(
+            policy_state, algorithm.get_initial_predict_state(batch_size),
+            time_step.is_first())
+        time_step, trans_state = algorithm.transform_timestep(
+            time_step, trans_state)
+        if self._use_jit and not alf.nest.flatten(
+                policy_state) and not alf.nest.flatten(trans_state):
+            action = self._predict_with_jit(time_step)
+        else:
+            policy_step = algorithm.predict_step(time_step, policy_state,
+                                                 self._epsilon_greedy)
+            action = policy_step.output
+            policy_state = policy_step.state
+
+        actions = []
+        begin = 0
+        for (client, _), size in zip(requests, sizes):
+            end = begin + size
+            actions.append(_slice(action, begin, end))
+            client.policy_state = _slice(policy_state, begin, end)
+            client.trans_state = _slice(trans_state, begin, end)
+            begin = end
+        self._num_samples += batch_size
+        return actions
+
+    def _predict_with_jit(self, time_step):
+        batch_size = alf.nest.get_nest_batch_size(time_step)
+        flat_inputs = alf.nest.flatten(time_step)
+        traced = self._traced.get(batch_size)
+        if traced is None:
+            algorithm = self._algorithm
+            policy_state = algorithm.get_initial_predict_state(batch_size)
+            output_structure = []
+
+            def _predict(*flat):
+                ts = alf.nest.pack_sequence_as(time_step, flat)
+                output = algorithm.predict_step(ts, policy_state,
+                                                self._epsilon_greedy).output
+                output_structure.append(output)
+                return tuple(alf.nest.flatten(output))
+
+            # The parameters are traced as constants, which is not allowed for
+            # tensors requiring grad. The traced functions are discarded when
+            # a new checkpoint is loaded.
+            params = [p for p in algorithm.parameters() if p.requires_grad]
+            for p in params:
+                p.requires_grad_(False)
+            try:
+                fn = torch.jit.trace(
+                    _predict, tuple(flat_inputs), check_trace=False)
+            finally:
+                for p in params:
+                    p.requires_grad_(True)
+            traced = (fn, output_structure[0])
+            self._traced[batch_size] = traced
+        fn, output_structure = traced
+        return alf.nest.pack_sequence_as(output_structure,
+                                         list(fn(*flat_inputs)))
+
+    def start(self):
+        """Start serving in a background thread."""
+        self._serve_thread = threading.Thread(
+            target=self.serve, name="PolicyServer", daemon=True)
+        self._serve_thread.start()
+
+    def stop(self):
+        """Stop serving and close all the connections."""
+        self._stop_event.set()
+        if self._serve_thread is not None:
+            self._serve_thread.join()
+            self._serve_thread = None
+        # Wake up the accept thread
+        try:
+            mp_connection.Client(self.address, authkey=self._authkey).close()
+        except (OSError, EOFError):
+            pass
+        self._accept_thread.join()
+        self._listener.close()
+        for conn in list(self._clients.keys()) + self._new_conns:
+            conn.close()
+        self._clients = {}
+        self._new_conns = []
+
+
+class PolicyClient(object):
+    """Get the actions for time steps from a ``PolicyServer``."""
+
+    def __init__(self, address, authkey=None):
+        """
+        Args:
+            address (str|tuple): the address of the server
+            authkey (bytes|None): the key to connect to the server
+        """
+        self._conn = mp_connection.Client(address, authkey=authkey)
+
+    def predict(self, time_step):
+        """Get the action for ``time_step``.
+
+        Args:
+            time_step (TimeStep): the batched time step from the environment
+        Returns:
+            nested Tensor: the action
+        """
+        self._conn.send(_to_numpy(time_step))
+        status, result = self._conn.recv()
+        if status != 'ok':
+            raise RuntimeError("PolicyServer failed: %s" % result)
+        return _to_tensor(result)
+
+    def close(self):
+        """Close the connection."""
+        self._conn.close()
+
+
+def run_episodes(env, client, num_episodes, metrics=[]):
+    """Run ``num_episodes`` episodes of ``env`` with actions from ``client``.
+
+    Args:
+        env (AlfEnvironment): the environment
+        client (PolicyClient): the client connected to a ``PolicyServer``
+        num_episodes (int): the number of episodes to run. The episodes of all
+            the environments in the batch are counted.
+        metrics (list[StepMetric]): metrics to be updated with the time steps
+    Returns:
+        int: the number of environment steps
+    """
+    time_step = common.get_initial_time_step(env)
+    episodes = 0
+    steps = 0
+    while episodes < num_episodes:
+        action = client.predict(time_step)
+        next_time_step = env.step(action)
+        for metric in metrics:
+            metric(time_step.cpu())
+        time_step = next_time_step
+        steps += 1
+        episodes += int(time_step.is_last().sum())
+    return steps
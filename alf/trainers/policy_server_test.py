@@ -0,0 +1,197 @@
+# Copyright (c) 2020 Horizon Robotics and ALF Contributors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from absl.testing import parameterized
+from functools import partial
+import os
+import tempfile
+import threading
+import torch
+
+import alf
+from alf.algorithms.actor_critic_algorithm import ActorCriticAlgorithm
+from alf.algorithms.config import TrainerConfig
+from alf.algorithms.rl_algorithm_test import MyEnv
+from alf.networks import (ActorDistributionNetwork,
+                          ActorDistributionRNNNetwork, ValueNetwork,
+                          ValueRNNNetwork)
+from alf.trainers.policy_server import PolicyClient, PolicyServer, run_episodes
+from alf.utils import common
+from alf.utils.checkpoint_utils import Checkpointer
+
+
+def _create_algorithm(rnn=False):
+    config = TrainerConfig(root_dir="dummy", unroll_length=5)
+    obs_spec = alf.TensorSpec((2, ), dtype='float32')
+    action_spec = alf.BoundedTensorSpec(
+        shape=(), dtype='int64', minimum=0, maximum=2)
+    if rnn:
+        actor_network = partial(
+            ActorDistributionRNNNetwork,
+            fc_layer_params=(10, ),
+            lstm_hidden_size=4,
+            actor_fc_layer_params=(8, ))
+        value_network = partial(
+            ValueRNNNetwork,
+            fc_layer_params=(10, ),
+            lstm_hidden_size=4,
+            value_fc_layer_params=(8, ))
+    else:
+        actor_network = partial(
+            ActorDistributionNetwork, fc_layer_params=(10, 8))
+        value_network = partial(ValueNetwork, fc_layer_params=(10, 8))
+    return ActorCriticAlgorithm(
+        observation_spec=obs_spec,
+        action_spec=action_spec,
+        actor_network_ctor=actor_network,
+        value_network_ctor=value_network,
+        config=config,
+        optimizer=alf.optimizers.Adam(lr=1e-2))
+
+
+def _run_client(address, batch_size, num_steps, results):
+    env = MyEnv(batch_size)
+    client = PolicyClient(address)
+    time_step = common.get_initial_time_step(env)
+    time_steps = []
+    actions = []
+    for _ in range(num_steps):
+        action = client.predict(time_step)
+        time_steps.append(time_step)
+        actions.append(action)
+        time_step = env.step(action)
+    client.close()
+    results.append((time_steps, actions))
+
+
+def _local_actions(alg, time_steps):
+    batch_size = time_steps[0].step_type.shape[0]
+    state = alg.get_initial_predict_state(batch_size)
+    actions = []
+    with torch.no_grad():
+        for time_step in time_steps:
+            state = common.reset_state_if_necessary(
+                state, alg.get_initial_predict_state(batch_size),
+                time_step.is_first())
+            policy_step = alg.predict_step(time_step, state, 0.)
+            state = policy_step.state
+            actions.append(policy_step.output)
+    return actions
+
+
+class PolicyServerTest(parameterized.TestCase, alf.test.TestCase):
+    @parameterized.parameters((False, False), (True, False), (False, True))
+    def test_policy_server(self, rnn, use_jit):
+        alg = _create_algorithm(rnn)
+        server = PolicyServer(
+            alg, epsilon_greedy=0., max_wait_time=0.01, use_jit=use_jit)
+        server.start()
+        results = []
+        threads = [
+            threading.Thread(
+                target=_run_client,
+                args=(server.address, batch_size, 20, results))
+            for batch_size in [1, 2, 3]
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        server.stop()
+
+        self.assertEqual(len(results), 3)
+        for time_steps, actions in results:
+            # The actions from the server are same as predicting with the
+            # states of each client separately.
+            local_actions = _local_actions(alg, time_steps)
+            for a, b in zip(actions, local_actions):
+                self.assertTensorEqual(a, b)
+        stats = server.get_stats()
+        self.assertEqual(stats['requests'], 60)
+        self.assertEqual(stats['samples'], 120)
+        # Some of the requests are batched.
+        self.assertLess(stats['batches'], 60)
+
+    def test_reload_checkpoint(self):
+        with tempfile.TemporaryDirectory() as ckpt_dir:
+            alg = _create_algorithm()
+            Checkpointer(ckpt_dir, algorithm=alg).save(10)
+            server_alg = _create_algorithm()
+            server = PolicyServer(
+                server_alg,
+                epsilon_greedy=0.,
+                checkpointer=Checkpointer(ckpt_dir, algorithm=server_alg),
+                reload_interval=0.)
+            self.assertEqual(server.checkpoint_step, 10)
+            for p, q in zip(alg.parameters(), server_alg.parameters()):
+                self.assertTensorEqual(p, q)
+
+            for p in alg.parameters():
+                p.data.add_(1.)
+            Checkpointer(ckpt_dir, algorithm=alg).save(20)
+            server.start()
+            client = PolicyClient(server.address)
+            env = MyEnv(2)
+            self.assertEqual(run_episodes(env, client, 3) >= 3, True)
+            client.close()
+            server.stop()
+            self.assertEqual(server.checkpoint_step, 20)
+            for p, q in zip(alg.parameters(), server_alg.parameters()):
+                self.assertTensorEqual(p, q)
+
+    def test_client_error(self):
+        alg = _create_algorithm()
+        server = PolicyServer(alg)
+        server.start()
+        client = PolicyClient(server.address)
+        time_step = common.get_initial_time_step(MyEnv(2))
+        client.predict(time_step)
+        # The batch size of a client cannot change.
+        with self.assertRaises(RuntimeError):
+            client.predict(common.get_initial_time_step(MyEnv(3)))
+        client.close()
+        server.stop()
+
+    def test_batching(self):
+        num_clients = 8
+        num_steps = 20
+        alg = _create_algorithm(rnn=True)
+        # Wait long enough for all the connected clients.
+        server = PolicyServer(alg, max_wait_time=10.)
+        server.start()
+        results = []
+        threads = [
+            threading.Thread(
+                target=_run_client,
+                args=(server.address, 2, num_steps, results))
+            for _ in range(num_clients)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        server.stop()
+
+        self.assertEqual(len(results), num_clients)
+        stats = server.get_stats()
+        self.assertEqual(stats['requests'], num_clients * num_steps)
+        self.assertEqual(stats['samples'], 2 * num_clients * num_steps)
+        # Once all the clients are connected, each batch has the requests of
+        # all of them. Only the clients connecting in the middle of a step can
+        # miss a batch.
+        self.assertLessEqual(stats['batches'], num_steps + num_clients)
+
+
+if __name__ == '__main__':
+    alf.test.main()
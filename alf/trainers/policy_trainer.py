@@ -15,6 +15,7 @@
 
 import abc
 from absl import logging
+import contextlib
 import gin
 import math
 import os
@@ -33,8 +34,11 @@ from alf.environments.utils import create_environment
 from alf.nest import map_structure
 from alf.tensor_specs import TensorSpec
 from alf.utils import common
+from alf.utils import data_parallel
 from alf.utils import git_utils
 from alf.utils import math_ops
+from alf.utils import mixed_precision
+from alf.utils import profiler
 from alf.utils.checkpoint_utils import Checkpointer
 import alf.utils.datagen as datagen
 from alf.utils.summary_utils import record_time
@@ -142,15 +146,32 @@ class Trainer(object):
         self._summary_interval = config.summary_interval
         self._summaries_flush_secs = config.summaries_flush_secs
         self._summary_max_queue = config.summary_max_queue
+        self._deferred_summary = config.deferred_summary
         self._debug_summaries = config.debug_summaries
         self._summarize_grads_and_vars = config.summarize_grads_and_vars
         self._config = config
 
-        self._random_seed = common.set_random_seed(config.random_seed)
+        self._rank = data_parallel.get_rank()
+        num_learners = data_parallel.get_world_size()
+        random_seed = config.random_seed
+        if num_learners > 1:
+            if config.mini_batch_size is not None:
+                # Each learner uses ``mini_batch_size // num_learners``
+                # samples (see ``Algorithm.train_from_replay_buffer()``)
+                assert config.mini_batch_size % num_learners == 0, (
+                    "mini_batch_size should be a multiple of num_learners")
+            if random_seed is not None:
+                random_seed += self._rank
+            # Only the learner with rank 0 evaluates.
+            self._evaluate = self._evaluate and self._rank == 0
+
+        self._random_seed = common.set_random_seed(random_seed)
 
     def train(self):
         """Perform training."""
         self._restore_checkpoint()
+        if data_parallel.is_distributed():
+            data_parallel.broadcast_parameters(self._algorithm)
         alf.summary.enable_summary()
 
         self._checkpoint_requested = False
@@ -163,6 +184,13 @@ class Trainer(object):
         logging.info("Use `kill -%s %s` to request debugging." % (int(
             signal.SIGUSR1), os.getpid()))
 
+        if (self._config.timeline_profiling
+                and data_parallel.is_main_process()):
+            profiler.set_profiler(
+                profiler.TimelineProfiler(
+                    self._train_dir,
+                    sample_interval=self._config.timeline_profiling_interval))
+
         checkpoint_saved = False
         try:
             if self._config.profiling:
@@ -170,12 +198,23 @@ class Trainer(object):
                 pr = cProfile.Profile()
                 pr.enable()
 
-            common.run_under_record_context(
-                self._train,
-                summary_dir=self._train_dir,
-                summary_interval=self._summary_interval,
-                flush_secs=self._summaries_flush_secs,
-                summary_max_queue=self._summary_max_queue)
+            compute_dtype = None
+            if self._config.mixed_precision:
+                compute_dtype = mixed_precision.default_compute_dtype()
+                logging.info(
+                    "Mixed precision training with %s" % compute_dtype)
+            with mixed_precision.autocast(compute_dtype):
+                if data_parallel.is_main_process():
+                    common.run_under_record_context(
+                        self._train,
+                        summary_dir=self._train_dir,
+                        summary_interval=self._summary_interval,
+                        flush_secs=self._summaries_flush_secs,
+                        summary_max_queue=self._summary_max_queue,
+                        deferred_summary=self._deferred_summary)
+                else:
+                    # Only the learner with rank 0 writes summaries
+                    self._train()
 
             if self._config.profiling:
                 pr.disable()
@@ -190,11 +229,18 @@ class Trainer(object):
             self._save_checkpoint()
             checkpoint_saved = True
         finally:
-            if self._config.confirm_checkpoint_upon_crash and not checkpoint_saved:
+            if (self._config.confirm_checkpoint_upon_crash
+                    and not checkpoint_saved
+                    and data_parallel.is_main_process()):
                 ans = input("Do you want to save checkpoint? (y/n): ")
                 if ans.lower().startswith('y'):
                     self._save_checkpoint()
+            # Make sure the checkpoint being written in background is finished
+            self._checkpointer.wait()
             self._close()
+            if profiler.get_profiler() is not None:
+                profiler.get_profiler().close()
+                profiler.set_profiler(None)
 
     @staticmethod
     def progress():
@@ -223,6 +269,8 @@ class Trainer(object):
         pass
 
     def _summarize_training_setting(self):
+        if not data_parallel.is_main_process():
+            return
         # We need to wait for one iteration to get the operative args
         # Right just give a fixed gin file name to store operative args
         common.write_gin_configs(self._root_dir, "configured.gin")
@@ -248,8 +296,24 @@ class Trainer(object):
         self._debug_requested = True
 
     def _save_checkpoint(self):
+        if not data_parallel.is_main_process():
+            # The checkpoint is saved by the learner with rank 0
+            return
         global_step = alf.summary.get_global_counter()
-        self._checkpointer.save(global_step=global_step)
+        with self._pause_algorithm():
+            self._checkpointer.save(global_step=global_step)
+
+    @contextlib.contextmanager
+    def _pause_algorithm(self, loading=False):
+        """Get a context within which the background threads of the algorithm
+        (if any) do not access the states to be checkpointed.
+
+        Args:
+            loading (bool): whether the states are loaded from a checkpoint
+                within the context, in which case the data prepared by the
+                background threads before loading should be discarded.
+        """
+        yield
 
     def _restore_checkpoint(self, checkpointer):
         """Retore from saved checkpoint.
@@ -264,7 +328,12 @@ class Trainer(object):
             self._algorithm.train_iter()
 
         try:
-            recovered_global_step = checkpointer.load()
+            with self._pause_algorithm(loading=True):
+                # The checkpoint is saved by the learner with rank 0. Its
+                # replay buffer only contains the experiences of that learner,
+                # so the other learners keep their own.
+                recovered_global_step = checkpointer.load(
+                    including_replay_buffer=data_parallel.is_main_process())
             self._trainer_progress.update()
         except Exception as e:
             raise RuntimeError(
@@ -396,8 +465,9 @@ class RLTrainer(Trainer):
 
         while True:
             t0 = time.time()
-            with record_time("time/train_iter"):
-                train_steps = self._algorithm.train_iter()
+            with profiler.iteration(iter_num):
+                with record_time("time/train_iter"):
+                    train_steps = self._algorithm.train_iter()
             t = time.time() - t0
             logging.log_every_n_seconds(
                 logging.INFO,
@@ -443,16 +513,34 @@ class RLTrainer(Trainer):
                 import pdb
                 pdb.set_trace()
 
+        # Stop the background unroll (if any) before the final checkpoint
+        self._algorithm.finish_train()
+
     def _close(self):
         """Closing operations after training. """
+        self._algorithm.finish_train()
         self._close_envs()
 
+    def _pause_algorithm(self, loading=False):
+        # The replay buffer and the environments are accessed by the background
+        # unroll thread if ``config.async_unroll`` is True. The replay buffer
+        # and the data transformer are accessed by the prefetch threads if
+        # ``config.replay_prefetch_size`` is positive.
+        return self._algorithm.pause_unroll(discard_prefetched=loading)
+
     def _restore_checkpoint(self):
+        modules = dict(
+            algorithm=self._algorithm, trainer_progress=self._trainer_progress)
+        if data_parallel.is_main_process():
+            # The metrics of the other learners are about their own
+            # environments, which are not saved.
+            modules['metrics'] = nn.ModuleList(self._algorithm.get_metrics())
         checkpointer = Checkpointer(
             ckpt_dir=os.path.join(self._train_dir, 'algorithm'),
-            algorithm=self._algorithm,
-            metrics=nn.ModuleList(self._algorithm.get_metrics()),
-            trainer_progress=self._trainer_progress)
+            async_save=self._config.async_checkpoint,
+            incremental_replay_buffer=(
+                self._config.incremental_replay_buffer_checkpoint),
+            **modules)
 
         super()._restore_checkpoint(checkpointer)
 
@@ -538,8 +626,9 @@ class SLTrainer(Trainer):
         while True:
             logging.info("-" * 68)
             logging.info("Epoch: {}".format(epoch_num + 1))
-            with record_time("time/train_iter"):
-                self._algorithm.train_iter()
+            with profiler.iteration(epoch_num):
+                with record_time("time/train_iter"):
+                    self._algorithm.train_iter()
 
             if self._evaluate and (epoch_num + 1) % self._eval_interval == 0:
                 self._algorithm.evaluate()
@@ -572,6 +661,9 @@ class SLTrainer(Trainer):
     def _restore_checkpoint(self):
         checkpointer = Checkpointer(
             ckpt_dir=os.path.join(self._train_dir, 'algorithm'),
+            async_save=self._config.async_checkpoint,
+            incremental_replay_buffer=(
+                self._config.incremental_replay_buffer_checkpoint),
             algorithm=self._algorithm,
             trainer_progress=self._trainer_progress)
 
@@ -13,15 +13,17 @@
 # limitations under the License.
 
 import functools
+import gin
 import tempfile
 import torch
+from unittest.mock import patch
 
 import alf
 from alf.algorithms.hypernetwork_algorithm import HyperNetwork
 from alf.algorithms.rl_algorithm_test import MyEnv, MyAlg
 from alf.trainers.policy_trainer import RLTrainer, TrainerConfig, play
 from alf.trainers.policy_trainer import create_dataset, SLTrainer
-from alf.utils import common
+from alf.utils import common, data_parallel
 
 
 class MyRLTrainer(RLTrainer):
@@ -83,6 +85,73 @@ class TrainerTest(alf.test.TestCase):
 
             # TODO: test play. Need real env to test.
 
+    def test_rl_trainer_async_unroll(self):
+        with tempfile.TemporaryDirectory() as root_dir:
+            conf = TrainerConfig(
+                algorithm_ctor=functools.partial(MyAlg, on_policy=False),
+                root_dir=root_dir,
+                unroll_length=5,
+                mini_batch_length=2,
+                mini_batch_size=6,
+                whole_replay_buffer_training=False,
+                clear_replay_buffer=False,
+                async_unroll=True,
+                num_checkpoints=2,
+                num_iterations=20)
+            trainer = MyRLTrainer(conf)
+            trainer.train()
+            self.assertEqual(RLTrainer.progress(), 1)
+            self.assertIsNone(trainer._algorithm._async_unroller)
+
+            # The checkpoint is loaded while the unroll thread is running
+            conf.num_iterations = 40
+            new_trainer = MyRLTrainer(conf)
+            new_trainer._restore_checkpoint()
+            self.assertEqual(RLTrainer.progress(), 0.5)
+            new_trainer.train()
+            self.assertEqual(RLTrainer.progress(), 1)
+
+    def test_rl_trainer_restore_data_parallel(self):
+        gin.bind_parameter('ReplayBuffer.enable_checkpoint', True)
+        self.addCleanup(gin.clear_config)
+        with tempfile.TemporaryDirectory() as root_dir:
+            conf = TrainerConfig(
+                algorithm_ctor=functools.partial(MyAlg, on_policy=False),
+                root_dir=root_dir,
+                unroll_length=5,
+                mini_batch_length=2,
+                mini_batch_size=6,
+                whole_replay_buffer_training=False,
+                clear_replay_buffer=False,
+                num_iterations=10)
+            trainer = MyRLTrainer(conf)
+            trainer.train()
+            replay_buffer_size = int(
+                trainer._algorithm._exp_replayer.total_size)
+            env_steps = int(trainer._algorithm.get_metrics()[1].result())
+            self.assertEqual(replay_buffer_size, 150)
+
+            # Only the learner with rank 0 restores the replay buffer and the
+            # metrics. The other learners only have what is collected by the
+            # iteration before loading the checkpoint.
+            for is_main_process in [True, False]:
+                new_trainer = MyRLTrainer(conf)
+                with patch.object(
+                        data_parallel,
+                        'is_main_process',
+                        return_value=is_main_process):
+                    new_trainer._restore_checkpoint()
+                alg = new_trainer._algorithm
+                size = int(alg._exp_replayer.total_size)
+                steps = int(alg.get_metrics()[1].result())
+                if is_main_process:
+                    self.assertEqual(size, replay_buffer_size)
+                    self.assertEqual(steps, env_steps)
+                else:
+                    self.assertEqual(size, 15)
+                    self.assertLess(steps, env_steps)
+                self.assertEqual(RLTrainer.progress(), 1)
+
     def test_sl_trainer(self):
         with tempfile.TemporaryDirectory() as root_dir:
             conf = TrainerConfig(
@@ -13,10 +13,13 @@
 # limitations under the License.
 
 from absl import logging
+import copy
 import glob
 import os
+import threading
 import torch
 from torch import nn
+from typing import NamedTuple
 import warnings
 
 
@@ -45,15 +48,59 @@ def enable_checkpoint(module, flag=True):
     module._alf_checkpoint_enabled = flag
 
 
+class _RowUpdate(NamedTuple):
+    """The rows of a replay buffer tensor changed since the previous checkpoint.
+
+    The rows are indexed by the first two dimensions of the tensor (i.e.,
+    the slots ``(env, position)`` of a ``RingBuffer``). ``values`` is of shape
+    ``[len(rows), -1]``.
+    """
+    shape: torch.Size
+    rows: torch.Tensor
+    values: torch.Tensor
+
+
+def _atomic_save(obj, f_path):
+    """Save ``obj`` to ``f_path`` so that ``f_path`` is either complete or
+    absent even if the process is killed during saving."""
+    tmp_path = f_path + '.tmp'
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, f_path)
+
+
 class Checkpointer(object):
-    """A checkpoint manager for saving and loading checkpoints."""
+    """A checkpoint manager for saving and loading checkpoints.
 
-    def __init__(self, ckpt_dir, **kwargs):
+    The files of a checkpoint are written to temporary files and renamed when
+    complete. The model file ``ckpt-{global_step}``, which marks the checkpoint
+    as available, is renamed last. So the 'latest' checkpoint is always the last
+    fully written one.
+    """
+
+    def __init__(self,
+                 ckpt_dir,
+                 async_save=False,
+                 incremental_replay_buffer=False,
+                 **kwargs):
         """A class for making checkpoints.
 
         Args:
             ckpt_dir: The directory to save checkpoints. Create ckpt_dir if
                 it doesn't exist.
+            async_save (bool): If True, ``save()`` only copies the states to a
+                staging area in CPU memory and the files are written by a
+                background thread, so that the training can continue during
+                the writing. The staging area is reused by later checkpoints
+                and needs as much memory as the checkpoint. ``wait()`` should be
+                called to make sure the last checkpoint is written.
+            incremental_replay_buffer (bool): If True, only the rows (i.e.,
+                ``(env, position)`` slots) of the replay buffer tensors changed
+                since the previous ``save()`` are written, together with the step
+                of the previous checkpoint. Loading such a checkpoint loads all
+                the previous checkpoints it depends on back to the first
+                ``save()`` of this ``Checkpointer``, which writes the whole
+                replay buffer. A copy of the replay buffer is kept in CPU memory
+                for finding the changed rows.
             kwargs: Items to be included in the checkpoint. Each item needs
                 to have state_dict and load_state_dict implemented.
                 For instance of Algorithm, only the root need to be passed in,
@@ -72,6 +119,14 @@ class Checkpointer(object):
         self._modules = kwargs
         self._ckpt_dir = ckpt_dir
         self._global_step = -1
+        self._async_save = async_save
+        self._incremental_replay_buffer = incremental_replay_buffer
+        # The staged copies of the tensors of the states keyed by their paths
+        self._staging = {}
+        # The step of the previous checkpoint saved by this Checkpointer
+        self._prev_saved_step = None
+        self._save_thread = None
+        self._save_error = None
 
         os.makedirs(self._ckpt_dir, exist_ok=True)
 
@@ -177,8 +232,9 @@ class Checkpointer(object):
                 for k in new[mk].keys():
                     merged[mk][k] = new[mk][k]
 
+        self.wait()
         if global_step == "latest":
-            global_step = self._get_latest_checkpoint_step()
+            global_step = self.get_latest_checkpoint_step()
 
         if global_step is None:
             warnings.warn("There is no checkpoint in directory %s. "
@@ -201,11 +257,14 @@ class Checkpointer(object):
                 f_path + '-optimizer', map_location=map_location)
             _merge_checkpoint(checkpoint, opt_checkpoint)
         if including_replay_buffer:
-            replay_buffer_checkpoint = torch.load(
-                f_path + '-replay_buffer', map_location=map_location)
+            replay_buffer_checkpoint = self._load_replay_buffer_checkpoint(
+                global_step, map_location)
             _merge_checkpoint(checkpoint, replay_buffer_checkpoint)
 
         self._global_step = checkpoint["global_step"]
+        # The staged replay buffer does not match the loaded one. So the next
+        # checkpoint needs to save the whole replay buffer.
+        self._prev_saved_step = None
         for k in self._modules.keys():
             _remove_ignored_parameters(checkpoint[k])
             _convert_legacy_parameter(checkpoint[k])
@@ -216,7 +275,35 @@ class Checkpointer(object):
 
         return self._global_step
 
-    def _get_latest_checkpoint_step(self):
+    def _load_replay_buffer_checkpoint(self, global_step, map_location):
+        """Load the replay buffer checkpoint of ``global_step`` and apply it to
+        the checkpoints it depends on if it is incremental."""
+        f_path = os.path.join(self._ckpt_dir,
+                              "ckpt-{0}-replay_buffer".format(global_step))
+        checkpoint = torch.load(f_path, map_location=map_location)
+        base_step = checkpoint.pop('base_step', None)
+        if base_step is None:
+            return checkpoint
+        base = self._load_replay_buffer_checkpoint(base_step, map_location)
+        for k, state in checkpoint.items():
+            for name, value in state.items():
+                if isinstance(value, _RowUpdate):
+                    t = base[k][name]
+                    assert t.shape == value.shape, (
+                        "Inconsistent shape of %s in ckpt-%s-replay_buffer" %
+                        (name, base_step))
+                    t.view(t.shape[0] * t.shape[1],
+                           -1)[value.rows] = value.values.to(t.device)
+                else:
+                    base[k][name] = value
+        return base
+
+    def get_latest_checkpoint_step(self):
+        """Get the step of the latest checkpoint in the checkpoint directory.
+
+        Returns:
+            int|None: None if there is no checkpoint.
+        """
         file_names = glob.glob(os.path.join(self._ckpt_dir, "ckpt-*"))
         if not file_names:
             return None
@@ -242,7 +329,7 @@ class Checkpointer(object):
                 "latest" is in the checkpoint directory.
         """
         if global_step == "latest":
-            global_step = self._get_latest_checkpoint_step()
+            global_step = self.get_latest_checkpoint_step()
             if global_step is None:
                 return False
         f_path = os.path.join(self._ckpt_dir, "ckpt-{0}".format(global_step))
@@ -264,6 +351,84 @@ class Checkpointer(object):
 
         return model_state, optimizer_state, replay_buffer_state
 
+    def _stage(self, value, path):
+        """Copy ``value`` to the staging area.
+
+        The tensors are copied to CPU tensors reused across checkpoints. Other
+        values are deep copied.
+        """
+        if isinstance(value, torch.Tensor):
+            value = value.detach()
+            buf = self._staging.get(path)
+            if (buf is None or buf.shape != value.shape
+                    or buf.dtype != value.dtype):
+                buf = torch.empty_like(value, device='cpu')
+                self._staging[path] = buf
+            buf.copy_(value)
+            return buf
+        elif isinstance(value, dict):
+            staged = type(value)(
+                (k, self._stage(v, path + (k, ))) for k, v in value.items())
+            if hasattr(value, '_metadata'):
+                staged._metadata = copy.deepcopy(value._metadata)
+            return staged
+        elif isinstance(value, (list, tuple)) and type(value) in (list, tuple):
+            return type(value)(
+                self._stage(v, path + (i, )) for i, v in enumerate(value))
+        else:
+            return copy.deepcopy(value)
+
+    def _stage_row_update(self, value, path):
+        """Copy the rows of ``value`` changed since the previous ``save()``
+        to the staging area.
+
+        Returns:
+            _RowUpdate | Tensor: the changed rows, or the staged tensor if
+            ``value`` is not in the previous checkpoint.
+        """
+        value = value.detach()
+        buf = self._staging.get(path)
+        if (self._prev_saved_step is None or value.ndim < 2 or buf is None
+                or buf.shape != value.shape or buf.dtype != value.dtype):
+            return self._stage(value, path)
+        n = value.shape[0] * value.shape[1]
+        new_rows = value.cpu().reshape(n, -1)
+        old_rows = buf.reshape(n, -1)
+        rows = (new_rows != old_rows).any(dim=1).nonzero().squeeze(1)
+        values = new_rows[rows]
+        old_rows[rows] = values
+        return _RowUpdate(shape=value.shape, rows=rows, values=values)
+
+    def _write(self, f_path, model_state, optimizer_state,
+               replay_buffer_state):
+        """Write the files of a checkpoint. The model file is written last."""
+        _atomic_save(replay_buffer_state, f_path + '-replay_buffer')
+        _atomic_save(optimizer_state, f_path + '-optimizer')
+        _atomic_save(model_state, f_path)
+        logging.info("Checkpoint '{}' is saved successfully.".format(
+            os.path.basename(f_path)))
+
+    def _write_in_background(self, *args):
+        try:
+            self._write(*args)
+        except Exception as e:
+            logging.exception("Failed to save checkpoint")
+            self._save_error = e
+
+    def wait(self):
+        """Wait until the checkpoint being written in background is finished.
+
+        Raises:
+            RuntimeError: if writing the checkpoint failed.
+        """
+        if self._save_thread is not None:
+            self._save_thread.join()
+            self._save_thread = None
+        if self._save_error is not None:
+            error = self._save_error
+            self._save_error = None
+            raise RuntimeError("Failed to save checkpoint") from error
+
     def save(self, global_step):
         """Save states of all modules to checkpoint
         Args:
@@ -272,6 +437,12 @@ class Checkpointer(object):
                 the checkpoint as a suffix. This function will also save a copy
                 of the latest checkpoint in a file named 'latest'.
         """
+        # The staging area can only be reused after the previous checkpoint
+        # is written.
+        self.wait()
+        # ``global_step`` may be the global counter, which is changed in place
+        # by the training.
+        global_step = copy.deepcopy(global_step)
         self._global_step = global_step
         f_path = os.path.join(self._ckpt_dir, "ckpt-{0}".format(global_step))
         state = {
@@ -288,11 +459,34 @@ class Checkpointer(object):
             optimizer_state[k] = opts
             replay_buffer_state[k] = rs
 
-        model_state['global_step'] = global_step
-
-        torch.save(model_state, f_path)
-        torch.save(optimizer_state, f_path + '-optimizer')
-        torch.save(replay_buffer_state, f_path + '-replay_buffer')
+        if self._incremental_replay_buffer:
+            replay_buffer_state = {
+                k: type(rs)(
+                    (name,
+                     self._stage_row_update(value, ('replay_buffer', k,
+                                                    name)) if
+                     isinstance(value, torch.Tensor) else copy.deepcopy(value))
+                    for name, value in rs.items())
+                for k, rs in replay_buffer_state.items()
+            }
+            if self._prev_saved_step is not None:
+                replay_buffer_state['base_step'] = self._prev_saved_step
+        elif self._async_save:
+            replay_buffer_state = self._stage(replay_buffer_state,
+                                              ('replay_buffer', ))
+        if self._async_save:
+            model_state = self._stage(model_state, ('model', ))
+            optimizer_state = self._stage(optimizer_state, ('optimizer', ))
 
-        logging.info(
-            "Checkpoint 'ckpt-{}' is saved successfully.".format(global_step))
+        model_state['global_step'] = global_step
+        self._prev_saved_step = int(global_step)
+
+        args = (f_path, model_state, optimizer_state, replay_buffer_state)
+        if self._async_save:
+            self._save_thread = threading.Thread(
+                target=self._write_in_background,
+                args=args,
+                name="CheckpointWriter")
+            self._save_thread.start()
+        else:
+            self._write(*args)
@@ -14,6 +14,7 @@
 
 from absl.testing import parameterized
 from collections import OrderedDict
+import copy
 import numpy as np
 import functools
 import json
@@ -591,5 +592,131 @@ class TestLoadStateDictForParallelNetwork(parameterized.TestCase,
             len(list(p_net_w_shared_preprocessor.parameters())))
 
 
+class Replayer(nn.Module):
+    def __init__(self, num_envs, capacity):
+        super().__init__()
+        self.register_buffer("_data", torch.zeros(num_envs, capacity, 3))
+        self.register_buffer("_step", torch.zeros(num_envs, capacity))
+        self.register_buffer("_current_pos",
+                             torch.zeros(num_envs, dtype=torch.int64))
+
+
+class AlgWithReplayer(Algorithm):
+    def __init__(self, num_envs=4, capacity=100):
+        super().__init__(
+            optimizer=alf.optimizers.Adam(lr=0.1), name="AlgWithReplayer")
+        self._net = nn.Linear(3, 2)
+        self._exp_replayer = Replayer(num_envs, capacity)
+
+    def observe(self, step, n):
+        replayer = self._exp_replayer
+        for _ in range(n):
+            pos = replayer._current_pos % replayer._data.shape[1]
+            env_ids = torch.arange(replayer._data.shape[0])
+            replayer._data[env_ids, pos] = float(step)
+            replayer._step[env_ids, pos] = float(step)
+            replayer._current_pos += 1
+
+    def train_step(self):
+        loss = self._net(torch.ones(3)).sum()
+        self.update_with_gradient(LossInfo(loss=loss))
+
+
+class TestAsyncCheckpoint(alf.test.TestCase):
+    def _assert_state_dict_equal(self, sd1, sd2):
+        self.assertEqual(sd1.keys(), sd2.keys())
+        for k in sd1.keys():
+            if isinstance(sd1[k], torch.Tensor):
+                self.assertTensorEqual(sd1[k], sd2[k])
+            else:
+                # optimizer state keyed by the ids of the parameters
+                states1 = list(sd1[k]['state'].values())
+                states2 = list(sd2[k]['state'].values())
+                self.assertEqual(len(states1), len(states2))
+                for s1, s2 in zip(states1, states2):
+                    self.assertTensorEqual(s1['exp_avg'], s2['exp_avg'])
+
+    def test_async_save(self):
+        with tempfile.TemporaryDirectory() as ckpt_dir:
+            alg = AlgWithReplayer()
+            ckpt_mngr = ckpt_utils.Checkpointer(
+                ckpt_dir, async_save=True, alg=alg)
+            for step in range(3):
+                alg.observe(step, 10)
+                alg.train_step()
+                ckpt_mngr.save(step)
+            expected = copy.deepcopy(alg.state_dict())
+            # The changes after ``save()`` do not affect the checkpoint
+            alg.observe(3, 10)
+            alg.train_step()
+            ckpt_mngr.wait()
+            self.assertEqual(
+                sorted(os.listdir(ckpt_dir)),
+                sorted('ckpt-%d%s' % (step, suffix) for step in range(3)
+                       for suffix in ['', '-optimizer', '-replay_buffer']))
+
+            alg2 = AlgWithReplayer()
+            ckpt_mngr2 = ckpt_utils.Checkpointer(ckpt_dir, alg=alg2)
+            self.assertEqual(ckpt_mngr2.load(), 2)
+            self._assert_state_dict_equal(alg2.state_dict(), expected)
+
+    def test_latest_is_complete(self):
+        with tempfile.TemporaryDirectory() as ckpt_dir:
+            alg = AlgWithReplayer()
+            ckpt_mngr = ckpt_utils.Checkpointer(ckpt_dir, alg=alg)
+            ckpt_mngr.save(1)
+            # Simulate a checkpoint interrupted during writing
+            for f in ['ckpt-2-replay_buffer', 'ckpt-2-optimizer.tmp']:
+                shutil.copy(
+                    os.path.join(ckpt_dir, 'ckpt-1-replay_buffer'),
+                    os.path.join(ckpt_dir, f))
+            self.assertEqual(ckpt_mngr.load(), 1)
+
+    def test_incremental_replay_buffer(self):
+        with tempfile.TemporaryDirectory() as ckpt_dir:
+            alg = AlgWithReplayer()
+            ckpt_mngr = ckpt_utils.Checkpointer(
+                ckpt_dir, incremental_replay_buffer=True, alg=alg)
+            alg.observe(0, 50)
+            ckpt_mngr.save(0)
+            alg.observe(1, 10)
+            ckpt_mngr.save(1)
+            alg.observe(2, 5)
+            ckpt_mngr.save(2)
+            expected = copy.deepcopy(alg.state_dict())
+
+            delta = torch.load(os.path.join(ckpt_dir, 'ckpt-2-replay_buffer'))
+            self.assertEqual(delta['base_step'], 1)
+            update = delta['alg']['_exp_replayer._data']
+            self.assertIsInstance(update, ckpt_utils._RowUpdate)
+            # Only the 5 new positions of each of the 4 environments are saved
+            self.assertEqual(update.values.shape, (20, 3))
+            update = delta['alg']['_exp_replayer._step']
+            self.assertEqual(update.values.shape, (20, 1))
+            self.assertLess(
+                os.path.getsize(
+                    os.path.join(ckpt_dir, 'ckpt-2-replay_buffer')),
+                os.path.getsize(
+                    os.path.join(ckpt_dir, 'ckpt-0-replay_buffer')))
+
+            alg2 = AlgWithReplayer()
+            ckpt_mngr2 = ckpt_utils.Checkpointer(
+                ckpt_dir, incremental_replay_buffer=True, alg=alg2)
+            self.assertEqual(ckpt_mngr2.load(), 2)
+            self._assert_state_dict_equal(alg2.state_dict(), expected)
+
+            alg3 = AlgWithReplayer()
+            ckpt_utils.Checkpointer(ckpt_dir, alg=alg3).load(1)
+            self.assertEqual(int(alg3._exp_replayer._current_pos[0]), 60)
+
+            # The first checkpoint after loading saves the whole replay buffer
+            alg2.observe(3, 1)
+            ckpt_mngr2.save(3)
+            full = torch.load(os.path.join(ckpt_dir, 'ckpt-3-replay_buffer'))
+            self.assertNotIn('base_step', full)
+            self.assertTensorEqual(full['alg']['_exp_replayer._data'],
+                                   alg2._exp_replayer._data)
+
+
 if __name__ == '__main__':
     alf.test.main()
@@ -26,6 +26,7 @@ import numpy as np
 import os
 import random
 import shutil
+import threading
 import time
 import torch
 import torch.distributions as td
@@ -36,7 +37,7 @@ import alf
 import alf.nest as nest
 from alf.tensor_specs import TensorSpec, BoundedTensorSpec
 from alf.utils.spec_utils import zeros_from_spec as zero_tensor_from_nested_spec
-from . import dist_utils, gin_utils
+from . import dist_utils, gin_utils, tensor_utils
 
 
 def add_method(cls):
@@ -168,6 +169,49 @@ def get_target_updater(models, target_models, tau=1.0, period=1, copy=True):
     models = as_list(models)
     target_models = as_list(target_models)
 
+    def _get_params(models):
+        params = []
+        for m in models:
+            params.extend([m] if isinstance(m, nn.Parameter) else m.
+                          parameters())
+        return params
+
+    params = _get_params(models)
+    target_params = _get_params(target_models)
+    flat_cache = {}
+
+    def _get_flat_params():
+        """Get the flat views of ``params`` and ``target_params``.
+
+        ``params`` are stored back to back if they are flattened by an
+        optimizer with ``flat_params=True``. In that case, ``target_params``
+        are also flattened (if they do not share storage with other tensors)
+        so that the whole update is one operation.
+
+        Returns:
+            tuple: the two flat views, or ``None`` if not possible.
+        """
+        key = (params[0].data_ptr(), target_params[0].data_ptr())
+        if key in flat_cache:
+            return flat_cache[key]
+        flat = tensor_utils.get_flat_view(params)
+        target_flat = tensor_utils.get_flat_view(target_params)
+        if (flat is not None and target_flat is None
+                and all(t.shape == p.shape and t.dtype == p.dtype and t.device
+                        == p.device and tensor_utils.owns_storage(t)
+                        for p, t in zip(params, target_params))):
+            target_flat, _ = tensor_utils.flatten_parameters(
+                target_params, with_grad=False)
+        if (flat is None or target_flat is None
+                or flat.shape != target_flat.shape):
+            result = None
+        else:
+            result = (flat, target_flat)
+        flat_cache.clear()
+        flat_cache[(params[0].data_ptr(),
+                    target_params[0].data_ptr())] = result
+        return result
+
     def _copy_model_or_parameter(s, t):
         if isinstance(s, nn.Parameter):
             t.data.copy_(s)
@@ -187,7 +231,16 @@ def get_target_updater(models, target_models, tau=1.0, period=1, copy=True):
             _copy_model_or_parameter(model, target_model)
 
     def update():
-        if tau != 1.0:
+        flat = None
+        if params and len(params) == len(target_params):
+            flat = _get_flat_params()
+        if flat is not None:
+            with torch.no_grad():
+                if tau != 1.0:
+                    flat[1].lerp_(flat[0], tau)
+                else:
+                    flat[1].copy_(flat[0])
+        elif tau != 1.0:
             for model, target_model in zip(models, target_models):
                 _lerp_model_or_parameter(model, target_model)
         else:
@@ -236,7 +289,8 @@ def run_under_record_context(func,
                              summary_dir,
                              summary_interval,
                              flush_secs,
-                             summary_max_queue=10):
+                             summary_max_queue=10,
+                             deferred_summary=False):
     """Run ``func`` under summary record context.
 
     Args:
@@ -248,10 +302,15 @@ def run_under_record_context(func,
         flush_secs (int): flush summary to disk every so many seconds
         summary_max_queue (int): the largest number of summaries to keep in a queue;
             will flush once the queue gets bigger than this. Defaults to 10.
+        deferred_summary (bool): whether to use ``alf.summary.DeferredSummaryWriter``
+            so that recording summaries does not synchronize with the device.
     """
     summary_dir = os.path.expanduser(summary_dir)
     summary_writer = alf.summary.create_summary_writer(
-        summary_dir, flush_secs=flush_secs, max_queue=summary_max_queue)
+        summary_dir,
+        flush_secs=flush_secs,
+        max_queue=summary_max_queue,
+        deferred=deferred_summary)
     global_step = alf.summary.get_global_counter()
 
     def _cond():
@@ -742,10 +801,16 @@ EXE_MODE_EVAL = 3
 # during training (vs unroll).  This is also used in tensorboard plotting of
 # network output values, evaluation of the same network during rollout vs eval vs
 # replay will be plotted to different graphs.
-_exe_mode = EXE_MODE_OTHER
+# The mode is kept per thread so that an unroll running in a background thread
+# (see ``TrainerConfig.async_unroll``) does not change the mode of training.
+_exe_mode_state = threading.local()
 _exe_mode_strs = ["other", "rollout", "replay", "eval"]
 
 
+def _get_exe_mode():
+    return getattr(_exe_mode_state, 'mode', EXE_MODE_OTHER)
+
+
 def set_exe_mode(mode):
     """Mark whether the current code belongs to unrolling or training. This flag
     might be used to change the behavior of some functions accordingly.
@@ -753,28 +818,27 @@ def set_exe_mode(mode):
     Args:
         training (bool): True for training, False for unrolling
     """
-    global _exe_mode
-    _exe_mode = mode
+    _exe_mode_state.mode = mode
 
 
 def exe_mode_name():
     """return the execution mode as string.
     """
-    return _exe_mode_strs[_exe_mode]
+    return _exe_mode_strs[_get_exe_mode()]
 
 
 def is_replay():
     """Return a bool value indicating whether the current code belongs to
     unrolling or training.
     """
-    return _exe_mode == EXE_MODE_REPLAY
+    return _get_exe_mode() == EXE_MODE_REPLAY
 
 
 def is_rollout():
     """Return a bool value indicating whether the current code belongs to
     unrolling or training.
     """
-    return _exe_mode == EXE_MODE_ROLLOUT
+    return _get_exe_mode() == EXE_MODE_ROLLOUT
 
 
 def mark_eval(func):
@@ -786,7 +850,7 @@ def mark_eval(func):
     """
 
     def _func(*args, **kwargs):
-        old_mode = _exe_mode
+        old_mode = _get_exe_mode()
         set_exe_mode(EXE_MODE_EVAL)
         ret = func(*args, **kwargs)
         set_exe_mode(old_mode)
@@ -804,7 +868,7 @@ def mark_replay(func):
     """
 
     def _func(*args, **kwargs):
-        old_mode = _exe_mode
+        old_mode = _get_exe_mode()
         set_exe_mode(EXE_MODE_REPLAY)
         ret = func(*args, **kwargs)
         set_exe_mode(old_mode)
@@ -822,7 +886,7 @@ def mark_rollout(func):
     """
 
     def _func(*args, **kwargs):
-        old_mode = _exe_mode
+        old_mode = _get_exe_mode()
         set_exe_mode(EXE_MODE_ROLLOUT)
         ret = func(*args, **kwargs)
         set_exe_mode(old_mode)
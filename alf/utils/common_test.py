@@ -15,9 +15,11 @@
 from absl import logging
 from contextlib import redirect_stderr
 from io import StringIO
+import torch
 
 import alf
 import alf.utils.common as common
+from alf.utils import tensor_utils
 
 
 class WraningOnceTest(alf.test.TestCase):
@@ -43,5 +45,30 @@ class WraningOnceTest(alf.test.TestCase):
             assert msg in gen_msg
 
 
+class TargetUpdaterTest(alf.test.TestCase):
+    def test_flat_target_updater(self):
+        def _make():
+            return torch.nn.Sequential(
+                torch.nn.Linear(3, 4), torch.nn.Linear(4, 2))
+
+        for flat in [False, True]:
+            model = _make()
+            target_model = _make()
+            if flat:
+                tensor_utils.flatten_parameters(list(model.parameters()))
+            updater = common.get_target_updater(
+                model, target_model, tau=0.5, copy=False)
+            expected = [
+                0.5 * (p + t)
+                for p, t in zip(model.parameters(), target_model.parameters())
+            ]
+            updater()
+            for e, t in zip(expected, target_model.parameters()):
+                self.assertTensorClose(e, t)
+            flat_target = tensor_utils.get_flat_view(
+                list(target_model.parameters()))
+            self.assertEqual(flat_target is not None, flat)
+
+
 if __name__ == '__main__':
     alf.test.main()
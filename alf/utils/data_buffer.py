@@ -13,10 +13,15 @@
 # limitations under the License.
 """Classes for storing data for sampling."""
 
+import fcntl
 import functools
 import gin
 from multiprocessing import Event, RLock
+import numpy as np
+import os
+import threading
 import time
+import zlib
 
 import torch
 import torch.nn as nn
@@ -25,13 +30,15 @@ import alf
 from alf.nest import get_nest_batch_size
 from alf.tensor_specs import TensorSpec
 from alf.nest.utils import convert_device
+from alf.utils import data_parallel
 
 
 def atomic(func):
     """Make class member function atomic by checking ``class._lock``.
 
     Can only be applied on class methods, whose containing class
-    must have ``_lock`` set to ``None`` or a ``multiprocessing.Lock`` object.
+    must have ``_lock`` set to ``None`` or a ``multiprocessing.Lock`` or
+    ``threading.Lock`` object.
 
     Args:
         func (callable): the function to be wrapped.
@@ -55,9 +62,159 @@ def atomic(func):
     return atomic_deco(func)
 
 
+def _get_codec(compression, level, dtype):
+    """Get the functions for compressing and decompressing a numpy array."""
+    if compression == "zlib":
+        level = 1 if level is None else level
+        compress = lambda a: zlib.compress(a.tobytes(), level)
+        decompress = lambda b: np.frombuffer(zlib.decompress(b), dtype=dtype)
+    elif compression == "lz4":
+        import lz4.frame
+        level = 0 if level is None else level
+        compress = lambda a: lz4.frame.compress(
+            a.tobytes(), compression_level=level)
+        decompress = lambda b: np.frombuffer(
+            lz4.frame.decompress(b), dtype=dtype)
+    elif compression == "png":
+        import cv2
+        assert dtype == np.uint8, "png compression only supports uint8"
+        level = 1 if level is None else level
+
+        def compress(a):
+            # Encode the array as a gray image with the last dimension as
+            # the width.
+            a = a.reshape(-1, a.shape[-1] if a.ndim > 0 else 1)
+            _, buf = cv2.imencode('.png', a,
+                                  [cv2.IMWRITE_PNG_COMPRESSION, level])
+            return buf.tobytes()
+
+        decompress = lambda b: cv2.imdecode(
+            np.frombuffer(b, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    else:
+        raise ValueError("Unsupported compression: %s" % compression)
+    return compress, decompress
+
+
+class CompressedTensorStore(object):
+    """Store a ``[num_environments, max_length, ...]`` tensor with each of its
+    ``[num_environments * max_length]`` items compressed separately.
+
+    It is used by ``RingBuffer`` for ``compressed_fields``. It supports the
+    indexing used by ``RingBuffer`` and ``ReplayBuffer``: writing with a 1-D
+    tensor of flat indices (i.e., ``env_id * max_length + idx``), and reading
+    with flat indices or a tuple of (env_ids, idx) tensors (or slices) in the
+    same way as a tensor. The items requested by one read are decompressed
+    only once even if some of them are requested multiple times (e.g., the
+    overlapping frames of ``FrameStacker``).
+
+    The items which have never been written are zeros.
+    """
+
+    def __init__(self,
+                 tensor_spec,
+                 num_environments,
+                 max_length,
+                 compression="zlib",
+                 compression_level=None):
+        """
+        Args:
+            tensor_spec (TensorSpec): spec of one item.
+            num_environments (int): number of environments.
+            max_length (int): number of items for each environment.
+            compression (str): one of "zlib", "lz4" and "png". "lz4" requires
+                the ``lz4`` package. "png" (lossless) only supports uint8
+                data and is typically the most compact for images.
+            compression_level (int): compression level. If None, a fast level
+                is used.
+        """
+        self._shape = tuple(tensor_spec.shape)
+        self._dtype = tensor_spec.dtype
+        self._np_dtype = torch.empty((), dtype=self._dtype).numpy().dtype
+        self._num_envs = num_environments
+        self._max_length = max_length
+        self._compression = compression
+        self._compress, self._decompress = _get_codec(
+            compression, compression_level, self._np_dtype)
+        self._zero = np.zeros(self._shape, dtype=self._np_dtype)
+        self._blobs = [None] * (num_environments * max_length)
+        self._nbytes = 0
+        self._num_items = 0
+
+    @property
+    def shape(self):
+        return (self._num_envs, self._max_length) + self._shape
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def nbytes(self):
+        """The total number of bytes of the compressed items."""
+        return self._nbytes
+
+    @property
+    def num_items(self):
+        """The number of items which have been written."""
+        return self._num_items
+
+    def _flat_indices(self, indices):
+        if isinstance(indices, torch.Tensor):
+            return indices.to(torch.int64)
+        indices = [i for i in indices if i is not Ellipsis]
+        if len(indices) == 1:
+            indices.append(slice(None))
+        assert len(indices) == 2, "Unsupported indices: %s" % (indices, )
+        env_ids, idx = indices
+        if isinstance(env_ids, slice) and isinstance(idx, slice):
+            env_ids = torch.arange(self._num_envs)[env_ids].unsqueeze(-1)
+            idx = torch.arange(self._max_length)[idx]
+        return env_ids.to(torch.int64) * self._max_length + idx
+
+    def __getitem__(self, indices):
+        flat_indices = self._flat_indices(indices).cpu()
+        unique, inverse = torch.unique(flat_indices, return_inverse=True)
+        items = [self._get_item(i) for i in unique.tolist()]
+        items = np.stack(items) if items else np.zeros(
+            (0, ) + self._shape, dtype=self._np_dtype)
+        return torch.from_numpy(items)[inverse]
+
+    def __setitem__(self, flat_indices, values):
+        values = values.detach().cpu().numpy()
+        for i, value in zip(flat_indices.tolist(), values):
+            blob = self._compress(np.ascontiguousarray(value))
+            old_blob = self._blobs[i]
+            if old_blob is None:
+                self._num_items += 1
+            else:
+                self._nbytes -= len(old_blob)
+            self._nbytes += len(blob)
+            self._blobs[i] = blob
+
+    def _get_item(self, i):
+        blob = self._blobs[i]
+        if blob is None:
+            return self._zero
+        return self._decompress(blob).reshape(self._shape)
+
+    def state_dict(self):
+        return dict(compression=self._compression, blobs=self._blobs)
+
+    def load_state_dict(self, state):
+        assert state['compression'] == self._compression, (
+            "The compression is different: %s vs. %s" % (state['compression'],
+                                                         self._compression))
+        assert len(state['blobs']) == len(self._blobs)
+        self._blobs = list(state['blobs'])
+        self._nbytes = sum(len(b) for b in self._blobs if b is not None)
+        self._num_items = sum(b is not None for b in self._blobs)
+
+
 class RingBuffer(nn.Module):
     """Batched Ring Buffer.
 
+    Multithreading safe, optionally via: ``allow_multithread`` flag.
+
     Multiprocessing safe, optionally via: ``allow_multiprocess`` flag, blocking
     modes to ``enqueue`` and ``dequeue``, a stop event to terminate blocked
     processes, and putting buffer into shared memory.
@@ -76,6 +233,11 @@ class RingBuffer(nn.Module):
     as the actual index of the element in the underlying store (``_buffer``).
     That means ``idx == pos % _max_length`` is always true, and one should use
     ``_buffer[idx]`` to retrieve the stored data.
+
+    Optionally, the data can be stored in memory-mapped files instead of in
+    memory (see ``mmap_dir``) so that the size of the buffer is not limited by
+    the RAM, and some fields (e.g. image observations) can be stored compressed
+    (see ``compressed_fields``).
     """
 
     def __init__(self,
@@ -84,6 +246,11 @@ class RingBuffer(nn.Module):
                  max_length=1024,
                  device="cpu",
                  allow_multiprocess=False,
+                 allow_multithread=False,
+                 mmap_dir=None,
+                 compressed_fields=None,
+                 compression="zlib",
+                 compression_level=None,
                  name="RingBuffer"):
         """
         Args:
@@ -95,6 +262,37 @@ class RingBuffer(nn.Module):
             device (str): A torch device to place the Variables and ops.
             allow_multiprocess (bool): if ``True``, allows multiple processes
                 to write and read the buffer asynchronously.
+            allow_multithread (bool): if ``True``, allows multiple threads of
+                the same process to write and read the buffer asynchronously.
+                It's implied by ``allow_multiprocess``.
+            mmap_dir (str): if provided, the data is stored in memory-mapped
+                files in this directory, one file for each tensor of
+                ``data_spec`` named as ``<name>[.<path>].bin``, where
+                ``<path>`` is the path of the tensor in ``data_spec``. For
+                data parallel training, ``<name>`` is followed by
+                ``.rank<rank>`` of the learner. The files are locked by the
+                buffer, so creating another buffer with the same files before
+                this buffer is garbage collected raises ``RuntimeError``. The
+                data is not included in ``state_dict()``. Instead, the files
+                are flushed when ``state_dict()`` is called, and they are
+                reused by a buffer created with the same ``mmap_dir``, ``name``
+                and shapes. So a checkpoint and resume only needs to save and
+                load the small indexing tensors of the buffer. Note that the
+                data added after the checkpoint overwrites the files, so after
+                resuming from an earlier checkpoint, some of the stored
+                experiences may be newer than the checkpoint. Only supported
+                for ``device="cpu"`` and ``allow_multiprocess=False``.
+            compressed_fields (list[str]): paths of the fields in
+                ``data_spec`` (e.g. "observation" or "observation.image") to be
+                stored compressed. Each step of each environment is compressed
+                separately using ``CompressedTensorStore``. Decompression
+                happens when the data is read. The compressed data is included
+                in ``state_dict()``. Only supported for ``device="cpu"`` and
+                ``allow_multiprocess=False``.
+            compression (str): compression method for ``compressed_fields``.
+                See ``CompressedTensorStore`` for the available methods.
+            compression_level (int): compression level for
+                ``compressed_fields``.
             name (str): name of the replay buffer.
         """
         super().__init__()
@@ -113,6 +311,10 @@ class RingBuffer(nn.Module):
             # notify a finished enqueue event, so blocked dequeues may start
             self._enqueued = Event()
             self._enqueued.clear()
+        elif allow_multithread:
+            self._lock = threading.RLock()
+            self._dequeued = None
+            self._enqueued = None
         else:
             self._lock = None
             self._dequeued = None
@@ -126,6 +328,72 @@ class RingBuffer(nn.Module):
             buffer_id[0] += 1
             return buf
 
+        self._mmap_arrays = []
+        self._mmap_files = []
+        mmap_name = name
+        if data_parallel.is_distributed():
+            # The learners on the same host each have their own buffer.
+            mmap_name += ".rank%d" % data_parallel.get_rank()
+
+        def _create_mmap_buffer(path, tensor_spec):
+            filename = os.path.join(
+                mmap_dir, mmap_name + ("." + path if path else "") + ".bin")
+            # Lock the file as long as this buffer exists so that two buffers
+            # (e.g. of the members of a population) cannot silently share it.
+            # The lock conflicts with the locks of the same process as well.
+            file = open(filename, 'ab')
+            try:
+                fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                file.close()
+                for f in self._mmap_files:
+                    f.close()
+                raise RuntimeError(
+                    "%s is already used by another buffer. Each buffer needs "
+                    "a different name or mmap_dir." % filename)
+            self._mmap_files.append(file)
+            shape = (num_environments, max_length) + tuple(tensor_spec.shape)
+            dtype = torch.empty((), dtype=tensor_spec.dtype).numpy().dtype
+            nbytes = int(np.prod(shape)) * dtype.itemsize
+            # Reuse the existing file so that the data can be restored from
+            # a checkpoint.
+            if os.path.isfile(filename) and os.path.getsize(
+                    filename) == nbytes:
+                mode = 'r+'
+            else:
+                mode = 'w+'
+            array = np.memmap(filename, dtype=dtype, mode=mode, shape=shape)
+            self._mmap_arrays.append(array)
+            return torch.from_numpy(array)
+
+        self._compressed_stores = []
+        compressed_fields = compressed_fields or []
+
+        def _create_buffer_with_path(path, tensor_spec):
+            if any(path == field or path.startswith(field + ".")
+                   for field in compressed_fields):
+                store = CompressedTensorStore(
+                    tensor_spec,
+                    num_environments,
+                    max_length,
+                    compression=compression,
+                    compression_level=compression_level)
+                self._compressed_stores.append(store)
+                return store
+            elif mmap_dir is not None:
+                return _create_mmap_buffer(path, tensor_spec)
+            else:
+                return _create_buffer(tensor_spec)
+
+        if mmap_dir is not None or compressed_fields:
+            assert device == "cpu", ("mmap_dir and compressed_fields are only "
+                                     "supported for device='cpu'")
+            assert not allow_multiprocess, (
+                "mmap_dir and compressed_fields are not supported with "
+                "allow_multiprocess")
+        if mmap_dir is not None:
+            os.makedirs(mmap_dir, exist_ok=True)
+
         with alf.device(self._device):
             self.register_buffer(
                 "_current_size",
@@ -137,9 +405,16 @@ class RingBuffer(nn.Module):
             self.register_buffer(
                 "_current_pos", torch.zeros(
                     num_environments, dtype=torch.int64))
-            self._buffer = alf.nest.map_structure(_create_buffer, data_spec)
+            if mmap_dir is None and not compressed_fields:
+                self._buffer = alf.nest.map_structure(_create_buffer,
+                                                      data_spec)
+            else:
+                self._buffer = alf.nest.py_map_structure_with_path(
+                    _create_buffer_with_path, data_spec)
+            # CompressedTensorStore can be directly indexed by flat indices.
             self._flattened_buffer = alf.nest.map_structure(
-                lambda x: x.view(-1, *x.shape[2:]), self._buffer)
+                lambda x: x if isinstance(x, CompressedTensorStore) else x.
+                view(-1, *x.shape[2:]), self._buffer)
 
         if allow_multiprocess:
             self.share_memory()
@@ -149,6 +424,50 @@ class RingBuffer(nn.Module):
         """The device where the data is stored in."""
         return self._device
 
+    @atomic
+    def flush(self):
+        """Write the data to the memory-mapped files if ``mmap_dir`` is used."""
+        for array in self._mmap_arrays:
+            array.flush()
+
+    @property
+    def bytes_per_transition(self):
+        """The average number of bytes used for storing one step of one
+        environment.
+
+        For ``compressed_fields``, it is the average size of the compressed
+        steps which have been stored.
+        """
+
+        def _bytes(buf):
+            if isinstance(buf, CompressedTensorStore):
+                return buf.nbytes / max(buf.num_items, 1)
+            return buf.element_size() * buf[0, 0].numel()
+
+        return sum(map(_bytes, alf.nest.flatten(self._buffer)))
+
+    @atomic
+    def _save_to_state_dict(self, destination, prefix, keep_vars):
+        # The data in the memory-mapped files is not in the state dict. Make
+        # sure the files are consistent with the saved positions.
+        self.flush()
+        super()._save_to_state_dict(destination, prefix, keep_vars)
+        for i, store in enumerate(self._compressed_stores):
+            destination[prefix + '_compressed_store%d' % i] = (
+                store.state_dict())
+
+    def _load_from_state_dict(self, state_dict, prefix, local_metadata, strict,
+                              missing_keys, unexpected_keys, error_msgs):
+        for i, store in enumerate(self._compressed_stores):
+            key = prefix + '_compressed_store%d' % i
+            if key in state_dict:
+                store.load_state_dict(state_dict.pop(key))
+            elif strict:
+                missing_keys.append(key)
+        super()._load_from_state_dict(state_dict, prefix, local_metadata,
+                                      strict, missing_keys, unexpected_keys,
+                                      error_msgs)
+
     def circular(self, pos):
         """Mod pos by _max_length to get the actual index in the _buffer."""
         return pos % self._max_length
@@ -398,6 +717,10 @@ class RingBuffer(nn.Module):
     def num_environments(self):
         return self._num_envs
 
+    @property
+    def max_length(self):
+        return self._max_length
+
     def get_earliest_position(self, env_ids):
         """The earliest position that is still in the replay buffer.
 
@@ -410,6 +733,18 @@ class RingBuffer(nn.Module):
         """
         return self._current_pos[env_ids] - self._current_size[env_ids]
 
+    def get_current_position(self, env_ids):
+        """The position after the latest one in the replay buffer.
+
+        Args:
+            env_ids (Tensor): int64 Tensor of environment ids
+        Returns:
+            A tensor with the same shape as env_ids, whose each entry is the
+                position where the next item of the corresponding environment
+                will be stored.
+        """
+        return self._current_pos[env_ids]
+
 
 class DataBuffer(RingBuffer):
     """A simple circular buffer supporting random sampling. This buffer doesn't
@@ -13,9 +13,11 @@
 # limitations under the License.
 import multiprocessing as mp
 from collections import namedtuple
+import gc
 import os
 import tempfile
 from time import sleep
+from unittest.mock import patch
 
 import torch
 
@@ -25,6 +27,7 @@ import alf
 from alf.tensor_specs import TensorSpec
 from alf.utils.data_buffer import RingBuffer, DataBuffer
 from alf.utils.checkpoint_utils import Checkpointer
+from alf.utils import data_parallel
 
 DataItem = namedtuple("DataItem", ["env_id", "x", "t", "o", "reward"])
 
@@ -213,6 +216,71 @@ class RingBufferTest(parameterized.TestCase, alf.test.TestCase):
             ring_buffer.stop()
             self.assertEqual(ring_buffer.enqueue(batch2, blocking=True), False)
 
+    def test_mmap_ring_buffer(self):
+        with tempfile.TemporaryDirectory() as mmap_dir:
+            ring_buffer = RingBuffer(
+                data_spec=self.data_spec,
+                num_environments=self.num_envs,
+                max_length=self.max_length,
+                mmap_dir=mmap_dir)
+            self.assertTrue(
+                os.path.isfile(os.path.join(mmap_dir, "RingBuffer.x.bin")))
+            self.assertTrue(
+                os.path.isfile(os.path.join(mmap_dir, "RingBuffer.o.a.bin")))
+            for t in range(6):
+                batch = get_batch(range(self.num_envs), self.dim, t=t, x=0.4)
+                ring_buffer.enqueue(batch)
+            # The data is not in the state dict.
+            self.assertEqual(
+                set(ring_buffer.state_dict().keys()),
+                {'_current_size', '_current_pos'})
+
+            with tempfile.TemporaryDirectory() as checkpoint_directory:
+                checkpoint = Checkpointer(
+                    checkpoint_directory, ring_buffer=ring_buffer)
+                checkpoint.save(10)
+                # The files are locked until the buffer is deleted.
+                with self.assertRaisesRegex(RuntimeError, "already used"):
+                    RingBuffer(
+                        data_spec=self.data_spec,
+                        num_environments=self.num_envs,
+                        max_length=self.max_length,
+                        mmap_dir=mmap_dir)
+                del checkpoint, ring_buffer
+                gc.collect()
+                ring_buffer = RingBuffer(
+                    data_spec=self.data_spec,
+                    num_environments=self.num_envs,
+                    max_length=self.max_length,
+                    mmap_dir=mmap_dir)
+                checkpoint = Checkpointer(
+                    checkpoint_directory, ring_buffer=ring_buffer)
+                self.assertEqual(checkpoint.load(), 10)
+
+            result = ring_buffer.dequeue(n=self.max_length)
+            self.assertEqual(result.t, torch.tensor([[2, 3, 4, 5]] * 8))
+            self.assertEqual(result.x[:, -1], batch.x)
+            self.assertEqual(result.o['g'][:, -1], batch.o['g'])
+
+    def test_mmap_ring_buffer_data_parallel(self):
+        with tempfile.TemporaryDirectory() as mmap_dir:
+            buffers = []
+            for rank in range(2):
+                with patch.object(
+                        data_parallel, 'is_distributed',
+                        return_value=True), patch.object(
+                            data_parallel, 'get_rank', return_value=rank):
+                    buffers.append(
+                        RingBuffer(
+                            data_spec=self.data_spec,
+                            num_environments=self.num_envs,
+                            max_length=self.max_length,
+                            mmap_dir=mmap_dir))
+                self.assertTrue(
+                    os.path.isfile(
+                        os.path.join(mmap_dir,
+                                     "RingBuffer.rank%d.x.bin" % rank)))
+
 
 class DataBufferTest(alf.test.TestCase):
     def test_data_buffer(self):
@@ -0,0 +1,186 @@
+# Copyright (c) 2020 Horizon Robotics and ALF Contributors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Utilities for data-parallel training with multiple learner processes.
+
+Each learner process trains the same model on its own share of the data. The
+gradients are averaged over all the learners before every optimizer step, so
+that the parameters of all the learners stay the same.
+"""
+
+from absl import logging
+import socket
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+
+def is_distributed():
+    """Whether the current process is one of multiple learners."""
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank():
+    """The rank of the current learner. 0 if not distributed."""
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size():
+    """The number of learners. 1 if not distributed."""
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process():
+    """Whether the current process is the learner with rank 0."""
+    return get_rank() == 0
+
+
+def min_over_learners(value):
+    """The minimum of an integer over all the learners.
+
+    It needs to be called by all the learners.
+
+    Args:
+        value (int): the value of the current learner
+    Returns:
+        int: the minimum. Same as ``value`` if not distributed.
+    """
+    if not is_distributed():
+        return value
+    value = torch.tensor(value, dtype=torch.int64)
+    dist.all_reduce(value, op=dist.ReduceOp.MIN)
+    return int(value)
+
+
+def init_learner(rank, world_size, init_method, backend="gloo"):
+    """Join the process group of the learners.
+
+    Args:
+        rank (int): the rank of the current learner
+        world_size (int): the number of learners
+        init_method (str): URL specifying how to find the other learners (see
+            ``torch.distributed.init_process_group()``)
+        backend (str): the backend for the communication. "gloo" works for
+            both CPU and GPU tensors.
+    """
+    dist.init_process_group(
+        backend, init_method=init_method, rank=rank, world_size=world_size)
+    logging.info("Learner %d/%d started" % (rank, world_size))
+
+
+def all_reduce_gradients(params):
+    """Average the gradients of ``params`` over all the learners in place.
+
+    The gradients of the parameters with the same dtype and device are packed
+    into one buffer so that there is only one ``all_reduce`` for them. A
+    parameter gets a gradient if it has a gradient in any of the learners, so
+    that all the learners pass the same gradients to the optimizers.
+
+    Args:
+        params (list[Parameter]): parameters whose order is the same in all the
+            learners.
+    """
+    groups = {}
+    for p in params:
+        groups.setdefault((p.dtype, p.device), []).append(p)
+    for group in groups.values():
+        _all_reduce_gradients(group)
+
+
+def _all_reduce_gradients(params):
+    world_size = get_world_size()
+    num_params = len(params)
+    buffer = torch.zeros(
+        sum(p.numel() for p in params) + num_params,
+        dtype=params[0].dtype,
+        device=params[0].device)
+    offset = 0
+    for p in params:
+        n = p.numel()
+        if p.grad is not None:
+            buffer[offset:offset + n].copy_(p.grad.reshape(-1))
+        offset += n
+    # The last ``num_params`` elements indicate whether each parameter has
+    # gradient.
+    buffer[offset:].copy_(
+        torch.tensor([float(p.grad is not None) for p in params]))
+    dist.all_reduce(buffer)
+    buffer.div_(world_size)
+    has_grad = (buffer[-num_params:] > 0).tolist()
+    offset = 0
+    for p, h in zip(params, has_grad):
+        n = p.numel()
+        if h:
+            grad = buffer[offset:offset + n].view_as(p)
+            if p.grad is None:
+                p.grad = grad.clone()
+            else:
+                p.grad.copy_(grad)
+        offset += n
+
+
+def broadcast_parameters(module, src=0):
+    """Copy the parameters of ``module`` from learner ``src``.
+
+    Note that the buffers of ``module`` (e.g., the replay buffer and the
+    running statistics of normalizers) are not copied since they are
+    computed from the data of each learner.
+
+    Args:
+        module (nn.Module): the module to be synchronized. Its parameters should
+            be same in all the learners.
+        src (int): the rank of the learner to copy from
+    """
+    with torch.no_grad():
+        for p in module.parameters():
+            dist.broadcast(p.data, src)
+
+
+def find_free_port():
+    """Find a free TCP port on localhost for the learners to connect."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _run_learner(rank, world_size, init_method, backend, fn, args):
+    # A spawned process inherits the "spawn" start method. Restore the default
+    # one so that the subprocesses (e.g. ``ProcessEnvironment``) are started in
+    # the same way as in the main process.
+    mp.set_start_method(None, force=True)
+    init_learner(rank, world_size, init_method, backend)
+    try:
+        fn(*args)
+    finally:
+        dist.destroy_process_group()
+
+
+def spawn_learners(fn, world_size, args=(), backend="gloo"):
+    """Run ``fn(*args)`` in ``world_size`` learner processes.
+
+    The learners are spawned on the local machine and joined into one process
+    group before calling ``fn``. It blocks until all the learners finish.
+
+    Args:
+        fn (Callable): the function to be run by each learner. It must be
+            picklable (e.g., a module level function).
+        world_size (int): the number of learners
+        args (tuple): arguments for ``fn``
+        backend (str): the backend for the communication
+    """
+    init_method = "tcp://127.0.0.1:%d" % find_free_port()
+    mp.spawn(
+        _run_learner,
+        args=(world_size, init_method, backend, fn, args),
+        nprocs=world_size,
+        join=True)
@@ -0,0 +1,127 @@
+# Copyright (c) 2020 Horizon Robotics and ALF Contributors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import time
+import torch
+import torch.distributed as dist
+import torch.nn as nn
+
+import alf
+from alf.algorithms.algorithm import Algorithm
+from alf.data_structures import LossInfo
+from alf.utils import data_parallel
+
+
+class MLPAlg(Algorithm):
+    def __init__(self, hidden_size=64):
+        super().__init__(optimizer=alf.optimizers.Adam(lr=0.01), name="MLPAlg")
+        self._net = nn.Sequential(
+            nn.Linear(16, hidden_size), nn.ReLU(), nn.Linear(hidden_size, 1))
+        self._unused = nn.Linear(2, 2)
+
+    def calc_loss(self, x, y):
+        return LossInfo(loss=(self._net(x).squeeze(-1) - y)**2)
+
+
+def _make_data(batch_size, seed):
+    g = torch.Generator().manual_seed(seed)
+    x = torch.randn(batch_size, 16, generator=g)
+    return x, x.sum(-1)
+
+
+def _check_all_reduce_gradients():
+    rank = data_parallel.get_rank()
+    world_size = data_parallel.get_world_size()
+    params = [
+        nn.Parameter(torch.zeros(3)),
+        nn.Parameter(torch.zeros(2, 2, dtype=torch.float64)),
+        nn.Parameter(torch.zeros(1))
+    ]
+    params[0].grad = torch.full((3, ), float(rank))
+    params[1].grad = torch.full((2, 2), float(rank), dtype=torch.float64)
+    if rank == 0:
+        # Only rank 0 has the gradient
+        params[2].grad = torch.ones(1)
+    data_parallel.all_reduce_gradients(params)
+    mean = sum(range(world_size)) / world_size
+    assert torch.all(params[0].grad == mean)
+    assert torch.all(params[1].grad == mean)
+    assert params[1].grad.dtype == torch.float64
+    assert torch.all(params[2].grad == 1 / world_size)
+
+
+def _check_min_over_learners():
+    rank = data_parallel.get_rank()
+    assert data_parallel.min_over_learners(5 - rank) == 4
+
+
+def _train(global_batch_size, num_updates, result_file=None):
+    rank = data_parallel.get_rank()
+    world_size = data_parallel.get_world_size()
+    torch.manual_seed(rank)
+    alg = MLPAlg()
+    data_parallel.broadcast_parameters(alg)
+    x, y = _make_data(global_batch_size, 0)
+    batch_size = global_batch_size // world_size
+    x = x[rank * batch_size:(rank + 1) * batch_size]
+    y = y[rank * batch_size:(rank + 1) * batch_size]
+    alg.update_with_gradient(alg.calc_loss(x, y))
+    dist.barrier()
+    t0 = time.time()
+    for _ in range(num_updates):
+        alg.update_with_gradient(alg.calc_loss(x, y))
+    dist.barrier()
+    t = time.time() - t0
+
+    # The parameters of all the learners are the same
+    for p in alg.parameters():
+        p0 = p.detach().clone()
+        dist.broadcast(p0, 0)
+        assert torch.all(p0 == p), "%s %s" % (p0, p)
+
+    if rank == 0 and result_file is not None:
+        params = torch.cat([p.detach().reshape(-1) for p in alg.parameters()])
+        torch.save((params, t), result_file)
+
+
+class DataParallelTest(alf.test.TestCase):
+    def test_not_distributed(self):
+        self.assertFalse(data_parallel.is_distributed())
+        self.assertEqual(data_parallel.get_rank(), 0)
+        self.assertEqual(data_parallel.get_world_size(), 1)
+        self.assertTrue(data_parallel.is_main_process())
+        self.assertEqual(data_parallel.min_over_learners(3), 3)
+
+    def test_all_reduce_gradients(self):
+        data_parallel.spawn_learners(_check_all_reduce_gradients, 2)
+
+    def test_min_over_learners(self):
+        data_parallel.spawn_learners(_check_min_over_learners, 2)
+
+    def test_data_parallel_training(self):
+        with tempfile.TemporaryDirectory() as root_dir:
+            result_file = os.path.join(root_dir, "result")
+            results = []
+            for world_size in [1, 2]:
+                data_parallel.spawn_learners(
+                    _train, world_size, args=(32, 5, result_file))
+                results.append(torch.load(result_file)[0])
+        # Same as training with the whole batch in one learner
+        self.assertTensorClose(results[0], results[1], epsilon=1e-5)
+
+
+if __name__ == '__main__':
+    alf.test.main()
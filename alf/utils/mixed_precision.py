@@ -0,0 +1,226 @@
+# Copyright (c) 2020 Horizon Robotics and ALF Contributors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Mixed precision computation for the layers in ``alf.layers``.
+
+Within ``autocast(dtype)``, the matrix multiplications and convolutions of
+``FC``, ``ParallelFC``, ``Conv2D`` and ``ParallelConv2D`` are computed in
+``dtype`` (``torch.bfloat16`` or ``torch.float16``). Their inputs and
+parameters are cast to ``dtype`` on the fly and the results are cast back to
+``torch.float32`` before adding the bias, so the parameters (i.e. the master
+weights updated by the optimizers), the gradients and all the other
+computations (e.g. activations, normalizations, log-probabilities of the
+distributions, ``StableTanh`` and the entropy target losses) stay in
+``torch.float32``.
+
+Since the gradients of ``torch.float16`` computations may underflow, the loss
+should be scaled by a ``LossScaler`` when using ``torch.float16``.
+``Algorithm.update_with_gradient()`` does this automatically.
+
+Note that ``torch.bfloat16`` is only faster on CPUs and PyTorch builds with
+native ``torch.bfloat16`` kernels. Otherwise, it is emulated and much slower
+than ``torch.float32``.
+"""
+
+import torch
+import torch.nn.functional as F
+
+import alf
+
+_compute_dtype = None
+
+
+def get_compute_dtype():
+    """Get the dtype for the layers set by ``autocast``.
+
+    Returns:
+        torch.dtype|None: None if not in the scope of ``autocast`` (i.e. the
+        layers are computed in the dtype of their parameters).
+    """
+    return _compute_dtype
+
+
+def default_compute_dtype():
+    """The low precision dtype suitable for the default device.
+
+    Returns:
+        torch.dtype: ``torch.float16`` for CUDA and ``torch.bfloat16`` for CPU.
+    """
+    if alf.get_default_device() == "cuda":
+        return torch.float16
+    return torch.bfloat16
+
+
+class autocast(object):
+    """A context manager setting the dtype for the layers.
+
+    It can be nested. ``autocast(None)`` can be used to compute a part in full
+    precision within the scope of an outer ``autocast``.
+    """
+
+    def __init__(self, dtype):
+        """
+        Args:
+            dtype (torch.dtype|None): ``torch.bfloat16``, ``torch.float16`` or
+                None for full precision.
+        """
+        assert dtype in (None, torch.bfloat16,
+                         torch.float16), ("Unsupported dtype %s" % dtype)
+        self._dtype = dtype
+        self._prev_dtype = None
+
+    def __enter__(self):
+        global _compute_dtype
+        self._prev_dtype = _compute_dtype
+        _compute_dtype = self._dtype
+
+    def __exit__(self, type, value, traceback):
+        global _compute_dtype
+        _compute_dtype = self._prev_dtype
+
+
+def _add_bias(y, bias):
+    y = y.to(torch.float32)
+    if bias is not None:
+        y = y + bias
+    return y
+
+
+def linear(inputs, weight, bias, dtype):
+    """Compute ``inputs @ weight.t() + bias`` with the product in ``dtype``.
+
+    Args:
+        inputs (Tensor): of shape ``[..., input_size]``
+        weight (Tensor): of shape ``[output_size, input_size]``
+        bias (Tensor|None): of shape ``[output_size]``
+        dtype (torch.dtype): dtype for the product
+    Returns:
+        Tensor: ``torch.float32`` tensor of shape ``[..., output_size]``
+    """
+    y = inputs.to(dtype).matmul(weight.to(dtype).t())
+    return _add_bias(y, bias)
+
+
+def parallel_linear(inputs, weight, bias, dtype):
+    """Compute ``bmm(inputs, weight.transpose(1, 2)) + bias`` in ``dtype``.
+
+    Args:
+        inputs (Tensor): of shape ``[n, B, input_size]``
+        weight (Tensor): of shape ``[n, output_size, input_size]``
+        bias (Tensor|None): of shape ``[n, output_size]``
+        dtype (torch.dtype): dtype for the product
+    Returns:
+        Tensor: ``torch.float32`` tensor of shape ``[n, B, output_size]``
+    """
+    inputs = inputs.to(dtype)
+    weight = weight.to(dtype).transpose(1, 2)
+    if dtype == torch.bfloat16 and not inputs.is_cuda:
+        # bmm does not support bfloat16 on CPU
+        y = torch.stack([x.matmul(w) for x, w in zip(inputs, weight)])
+    else:
+        y = torch.bmm(inputs, weight)
+    if bias is not None:
+        bias = bias.unsqueeze(1)
+    return _add_bias(y, bias)
+
+
+def conv2d(img, conv, dtype):
+    """Compute the convolution of ``nn.Conv2d`` ``conv`` in ``dtype``.
+
+    Args:
+        img (Tensor): of shape ``[B, C, H, W]``
+        conv (nn.Conv2d): the convolution module
+        dtype (torch.dtype): dtype for the convolution
+    Returns:
+        Tensor: ``torch.float32`` tensor of shape ``[B, C', H', W']``
+    """
+    y = F.conv2d(
+        img.to(dtype), conv.weight.to(dtype), None, conv.stride, conv.padding,
+        conv.dilation, conv.groups)
+    bias = conv.bias
+    if bias is not None:
+        bias = bias.view(1, -1, 1, 1)
+    return _add_bias(y, bias)
+
+
+class LossScaler(object):
+    """Dynamic loss scaling for ``torch.float16`` training.
+
+    The loss is multiplied by ``scale`` before ``backward()`` so that the small
+    gradients do not underflow in ``torch.float16``. The gradients are divided
+    by ``scale`` before the optimizer step. If any gradient is inf or nan, the
+    step should be skipped and ``scale`` is reduced by ``backoff_factor``.
+    ``scale`` is increased by ``growth_factor`` after ``growth_interval``
+    consecutive steps with finite gradients.
+    """
+
+    def __init__(self,
+                 init_scale=2.**16,
+                 growth_factor=2.,
+                 backoff_factor=0.5,
+                 growth_interval=2000):
+        """
+        Args:
+            init_scale (float): the initial scale
+            growth_factor (float): factor to increase the scale
+            backoff_factor (float): factor to decrease the scale
+            growth_interval (int): increase the scale after so many steps
+                without inf or nan gradients.
+        """
+        self._scale = init_scale
+        self._growth_factor = growth_factor
+        self._backoff_factor = backoff_factor
+        self._growth_interval = growth_interval
+        self._num_good_steps = 0
+
+    @property
+    def scale(self):
+        """The current scale."""
+        return self._scale
+
+    def scale_loss(self, loss):
+        """Multiply ``loss`` by ``scale``."""
+        return loss * self._scale
+
+    def unscale_(self, params):
+        """Divide the gradients of ``params`` by ``scale`` in place.
+
+        Args:
+            params (list[Parameter]): the parameters
+        Returns:
+            bool: True if any gradient is inf or nan.
+        """
+        grads = [p.grad for p in params if p.grad is not None]
+        if not grads:
+            return False
+        inv_scale = 1. / self._scale
+        finite = []
+        for g in grads:
+            g.mul_(inv_scale)
+            finite.append(torch.isfinite(g).all())
+        return not bool(torch.stack(finite).all())
+
+    def update(self, found_inf):
+        """Update the scale after a step.
+
+        Args:
+            found_inf (bool): whether the gradients of the step have inf or nan
+        """
+        if found_inf:
+            self._scale *= self._backoff_factor
+            self._num_good_steps = 0
+        else:
+            self._num_good_steps += 1
+            if self._num_good_steps == self._growth_interval:
+                self._scale *= self._growth_factor
+                self._num_good_steps = 0
@@ -0,0 +1,149 @@
+# Copyright (c) 2020 Horizon Robotics and ALF Contributors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from absl import logging
+from absl.testing import parameterized
+import time
+import torch
+import torch.nn as nn
+
+import alf
+from alf.algorithms.algorithm import Algorithm
+from alf.data_structures import LossInfo
+import alf.layers as layers
+from alf.utils import mixed_precision
+
+
+class ScalarAlg(Algorithm):
+    def __init__(self):
+        super().__init__(optimizer=alf.optimizers.SGD(lr=1.), name="ScalarAlg")
+        self._w = nn.Parameter(torch.ones(()))
+
+    def calc_loss(self, scale):
+        return LossInfo(loss=self._w * torch.full((2, 3), scale))
+
+
+class MLPAlg(Algorithm):
+    def __init__(self, hidden_size):
+        super().__init__(optimizer=alf.optimizers.Adam(lr=1e-3), name="MLPAlg")
+        self._net = nn.Sequential(
+            layers.FC(16, hidden_size, activation=torch.relu_),
+            layers.FC(hidden_size, hidden_size, activation=torch.relu_),
+            layers.FC(hidden_size, 1))
+
+    def calc_loss(self, x, y):
+        return LossInfo(loss=(self._net(x).squeeze(-1) - y)**2)
+
+
+class MixedPrecisionTest(parameterized.TestCase, alf.test.TestCase):
+    def _check_layer(self, layer, x):
+        y = layer(x)
+        y.sum().backward()
+        grads = [p.grad.clone() for p in layer.parameters()]
+        layer.zero_grad()
+        with mixed_precision.autocast(torch.bfloat16):
+            y1 = layer(x)
+            y1.sum().backward()
+        self.assertEqual(y1.dtype, torch.float32)
+        self.assertTensorClose(y1, y, epsilon=0.05)
+        for p, g in zip(layer.parameters(), grads):
+            self.assertEqual(p.dtype, torch.float32)
+            self.assertEqual(p.grad.dtype, torch.float32)
+            self.assertLess(
+                float((p.grad - g).abs().max()),
+                0.02 * float(g.abs().max()) + 1e-3)
+
+    @parameterized.parameters((True, ), (False, ))
+    def test_layers(self, use_bias):
+        self._check_layer(
+            layers.FC(8, 6, activation=torch.tanh, use_bias=use_bias),
+            torch.randn(5, 8))
+        self._check_layer(
+            layers.ParallelFC(
+                8, 6, 3, activation=torch.tanh, use_bias=use_bias),
+            torch.randn(5, 8))
+        self._check_layer(
+            layers.Conv2D(3, 4, 3, activation=torch.tanh, use_bias=use_bias),
+            torch.randn(2, 3, 7, 7))
+        self._check_layer(
+            layers.ParallelConv2D(
+                3, 4, 3, 2, activation=torch.tanh, use_bias=use_bias),
+            torch.randn(2, 3, 7, 7))
+
+    def test_autocast(self):
+        self.assertIsNone(mixed_precision.get_compute_dtype())
+        with mixed_precision.autocast(torch.bfloat16):
+            self.assertEqual(mixed_precision.get_compute_dtype(),
+                             torch.bfloat16)
+            with mixed_precision.autocast(None):
+                self.assertIsNone(mixed_precision.get_compute_dtype())
+            self.assertEqual(mixed_precision.get_compute_dtype(),
+                             torch.bfloat16)
+        self.assertIsNone(mixed_precision.get_compute_dtype())
+
+    def test_loss_scaler(self):
+        scaler = mixed_precision.LossScaler(init_scale=4., growth_interval=2)
+        p = nn.Parameter(torch.zeros(2))
+        p.grad = torch.tensor([4., 8.])
+        self.assertFalse(scaler.unscale_([p]))
+        self.assertTensorEqual(p.grad, torch.tensor([1., 2.]))
+        scaler.update(False)
+        self.assertEqual(scaler.scale, 4.)
+        scaler.update(False)
+        self.assertEqual(scaler.scale, 8.)
+        p.grad = torch.tensor([float('inf'), 1.])
+        self.assertTrue(scaler.unscale_([p]))
+        scaler.update(True)
+        self.assertEqual(scaler.scale, 4.)
+
+    def test_update_with_gradient(self):
+        alg = ScalarAlg()
+        with mixed_precision.autocast(torch.float16):
+            # The scaled gradient overflows, so the update is skipped.
+            alg.update_with_gradient(alg.calc_loss(1e35))
+            self.assertEqual(float(alg._w), 1.)
+            self.assertEqual(alg._loss_scaler.scale, 2.**15)
+            # The gradient is unscaled before the update
+            alg.update_with_gradient(alg.calc_loss(0.5))
+            self.assertAlmostEqual(float(alg._w), 0.5)
+        # No loss scaling without float16
+        alg.update_with_gradient(alg.calc_loss(0.5))
+        self.assertAlmostEqual(float(alg._w), 0.)
+        self.assertEqual(alg._loss_scaler.scale, 2.**15)
+
+    def test_throughput_and_accuracy(self):
+        # The size of the networks of sac_pendulum.gin
+        hidden_size = 100
+        batch_size = 256
+        num_updates = 100
+        g = torch.Generator().manual_seed(0)
+        x = torch.randn(batch_size, 16, generator=g)
+        y = torch.sin(x).sum(-1)
+        losses = []
+        for compute_dtype in [None, mixed_precision.default_compute_dtype()]:
+            torch.manual_seed(0)
+            alg = MLPAlg(hidden_size)
+            with mixed_precision.autocast(compute_dtype):
+                t0 = time.time()
+                for _ in range(num_updates):
+                    loss, _ = alg.update_with_gradient(alg.calc_loss(x, y))
+                t = time.time() - t0
+            losses.append(float(loss.loss))
+            logging.info("dtype=%s: %.1f updates/s, final loss=%.4f" %
+                         (compute_dtype, num_updates / t, losses[-1]))
+        self.assertLess(losses[1], 1.5 * losses[0])
+
+
+if __name__ == '__main__':
+    alf.test.main()
@@ -0,0 +1,339 @@
+# Copyright (c) 2020 Horizon Robotics and ALF Contributors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A timeline profiler recording nested spans of the training loop.
+
+The phases of the training loop are marked by ``span``:
+
+.. code-block:: python
+
+    with profiler.span("calc_loss"):
+        loss_info = self.calc_loss(experience, train_info)
+
+When a ``TimelineProfiler`` is installed by ``set_profiler()``, the spans in
+the sampled training iterations (see ``iteration()``) are recorded. The
+recorded spans can be exported to a Chrome trace file, which can be viewed
+with ``chrome://tracing`` or https://ui.perfetto.dev, and aggregated to a
+per-phase table. When no profiler is installed, a span only costs a check of a
+global variable.
+"""
+
+from absl import logging
+import functools
+import gin
+import json
+import os
+import threading
+import time
+import torch
+
+_profiler = None
+
+
+class _Span(object):
+    """The record of an open span."""
+    __slots__ = ['name', 'start', 'child_time']
+
+    def __init__(self, name, start):
+        self.name = name
+        self.start = start
+        self.child_time = 0.
+
+
+class _PhaseStats(object):
+    """The aggregated statistics of the spans with the same name."""
+    __slots__ = ['count', 'total', 'self_time', 'max']
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.
+        self.self_time = 0.
+        self.max = 0.
+
+
+@gin.configurable
+class TimelineProfiler(object):
+    """Record the spans of sampled training iterations.
+
+    Each span is recorded with the thread it runs on, so the spans from the
+    background threads (e.g. the unroll thread of ``TrainerConfig.async_unroll``)
+    appear as separate tracks in the trace. Besides the total time, the table
+    written by ``write_summary_table()`` also shows the self time of each
+    phase, which excludes the time of the nested spans.
+
+    Note that the spans measure the time on the host. For CUDA, the time of the
+    asynchronous kernels is attributed to the span where the host waits for
+    them unless ``cuda_synchronize`` is True.
+    """
+
+    def __init__(self,
+                 output_dir,
+                 sample_interval=100,
+                 cuda_synchronize=False,
+                 max_events=1000000):
+        """
+        Args:
+            output_dir (str): the directory for the trace file
+                ``timeline.json`` and the table ``timeline_summary.txt``.
+            sample_interval (int): record the spans of one training iteration
+                out of every so many iterations.
+            cuda_synchronize (bool): whether to synchronize CUDA at the
+                beginning and the end of each span so that the GPU time is
+                attributed to the span launching the kernels. It slows down the
+                sampled iterations.
+            max_events (int): stop recording after so many spans to bound the
+                memory usage.
+        """
+        assert sample_interval >= 1
+        self._output_dir = output_dir
+        self._sample_interval = sample_interval
+        self._cuda_synchronize = (cuda_synchronize
+                                  and torch.cuda.is_available())
+        self._max_events = max_events
+        self._sampling = False
+        self._start_time = time.perf_counter()
+        self._thread_state = threading.local()
+        # list of (name, thread_id, start, duration)
+        self._events = []
+        self._thread_names = {}
+        self._stats = {}
+        self._num_sampled_iterations = 0
+        self._lock = threading.Lock()
+
+    @property
+    def sampling(self):
+        """Whether the spans are recorded currently."""
+        return self._sampling
+
+    def _stack(self):
+        stack = getattr(self._thread_state, 'stack', None)
+        if stack is None:
+            stack = []
+            self._thread_state.stack = stack
+        return stack
+
+    def push(self, name):
+        """Open a span. Should be paired with ``pop()``."""
+        stack = self._stack()
+        if not self._sampling:
+            # A placeholder so that the span is ignored by ``pop()`` even if
+            # the sampling is turned on before it is closed.
+            stack.append(None)
+            return
+        if self._cuda_synchronize:
+            torch.cuda.synchronize()
+        stack.append(_Span(name, time.perf_counter()))
+
+    def pop(self):
+        """Close the span opened by the latest ``push()`` of this thread."""
+        stack = self._stack()
+        if not stack:
+            return
+        span = stack.pop()
+        if span is None:
+            return
+        if self._cuda_synchronize:
+            torch.cuda.synchronize()
+        duration = time.perf_counter() - span.start
+        for parent in reversed(stack):
+            if parent is not None:
+                parent.child_time += duration
+                break
+        with self._lock:
+            stats = self._stats.get(span.name)
+            if stats is None:
+                stats = _PhaseStats()
+                self._stats[span.name] = stats
+            stats.count += 1
+            stats.total += duration
+            stats.self_time += duration - span.child_time
+            stats.max = max(stats.max, duration)
+            if len(self._events) < self._max_events:
+                thread_id = threading.get_ident()
+                if thread_id not in self._thread_names:
+                    self._thread_names[thread_id] = (
+                        threading.current_thread().name)
+                self._events.append((span.name, thread_id,
+                                     span.start - self._start_time, duration))
+                if len(self._events) == self._max_events:
+                    logging.warning(
+                        "TimelineProfiler: the number of events reaches %d. "
+                        "The later spans are only aggregated." %
+                        self._max_events)
+
+    def start_iteration(self, iter_num):
+        """Start training iteration ``iter_num``.
+
+        The spans are recorded if ``iter_num`` is a multiple of
+        ``sample_interval``.
+        """
+        self._sampling = iter_num % self._sample_interval == 0
+        if self._sampling:
+            self._num_sampled_iterations += 1
+
+    def end_iteration(self):
+        """End the current training iteration."""
+        self._sampling = False
+
+    def export_chrome_trace(self, path):
+        """Write the recorded spans as a Chrome trace JSON file.
+
+        Args:
+            path (str): path of the trace file
+        """
+        pid = os.getpid()
+        with self._lock:
+            events = list(self._events)
+        thread_ids = {}
+        trace_events = []
+        for name, thread, start, duration in events:
+            tid = thread_ids.setdefault(thread, len(thread_ids))
+            trace_events.append(
+                dict(
+                    name=name,
+                    ph="X",
+                    ts=start * 1e6,
+                    dur=duration * 1e6,
+                    pid=pid,
+                    tid=tid))
+        for thread, tid in thread_ids.items():
+            trace_events.append(
+                dict(
+                    name="thread_name",
+                    ph="M",
+                    pid=pid,
+                    tid=tid,
+                    args=dict(name=self._thread_names[thread])))
+        with open(path, 'w') as f:
+            json.dump(dict(traceEvents=trace_events), f)
+
+    def summary_table(self):
+        """Get the table of the aggregated time of each phase.
+
+        Returns:
+            str: a table sorted by the total time of the phases. The time is in
+            milliseconds per sampled iteration.
+        """
+        n = max(self._num_sampled_iterations, 1)
+        with self._lock:
+            stats = sorted(
+                self._stats.items(), key=lambda x: x[1].total, reverse=True)
+        lines = [
+            "%-32s %10s %12s %12s %12s %12s" %
+            ("phase", "count/iter", "total(ms)", "self(ms)", "mean(ms)",
+             "max(ms)")
+        ]
+        for name, s in stats:
+            lines.append(
+                "%-32s %10.1f %12.3f %12.3f %12.3f %12.3f" %
+                (name, s.count / n, s.total * 1e3 / n, s.self_time * 1e3 / n,
+                 s.total * 1e3 / s.count, s.max * 1e3))
+        lines.append("Sampled iterations: %d" % self._num_sampled_iterations)
+        return '\n'.join(lines)
+
+    def write_summary_table(self, path):
+        """Write ``summary_table()`` to ``path``."""
+        with open(path, 'w') as f:
+            f.write(self.summary_table() + '\n')
+
+    def close(self):
+        """Write the trace and the table to ``output_dir``."""
+        os.makedirs(self._output_dir, exist_ok=True)
+        self.export_chrome_trace(
+            os.path.join(self._output_dir, "timeline.json"))
+        self.write_summary_table(
+            os.path.join(self._output_dir, "timeline_summary.txt"))
+        logging.info("Timeline profile is written to %s" % self._output_dir)
+
+
+def set_profiler(profiler):
+    """Install the profiler used by ``span`` and ``iteration``.
+
+    Args:
+        profiler (TimelineProfiler|None): None to disable profiling.
+    """
+    global _profiler
+    _profiler = profiler
+
+
+def get_profiler():
+    """Get the installed ``TimelineProfiler``. None if not installed."""
+    return _profiler
+
+
+class span(object):
+    """Mark a phase of the training to be recorded by the ``TimelineProfiler``.
+
+    It can be used as a context manager or a decorator:
+
+    .. code-block:: python
+
+        with profiler.span("backward"):
+            loss.backward()
+
+        @profiler.span("unroll")
+        def unroll(self, unroll_length):
+            ...
+    """
+    __slots__ = ['_name']
+
+    def __init__(self, name):
+        """
+        Args:
+            name (str): name of the phase
+        """
+        self._name = name
+
+    def __enter__(self):
+        if _profiler is not None:
+            _profiler.push(self._name)
+
+    def __exit__(self, type, value, traceback):
+        if _profiler is not None:
+            _profiler.pop()
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def _wrapper(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+
+        return _wrapper
+
+
+class iteration(object):
+    """A context manager for one training iteration.
+
+    If the iteration is sampled by the installed ``TimelineProfiler``, the
+    spans inside it are recorded and the iteration itself is recorded as a
+    span named ``name``.
+    """
+
+    def __init__(self, iter_num, name="train_iter"):
+        """
+        Args:
+            iter_num (int): the number of the iteration
+            name (str): name of the span for the iteration
+        """
+        self._iter_num = iter_num
+        self._name = name
+
+    def __enter__(self):
+        if _profiler is not None:
+            _profiler.start_iteration(self._iter_num)
+            _profiler.push(self._name)
+
+    def __exit__(self, type, value, traceback):
+        if _profiler is not None:
+            _profiler.pop()
+            _profiler.end_iteration()
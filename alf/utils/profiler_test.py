@@ -0,0 +1,115 @@
+# Copyright (c) 2020 Horizon Robotics and ALF Contributors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from absl import logging
+import json
+import os
+import tempfile
+import threading
+import time
+
+import alf
+from alf.utils import profiler
+
+
+@profiler.span("decorated")
+def _decorated(x):
+    time.sleep(0.001)
+    return x + 1
+
+
+class TimelineProfilerTest(alf.test.TestCase):
+    def tearDown(self):
+        profiler.set_profiler(None)
+
+    def test_timeline_profiler(self):
+        with tempfile.TemporaryDirectory() as root_dir:
+            p = profiler.TimelineProfiler(root_dir, sample_interval=2)
+            profiler.set_profiler(p)
+
+            def _background():
+                with profiler.span("background"):
+                    time.sleep(0.002)
+
+            for i in range(4):
+                with profiler.iteration(i):
+                    with profiler.span("outer"):
+                        time.sleep(0.002)
+                        with profiler.span("inner"):
+                            time.sleep(0.002)
+                        self.assertEqual(_decorated(i), i + 1)
+                    thread = threading.Thread(
+                        target=_background, name="background_thread")
+                    thread.start()
+                    thread.join()
+            # Not in any iteration
+            with profiler.span("outer"):
+                pass
+            p.close()
+
+            # iterations 0 and 2 are sampled
+            stats = p._stats
+            self.assertEqual(
+                sorted(stats.keys()),
+                ["background", "decorated", "inner", "outer", "train_iter"])
+            for s in stats.values():
+                self.assertEqual(s.count, 2)
+            outer = stats["outer"]
+            self.assertAlmostEqual(
+                outer.self_time,
+                outer.total - stats["inner"].total - stats["decorated"].total,
+                delta=1e-9)
+            self.assertGreater(outer.self_time, 0.004)
+
+            with open(os.path.join(root_dir, "timeline.json")) as f:
+                trace = json.load(f)["traceEvents"]
+            spans = [e for e in trace if e["ph"] == "X"]
+            self.assertEqual(len(spans), 10)
+            threads = {
+                e["tid"]: e["args"]["name"]
+                for e in trace if e["ph"] == "M"
+            }
+            self.assertEqual(len(threads), 2)
+            for e in spans:
+                if e["name"] == "background":
+                    self.assertEqual(threads[e["tid"]], "background_thread")
+            # nested spans are within their parents
+            iters = [e for e in spans if e["name"] == "train_iter"]
+            for e in spans:
+                self.assertTrue(
+                    any(it["ts"] <= e["ts"] and e["ts"] + e["dur"] <=
+                        it["ts"] + it["dur"] for it in iters))
+
+            with open(os.path.join(root_dir, "timeline_summary.txt")) as f:
+                table = f.read()
+            logging.info("\n" + table)
+            self.assertIn("Sampled iterations: 2", table)
+
+    def test_overhead(self):
+        n = 100000
+        for installed in [False, True]:
+            if installed:
+                # Installed but not sampling
+                profiler.set_profiler(profiler.TimelineProfiler(""))
+            t0 = time.time()
+            for _ in range(n):
+                with profiler.span("span"):
+                    pass
+            t = time.time() - t0
+            logging.info("profiler installed=%s: %.3f us per span" %
+                         (installed, t * 1e6 / n))
+
+
+if __name__ == '__main__':
+    alf.test.main()
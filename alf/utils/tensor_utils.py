@@ -270,3 +270,89 @@ def clip_by_norms(tensors, clip_norm, in_place=False):
     return alf.nest.map_structure(
         lambda t: clip_by_global_norm([t], clip_norm, in_place=in_place)[0]
         if t is not None else t, tensors)
+
+
+def get_flat_view(tensors):
+    """Get a 1-D view covering all ``tensors`` if they are stored back to back.
+
+    Args:
+        tensors (list[Tensor]): a list of tensors
+    Returns:
+        Tensor: a 1-D tensor sharing the storage of ``tensors``, whose
+        elements are the concatenation of the flattened ``tensors``. ``None``
+        if ``tensors`` are not contiguous tensors laid out one after another
+        in the same storage.
+    """
+    if not tensors:
+        return None
+    first = tensors[0]
+    numel = 0
+    for t in tensors:
+        if (t.dtype != first.dtype or t.device != first.device
+                or not t.is_contiguous() or t.data_ptr() !=
+                first.data_ptr() + numel * first.element_size()):
+            return None
+        numel += t.numel()
+    try:
+        # Fails if the memory of ``tensors`` is not all in the storage of
+        # ``first``, e.g. if they are separately allocated back to back.
+        return first.detach().as_strided((numel, ), (1, ))
+    except RuntimeError:
+        return None
+
+
+def owns_storage(tensor):
+    """Whether ``tensor`` covers its whole storage.
+
+    If so, ``tensor`` does not share its memory with any other tensor except
+    for its own views.
+
+    Args:
+        tensor (Tensor): a contiguous tensor
+    Returns:
+        bool:
+    """
+    if hasattr(tensor, 'untyped_storage'):
+        nbytes = tensor.untyped_storage().nbytes()
+    else:
+        # ``untyped_storage()`` is only available since torch 2.0
+        nbytes = tensor.storage().size() * tensor.element_size()
+    return nbytes == tensor.numel() * tensor.element_size()
+
+
+def flatten_parameters(params, with_grad=True):
+    """Store the data and gradients of ``params`` in two flat buffers.
+
+    The data of each parameter becomes a view of one 1-D buffer, and its
+    gradient becomes a view of another 1-D buffer. The current values of the
+    data and gradients are kept. Since ``backward()`` accumulates the
+    gradients in place when they exist, the gradient buffer always holds the
+    gradients of all ``params`` and elementwise operations on all ``params``
+    (e.g., gradient clipping, soft update and optimizer steps) can be done
+    with one operation on the buffers.
+
+    Note that ``module.to()`` or assigning ``param.data`` or ``param.grad``
+    afterwards breaks the connection with the buffers.
+
+    Args:
+        params (list[Parameter]): parameters with the same dtype and device
+        with_grad (bool): whether to also put the gradients in a flat buffer.
+    Returns:
+        tuple:
+        - Tensor: the 1-D data buffer
+        - Tensor: the 1-D gradient buffer. ``None`` if ``with_grad`` is False.
+    """
+    assert len(set((p.dtype, p.device) for p in params)) == 1, (
+        "All parameters should have the same dtype and device")
+    data = torch.cat([p.detach().reshape(-1) for p in params])
+    grad = torch.zeros_like(data) if with_grad else None
+    offset = 0
+    for p in params:
+        n = p.numel()
+        p.data = data[offset:offset + n].view_as(p)
+        if with_grad:
+            if p.grad is not None:
+                grad[offset:offset + n].copy_(p.grad.reshape(-1))
+            p.grad = grad[offset:offset + n].view_as(p)
+        offset += n
+    return data, grad
@@ -61,5 +61,45 @@ class NormClippingTest(alf.test.TestCase):
             torch.as_tensor(1.0))
 
 
+class FlattenParametersTest(alf.test.TestCase):
+    def test_flatten_parameters(self):
+        layer = torch.nn.Linear(3, 2)
+        params = list(layer.parameters())
+        self.assertIsNone(tensor_utils.get_flat_view(params))
+        self.assertTrue(all(tensor_utils.owns_storage(p) for p in params))
+        values = [p.detach().clone() for p in params]
+        layer(torch.randn(4, 3)).sum().backward()
+        grads = [p.grad.clone() for p in params]
+
+        data, grad = tensor_utils.flatten_parameters(params)
+        self.assertEqual(data.shape, (8, ))
+        for p, v, g in zip(params, values, grads):
+            self.assertTensorEqual(p, v)
+            self.assertEqual(p.grad, g)
+        flat = tensor_utils.get_flat_view(params)
+        self.assertEqual(flat.data_ptr(), data.data_ptr())
+        self.assertEqual(flat.shape, data.shape)
+
+        # backward() accumulates into the flat gradient
+        grad.zero_()
+        x = torch.randn(4, 3)
+        layer(x).sum().backward()
+        self.assertEqual(params[0].grad, torch.ones(2, 1) * x.sum(0))
+        self.assertEqual(grad[6:], torch.full((2, ), 4.))
+        data.zero_()
+        self.assertTensorEqual(layer.weight, torch.zeros(2, 3))
+        self.assertFalse(tensor_utils.owns_storage(layer.weight))
+
+    def test_get_flat_view(self):
+        x = torch.arange(10.)
+        flat = tensor_utils.get_flat_view([x[:3], x[3:5].view(2, 1), x[5:]])
+        self.assertEqual(flat.data_ptr(), x.data_ptr())
+        self.assertTensorEqual(flat, x)
+        # not back to back
+        self.assertIsNone(tensor_utils.get_flat_view([x[:3], x[4:]]))
+        # different storages
+        self.assertIsNone(tensor_utils.get_flat_view([x, torch.zeros(2)]))
+
+
 if __name__ == "__main__":
     alf.test.main()
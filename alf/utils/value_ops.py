@@ -104,6 +104,36 @@ def action_importance_ratio(action_distribution, collect_action_distribution,
     return importance_ratio, importance_ratio_clipped
 
 
+def reverse_linear_recurrence(a, b, final):
+    """Solve the linear recurrence ``x[t] = a[t] * x[t + 1] + b[t]`` backward
+    in time.
+
+    Instead of iterating over ``t``, it uses a parallel scan with
+    ``ceil(log2(T))`` steps, each of which combines the affine maps
+    ``x -> a[t] * x + b[t]`` of two segments of the sequence. The result is
+    the same as the sequential computation up to floating point rounding.
+
+    Args:
+        a (Tensor): shape is ``[T, ...]``. It needs to be broadcastable to the
+            shape of ``b``.
+        b (Tensor): shape is ``[T, ...]``.
+        final (Tensor): the value of ``x[T]``. Its shape is ``b.shape[1:]``.
+    Returns:
+        Tensor: ``x[0:T]`` with the same shape as ``b``.
+    """
+    T = b.shape[0]
+    # Fold ``x[T]`` into the last step so that ``x[T]`` can be treated as 0.
+    b = torch.cat([b[:-1], torch.addcmul(b[-1:], a[-1:], final.unsqueeze(0))])
+    d = 1
+    while d < T:
+        # After this step, (a[t], b[t]) is the composition of the maps of
+        # steps t, t+1, ..., t+2d-1.
+        b = torch.cat([torch.addcmul(b[:-d], a[:-d], b[d:]), b[-d:]])
+        a = torch.cat([a[:-d] * a[d:], a[-d:]])
+        d *= 2
+    return b
+
+
 def discounted_return(rewards, values, step_types, discounts, time_major=True):
     """Computes discounted return for the first T-1 steps.
 
@@ -145,15 +175,13 @@ def discounted_return(rewards, values, step_types, discounts, time_major=True):
     is_lasts = common.expand_dims_as(is_lasts, values)
     discounts = common.expand_dims_as(discounts, values)
 
-    rets = torch.zeros_like(values)
-    rets[-1] = values[-1]
-
     with torch.no_grad():
-        for t in reversed(range(rewards.shape[0] - 1)):
-            acc_value = rets[t + 1] * discounts[t + 1] + rewards[t + 1]
-            rets[t] = is_lasts[t] * values[t] + (1 - is_lasts[t]) * acc_value
-
-    rets = rets[:-1]
+        # rets[t] = is_lasts[t] * values[t] + (1 - is_lasts[t])
+        #     * (rets[t + 1] * discounts[t + 1] + rewards[t + 1])
+        not_lasts = 1 - is_lasts[:-1]
+        rets = reverse_linear_recurrence(
+            not_lasts * discounts[1:],
+            is_lasts[:-1] * values[:-1] + not_lasts * rewards[1:], values[-1])
 
     if not time_major:
         rets = rets.transpose(0, 1)
@@ -242,14 +270,15 @@ def generalized_advantage_estimation(rewards,
 
     weighted_discounts = discounts[1:] * td_lambda
 
-    advs = torch.zeros_like(values)
     delta = rewards[1:] + discounts[1:] * values[1:] - values[:-1]
 
     with torch.no_grad():
-        for t in reversed(range(rewards.shape[0] - 1)):
-            advs[t] = (1 - is_lasts[t]) * \
-                      (delta[t] + weighted_discounts[t] * advs[t + 1])
-        advs = advs[:-1]
+        # advs[t] = (1 - is_lasts[t])
+        #     * (delta[t] + weighted_discounts[t] * advs[t + 1])
+        not_lasts = 1 - is_lasts[:-1]
+        advs = reverse_linear_recurrence(not_lasts * weighted_discounts,
+                                         not_lasts * delta,
+                                         torch.zeros_like(values[-1]))
 
     if not time_major:
         advs = advs.transpose(0, 1)
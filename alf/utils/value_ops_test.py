@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from absl import logging
+import time
 import unittest
 import torch
 from alf.data_structures import TimeStep, StepType
@@ -172,5 +174,77 @@ class GeneralizedAdvantageTest(unittest.TestCase):
             expected=expected)
 
 
+def _discounted_return_loop(rewards, values, step_types, discounts):
+    """Sequential time major implementation for comparison."""
+    is_lasts = (step_types == StepType.LAST).to(dtype=torch.float32)
+    rets = torch.zeros_like(values)
+    rets[-1] = values[-1]
+    for t in reversed(range(rewards.shape[0] - 1)):
+        acc_value = rets[t + 1] * discounts[t + 1] + rewards[t + 1]
+        rets[t] = is_lasts[t] * values[t] + (1 - is_lasts[t]) * acc_value
+    return rets[:-1]
+
+
+def _gae_loop(rewards, values, step_types, discounts, td_lambda):
+    """Sequential time major implementation for comparison."""
+    is_lasts = (step_types == StepType.LAST).to(dtype=torch.float32)
+    weighted_discounts = discounts[1:] * td_lambda
+    advs = torch.zeros_like(values)
+    delta = rewards[1:] + discounts[1:] * values[1:] - values[:-1]
+    for t in reversed(range(rewards.shape[0] - 1)):
+        advs[t] = (1 - is_lasts[t]) * (
+            delta[t] + weighted_discounts[t] * advs[t + 1])
+    return advs[:-1]
+
+
+def _random_trajectories(T, B):
+    step_types = torch.full((T, B), StepType.MID, dtype=torch.int32)
+    step_types[torch.rand(T, B) < 0.05] = int(StepType.LAST)
+    discounts = torch.full((T, B), 0.99)
+    discounts[torch.rand(T, B) < 0.5] = 0.
+    discounts[step_types != StepType.LAST] = 0.99
+    return dict(
+        rewards=torch.randn(T, B),
+        values=torch.randn(T, B),
+        step_types=step_types,
+        discounts=discounts)
+
+
+class ParallelScanTest(unittest.TestCase):
+    """Compare the parallel scan implementation with the sequential one."""
+
+    def test_same_as_loop(self):
+        for T in (2, 3, 8, 13, 128, 1000):
+            trajs = _random_trajectories(T, 16)
+            np.testing.assert_allclose(
+                value_ops.discounted_return(**trajs),
+                _discounted_return_loop(**trajs),
+                rtol=1e-5,
+                atol=1e-5)
+            np.testing.assert_allclose(
+                value_ops.generalized_advantage_estimation(
+                    td_lambda=0.95, **trajs),
+                _gae_loop(td_lambda=0.95, **trajs),
+                rtol=1e-5,
+                atol=1e-5)
+
+    def test_benchmark(self):
+        batch_size = 32
+        for T in (8, 128, 2048):
+            trajs = _random_trajectories(T, batch_size)
+            n = max(5, 8192 // T)
+            t0 = time.time()
+            for _ in range(n):
+                _gae_loop(td_lambda=0.95, **trajs)
+            t1 = time.time()
+            for _ in range(n):
+                value_ops.generalized_advantage_estimation(
+                    td_lambda=0.95, **trajs)
+            t2 = time.time()
+            logging.info(
+                "T=%s loop: %.3fms scan: %.3fms" % (T, (t1 - t0) / n * 1000,
+                                                    (t2 - t1) / n * 1000))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -16,6 +16,7 @@ from setuptools import setup, find_packages
 import os
 
 os.system("pip install -e ./alf/nest/cnest")
+os.system("pip install -e ./alf/experience_replayers/csegment_tree")
 
 setup(
     name='alf',